@@ -0,0 +1 @@
+# Benchmarks and golden-dataset generator for the calculation core (not part of the installed package)
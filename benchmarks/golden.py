@@ -0,0 +1,128 @@
+# Golden regression dataset: configs x sizings with the metrics of the current implementation.
+# tests/test_golden.py recomputes every case and requires identical results, so a faster engine can prove it
+# matches the reference numbers (and display strings) exactly.
+#
+#   python -m benchmarks.golden            # check the current tree against the stored dataset
+#   python -m benchmarks.golden --write    # regenerate (only for intentional model changes)
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'golden')
+ANNUAL_PATH = os.path.join(GOLDEN_DIR, 'annual_metrics.json')
+HOURLY_PATH = os.path.join(GOLDEN_DIR, 'hourly_metrics.json')
+
+# Config overrides of DEFAULT_CONFIG, chosen to hit every branch of the model
+ANNUAL_CONFIGS = {
+    'default': {},
+    'high_tax_short_depreciation': {'tax_rate': 0.4, 'depreciation_years': 5},
+    'no_depreciation': {'depreciation_years': 0},
+    'long_life_low_discount': {'project_lifespan_years': 30, 'discount_rate': 0.04},
+    'peak_heavy_tariff': {'grid_price_peak': 1.6, 'grid_price_valley': 0.3, 'peak_perc': 0.3, 'valley_perc': 0.4},
+    'heat_only': {'annual_elec_kwh': 0, 'annual_cool_kwh': 0},
+    'small_park': {'annual_elec_kwh': 200_000, 'annual_heat_kwh': 100_000, 'annual_cool_kwh': 50_000},
+    'zero_demand': {'annual_elec_kwh': 0, 'annual_heat_kwh': 0, 'annual_cool_kwh': 0},
+}
+SIZINGS = [
+    [0, 0, 0, 0],
+    [1000, 0, 0, 0],
+    [0, 3000, 0, 0],
+    [0, 0, 300, 0],
+    [0, 0, 0, 1000],
+    [500, 2000, 200, 500],
+    [2500, 5000, 1000, 2500],
+    [5000, 10000, 2000, 5000],
+    [150, 9900, 40, 0],
+    [4950, 100, 1990, 4950],
+]
+HOURLY_SIZINGS = [[0, 0, 0, 0], [1000, 3000, 300, 500], [0, 8000, 0, 4000], [3000, 0, 1500, 0]]
+ANNUAL_KEYS = ('total_capex', 'annual_opex_mixed', 'annual_gross_saving', 'payback_period', 'payback_year_num', 'irr', 'irr_value', 'npv_value', 'cash_flows')
+HOURLY_KEYS = ('total_capex', 'annual_grid_cost', 'annual_gross_saving', 'payback_year_num', 'irr_value', 'npv_value')
+
+
+def _plain(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_plain(v) for v in value]
+    return value if isinstance(value, str) else float(value)
+
+
+def build_annual():
+    from efinops.model import calculate_mixed_system_metrics, complete_config
+
+    cases = []
+    for name, overrides in ANNUAL_CONFIGS.items():
+        config = complete_config(overrides)
+        for sizing in SIZINGS:
+            metrics = calculate_mixed_system_metrics(config, *sizing)
+            cases.append({'config': name, 'overrides': overrides, 'sizing': sizing,
+                          'expected': {key: _plain(metrics[key]) for key in ANNUAL_KEYS if key in metrics}})
+    return cases
+
+
+def build_hourly():
+    from efinops.model import MODEL_HOURLY, complete_config, evaluate_model_batch
+
+    config = complete_config()
+    metrics = evaluate_model_batch(config, HOURLY_SIZINGS, MODEL_HOURLY)
+    return [{'config': 'default', 'overrides': {}, 'sizing': sizing,
+             'expected': {**{key: _plain(metrics[key][i]) for key in HOURLY_KEYS},
+                          'dispatch': {key: _plain(value[i]) for key, value in metrics['dispatch'].items()}}}
+            for i, sizing in enumerate(HOURLY_SIZINGS)]
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write(path, cases):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(cases, f, ensure_ascii=False, indent=1) # inf / -inf are stored as Infinity / -Infinity
+        f.write('\n')
+
+
+def _same(want, have, rtol):
+    if isinstance(want, str) or have is None or isinstance(have, str):
+        return want == have
+    want, have = np.asarray(want, dtype=float), np.asarray(have, dtype=float)
+    return want.shape == have.shape and np.allclose(have, want, rtol=rtol, atol=0, equal_nan=True)
+
+
+# Differences between two case lists as readable lines (empty when identical up to rtol)
+def diff_cases(expected_cases, actual_cases, rtol=0.0):
+    lines = []
+    if len(expected_cases) != len(actual_cases):
+        lines.append(f"case count: expected {len(expected_cases)}, got {len(actual_cases)}")
+    for expected, actual in zip(expected_cases, actual_cases):
+        for key, want in expected['expected'].items():
+            have = actual['expected'].get(key)
+            pairs = [(f"{key}.{k}", v, (have or {}).get(k)) for k, v in want.items()] if isinstance(want, dict) else [(key, want, have)]
+            lines.extend(f"{expected['config']} {expected['sizing']} {name}: expected {w!r}, got {h!r}"
+                         for name, w, h in pairs if not _same(w, h, rtol))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or regenerate the golden regression dataset")
+    parser.add_argument('--write', action='store_true', help="overwrite the stored dataset with the current results")
+    parser.add_argument('--rtol', type=float, default=0.0, help="relative tolerance of the check (default: bit-identical)")
+    args = parser.parse_args(argv)
+    datasets = ((ANNUAL_PATH, build_annual()), (HOURLY_PATH, build_hourly()))
+    if args.write:
+        for path, cases in datasets:
+            write(path, cases)
+            print(f"wrote {len(cases)} cases to {path}")
+        return 0
+    failures = [line for path, cases in datasets for line in diff_cases(load(path), cases, args.rtol)]
+    for line in failures:
+        print(line)
+    print(f"{len(failures)} differences")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,390 @@
+# Benchmark suite for the calculation core (asv style: each benchmark is a setup returning a timed body).
+#
+#   python -m benchmarks.run                              # full suite, table on stdout
+#   python -m benchmarks.run --quick -o bench.json        # smaller sizes, results saved as JSON
+#   python -m benchmarks.run --compare bench.json         # exit 1 if anything got slower than --max-slowdown
+#   python -m benchmarks.run --only batch_annual          # benchmarks whose name contains the text
+#
+# Reported per benchmark: median and min wall time of the body over its repeats, throughput where the body
+# evaluates a batch, and the peak traced memory of one extra run (tracemalloc, NumPy buffers included).
+# Optimizer benchmarks also report the time until the proven optimum (branch and bound without time limit)
+# was first evaluated. Correctness is covered separately by the golden dataset (benchmarks/golden.py).
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from efinops.model import (
+    ANNUAL_STAGES,
+    MODEL_HOURLY,
+    calculate_mixed_system_bounds_batch,
+    calculate_mixed_system_metrics,
+    calculate_mixed_system_metrics_batch,
+    calculate_mixed_system_metrics_hourly_display,
+    complete_config,
+    evaluate_model_batch,
+)
+
+CONFIG = complete_config()
+SIZING = (1000.0, 3000.0, 300.0, 500.0)
+SIZING_SCALE = np.array([5000.0, 10000.0, 2000.0, 5000.0])
+BATCH_CHUNK = 100_000 # Largest batch evaluated in one call (bounds the cash-flow matrix of the 1e6 case)
+OPTIMIZER_TIME_BUDGET = 2.0
+
+# name -> (setup, items per body call, repeats, quick repeats or None to skip in --quick, body returns extra metrics)
+BENCHMARKS = {}
+
+
+def benchmark(name, items=None, repeats=5, quick_repeats=3, reports=False):
+    def register(setup):
+        BENCHMARKS[name] = (setup, items, repeats, quick_repeats, reports)
+        return setup
+    return register
+
+
+def random_sizings(n, seed=0):
+    return np.random.default_rng(seed).uniform(0.0, 1.0, (n, 4)) * SIZING_SCALE
+
+
+# --- Single scenario latency ---
+
+@benchmark('scalar_metrics', items=1, repeats=200, quick_repeats=50)
+def setup_scalar_metrics():
+    return lambda: calculate_mixed_system_metrics(CONFIG, *SIZING)
+
+
+@benchmark('hourly_single', items=1, repeats=10)
+def setup_hourly_single():
+    from efinops.hourly import hourly_inputs
+
+    hourly = hourly_inputs(CONFIG)
+    return lambda: calculate_mixed_system_metrics_hourly_display(CONFIG, SIZING, hourly)
+
+
+# --- Batch throughput ---
+
+def _setup_batch(n, compute_irr=True):
+    sizings = random_sizings(n)
+    def body():
+        for start in range(0, n, BATCH_CHUNK):
+            calculate_mixed_system_metrics_batch(CONFIG, sizings[start:start + BATCH_CHUNK], compute_irr)
+    return body
+
+
+benchmark('batch_annual_1e3', items=1_000, repeats=20, quick_repeats=5)(lambda: _setup_batch(1_000))
+benchmark('batch_annual_1e5', items=100_000, repeats=3, quick_repeats=1)(lambda: _setup_batch(100_000))
+benchmark('batch_annual_1e6', items=1_000_000, repeats=1, quick_repeats=None)(lambda: _setup_batch(1_000_000))
+benchmark('batch_annual_npv_only_1e5', items=100_000, repeats=5, quick_repeats=1)(lambda: _setup_batch(100_000, compute_irr=False))
+
+
+@benchmark('irr_solve_1e5', items=100_000, repeats=3, quick_repeats=1)
+def setup_irr_solve():
+    from efinops.irr import solve_irr_batch
+
+    cash_flows = calculate_mixed_system_metrics_batch(CONFIG, random_sizings(100_000), compute_irr=False)['cash_flows']
+    return lambda: solve_irr_batch(cash_flows)
+
+
+@benchmark('pipeline_financial_rerun_1e4', items=10_000, repeats=10, quick_repeats=3)
+def setup_pipeline_financial_rerun():
+    from efinops.pipeline import StagePipeline
+
+    sizings = random_sizings(10_000)
+    pipeline = StagePipeline(ANNUAL_STAGES)
+    calculate_mixed_system_metrics_batch(CONFIG, sizings, pipeline=pipeline)
+    rates = iter(np.linspace(0.03, 0.12, 10_000))
+    return lambda: calculate_mixed_system_metrics_batch({**CONFIG, 'discount_rate': next(rates)}, sizings, pipeline=pipeline)
+
+
+@benchmark('hourly_batch_256', items=256, repeats=3, quick_repeats=1)
+def setup_hourly_batch():
+    from efinops.hourly import hourly_inputs
+
+    hourly = hourly_inputs(CONFIG)
+    sizings = random_sizings(256)
+    return lambda: evaluate_model_batch(CONFIG, sizings, MODEL_HOURLY, hourly=hourly)
+
+
+# --- Analyses built on the core ---
+
+@benchmark('monte_carlo_20k', items=20_000, repeats=3, quick_repeats=1)
+def setup_monte_carlo():
+    from efinops.montecarlo import run_monte_carlo, triangular_spread
+
+    distributions = triangular_spread(CONFIG, 0.2)
+    return lambda: run_monte_carlo(CONFIG, SIZING, distributions, n_draws=20_000)
+
+
+@benchmark('tornado', items=1, repeats=10, quick_repeats=3)
+def setup_tornado():
+    from efinops.sensitivity import tornado
+
+    return lambda: tornado(CONFIG, SIZING)
+
+
+@benchmark('portfolio_50_parks', items=50, repeats=3, quick_repeats=1)
+def setup_portfolio():
+    from efinops.portfolio import Portfolio
+
+    rng = np.random.default_rng(1)
+    configs = [{'annual_elec_kwh': rng.uniform(1e5, 2e7), 'annual_heat_kwh': rng.uniform(1e5, 1e7), 'discount_rate': rng.uniform(0.04, 0.1)}
+               for _ in range(50)]
+    return lambda: Portfolio(configs).allocate(20_000_000)
+
+
+@benchmark('chargeback_5000_meters', items=5000, repeats=3, quick_repeats=1)
+def setup_chargeback():
+    import pandas as pd
+
+    from efinops.chargeback import chargeback
+    from efinops.hourly import synthetic_profiles
+
+    rng = np.random.default_rng(2)
+    n = 5000
+    carriers = rng.choice(['elec', 'heat', 'cool'], n, p=[0.6, 0.25, 0.15])
+    profiles = synthetic_profiles(CONFIG)
+    shapes = {'elec': profiles['elec_load'], 'heat': profiles['heat_load'], 'cool': profiles['cool_load']}
+    hourly = np.stack([shapes[c] / shapes[c].sum() * rng.uniform(1e3, 5e5) for c in carriers]).astype(np.float32)
+    meters = pd.DataFrame({'meter_id': [f"m{i}" for i in range(n)], 'carrier': carriers, 'zone': rng.choice(['A', 'B', 'C'], n)})
+    hierarchy = pd.DataFrame({'meter_id': meters['meter_id'], 'tenant': [f"t{i % 200}" for i in range(n)]})
+    meter_data = {'meters': meters.astype('category'), 'hourly_kwh': hourly}
+    return lambda: chargeback(CONFIG, meter_data, SIZING, hierarchy)
+
+
+@benchmark('storage_dispatch_32_sizes', items=32, repeats=3, quick_repeats=1)
+def setup_storage_dispatch():
+    from efinops.hourly import hourly_inputs
+    from efinops.storage import optimal_storage_dispatch
+
+    rng = np.random.default_rng(3)
+    hourly = hourly_inputs(CONFIG)
+    capacities = np.linspace(100.0, 3200.0, 32)
+    # Metered-style load: every day differs, so no window is shared and each size costs a full solve
+    net_load = np.repeat((hourly['profiles']['elec_load'] * rng.uniform(0.7, 1.3, 8760))[:, None], len(capacities), axis=1)
+    return lambda: optimal_storage_dispatch(CONFIG, net_load, 0.0, hourly['prices'], hourly['periods'], capacities)
+
+
+# --- Optimizer time-to-optimum ---
+
+_reference_optimum = {}
+
+
+def _proven_optimum(objective):
+    from efinops.optimize import optimize
+
+    if objective not in _reference_optimum:
+        result = optimize(CONFIG, objective, lambda sizings: calculate_mixed_system_metrics_batch(CONFIG, sizings, objective == 'irr'),
+                          lambda lower, upper: calculate_mixed_system_bounds_batch(CONFIG, lower, upper),
+                          method='branch_and_bound', time_budget=600.0, record_candidates=False)
+        _reference_optimum[objective] = result['best_score']
+    return _reference_optimum[objective]
+
+
+def _setup_optimizer(method, objective):
+    from efinops.optimize import objective_scores, optimize
+
+    optimum = _proven_optimum(objective)
+    def body():
+        state = {'start': time.perf_counter(), 'reached': None}
+        def evaluate(sizings):
+            metrics = calculate_mixed_system_metrics_batch(CONFIG, sizings, objective == 'irr')
+            if state['reached'] is None and np.max(objective_scores(objective, metrics, CONFIG)) >= optimum - 1e-9 * abs(optimum):
+                state['reached'] = time.perf_counter() - state['start']
+            return metrics
+        result = optimize(CONFIG, objective, evaluate, lambda lower, upper: calculate_mixed_system_bounds_batch(CONFIG, lower, upper),
+                          method=method, time_budget=OPTIMIZER_TIME_BUDGET, record_candidates=False)
+        return {'time_to_optimum_s': state['reached'], 'found_optimum': state['reached'] is not None,
+                'evaluations': result['evaluations'], 'exhaustive': result['exhaustive']}
+    return body
+
+
+for _method in ('grid', 'adaptive_grid', 'coordinate_descent', 'branch_and_bound', 'hybrid'):
+    for _objective in ('npv', 'irr'):
+        benchmark(f'optimizer_{_method}_{_objective}', repeats=1, quick_repeats=1 if _method == 'hybrid' else None, reports=True)(
+            lambda method=_method, objective=_objective: _setup_optimizer(method, objective))
+
+
+# Re-optimization of the hourly model after a unit-cost edit, warm-started from a cold search of the same park
+@benchmark('optimizer_warm_reoptimize_hourly', repeats=3, quick_repeats=1, reports=True)
+def setup_warm_reoptimize():
+    from efinops.hourly import hourly_inputs
+    from efinops.warmstart import CandidateMemory, warm_optimize
+
+    hourly = hourly_inputs(CONFIG)
+    memory = CandidateMemory()
+    def search(config):
+        return warm_optimize(config, 'npv', lambda sizings: evaluate_model_batch(config, sizings, MODEL_HOURLY, False, hourly), memory,
+                             time_budget=OPTIMIZER_TIME_BUDGET, record_candidates=False)
+    search(CONFIG)
+    costs = iter(np.linspace(1000.0, 1400.0, 100))
+    def body():
+        result = search({**CONFIG, 'storage_cost_kwh': next(costs)})
+        return {key: result['warm'][key] for key in ('rescored', 'reused', 'model_evaluations')}
+    return body
+
+
+# --- Scenario store ---
+
+# Bulk insert of 100k evaluated scenarios (one large annual search) into a fresh store, then a top-20 query
+def _store_directory():
+    import atexit
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp(prefix='efinops-bench-')
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+
+def _store_scenarios(n):
+    sizings = np.unique(np.round(random_sizings(n) / 10.0) * 10.0, axis=0)
+    return sizings, calculate_mixed_system_metrics_batch(CONFIG, sizings, False)
+
+
+@benchmark('scenario_store_insert_100k', items=100_000, repeats=3, quick_repeats=1)
+def setup_scenario_store_insert():
+    from efinops.scenario_store import ScenarioStore
+
+    directory = _store_directory()
+    sizings, metrics = _store_scenarios(100_000)
+    runs = iter(range(1_000))
+    return lambda: ScenarioStore(os.path.join(directory, f"store-{next(runs)}.sqlite")).insert(CONFIG, 'annual', sizings, metrics)
+
+
+@benchmark('scenario_store_top_20_under_capex', items=1, repeats=50, quick_repeats=10)
+def setup_scenario_store_top():
+    from efinops.scenario_store import ScenarioStore
+
+    store = ScenarioStore(os.path.join(_store_directory(), 'store.sqlite'))
+    sizings, metrics = _store_scenarios(100_000)
+    store.insert(CONFIG, 'annual', sizings, metrics, park='bench')
+    return lambda: store.top('npv_value', 20, config=CONFIG, park='bench', max_capex=5e6)
+
+
+# --- Operate monitoring ---
+
+# A day of 1-minute readings of 5000 meters (7.2M readings) through a monitor seeded from their hourly profiles
+@benchmark('monitor_5000_meters_1_day', items=5000 * 1440, repeats=3, quick_repeats=1)
+def setup_monitor():
+    import pandas as pd
+
+    from efinops.hourly import synthetic_profiles
+    from efinops.monitor import MeterMonitor, synthetic_feed
+
+    rng = np.random.default_rng(0)
+    load = synthetic_profiles(CONFIG)['elec_load']
+    n_meters = 5000
+    meter_data = {
+        'meters': pd.DataFrame({'meter_id': pd.Categorical([f"M{i}" for i in range(n_meters)])}),
+        'hourly_kwh': (rng.uniform(1.0, 50.0, (n_meters, 1)) * load / load.mean()).astype(np.float32),
+        'year': 2024,
+    }
+    feed = list(synthetic_feed(meter_data, start_day=38, days=1))
+
+    def run():
+        monitor = MeterMonitor(CONFIG)
+        monitor.seed(meter_data, day=38)
+        for chunk in feed:
+            monitor.process(chunk)
+    return run
+
+
+# --- Runner ---
+
+def run_benchmark(name, quick=False):
+    setup, items, repeats, quick_repeats, reports = BENCHMARKS[name]
+    body = setup()
+    repeats = quick_repeats if quick else repeats
+    times = []
+    extra = {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = body()
+        if reports:
+            extra = value
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    body()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    median = statistics.median(times)
+    result = {'median_s': median, 'min_s': min(times), 'repeats': repeats, 'peak_mem_mb': peak / 2**20}
+    if items:
+        result.update({'items': items, 'items_per_s': items / median})
+    result.update(extra)
+    return result
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def format_row(name, result):
+    throughput = f"{result['items_per_s']:>14,.0f}/s" if 'items_per_s' in result else ' ' * 16
+    line = f"{name:<36} {result['median_s'] * 1e3:>11.3f} ms {throughput} {result['peak_mem_mb']:>9.1f} MB"
+    if 'time_to_optimum_s' in result:
+        reached = f"{result['time_to_optimum_s']:.3f} s" if result['found_optimum'] else "not reached"
+        line += f"  optimum: {reached}"
+    return line
+
+
+# Ratios new / old median time; returns (lines, names slower than max_slowdown)
+def compare(results, baseline, max_slowdown):
+    lines, slower = [], []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median_s'] / baseline[name]['median_s']
+        flag = ''
+        if ratio > max_slowdown:
+            slower.append(name)
+            flag = '  SLOWER'
+        lines.append(f"{name:<36} {ratio:>6.2f}x{flag}")
+    return lines, slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the E-FinOps calculation core")
+    parser.add_argument('--quick', action='store_true', help="fewer repeats; skips the 1e6 batch and most optimizer runs")
+    parser.add_argument('--only', default=None, help="run benchmarks whose name contains this text")
+    parser.add_argument('-o', '--output', default=None, help="write results as JSON")
+    parser.add_argument('--compare', default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument('--max-slowdown', type=float, default=1.25, help="allowed median time ratio in --compare")
+    args = parser.parse_args(argv)
+
+    names = [name for name, (_, _, _, quick_repeats, _) in BENCHMARKS.items()
+             if (not args.quick or quick_repeats is not None) and (args.only is None or args.only in name)]
+    results = {}
+    print(f"{'benchmark':<36} {'median':>14} {'throughput':>16} {'peak mem':>12}")
+    for name in names:
+        results[name] = run_benchmark(name, args.quick)
+        print(format_row(name, results[name]), flush=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment(), 'quick': args.quick, 'results': results}, f, indent=1)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            lines, slower = compare(results, json.load(f)['results'], args.max_slowdown)
+        print()
+        print('\n'.join(lines))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
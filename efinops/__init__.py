@@ -0,0 +1,44 @@
+# E-FinOps calculation engines (importable without Streamlit)
+# The public calculation API is re-exported lazily: `import efinops` loads nothing heavy, and each name
+# imports its submodule (and NumPy) on first access.
+import importlib
+
+_EXPORTS = {
+    'DEFAULT_CONFIG': 'efinops.model',
+    'MODEL_ANNUAL': 'efinops.model',
+    'MODEL_HOURLY': 'efinops.model',
+    'complete_config': 'efinops.model',
+    'calculate_avg_tou_price': 'efinops.model',
+    'calculate_baseline_annual_cost': 'efinops.model',
+    'calculate_mixed_system_metrics': 'efinops.model',
+    'calculate_mixed_system_metrics_batch': 'efinops.model',
+    'calculate_mixed_system_bounds_batch': 'efinops.model',
+    'evaluate_model_batch': 'efinops.model',
+    'optimize': 'efinops.optimize',
+    'pareto_optimize': 'efinops.pareto',
+    'warm_optimize': 'efinops.warmstart',
+    'compile_tariff': 'efinops.tariff',
+    'sensitivity_grid': 'efinops.sensitivity',
+    'tornado': 'efinops.sensitivity',
+    'run_monte_carlo': 'efinops.montecarlo',
+    'Portfolio': 'efinops.portfolio',
+    'chargeback': 'efinops.chargeback',
+    'JobRunner': 'efinops.jobs',
+    'ScenarioStore': 'efinops.scenario_store',
+    'MeterMonitor': 'efinops.monitor',
+    'solve_irr_batch': 'efinops.irr',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'efinops' has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,5 @@
+import sys
+
+from efinops.cli import main
+
+sys.exit(main())
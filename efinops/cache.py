@@ -0,0 +1,145 @@
+# Memoization for scenario evaluations.
+# Results are keyed on a stable hash of the config dict plus the sizing tuple, so a slider position that
+# was already evaluated under the same config is served from memory instead of being recomputed.
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from efinops.instrument import count
+
+
+# Stable across processes and Python runs (unlike hash()): JSON with sorted keys, then SHA-256.
+# Numbers are hashed as floats, so 5, 5.0 and NumPy scalars of the same value give the same hash.
+def config_hash(config):
+    payload = json.dumps(_canonical(config), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+# JSON-ready copy of a config value: numbers as floats, arrays and tuples as lists
+def _canonical(value):
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray) and value.dtype.kind in 'iuf':
+        return value.astype(float).tolist()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        if all(type(item) is float for item in value): # Long price vectors skip the per-item conversion
+            return list(value)
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    return value
+
+
+# Content hash of a dict of NumPy arrays (e.g. metered load profiles), for use as a config value
+def arrays_hash(arrays):
+    digest = hashlib.sha256()
+    for key in sorted(arrays):
+        digest.update(key.encode('utf-8'))
+        digest.update(np.ascontiguousarray(arrays[key]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# Sizing tuple normalized to floats so 100 and 100.0 (or numpy scalars) hit the same entry
+def sizing_key(sizing):
+    return tuple(float(v) for v in sizing)
+
+
+# Bounded LRU cache with hit/miss counters, shared by Streamlit script threads and job threads.
+# Entries are guarded by a lock; compute() runs outside it under a per-key lock, so a value is computed
+# once per key while lookups of other keys go on.
+# name: when given, lookups are also counted in efinops.instrument as cache_lookups{cache=name, result=hit|miss}
+class ScenarioCache:
+    def __init__(self, maxsize=1024, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._computing = {} # key -> lock held while the key's value is computed
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    # Cached value and True, or (None, False); counts the lookup (a hit marks the entry as recently used).
+    # Called with the lock held.
+    def _lookup(self, key):
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key], True
+        self.misses += 1
+        return None, False
+
+    def _count(self, found):
+        if self.name is not None:
+            count('cache_lookups', cache=self.name, result='hit' if found else 'miss')
+
+    # Return the cached value for key, computing (and storing) it with compute() on a miss. Concurrent
+    # misses of one key wait for the first compute() instead of running their own.
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                value, _ = self._lookup(key)
+                guard = None
+            else:
+                guard = self._computing.setdefault(key, threading.Lock())
+        if guard is None:
+            self._count(True)
+            return value
+        with guard:
+            with self._lock:
+                value, found = self._lookup(key) # Another thread may have computed it while this one waited
+            self._count(found)
+            if found:
+                return value
+            try:
+                value = compute()
+                self.put(key, value)
+            finally:
+                with self._lock:
+                    if self._computing.get(key) is guard:
+                        del self._computing[key]
+        return value
+
+    # Cached value of key (marked as recently used), or None; for callers that compute missing values in batches
+    def peek(self, key):
+        with self._lock:
+            value, found = self._lookup(key)
+        self._count(found)
+        return value
+
+    # Store a value (replacing any entry of the key), evicting the least recently used entry when full
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    # Drop all entries (counters are kept so hit rates stay meaningful across config edits)
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        lookups = hits + misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,263 @@
+# Tenant / department / device cost allocation (chargeback) from metered hourly data ("人人有责").
+# Every demand meter is charged what its energy would cost from the grid hour by hour (heat and cooling
+# converted to grid electricity with the baseline COP / EER, priced with the TOU vector), minus its share of
+# the savings of the shared assets, plus its share of their annualized cost. Savings and asset costs form two
+# pools, each split by its own rule:
+#   pv_storage - PV and storage (hourly grid-import reduction beyond the thermal assets), all demand meters
+#   thermal    - solar thermal and heat pump (reduction from baseline to the thermal-only dispatch), heat and
+#                cooling meters
+# Pool savings per hour come from one batched hourly dispatch of [thermal-only sizing, full sizing].
+#
+# Meters are processed in chunks with a single matrix product per chunk: hourly kWh (meters x 8760) times a
+# (8760 x k) matrix whose columns sum energy, baseline cost and each pool's per-kWh share into months, so
+# thousands of meters need no per-meter Python work.
+import numpy as np
+import pandas as pd
+
+from efinops.hourly import hourly_inputs, simulate_dispatch_batch
+from efinops.ingest import CARRIER_COOL, CARRIER_ELEC, CARRIER_HEAT, CARRIER_TARGETS, annual_totals, load_profiles
+from efinops.instrument import timer
+from efinops.tariff import HOURS_PER_YEAR, MONTH_OF_HOUR, MONTHS
+
+POOL_PV_STORAGE = 'pv_storage'
+POOL_THERMAL = 'thermal'
+POOLS = (POOL_PV_STORAGE, POOL_THERMAL)
+# Carriers whose meters share each pool
+POOL_CARRIERS = {
+    POOL_PV_STORAGE: (CARRIER_ELEC, CARRIER_HEAT, CARRIER_COOL),
+    POOL_THERMAL: (CARRIER_HEAT, CARRIER_COOL),
+}
+# Sizing columns (efinops.finance.SIZING_COLUMNS order) whose CAPEX belongs to each pool
+POOL_SIZING = {POOL_PV_STORAGE: (1, 3), POOL_THERMAL: (0, 2)}
+
+# Allocation rules; every rule splits a pool among the pool's meters only
+RULE_HOURLY_ENERGY = 'hourly_energy' # Each hour's amount by the meters' grid-equivalent kWh in that hour
+RULE_ANNUAL_ENERGY = 'annual_energy' # By annual grid-equivalent kWh
+RULE_BASELINE_COST = 'baseline_cost' # By annual baseline (pure grid) cost
+RULE_FIXED = 'fixed'                 # Contract shares per group of the first hierarchy level, by energy within a group
+ALLOCATION_RULES = (RULE_HOURLY_ENERGY, RULE_ANNUAL_ENERGY, RULE_BASELINE_COST, RULE_FIXED)
+
+HIERARCHY_LEVELS = ('tenant', 'department', 'zone', 'device') # Default levels, where present
+CHARGEBACK_CHUNK_METERS = 1024 # Meters per matrix product (a float64 chunk of 1024 x 8760 is about 72 MB)
+
+AMOUNT_COLUMNS = ('energy_kwh', 'grid_kwh', 'baseline_cost', 'pv_storage_saving', 'thermal_saving', 'asset_cost', 'net_cost')
+
+
+# Capital recovery factor: annual payment that repays 1 over `years` at `rate`
+def capital_recovery_factor(rate, years):
+    if years <= 0:
+        return 0.0
+    return 1.0 / years if rate == 0 else rate / (1 - (1 + rate) ** -years)
+
+
+# Annualized CAPEX (capital recovery over the project life at the discount rate) plus OPEX of each pool's assets
+def pool_asset_costs(config, sizing):
+    unit_costs = np.array([config['st_cost_m2'], config['pv_cost_m2'], config['hp_cost_kw'], config['storage_cost_kwh']])
+    capex = np.asarray(sizing, dtype=float) * unit_costs
+    factor = capital_recovery_factor(config['discount_rate'], config['project_lifespan_years']) + config['opex_percentage']
+    return {pool: float(capex[list(columns)].sum() * factor) for pool, columns in POOL_SIZING.items()}
+
+
+# Hourly saving (¥) of each pool for the park, and the park totals they derive from.
+# The load profiles are the metered ones, unscaled (carriers without meters count as zero load).
+def pool_savings(config, meter_data, sizing):
+    totals = {config_key: 0.0 for config_key, _ in CARRIER_TARGETS.values()}
+    totals.update(annual_totals(meter_data))
+    park_config = {**config, **totals}
+    hourly = hourly_inputs(park_config, load_profiles(meter_data))
+    profiles, prices = hourly['profiles'], hourly['prices']
+    st_area, pv_area, hp_capacity_kw, storage_capacity_kwh = (float(value) for value in sizing)
+    dispatch = simulate_dispatch_batch(park_config, profiles, prices, hourly['periods'],
+                                       [[st_area, 0.0, hp_capacity_kw, 0.0], [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh]],
+                                       keep_hourly=True)
+    thermal_import, mixed_import = dispatch['grid_import']
+    baseline_import = profiles['elec_load'] + profiles['heat_load'] / config['grid_avg_cop'] + profiles['cool_load'] / config['grid_avg_eer']
+    return {
+        'prices': prices,
+        'savings': {
+            POOL_THERMAL: (baseline_import - thermal_import) * prices,
+            POOL_PV_STORAGE: (thermal_import - mixed_import) * prices,
+        },
+        'baseline_cost': float(baseline_import @ prices),
+        'mixed_grid_cost': float(mixed_import @ prices),
+    }
+
+
+# Per-meter table: meter metadata joined with the optional hierarchy (meter_id plus e.g. tenant / department)
+def _meter_table(meter_data, hierarchy):
+    meters = meter_data['meters'].drop(columns=['coverage'], errors='ignore').copy()
+    meters['meter_id'] = meters['meter_id'].astype(str)
+    if hierarchy is not None:
+        hierarchy = pd.DataFrame(hierarchy).copy()
+        hierarchy['meter_id'] = hierarchy['meter_id'].astype(str)
+        meters = meters.drop(columns=[c for c in hierarchy.columns if c != 'meter_id' and c in meters.columns])
+        meters = meters.merge(hierarchy.drop_duplicates('meter_id'), on='meter_id', how='left')
+    meters['carrier'] = meters['carrier'].astype(str)
+    return meters
+
+
+# Monthly sums of the columns of hourly (meters x 8760) kWh weighted by each row of `weights` (k x 8760):
+# returns (meters x k x 12), computed as one matrix product per chunk of meters
+def _monthly_products(hourly_kwh, weights, rows, chunk_meters):
+    month_matrix = np.zeros((HOURS_PER_YEAR, MONTHS))
+    month_matrix[np.arange(HOURS_PER_YEAR), MONTH_OF_HOUR] = 1.0
+    operator = (weights[:, :, None] * month_matrix[None, :, :]).transpose(1, 0, 2).reshape(HOURS_PER_YEAR, -1)
+    result = np.empty((len(rows), len(weights) * MONTHS))
+    for start in range(0, len(rows), chunk_meters):
+        chunk = rows[start:start + chunk_meters]
+        result[start:start + len(chunk)] = np.asarray(hourly_kwh[chunk], dtype=np.float64) @ operator
+    return result.reshape(len(rows), len(weights), MONTHS)
+
+
+# Hourly sum over the given meter rows of hourly kWh x row_weights (8760,), chunked like _monthly_products
+def _weighted_hourly_sum(hourly_kwh, rows, row_weights, chunk_meters):
+    total = np.zeros(HOURS_PER_YEAR)
+    for start in range(0, len(rows), chunk_meters):
+        total += row_weights[start:start + chunk_meters] @ np.asarray(hourly_kwh[rows[start:start + chunk_meters]], dtype=np.float64)
+    return total
+
+
+def _month_totals(hourly):
+    return np.bincount(MONTH_OF_HOUR, weights=hourly, minlength=MONTHS)
+
+
+# Annual share of every meter in a pool under an annual rule (zero for meters outside the pool)
+def _annual_shares(rule, eligible, grid_kwh, baseline_cost, meters, level, fixed_shares):
+    if rule == RULE_ANNUAL_ENERGY:
+        weights = grid_kwh * eligible
+    elif rule == RULE_BASELINE_COST:
+        weights = baseline_cost * eligible
+    elif rule == RULE_FIXED:
+        if level is None or not fixed_shares:
+            raise ValueError("The fixed rule needs a hierarchy level and fixed_shares {group: share}")
+        groups = meters[level].astype(str).to_numpy()
+        codes, names = pd.factorize(groups)
+        energy = grid_kwh * eligible
+        group_energy = np.bincount(codes, weights=energy, minlength=len(names))
+        contract = np.array([float(fixed_shares.get(name, 0.0)) for name in names])
+        contract = np.where(group_energy > 0, contract, 0.0) # A group without consumption in the pool gets nothing
+        if contract.sum() <= 0:
+            raise ValueError("fixed_shares do not cover any consuming group")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = np.nan_to_num(contract[codes] / contract.sum() * energy / group_energy[codes])
+    else:
+        raise ValueError(f"Unknown allocation rule: {rule}")
+    total = weights.sum()
+    return weights / total if total > 0 else np.zeros_like(weights)
+
+
+# Chargeback of a park for one installed sizing [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh].
+# meter_data: efinops.ingest result; hierarchy: optional table of meter_id plus level columns (e.g. tenant,
+# department); rules: {pool: rule}, default hourly_energy; fixed_shares: {pool: {group of levels[0]: share}}.
+# Returns:
+#   meters   - DataFrame per demand meter: meter_id, carrier, levels, AMOUNT_COLUMNS (annual, ¥ and kWh)
+#   monthly  - the same amounts per meter and month (long table with a 'month' column, 1..12)
+#   pools    - per pool: rule, saving and asset_cost totals
+#   park     - baseline_cost, mixed_grid_cost, asset_cost and net_cost of the park
+#   levels   - hierarchy levels available for rollup
+# Net costs add up to the park's mixed-system grid cost plus the asset cost.
+def chargeback(config, meter_data, sizing=(0.0, 0.0, 0.0, 0.0), hierarchy=None, levels=None, rules=None, fixed_shares=None,
+               include_asset_cost=True, chunk_meters=CHARGEBACK_CHUNK_METERS):
+    rules = {**{pool: RULE_HOURLY_ENERGY for pool in POOLS}, **(rules or {})}
+    fixed_shares = fixed_shares or {}
+    with timer('chargeback'):
+        meters = _meter_table(meter_data, hierarchy)
+        levels = [level for level in (levels or HIERARCHY_LEVELS) if level in meters.columns]
+        carriers = meters['carrier'].to_numpy()
+        rows = np.flatnonzero(np.isin(carriers, list(CARRIER_TARGETS)))
+        meters = meters.iloc[rows].reset_index(drop=True)
+        carriers = carriers[rows]
+        # Grid electricity per metered kWh under the baseline (pure grid) supply
+        to_grid = np.select([carriers == CARRIER_HEAT, carriers == CARRIER_COOL],
+                            [1.0 / config['grid_avg_cop'], 1.0 / config['grid_avg_eer']], 1.0)
+
+        park = pool_savings(config, meter_data, sizing)
+        asset_costs = pool_asset_costs(config, sizing) if include_asset_cost else {pool: 0.0 for pool in POOLS}
+        hourly_asset = {pool: np.full(HOURS_PER_YEAR, cost / HOURS_PER_YEAR) for pool, cost in asset_costs.items()}
+        eligible = {pool: np.isin(carriers, POOL_CARRIERS[pool]) for pool in POOLS}
+
+        # Pool amounts per grid-equivalent kWh of the pool's meters, hour by hour (hourly_energy rule)
+        hourly_meter_kwh = meter_data['hourly_kwh']
+        pool_grid_kwh = {pool: _weighted_hourly_sum(hourly_meter_kwh, rows, to_grid * eligible[pool], chunk_meters) for pool in POOLS}
+        weights = [np.ones(HOURS_PER_YEAR), park['prices']]
+        for pool in POOLS:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                per_kwh = np.where(pool_grid_kwh[pool] > 0, 1.0 / pool_grid_kwh[pool], 0.0)
+            weights += [park['savings'][pool] * per_kwh, hourly_asset[pool] * per_kwh]
+        monthly = _monthly_products(hourly_meter_kwh, np.array(weights), rows, chunk_meters)
+
+        energy = monthly[:, 0]
+        grid_kwh = energy * to_grid[:, None]
+        baseline_cost = monthly[:, 1] * to_grid[:, None]
+        annual_grid_kwh = grid_kwh.sum(axis=1)
+        annual_baseline_cost = baseline_cost.sum(axis=1)
+
+        allocated = {}
+        for p, pool in enumerate(POOLS):
+            pool_monthly = {'saving': _month_totals(park['savings'][pool]), 'asset_cost': _month_totals(hourly_asset[pool])}
+            fallback = _annual_shares(RULE_ANNUAL_ENERGY, eligible[pool], annual_grid_kwh, annual_baseline_cost, meters, None, None)
+            if rules[pool] == RULE_HOURLY_ENERGY:
+                shares = None
+                hourly_allocated = {'saving': monthly[:, 2 + 2 * p] * to_grid[:, None] * eligible[pool][:, None],
+                                    'asset_cost': monthly[:, 3 + 2 * p] * to_grid[:, None] * eligible[pool][:, None]}
+            else:
+                shares = _annual_shares(rules[pool], eligible[pool], annual_grid_kwh, annual_baseline_cost, meters,
+                                        levels[0] if levels else None, fixed_shares.get(pool))
+            for component, totals in pool_monthly.items():
+                if shares is None:
+                    # Hours in which no meter of the pool consumed are spread by annual energy
+                    values = hourly_allocated[component] + fallback[:, None] * (totals - hourly_allocated[component].sum(axis=0))[None, :]
+                else:
+                    values = shares[:, None] * totals[None, :]
+                allocated[(pool, component)] = values
+
+        amounts = {
+            'energy_kwh': energy,
+            'grid_kwh': grid_kwh,
+            'baseline_cost': baseline_cost,
+            'pv_storage_saving': allocated[(POOL_PV_STORAGE, 'saving')],
+            'thermal_saving': allocated[(POOL_THERMAL, 'saving')],
+            'asset_cost': allocated[(POOL_PV_STORAGE, 'asset_cost')] + allocated[(POOL_THERMAL, 'asset_cost')],
+        }
+        amounts['net_cost'] = amounts['baseline_cost'] - amounts['pv_storage_saving'] - amounts['thermal_saving'] + amounts['asset_cost']
+
+        info = meters[['meter_id', 'carrier'] + levels]
+        annual = info.copy()
+        for column in AMOUNT_COLUMNS:
+            annual[column] = amounts[column].sum(axis=1)
+        monthly_table = info.loc[np.repeat(np.arange(len(info)), MONTHS)].reset_index(drop=True)
+        monthly_table.insert(len(info.columns), 'month', np.tile(np.arange(1, MONTHS + 1), len(info)))
+        for column in AMOUNT_COLUMNS:
+            monthly_table[column] = amounts[column].ravel()
+
+    return {
+        'meters': annual,
+        'monthly': monthly_table,
+        'pools': {pool: {'rule': rules[pool], 'saving': float(park['savings'][pool].sum()), 'asset_cost': asset_costs[pool]} for pool in POOLS},
+        'park': {
+            'baseline_cost': park['baseline_cost'],
+            'mixed_grid_cost': park['mixed_grid_cost'],
+            'asset_cost': float(sum(asset_costs.values())),
+            'net_cost': park['mixed_grid_cost'] + float(sum(asset_costs.values())),
+        },
+        'levels': levels,
+    }
+
+
+# Chargeback table summed over hierarchy levels (e.g. ['tenant'] or ['tenant', 'department']), with each
+# group's share of the total net cost. Works on both the 'meters' and the 'monthly' table.
+def rollup(table, levels, by_month=False):
+    keys = list(levels) + (['month'] if by_month else [])
+    columns = [column for column in AMOUNT_COLUMNS if column in table.columns]
+    grouped = table.groupby(keys, observed=True, dropna=False, sort=True)[columns].sum().reset_index()
+    grouped.insert(len(keys), 'meters', table.groupby(keys, observed=True, dropna=False, sort=True).size().to_numpy())
+    total = grouped['net_cost'].sum()
+    grouped['net_cost_share'] = grouped['net_cost'] / total if total else 0.0
+    return grouped
+
+
+# Monthly close: chargeback of one month (1..12) rolled up to the given levels
+def monthly_close(result, month, levels=None):
+    levels = result['levels'] if levels is None else levels
+    monthly = result['monthly']
+    return rollup(monthly[monthly['month'] == month], levels)
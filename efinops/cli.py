@@ -0,0 +1,264 @@
+# Command-line batch mode: evaluate or optimize many parks without a browser session.
+#
+#   python -m efinops evaluate parks.csv -o metrics.csv
+#   python -m efinops optimize parks.json -o best.json --objective npv --time-budget 2 --workers 8
+#   python -m efinops portfolio parks.csv --budget 5000000 --rank-by npv
+#   python -m efinops optimize parks.csv --metrics-out run.prom   # timings and counters (.prom/.txt or .json)
+#
+# The input holds one flat record per park (CSV rows, a JSON list, {"parks": [...]}, a JSON object keyed by
+# park name, or JSON Lines): 'park' names the park, st_area / pv_area / hp_capacity_kw / storage_capacity_kwh
+# give the sizing to evaluate (default 0), and every other key overrides a value of DEFAULT_CONFIG.
+# With --model hourly and --profile-store, parks found in the profile store use their metered load profiles
+# (latest year, or the record's 'profile_year') and metered annual totals unless the record overrides them.
+#
+# Only the standard library is imported at startup; NumPy and the engines are loaded when a command runs.
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+
+SIZING_KEYS = ('st_area', 'pv_area', 'hp_capacity_kw', 'storage_capacity_kwh') # efinops.finance.SIZING_COLUMNS
+RECORD_KEYS = ('park', 'profile_year')
+METRIC_KEYS = ('total_capex', 'annual_opex_mixed', 'annual_gross_saving', 'payback_year_num', 'irr_value', 'npv_value')
+OPTIMIZE_KEYS = ('objective', 'method', 'evaluations', 'elapsed_s', 'exhaustive')
+PORTFOLIO_KEYS = ('rank', 'funded', 'cumulative_capex')
+
+
+# --- Input ---
+
+def _parse_scalar(value):
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    for parse in (int, float):
+        try:
+            return parse(text)
+        except ValueError:
+            pass
+    return text
+
+
+# text: file contents; file_format: 'csv', 'json' or 'jsonl'
+def parse_park_records(text, file_format):
+    if file_format == 'csv':
+        records = [{key: _parse_scalar(value) for key, value in row.items() if value not in (None, '')}
+                   for row in csv.DictReader(io.StringIO(text.lstrip('\ufeff')))]
+    elif file_format == 'jsonl':
+        records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+        if isinstance(data, dict) and 'parks' in data:
+            records = data['parks']
+        elif isinstance(data, dict):
+            records = [{'park': name, **record} for name, record in data.items()]
+        else:
+            records = data
+    for i, record in enumerate(records):
+        record.setdefault('park', f"park_{i + 1}")
+    return records
+
+
+def read_park_records(path):
+    file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl' if path.lower().endswith('.jsonl') else 'json'
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return parse_park_records(f.read(), file_format)
+
+
+# --- Per-park work (top level so it can run in worker processes) ---
+
+def _park_inputs(record, model, profile_store):
+    from efinops.model import DEFAULT_CONFIG, MODEL_HOURLY, complete_config
+
+    overrides = {key: value for key, value in record.items() if key not in RECORD_KEYS and key not in SIZING_KEYS}
+    if isinstance(overrides.get('tariff'), str):
+        overrides['tariff'] = json.loads(overrides['tariff']) # CSV cell holding a tariff definition as JSON
+    unknown = sorted(set(overrides) - set(DEFAULT_CONFIG))
+    if unknown:
+        raise ValueError(f"unknown config keys: {', '.join(unknown)}")
+
+    load_profiles = None
+    if model == MODEL_HOURLY and profile_store:
+        from efinops.ingest import annual_totals, load_profiles as metered_load_profiles
+        from efinops.profile_store import ProfileStore
+
+        store = ProfileStore(profile_store)
+        years = store.years(record['park'])
+        if years:
+            meter_data = store.get(record['park'], record.get('profile_year', years[-1]))
+            load_profiles = metered_load_profiles(meter_data)
+            overrides = {**annual_totals(meter_data), **overrides}
+    sizing = [float(record.get(key, 0.0)) for key in SIZING_KEYS]
+    return complete_config(overrides), sizing, load_profiles
+
+
+def _metric_row(metrics, i):
+    return {key: float(metrics[key][i]) if metrics.get(key) is not None else None for key in METRIC_KEYS}
+
+
+def run_park(task):
+    record, command, options = task
+    from efinops.hourly import hourly_inputs
+    from efinops.model import MODEL_ANNUAL, calculate_mixed_system_bounds_batch, evaluate_model_batch
+
+    row = {'park': record['park'], 'model': options['model'], 'status': 'ok', 'error': ''}
+    try:
+        config, sizing, load_profiles = _park_inputs(record, options['model'], options.get('profile_store'))
+        hourly = None if options['model'] == MODEL_ANNUAL else hourly_inputs(config, load_profiles)
+        if command == 'optimize':
+            from efinops.optimize import optimize
+
+            result = optimize(
+                config, options['objective'],
+                evaluate_batch=lambda sizings: evaluate_model_batch(config, sizings, options['model'], options['objective'] == 'irr', hourly),
+                bound_batch=(lambda lower, upper: calculate_mixed_system_bounds_batch(config, lower, upper)) if options['model'] == MODEL_ANNUAL else None,
+                method=options['method'],
+                time_budget=options['time_budget'],
+                record_candidates=False,
+            )
+            if result['best_params'] is None:
+                raise ValueError("no feasible sizing found")
+            sizing = result['best_params']
+            row.update({'objective': options['objective'], 'method': result['method'], 'evaluations': result['evaluations'],
+                        'elapsed_s': round(result['elapsed'], 3), 'exhaustive': result['exhaustive']})
+        row.update(dict(zip(SIZING_KEYS, sizing)))
+        row.update(_metric_row(evaluate_model_batch(config, [sizing], options['model'], True, hourly), 0))
+    except Exception as exc: # Reported per park; the other parks still run
+        row.update({'status': 'error', 'error': f"{type(exc).__name__}: {exc}"})
+    return row
+
+
+# Worker-process variant: returns the row and the instrumentation recorded for this park only
+def _run_park_instrumented(task):
+    from efinops.instrument import REGISTRY
+
+    REGISTRY.reset()
+    row = run_park(task)
+    return row, REGISTRY.snapshot()
+
+
+def run_parks(records, command, options, workers=1):
+    tasks = [(record, command, options) for record in records]
+    if workers <= 1 or len(tasks) <= 1:
+        return [run_park(task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    from efinops.instrument import REGISTRY
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row, snapshot in pool.map(_run_park_instrumented, tasks):
+            REGISTRY.merge(snapshot)
+            rows.append(row)
+    return rows
+
+
+# Shared-budget allocation over all parks (annual model, see efinops.portfolio)
+def run_portfolio(records, options):
+    from efinops.portfolio import Portfolio
+
+    configs = [_park_inputs(record, 'annual', None)[0] for record in records]
+    result = Portfolio(configs, [record['park'] for record in records]).allocate(
+        options['budget'], rank_by=options['rank_by'], points_per_dim=options['points_per_dim'])
+    rows = []
+    for i, park in enumerate(result['park']):
+        funded = bool(result['funded'][i])
+        row = {'park': park, 'model': 'annual', 'status': 'ok', 'error': '', 'rank': i + 1 if funded else None, 'funded': funded,
+               'cumulative_capex': float(result['cumulative_capex'][i])}
+        row.update(dict(zip(SIZING_KEYS, (float(value) for value in result['sizing'][i]))))
+        row.update({key: float(result[key][i]) for key in METRIC_KEYS})
+        rows.append(row)
+    return rows
+
+
+# --- Output ---
+
+def _json_value(value):
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+
+def write_rows(rows, path, command):
+    columns = ['park', 'model', 'status'] + list(SIZING_KEYS) + list(METRIC_KEYS)
+    if command == 'optimize':
+        columns += list(OPTIMIZE_KEYS)
+    elif command == 'portfolio':
+        columns += list(PORTFOLIO_KEYS)
+    columns.append('error')
+
+    if path != '-' and path.lower().endswith(('.json', '.jsonl')):
+        with open(path, 'w', encoding='utf-8') as f:
+            clean = [{key: _json_value(row.get(key)) for key in columns} for row in rows]
+            if path.lower().endswith('.jsonl'):
+                f.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in clean)
+            else:
+                json.dump(clean, f, ensure_ascii=False, indent=1)
+        return
+    f = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    try:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+# --- Entry point ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='efinops', description="E-FinOps batch evaluation of park configurations")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('evaluate', "metrics of the sizing given in each record"),
+                            ('optimize', "best sizing per park on the slider lattice")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('input', help="park records (.csv, .json or .jsonl)")
+        command.add_argument('-o', '--output', default='-', help="output file (.csv, .json or .jsonl; default: CSV on stdout)")
+        command.add_argument('--model', choices=('annual', 'hourly'), default='annual')
+        command.add_argument('--profile-store', default=None, help="profile store directory with metered load profiles (hourly model)")
+        command.add_argument('--workers', type=int, default=1, help="parks evaluated in parallel processes (0 = one per CPU)")
+        command.add_argument('--metrics-out', default=None, help="write timings and counters (.prom/.txt: Prometheus text, else JSON)")
+        if name == 'optimize':
+            command.add_argument('--objective', choices=('irr', 'payback', 'npv'), default='npv')
+            command.add_argument('--method', default='hybrid', help="optimizer strategy (see efinops.optimize.OPTIMIZERS)")
+            command.add_argument('--time-budget', type=float, default=1.0, help="seconds per park")
+    command = commands.add_parser('portfolio', help="rank park investments under a shared capital budget (annual model)")
+    command.add_argument('input', help="park records (.csv, .json or .jsonl)")
+    command.add_argument('-o', '--output', default='-', help="output file (.csv, .json or .jsonl; default: CSV on stdout)")
+    command.add_argument('--budget', type=float, required=True, help="total CAPEX available to the portfolio")
+    command.add_argument('--rank-by', choices=('npv', 'irr'), default='npv')
+    command.add_argument('--points-per-dim', type=int, default=7, help="candidate sizings per sizing axis")
+    command.add_argument('--metrics-out', default=None, help="write timings and counters (.prom/.txt: Prometheus text, else JSON)")
+    return parser
+
+
+# Timings and counters of this run, park outcomes included
+def write_metrics(rows, path):
+    from efinops.instrument import REGISTRY, write_snapshot
+
+    for row in rows:
+        REGISTRY.count('parks', status=row['status'])
+    write_snapshot(REGISTRY.snapshot(), path)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'portfolio':
+        rows = run_portfolio(read_park_records(args.input), {'budget': args.budget, 'rank_by': args.rank_by, 'points_per_dim': args.points_per_dim})
+        write_rows(rows, args.output, args.command)
+        if args.metrics_out:
+            write_metrics(rows, args.metrics_out)
+        return 0
+    options = {'model': args.model, 'profile_store': args.profile_store}
+    if args.command == 'optimize':
+        options.update({'objective': args.objective, 'method': args.method, 'time_budget': args.time_budget})
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    rows = run_parks(read_park_records(args.input), args.command, options, workers)
+    write_rows(rows, args.output, args.command)
+    if args.metrics_out:
+        write_metrics(rows, args.metrics_out)
+    failed = [row for row in rows if row['status'] != 'ok']
+    for row in failed:
+        print(f"{row['park']}: {row['error']}", file=sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,142 @@
+# Process-pool executor for scenario sweeps (optimizer batches, sensitivity grids).
+# Candidate sizings are split into chunks and evaluated by worker processes. Each worker receives the config
+# once through the pool initializer (and builds the hourly profiles once), so tasks only carry a slice of
+# the sizing array. Results are merged into the output arrays as chunks complete, and a sweep stops
+# submitting work as soon as it is cancelled.
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from efinops.finance import as_sizings
+from efinops.hourly import DISPATCH_BATCH_SIZE, hourly_inputs
+from efinops.model import MODEL_ANNUAL, MODEL_HOURLY, evaluate_model_batch
+
+SWEEP_CHUNK_SIZE = DISPATCH_BATCH_SIZE # Max scenarios per task
+TASKS_IN_FLIGHT_PER_WORKER = 2 # Keeps every worker busy while bounding queued sizings and results
+
+
+class SweepCancelled(Exception):
+    pass
+
+
+# --- Worker side ---
+
+_worker_state = {}
+
+
+def _init_worker(config, model, load_profiles):
+    _worker_state['config'] = config
+    _worker_state['model'] = model
+    _worker_state['hourly'] = hourly_inputs(config, load_profiles) if model == MODEL_HOURLY else None
+
+
+# Evaluate one chunk; only the requested metric keys are sent back (all array-valued ones when keys is None)
+def _evaluate_chunk(start, sizings, compute_irr, keys):
+    metrics = evaluate_model_batch(_worker_state['config'], sizings, _worker_state['model'], compute_irr,
+                                   _worker_state['hourly'])
+    if keys is None:
+        keys = [key for key, value in metrics.items() if isinstance(value, (np.ndarray, dict))]
+    return start, len(sizings), {key: metrics[key] for key in keys if metrics.get(key) is not None}
+
+
+# --- Merging ---
+
+# Write a chunk's metrics into the preallocated output (nested dicts such as 'dispatch' are merged per key)
+def _merge_chunk(output, chunk, start, n):
+    for key, value in chunk.items():
+        if isinstance(value, dict):
+            _merge_chunk(output.setdefault(key, {}), value, start, n)
+            continue
+        value = np.asarray(value)
+        if key not in output:
+            output[key] = np.empty((n,) + value.shape[1:], dtype=value.dtype)
+        output[key][start:start + len(value)] = value
+
+
+class SweepExecutor:
+    # max_workers defaults to os.cpu_count(). The spawn start method is used by default because the
+    # Streamlit server is multi-threaded and forking it is unsafe.
+    # load_profiles: metered load profiles for the hourly model (see efinops.hourly.hourly_inputs)
+    def __init__(self, config, model=MODEL_ANNUAL, max_workers=None, chunk_size=SWEEP_CHUNK_SIZE, mp_context='spawn',
+                 load_profiles=None):
+        self.config = config
+        self.model = model
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._cancel_event = threading.Event()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(mp_context),
+            initializer=_init_worker,
+            initargs=(config, model, load_profiles),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    # Request cancellation (safe to call from another thread). Every sweep raises SweepCancelled until
+    # clear_cancel() is called, so a multi-batch run such as an optimizer search stops as a whole.
+    def cancel(self):
+        self._cancel_event.set()
+
+    def clear_cancel(self):
+        self._cancel_event.clear()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    # Chunk length for n scenarios: small sweeps are still spread over every worker
+    def _chunk_length(self, n):
+        return max(1, min(self.chunk_size, math.ceil(n / self.max_workers)))
+
+    # Yield (start, length, metrics) per chunk in completion order. Raises SweepCancelled once cancel() was called;
+    # queued chunks are dropped, chunks already running finish in the background and are discarded.
+    def map_chunks(self, sizings, compute_irr=True, keys=None):
+        sizings = as_sizings(sizings)
+        step = self._chunk_length(len(sizings))
+        starts = iter(range(0, len(sizings), step))
+        pending = set()
+        try:
+            if self.cancelled:
+                raise SweepCancelled()
+            while True:
+                while len(pending) < self.max_workers * TASKS_IN_FLIGHT_PER_WORKER:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    pending.add(self._pool.submit(_evaluate_chunk, start, sizings[start:start + step], compute_irr, keys))
+                if not pending:
+                    return
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                if self.cancelled:
+                    raise SweepCancelled()
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    # Evaluate all sizings and return the merged metrics (same layout as evaluate_model_batch).
+    # on_chunk(completed, total) is called after each merged chunk, e.g. to feed a ThrottledProgress.
+    def evaluate_batch(self, sizings, compute_irr=True, keys=None, on_chunk=None):
+        sizings = as_sizings(sizings)
+        n = len(sizings)
+        output = {}
+        completed = 0
+        for start, length, chunk in self.map_chunks(sizings, compute_irr, keys):
+            _merge_chunk(output, chunk, start, n)
+            completed += length
+            if on_chunk is not None:
+                on_chunk(completed, n)
+        return output
@@ -0,0 +1,93 @@
+# Financial layer shared by the energy models (annual simplified model and hourly dispatch).
+# Every function works on arrays of candidates: an energy model supplies CAPEX and the annual grid cost
+# per candidate, and this module turns them into after-tax cash flows, payback, IRR and NPV.
+import numpy as np
+
+from efinops.irr import solve_irr_batch
+
+SIZING_COLUMNS = ('st_area', 'pv_area', 'hp_capacity_kw', 'storage_capacity_kwh')
+CAPEX_COST_KEYS = ('st_cost_m2', 'pv_cost_m2', 'hp_cost_kw', 'storage_cost_kwh') # Unit cost of each sizing column
+
+
+# Validate and normalize an (N, 4) sizing array (columns as in SIZING_COLUMNS)
+def as_sizings(sizings):
+    sizings = np.atleast_2d(np.asarray(sizings, dtype=float))
+    if sizings.shape[1] != len(SIZING_COLUMNS):
+        raise ValueError("sizings must have shape (N, 4): st_area, pv_area, hp_capacity_kw, storage_capacity_kwh")
+    return sizings
+
+
+# Total CAPEX per candidate from the configured unit costs (scalars, or arrays with one value per candidate)
+def capex_batch(config, sizings):
+    sizings = as_sizings(sizings)
+    unit_costs = [config[key] for key in CAPEX_COST_KEYS]
+    if all(np.ndim(cost) == 0 for cost in unit_costs):
+        return sizings @ np.array(unit_costs, dtype=float)
+    return sum(sizings[:, i] * np.asarray(cost, dtype=float) for i, cost in enumerate(unit_costs))
+
+
+# After-tax cash flows and investment metrics for arrays of candidates
+# CF_0 = -CAPEX, CF_t = Gross Saving * (1 - T) + Depreciation_t * T, with straight-line depreciation over depreciation_years.
+# Returns NumPy arrays: annual_opex_mixed, annual_gross_saving, cash_flows (N x lifespan+1), payback_year_num
+# (inf if never recovered), irr_value/irr_status (None when compute_irr is False) and npv_value.
+def cash_flow_metrics(config, total_capex, annual_grid_cost, baseline_annual_cost, compute_irr=True):
+    total_capex = np.atleast_1d(np.asarray(total_capex, dtype=float))
+    annual_grid_cost = np.broadcast_to(np.asarray(annual_grid_cost, dtype=float), total_capex.shape)
+    n = total_capex.shape[0]
+    project_lifespan = config['project_lifespan_years']
+    depreciation_years = config['depreciation_years']
+    tax_rate = config['tax_rate']
+
+    annual_opex_mixed = total_capex * config['opex_percentage']
+    annual_gross_saving = baseline_annual_cost - (annual_grid_cost + annual_opex_mixed)
+
+    years = np.arange(1, project_lifespan + 1)
+    # 1.0 for years inside the depreciation window, 0.0 afterwards
+    depreciation_mask = (years <= depreciation_years).astype(float) if depreciation_years > 0 else np.zeros(project_lifespan)
+    annual_depreciation = total_capex / depreciation_years if depreciation_years > 0 else np.zeros(n)
+
+    cash_flows = np.empty((n, project_lifespan + 1))
+    cash_flows[:, 0] = -total_capex
+    cash_flows[:, 1:] = (annual_gross_saving * (1 - tax_rate))[:, None] + (annual_depreciation * tax_rate)[:, None] * depreciation_mask[None, :]
+
+    payback_year_num = payback_years(cash_flows)
+
+    # IRR: solved for all rows at once; -inf where CF_0 >= 0 or no later CF is positive
+    irr_value, irr_status = solve_irr_batch(cash_flows) if compute_irr else (None, None)
+
+    # NPV: discount every row with the same factor vector (matches npf.npv, CF_0 undiscounted)
+    discount_factors = (1 + config['discount_rate']) ** -np.arange(project_lifespan + 1)
+    npv_value = cash_flows @ discount_factors
+
+    return {
+        "total_capex": total_capex,
+        "annual_opex_mixed": annual_opex_mixed,
+        "annual_gross_saving": annual_gross_saving,
+        "payback_year_num": payback_year_num,
+        "irr_value": irr_value,
+        "irr_status": irr_status,
+        "npv_value": npv_value,
+        "cash_flows": cash_flows,
+    }
+
+
+# Payback per row of an (N x years+1) cash-flow matrix: first year where the cumulative CF crosses from
+# negative to non-negative, interpolated within the year; inf if the project never recovers
+def payback_years(cash_flows):
+    cumulative_cf = np.cumsum(cash_flows, axis=1)
+    crossing = (cumulative_cf[:, 1:] >= 0) & (cumulative_cf[:, :-1] < 0)
+    has_crossing = crossing.any(axis=1) & (cumulative_cf[:, -1] >= 0)
+    first_crossing = np.argmax(crossing, axis=1) + 1
+    rows = np.arange(len(cash_flows))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payback_interp = first_crossing - 1 + np.abs(cumulative_cf[rows, first_crossing - 1]) / cash_flows[rows, first_crossing]
+    return np.where(has_crossing, payback_interp, np.inf)
+
+
+# Payback display string with the same wording as the What-If page
+def format_payback(payback_year_num, cash_flows):
+    if np.isfinite(payback_year_num):
+        return f"{payback_year_num:.2f} 年"
+    if cash_flows[0] >= 0 and np.sum(cash_flows) >= 0:
+        return "即时"
+    return "N/A (未能回本)"
@@ -0,0 +1,211 @@
+# Streaming ingestion of smart-meter exports (Phase 1 "Inform": electricity / heat / cooling meters per
+# zone, device and source).
+# Exports are read in chunks and accumulated into a (meters x 8760) float32 array of hourly kWh, so memory
+# is bounded by the number of meters, not by the number of 15-minute rows. The result feeds the annual
+# demand totals of the configuration page and the load profiles of the hourly model.
+#
+# Expected long format, one row per meter reading (column names configurable via `columns`):
+#   timestamp  - start of the metering interval (any resolution; sub-hourly rows are summed per hour), local
+#                time; a UTC offset or time zone is dropped after parsing
+#   meter_id   - meter identifier
+#   kwh        - energy of the interval in kWh (or kW readings with value_kind='power', averaged per hour)
+#   carrier    - 'elec', 'heat' or 'cool' for demand meters; other values (e.g. 'pv') are kept but not
+#                counted as demand. May be omitted when meter_carriers maps meter_id -> carrier.
+# Optional per-meter metadata columns (zone, device, source) are kept as categoricals.
+import os
+
+import numpy as np
+import pandas as pd
+
+from efinops.tariff import DAYS_PER_YEAR, HOURS_PER_DAY, HOURS_PER_YEAR
+
+CARRIER_ELEC = 'elec'
+CARRIER_HEAT = 'heat'
+CARRIER_COOL = 'cool'
+# Demand carriers and the config value / hourly profile each one feeds
+CARRIER_TARGETS = {
+    CARRIER_ELEC: ('annual_elec_kwh', 'elec_load'),
+    CARRIER_HEAT: ('annual_heat_kwh', 'heat_load'),
+    CARRIER_COOL: ('annual_cool_kwh', 'cool_load'),
+}
+
+DEFAULT_COLUMNS = {'timestamp': 'timestamp', 'meter_id': 'meter_id', 'value': 'kwh', 'carrier': 'carrier'}
+METADATA_COLUMNS = ('zone', 'device', 'source')
+INGEST_CHUNK_ROWS = 500_000 # Rows per chunk read from the export
+
+VALUE_ENERGY = 'energy' # Interval energy (kWh): summed per hour
+VALUE_POWER = 'power'   # Instantaneous power (kW): averaged per hour
+
+
+# Reading timestamps as naive local (wall-clock) times, the time base of the TOU calendar. Aware timestamps
+# (ISO exports with a UTC offset, zoned Parquet columns) keep their local time and drop the offset.
+def _local_timestamps(column):
+    try:
+        timestamps = pd.to_datetime(column)
+    except ValueError:
+        # Offsets that change inside the chunk (daylight saving time) need one conversion per reading
+        return pd.Series([pd.Timestamp(value).tz_localize(None) for value in column], index=column.index, dtype='datetime64[ns]')
+    return timestamps.dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps
+
+
+# Hourly accumulator fed chunk by chunk; call result() after the last chunk
+class MeterAccumulator:
+    def __init__(self, year=None, columns=None, meter_carriers=None, value_kind=VALUE_ENERGY):
+        if value_kind not in (VALUE_ENERGY, VALUE_POWER):
+            raise ValueError(f"Unknown value_kind: {value_kind}")
+        self.year = year
+        self.columns = {**DEFAULT_COLUMNS, **(columns or {})}
+        self.meter_carriers = dict(meter_carriers or {})
+        self.value_kind = value_kind
+        self.rows_read = 0
+        self.rows_dropped = 0
+        self._meter_codes = {}
+        self._metadata = []
+        self._sums = np.zeros((0, HOURS_PER_YEAR))
+        self._counts = np.zeros((0, HOURS_PER_YEAR), dtype=np.int32)
+
+    def _grow(self, n_meters):
+        if n_meters <= len(self._sums):
+            return
+        capacity = max(n_meters, 2 * len(self._sums), 16)
+        self._sums = np.vstack([self._sums, np.zeros((capacity - len(self._sums), HOURS_PER_YEAR))])
+        self._counts = np.vstack([self._counts, np.zeros((capacity - len(self._counts), HOURS_PER_YEAR), dtype=np.int32)])
+
+    # Integer codes for the chunk's meter ids; new meters get the next free rows. Works on the categorical
+    # codes so per-row string handling is limited to the chunk's distinct meters.
+    def _codes(self, chunk):
+        cols = self.columns
+        meter_ids = chunk[cols['meter_id']].astype('category')
+        chunk_codes = meter_ids.cat.codes.to_numpy()
+        _, first_positions = np.unique(chunk_codes, return_index=True)
+        lookup = np.empty(len(meter_ids.cat.categories), dtype=np.int64)
+        for position in first_positions:
+            category = chunk_codes[position]
+            meter_id = str(meter_ids.cat.categories[category])
+            if meter_id not in self._meter_codes:
+                row = chunk.iloc[position]
+                self._meter_codes[meter_id] = len(self._meter_codes)
+                carrier = self.meter_carriers.get(meter_id, row[cols['carrier']] if cols['carrier'] in chunk else None)
+                meta = {'meter_id': meter_id, 'carrier': None if pd.isna(carrier) else str(carrier)}
+                meta.update({name: row[name] for name in METADATA_COLUMNS if name in chunk})
+                self._metadata.append(meta)
+            lookup[category] = self._meter_codes[meter_id]
+        self._grow(len(self._meter_codes))
+        return lookup[chunk_codes]
+
+    def add_chunk(self, chunk):
+        cols = self.columns
+        self.rows_read += len(chunk)
+        timestamps = _local_timestamps(chunk[cols['timestamp']])
+        values = pd.to_numeric(chunk[cols['value']], errors='coerce').to_numpy(dtype=np.float64)
+        if self.year is None and len(chunk):
+            self.year = int(timestamps.iloc[0].year)
+
+        # Hour of the (non-leap) year; 29 February, rows outside the year and rows without a meter id are dropped
+        start = pd.Timestamp(year=self.year, month=1, day=1)
+        hour = ((timestamps - start) // pd.Timedelta(hours=1)).to_numpy()
+        leap_day = (timestamps.dt.month == 2) & (timestamps.dt.day == 29)
+        after_leap_day = (timestamps.dt.month > 2) & timestamps.dt.is_leap_year
+        hour = hour - np.where(after_leap_day, HOURS_PER_DAY, 0)
+        keep = (timestamps.dt.year == self.year).to_numpy() & ~leap_day.to_numpy() & np.isfinite(values)
+        keep &= chunk[cols['meter_id']].notna().to_numpy()
+        self.rows_dropped += int((~keep).sum())
+        if not keep.any():
+            return
+
+        codes = self._codes(chunk.loc[keep])
+        flat = codes * HOURS_PER_YEAR + hour[keep]
+        cells, inverse = np.unique(flat, return_inverse=True)
+        self._sums.ravel()[cells] += np.bincount(inverse, weights=values[keep])
+        self._counts.ravel()[cells] += np.bincount(inverse).astype(np.int32)
+
+    # Hourly kWh per meter as a dict:
+    #   meters       - DataFrame, one row per meter: meter_id / carrier / metadata as categoricals, coverage
+    #                  (fraction of the 8760 hours with readings)
+    #   hourly_kwh   - float32 array (meters x 8760); hours without readings are filled with the meter's
+    #                  mean for the same hour of day
+    #   year, rows_read, rows_dropped
+    def result(self):
+        n = len(self._meter_codes)
+        sums = self._sums[:n]
+        counts = self._counts[:n]
+        observed = counts > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            hourly = sums / counts if self.value_kind == VALUE_POWER else sums.copy()
+            # Gap filling from the hour-of-day mean of the observed hours
+            by_hour_of_day = np.where(observed, hourly, 0.0).reshape(n, DAYS_PER_YEAR, HOURS_PER_DAY).sum(axis=1)
+            observed_by_hour = observed.reshape(n, DAYS_PER_YEAR, HOURS_PER_DAY).sum(axis=1)
+            hour_of_day_mean = np.nan_to_num(by_hour_of_day / observed_by_hour)
+        hourly = np.where(observed, hourly, np.tile(hour_of_day_mean, DAYS_PER_YEAR))
+
+        meters = pd.DataFrame(self._metadata, columns=['meter_id', 'carrier'] + [c for c in METADATA_COLUMNS if any(c in m for m in self._metadata)])
+        for column in meters.columns:
+            meters[column] = meters[column].astype('category')
+        meters['coverage'] = observed.mean(axis=1).astype(np.float32) if n else np.zeros(0, dtype=np.float32)
+        return {
+            'meters': meters,
+            'hourly_kwh': hourly.astype(np.float32),
+            'year': self.year,
+            'rows_read': self.rows_read,
+            'rows_dropped': self.rows_dropped,
+        }
+
+
+# Chunks of a CSV or Parquet export; `source` is a path or a file-like object (e.g. a Streamlit upload)
+def iter_meter_chunks(source, chunk_rows=INGEST_CHUNK_ROWS, file_format=None, columns=None):
+    if file_format is None:
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', '')
+        file_format = 'parquet' if str(name).lower().endswith(('.parquet', '.pq')) else 'csv'
+    if file_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Reading Parquet meter exports requires pyarrow") from exc
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif file_format == 'csv':
+        # Repeated strings are parsed straight into categoricals; meter ids stay strings even if numeric
+        columns = {**DEFAULT_COLUMNS, **(columns or {})}
+        dtype = {column: 'category' for column in (columns['meter_id'], columns['carrier']) + METADATA_COLUMNS}
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype=dtype)
+    else:
+        raise ValueError(f"Unknown file format: {file_format}")
+
+
+# Read a whole export chunk by chunk and return MeterAccumulator.result()
+def ingest_meter_file(source, year=None, columns=None, meter_carriers=None, value_kind=VALUE_ENERGY,
+                      chunk_rows=INGEST_CHUNK_ROWS, file_format=None):
+    accumulator = MeterAccumulator(year, columns, meter_carriers, value_kind)
+    for chunk in iter_meter_chunks(source, chunk_rows, file_format, columns):
+        accumulator.add_chunk(chunk)
+    return accumulator.result()
+
+
+# Long-format hourly table (meter_id categorical, hour int16, kwh float32) for display or export
+def hourly_frame(meter_data):
+    meter_ids = meter_data['meters']['meter_id']
+    n = len(meter_ids)
+    return pd.DataFrame({
+        'meter_id': pd.Categorical.from_codes(np.repeat(meter_ids.cat.codes.to_numpy(), HOURS_PER_YEAR), meter_ids.cat.categories),
+        'hour': np.tile(np.arange(HOURS_PER_YEAR, dtype=np.int16), n),
+        'kwh': meter_data['hourly_kwh'].ravel(),
+    })
+
+
+# Site load profiles (elec_load / heat_load / cool_load, kWh per hour) summed over the demand meters of
+# each carrier; carriers without meters are missing from the dict
+def load_profiles(meter_data):
+    carriers = meter_data['meters']['carrier'].astype(str).to_numpy()
+    profiles = {}
+    for carrier, (_, profile_key) in CARRIER_TARGETS.items():
+        rows = carriers == carrier
+        if rows.any():
+            profiles[profile_key] = meter_data['hourly_kwh'][rows].sum(axis=0, dtype=np.float64)
+    return profiles
+
+
+# Annual demand totals for the configuration page (annual_elec_kwh / annual_heat_kwh / annual_cool_kwh)
+def annual_totals(meter_data):
+    profiles = load_profiles(meter_data)
+    return {config_key: float(profiles[profile_key].sum())
+            for config_key, profile_key in CARRIER_TARGETS.values() if profile_key in profiles}
@@ -0,0 +1,142 @@
+# Lightweight instrumentation of the calculation hot paths: wall-clock timers and event counters.
+# The engines record into the process-wide REGISTRY (per model stage, optimizer phase, IRR solve, cache
+# lookup), always per batch and never per candidate, so the overhead is a few microseconds per call.
+# The app shows the numbers in a debug panel; the CLI exports them as JSON or Prometheus text format.
+#
+#   with timer('stage', stage='generation'):
+#       ...
+#   count('evaluations', 4096, source='optimizer')
+import json
+import threading
+import time
+from contextlib import ContextDecorator
+
+METRIC_PREFIX = 'efinops'
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+# Timers hold [calls, total seconds, max seconds], counters a running total; both keyed by (name, labels)
+class Registry:
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    def observe(self, name, seconds, **labels):
+        self._observe(_key(name, labels), seconds)
+
+    def _observe(self, key, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._timers.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # Context manager (or function decorator) timing its block
+    def timer(self, name, **labels):
+        return _Timer(self, _key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    # Plain-data copy: {'timers': [{name, labels, calls, total_s, max_s}], 'counters': [{name, labels, value}]}
+    def snapshot(self):
+        with self._lock:
+            timers = [{'name': name, 'labels': dict(labels), 'calls': calls, 'total_s': total, 'max_s': peak}
+                      for (name, labels), (calls, total, peak) in sorted(self._timers.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {'timers': timers, 'counters': counters}
+
+    # Add a snapshot taken elsewhere (e.g. in a worker process) to this registry
+    def merge(self, snapshot):
+        with self._lock:
+            for timer in snapshot['timers']:
+                entry = self._timers.setdefault(_key(timer['name'], timer['labels']), [0, 0.0, 0.0])
+                entry[0] += timer['calls']
+                entry[1] += timer['total_s']
+                entry[2] = max(entry[2], timer['max_s'])
+            for counter in snapshot['counters']:
+                key = _key(counter['name'], counter['labels'])
+                self._counters[key] = self._counters.get(key, 0) + counter['value']
+
+
+# Plain class rather than @contextmanager: entering and leaving costs well under a microsecond
+class _Timer(ContextDecorator):
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+    # Fresh instance per decorated call, so recursive and concurrent calls keep their own start time
+    def _recreate_cm(self):
+        return _Timer(self.registry, self.key)
+
+
+REGISTRY = Registry()
+timer = REGISTRY.timer
+count = REGISTRY.count
+
+
+def to_json(snapshot):
+    return json.dumps(snapshot, ensure_ascii=False, indent=1)
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{label}="{value}"' for label, value in zip(labels, escaped)) + '}'
+
+
+# Prometheus text exposition format: a timer becomes <prefix>_<name>_seconds (summary: _count, _sum) plus a
+# <prefix>_<name>_seconds_max gauge, a counter becomes <prefix>_<name>_total
+def to_prometheus(snapshot, prefix=METRIC_PREFIX):
+    families = {} # metric name -> (type, sample lines); every family is written as one contiguous block
+    def add(metric, metric_type, line):
+        families.setdefault(metric, (metric_type, []))[1].append(line)
+
+    for timer_entry in snapshot['timers']:
+        metric = f"{prefix}_{timer_entry['name']}_seconds"
+        labels = _prometheus_labels(timer_entry['labels'])
+        add(metric, 'summary', f"{metric}_count{labels} {timer_entry['calls']}")
+        add(metric, 'summary', f"{metric}_sum{labels} {timer_entry['total_s']!r}")
+        add(f"{metric}_max", 'gauge', f"{metric}_max{labels} {timer_entry['max_s']!r}")
+    for counter in snapshot['counters']:
+        metric = f"{prefix}_{counter['name']}_total"
+        add(metric, 'counter', f"{metric}{_prometheus_labels(counter['labels'])} {counter['value']}")
+
+    lines = []
+    for metric, (metric_type, samples) in families.items():
+        lines.append(f"# TYPE {metric} {metric_type}")
+        lines += samples
+    return '\n'.join(lines) + '\n'
+
+
+# Export format from the file extension: .prom / .txt -> Prometheus text, anything else JSON
+def write_snapshot(snapshot, path):
+    text = to_prometheus(snapshot) if path.lower().endswith(('.prom', '.txt')) else to_json(snapshot)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
@@ -0,0 +1,110 @@
+# Vectorized IRR solver for matrices of cash-flow series (one series per row).
+# Replaces per-series npf.irr calls in the optimizer and batch evaluator; results agree with npf.irr
+# (which returns the real root closest to zero) to within the solver tolerance.
+import numpy as np
+
+from efinops.instrument import count, timer
+
+# Status codes returned per cash-flow row, mapped to the same "N/A (...)" categories the UI shows
+IRR_STATUS_OK = 0
+IRR_STATUS_INITIAL_NOT_NEGATIVE = 1
+IRR_STATUS_NO_POSITIVE_CF = 2
+IRR_STATUS_INVALID = 3
+
+IRR_STATUS_DISPLAY = {
+    IRR_STATUS_INITIAL_NOT_NEGATIVE: "N/A (初始投资应为负值)",
+    IRR_STATUS_NO_POSITIVE_CF: "N/A (无正现金流)",
+    IRR_STATUS_INVALID: "N/A (IRR计算结果无效)",
+}
+
+# Brackets are searched on u = ln(1 + r), i.e. r from about -99.9% to +109500%
+_IRR_U_GRID_COARSE = np.linspace(-7.0, 7.0, 57)
+_IRR_U_GRID_FINE = np.linspace(-7.0, 7.0, 1121)
+
+def format_irr(irr_value, status):
+    if status == IRR_STATUS_OK:
+        return f"{irr_value*100:.2f} %"
+    return IRR_STATUS_DISPLAY[status]
+
+# Find, for every row, the grid cell containing the NPV sign change closest to r = 0 (npf.irr picks the root closest to zero)
+def _irr_scan_brackets(cash_flows, u_grid):
+    periods = np.arange(cash_flows.shape[1])
+    npv_grid = cash_flows @ np.exp(-np.outer(periods, u_grid))
+    sign_change = np.sign(npv_grid[:, :-1]) * np.sign(npv_grid[:, 1:]) <= 0
+    distance_to_zero = np.abs(np.expm1(0.5 * (u_grid[:-1] + u_grid[1:])))
+    cost = np.where(sign_change, distance_to_zero[None, :], np.inf)
+    cell = np.argmin(cost, axis=1)
+    found = np.isfinite(cost[np.arange(len(cell)), cell])
+    rows = np.arange(len(cell))
+    return found, u_grid[cell], u_grid[cell + 1], npv_grid[rows, cell], npv_grid[rows, cell + 1]
+
+# Safeguarded Newton iteration in u-space, falling back to bisection whenever a step leaves the bracket
+def _irr_refine(cash_flows, lo, hi, f_lo, f_hi, tol, maxiter):
+    periods = np.arange(cash_flows.shape[1], dtype=float)
+    k = cash_flows.shape[0]
+    result = np.full(k, np.nan)
+    active = np.arange(k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Start from the secant point of the bracket
+        u = np.where(f_hi != f_lo, lo - f_lo * (hi - lo) / (f_hi - f_lo), 0.5 * (lo + hi))
+        u = np.where((u > lo) & (u < hi), u, 0.5 * (lo + hi))
+        for _ in range(maxiter):
+            cf = cash_flows[active]
+            weights = np.exp(-np.outer(u, periods))
+            f = (cf * weights).sum(axis=1)
+            df = -(cf * weights * periods).sum(axis=1)
+
+            same_side = np.sign(f) == np.sign(f_lo)
+            lo = np.where(same_side, u, lo)
+            f_lo = np.where(same_side, f, f_lo)
+            hi = np.where(same_side, hi, u)
+
+            newton = u - f / df
+            in_bracket = np.isfinite(newton) & (newton > lo) & (newton < hi)
+            u_next = np.where(in_bracket, newton, 0.5 * (lo + hi))
+            done = (np.abs(u_next - u) <= tol * (1 + np.abs(u_next))) | (f == 0)
+
+            result[active[done]] = np.where(f[done] == 0, u[done], u_next[done])
+            keep = ~done
+            active, u, lo, hi, f_lo = active[keep], u_next[keep], lo[keep], hi[keep], f_lo[keep]
+            if active.size == 0:
+                break
+    return np.expm1(result)
+
+# Solve IRR for every row of a cash-flow matrix (N x periods) at once
+# Returns (irr_values, status). irr_values follows the scalar model's conventions:
+# -inf where IRR is not applicable (status 1/2), nan where no root is found (status 3).
+@timer('irr_solve')
+def solve_irr_batch(cash_flows, tol=1e-12, maxiter=100):
+    cash_flows = np.atleast_2d(np.asarray(cash_flows, dtype=float))
+    n = cash_flows.shape[0]
+    count('irr_rows', n)
+    irr_values = np.full(n, -np.inf)
+    status = np.full(n, IRR_STATUS_OK, dtype=np.int8)
+
+    initial_negative = cash_flows[:, 0] < 0
+    has_positive = (cash_flows[:, 1:] > 0).any(axis=1)
+    status[~initial_negative] = IRR_STATUS_INITIAL_NOT_NEGATIVE
+    status[initial_negative & ~has_positive] = IRR_STATUS_NO_POSITIVE_CF
+
+    eligible = np.flatnonzero(initial_negative & has_positive)
+    if eligible.size == 0:
+        return irr_values, status
+
+    # Conventional series (no negative flow after year 0) have exactly one root, so a coarse scan brackets it.
+    # Anything else may have several roots and gets the fine scan.
+    cf = cash_flows[eligible]
+    non_conventional = (cf[:, 1:] < 0).any(axis=1)
+    found = np.zeros(eligible.size, dtype=bool)
+    lo, hi, f_lo, f_hi = (np.empty(eligible.size) for _ in range(4))
+    for group, u_grid in ((~non_conventional, _IRR_U_GRID_COARSE), (non_conventional, _IRR_U_GRID_FINE)):
+        if group.any():
+            found[group], lo[group], hi[group], f_lo[group], f_hi[group] = _irr_scan_brackets(cf[group], u_grid)
+
+    solved = np.full(eligible.size, np.nan)
+    if found.any():
+        solved[found] = _irr_refine(cf[found], lo[found], hi[found], f_lo[found], f_hi[found], tol, maxiter)
+
+    irr_values[eligible] = solved
+    status[eligible[np.isnan(solved)]] = IRR_STATUS_INVALID
+    return irr_values, status
@@ -0,0 +1,370 @@
+# Background jobs for long computations (optimizer searches) that must outlive a Streamlit rerun.
+# Jobs run on a small thread pool owned by the server process, so a widget interaction, which restarts the
+# script thread, no longer aborts the search. Every job has a row in a local SQLite job table: status,
+# parameters, throttled progress (fraction plus info such as evaluations and the best sizing found so far)
+# and the final result. Pages poll the table instead of blocking, several sessions share the pool, and the
+# partial best of a job survives cancellation and even a server restart.
+#
+# Several runners may share one job table (a second server process, or a new runner after a cache_resource
+# rebuild while the old one still finishes its jobs). Every job row names the runner that owns it, and every
+# runner keeps a heartbeat in the runners table; left-over jobs of runners whose heartbeat stopped (a stopped
+# or crashed server) are marked interrupted by the live runners.
+#
+# A job is a function(context) returning a JSON-serializable dict. It reports through
+# context.report(fraction, **info) (or passes context.progress to efinops.optimize) and calls
+# context.check(), which raises JobCancelled once the job was cancelled.
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from efinops.instrument import count, timer
+from efinops.progress import ThrottledProgress
+
+JOBS_DB_ENV = 'EFINOPS_JOBS_DB'
+DEFAULT_JOBS_DB = os.path.join(os.path.expanduser('~'), '.efinops', 'jobs.sqlite')
+JOB_WORKERS = 2 # Jobs running at once per server process; further jobs wait in the queue
+JOB_PROGRESS_UPDATES_PER_SECOND = 2.0 # Max job table writes per second and job
+JOB_HEARTBEAT_S = 5.0 # Interval of a runner's heartbeat; its active jobs are interrupted after RUNNER_TIMEOUT_S without one
+RUNNER_TIMEOUT_S = 30.0
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_INTERRUPTED = 'interrupted' # Was queued or running when its server process stopped
+JOB_ACTIVE = (JOB_QUEUED, JOB_RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    runner TEXT,
+    status TEXT NOT NULL,
+    params TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    info TEXT,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS runners (
+    runner_id TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+"""
+_JSON_COLUMNS = ('params', 'info', 'result')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def default_jobs_path():
+    return os.environ.get(JOBS_DB_ENV, DEFAULT_JOBS_DB)
+
+
+# Handle passed to a running job
+class JobContext:
+    def __init__(self, runner, job_id, cancel_event, updates_per_second=JOB_PROGRESS_UPDATES_PER_SECOND):
+        self.job_id = job_id
+        self._runner = runner
+        self._cancel_event = cancel_event
+        self.progress = ThrottledProgress(self._persist, updates_per_second)
+
+    def _persist(self, fraction, info):
+        self._runner._update(self.job_id, progress=fraction, info=info)
+
+    # fraction in [0, 1]; info (e.g. evaluations, best_score, best_params) is stored as the job's partial result
+    def report(self, fraction, **info):
+        return self.progress.report(fraction, **info)
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+class JobRunner:
+    # path: SQLite file of the job table (default ~/.efinops/jobs.sqlite or $EFINOPS_JOBS_DB)
+    def __init__(self, path=None, max_workers=JOB_WORKERS, updates_per_second=JOB_PROGRESS_UPDATES_PER_SECOND):
+        self.path = path or default_jobs_path()
+        self.updates_per_second = updates_per_second
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='efinops-job')
+        self._lock = threading.Lock()
+        self._cancel_events = {}
+        self._futures = {}
+        self.runner_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+            if 'runner' not in {row['name'] for row in db.execute("PRAGMA table_info(jobs)")}: # Job table of an older version
+                db.execute("ALTER TABLE jobs ADD COLUMN runner TEXT")
+        self._beat()
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='efinops-job-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    # One connection per call (committed and closed on exit): the table is written from job threads and
+    # read from script threads
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # Refresh this runner's heartbeat and interrupt the active jobs of runners without a recent one (jobs of
+    # older versions have no runner). Stale runner rows are removed.
+    def _beat(self):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO runners (runner_id, pid, heartbeat) VALUES (?, ?, ?)", (self.runner_id, os.getpid(), now))
+            db.execute("DELETE FROM runners WHERE heartbeat < ?", (now - RUNNER_TIMEOUT_S,))
+            db.execute("UPDATE jobs SET status = ?, finished = ? WHERE status IN (?, ?) "
+                       "AND (runner IS NULL OR runner NOT IN (SELECT runner_id FROM runners))", (JOB_INTERRUPTED, now) + JOB_ACTIVE)
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(JOB_HEARTBEAT_S):
+            try:
+                self._beat()
+            except sqlite3.OperationalError: # Table locked by another process for longer than the timeout; retried next beat
+                pass
+
+    def _update(self, job_id, **values):
+        values = {key: json.dumps(value) if key in _JSON_COLUMNS else value for key, value in values.items()}
+        assignments = ', '.join(f"{key} = ?" for key in values)
+        with self._lock, self._connect() as db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values.values(), job_id))
+
+    # Queue function(context) and return the job id. params: JSON-serializable description shown with the job.
+    def submit(self, kind, function, params=None, owner=None):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock, self._connect() as db:
+            db.execute("INSERT INTO jobs (job_id, kind, owner, runner, status, params, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (job_id, kind, owner, self.runner_id, JOB_QUEUED, json.dumps(params or {}), time.time()))
+        cancel_event = threading.Event()
+        # Registered under the lock, which _run takes before removing the entries, so a job that finishes at once
+        # cannot leave its future behind
+        with self._lock:
+            self._cancel_events[job_id] = cancel_event
+            self._futures[job_id] = self._pool.submit(self._run, job_id, kind, function, cancel_event)
+        return job_id
+
+    def _run(self, job_id, kind, function, cancel_event):
+        if cancel_event.is_set():
+            self._update(job_id, status=JOB_CANCELLED, finished=time.time())
+            self._forget(job_id)
+            return
+        self._update(job_id, status=JOB_RUNNING, started=time.time())
+        context = JobContext(self, job_id, cancel_event, self.updates_per_second)
+        try:
+            with timer('job', kind=kind):
+                result = function(context)
+        except JobCancelled:
+            status, values = JOB_CANCELLED, {}
+        except Exception as exc: # Recorded in the job table; the runner keeps serving other jobs
+            status, values = JOB_FAILED, {'error': f"{type(exc).__name__}: {exc}"}
+        else:
+            status, values = JOB_DONE, {'result': result, 'progress': 1.0}
+        count('jobs', kind=kind, status=status)
+        self._update(job_id, status=status, finished=time.time(), **values)
+        self._forget(job_id)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._cancel_events.pop(job_id, None)
+            self._futures.pop(job_id, None)
+
+    # Cancel a queued or running job (a running job stops at its next context.check())
+    def cancel(self, job_id):
+        event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+
+    # Block until the job has finished (for scripts and tests) and return its row
+    def wait(self, job_id, timeout=None):
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.get(job_id)
+
+    # Job row as a dict (JSON columns decoded), or None for an unknown id
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else _decode(row)
+
+    # Most recent jobs first, optionally of one owner (e.g. a browser session)
+    def jobs(self, owner=None, limit=20):
+        query, args = "SELECT * FROM jobs", ()
+        if owner is not None:
+            query, args = query + " WHERE owner = ?", (owner,)
+        with self._connect() as db:
+            rows = db.execute(query + " ORDER BY created DESC LIMIT ?", (*args, limit)).fetchall()
+        return [_decode(row) for row in rows]
+
+    def shutdown(self, wait=True):
+        if not wait:
+            for event in list(self._cancel_events.values()):
+                event.set()
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        self._stopped.set()
+        if wait: # All jobs have finished; without waiting, the heartbeat simply expires
+            with self._lock, self._connect() as db:
+                db.execute("DELETE FROM runners WHERE runner_id = ?", (self.runner_id,))
+
+
+def _decode(row):
+    job = dict(row)
+    for key in _JSON_COLUMNS:
+        job[key] = json.loads(job[key]) if job[key] is not None else None
+    return job
+
+
+# --- Optimizer jobs ---
+
+# Model evaluator of an optimizer job: evaluate_batch(sizings) -> metrics that stops at cancellation. The hourly
+# model is evaluated on a worker process pool owned by the job (only `keys` are sent back); the pool is shut
+# down on exit and a cancelled sweep surfaces as JobCancelled.
+@contextmanager
+def _job_evaluator(context, config, model, compute_irr, keys, load_profiles, max_workers):
+    from efinops.executor import SweepCancelled, SweepExecutor
+    from efinops.model import MODEL_HOURLY, evaluate_model_batch
+
+    executor = SweepExecutor(config, model, max_workers=max_workers, load_profiles=load_profiles) if model == MODEL_HOURLY else None
+
+    def evaluate_batch(sizings):
+        context.check()
+        if executor is None:
+            return evaluate_model_batch(config, sizings, model, compute_irr)
+        if context.cancelled:
+            executor.cancel()
+        return executor.evaluate_batch(sizings, compute_irr, keys=keys, on_chunk=lambda completed, total: context.check())
+    try:
+        yield evaluate_batch
+    except SweepCancelled:
+        raise JobCancelled()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+# evaluate_batch that also records every evaluated scenario into a ScenarioStore (efinops.scenario_store) when
+# store is given; the scenarios are bulk-inserted on exit, also those of a cancelled or failed search
+@contextmanager
+def _scenario_recording(evaluate_batch, store, config, model, park):
+    if store is None:
+        yield evaluate_batch
+        return
+    from efinops.scenario_store import ScenarioRecorder
+
+    recorder = ScenarioRecorder(evaluate_batch)
+    try:
+        yield recorder
+    finally:
+        with timer('scenario_store_insert', model=model):
+            recorder.save(store, config, model, park or '')
+
+
+def _bound_batch(config, model):
+    from efinops.model import MODEL_ANNUAL, calculate_mixed_system_bounds_batch
+
+    return (lambda lower, upper: calculate_mixed_system_bounds_batch(config, lower, upper)) if model == MODEL_ANNUAL else None
+
+
+# Job function running efinops.optimize.optimize on one config. The result holds the optimize() summary plus
+# the best `table_rows` candidates as lists (sizings, objective values). Progress info carries evaluations,
+# best_score and best_params, so the best sizing found so far is kept even if the job is cancelled.
+# park: the park of the config. When given, the search is warm-started from the park's previous searches under
+# this model (efinops.warmstart; unless warm_start is False) and the result also carries their 'warm' summary.
+# store: ScenarioStore that receives every scenario the search evaluated, filed under the park.
+def optimization_job(config, objective, model, method='hybrid', time_budget=1.0, load_profiles=None, table_rows=10_000,
+                     max_workers=None, park=None, warm_start=True, store=None):
+    warm = park is not None and warm_start
+
+    def run(context):
+        from efinops.optimize import OBJECTIVE_IRR, OBJECTIVE_METRIC_KEYS, optimize, top_candidates
+        from efinops.scenario_store import STORE_METRIC_KEYS
+        from efinops.warmstart import WARM_EVALUATE_KEYS, candidate_memory, warm_optimize
+
+        keys = WARM_EVALUATE_KEYS if warm else OBJECTIVE_METRIC_KEYS[objective]
+        if store is not None:
+            keys = tuple(dict.fromkeys(keys + STORE_METRIC_KEYS))
+        with (_job_evaluator(context, config, model, objective == OBJECTIVE_IRR, keys, load_profiles, max_workers) as evaluate_batch,
+              _scenario_recording(evaluate_batch, store, config, model, park) as evaluate_batch):
+            if not warm:
+                result = optimize(config, objective, evaluate_batch, bound_batch=_bound_batch(config, model),
+                                  method=method, time_budget=time_budget, progress=context.progress)
+            else:
+                result = warm_optimize(config, objective, evaluate_batch, candidate_memory(park, model),
+                                       bound_batch=_bound_batch(config, model), method=method, time_budget=time_budget,
+                                       progress=context.progress)
+        sizings, values = top_candidates(result, table_rows)
+        return {
+            'method': result['method'],
+            'objective': objective,
+            'model': model,
+            'best_params': result['best_params'],
+            'best_score': result['best_score'],
+            'evaluations': result['evaluations'],
+            'elapsed': result['elapsed'],
+            'exhaustive': result['exhaustive'],
+            'candidates': {'sizings': sizings.tolist(), 'values': values.tolist()},
+            **({'warm': result['warm']} if 'warm' in result else {}),
+        }
+    return run
+
+
+# Job function running efinops.pareto.pareto_optimize: the result holds the frontier as lists (sizings and
+# one list per PARETO_METRIC_KEYS metric, None where not computable or never paid back), the best sizing per
+# searched objective and the run summary (exhaustive: the front is the exact lattice front, otherwise an
+# approximation). Progress info carries evaluations and front_size.
+# store: ScenarioStore that receives every scenario the search evaluated, filed under park.
+def pareto_job(config, model, method='hybrid', time_budget=1.0, load_profiles=None, max_workers=None, park=None, store=None):
+    def run(context):
+        from efinops.pareto import OBJECTIVE_PARETO, PARETO_METRIC_KEYS, pareto_optimize
+        from efinops.scenario_store import STORE_METRIC_KEYS
+
+        keys = PARETO_METRIC_KEYS if store is None else tuple(dict.fromkeys(PARETO_METRIC_KEYS + STORE_METRIC_KEYS))
+        with (_job_evaluator(context, config, model, True, keys, load_profiles, max_workers) as evaluate_batch,
+              _scenario_recording(evaluate_batch, store, config, model, park) as evaluate_batch):
+            result = pareto_optimize(config, evaluate_batch, bound_batch=_bound_batch(config, model),
+                                     method=method, time_budget=time_budget, progress=context.progress)
+        front = result['front']
+        return {
+            'method': result['method'],
+            'objective': OBJECTIVE_PARETO,
+            'model': model,
+            'front': {'sizings': front['sizings'].tolist(),
+                      **{key: [float(v) if math.isfinite(v) else None for v in front[key]] for key in PARETO_METRIC_KEYS}},
+            'best': result['best'],
+            'evaluations': result['evaluations'],
+            'elapsed': result['elapsed'],
+            'exhaustive': result['exhaustive'],
+            'optima_exhaustive': result['optima_exhaustive'],
+        }
+    return run
@@ -0,0 +1,309 @@
+# Annual simplified energy model of the mixed system (solar thermal, PV, heat pump, storage).
+# Moved out of efinops_app.py so the evaluators can be imported by worker processes and headless tools;
+# the What-If page imports them from here.
+import numpy as np
+
+from efinops.finance import CAPEX_COST_KEYS, SIZING_COLUMNS, as_sizings, capex_batch, cash_flow_metrics, format_payback
+from efinops.hourly import calculate_mixed_system_metrics_hourly, hourly_inputs
+from efinops.instrument import count
+from efinops.irr import IRR_STATUS_INITIAL_NOT_NEGATIVE, format_irr
+from efinops.pipeline import Stage, run_stages
+from efinops.storage import STORAGE_PLAN_KEYS, annual_storage_saving
+from efinops.tariff import TARIFF_KEY, compiled_tariff
+
+MODEL_ANNUAL = 'annual' # Annual totals with fixed run hours (calculate_mixed_system_metrics)
+MODEL_HOURLY = 'hourly' # 8760-hour dispatch under TOU pricing (efinops.hourly)
+MODELS = (MODEL_ANNUAL, MODEL_HOURLY)
+
+# Default park configuration (the initial values of the configuration page)
+DEFAULT_CONFIG = {
+    'annual_elec_kwh': 10_000_000,
+    'annual_heat_kwh': 5_000_000,
+    'annual_cool_kwh': 3_000_000,
+
+    'grid_price_static': 0.8, # 元/kWh
+    'grid_price_peak': 1.2,   # 元/kWh
+    'grid_price_valley': 0.5, # 元/kWh
+    'grid_price_shoulder': 0.8, # 元/kWh
+    'peak_perc': 0.20, # 20%
+    'valley_perc': 0.35, # 35%
+    # shoulder_perc derived as 1 - peak - valley
+    'tariff': None, # Tariff definition (efinops.tariff) replacing the three TOU prices and shares above when set
+
+    'grid_avg_cop': 2.5, # Baseline electric heating/cooling efficiency
+    'grid_avg_eer': 3.5,
+
+    'st_kwh_m2_hr': 0.5, # kWh/m²/hr
+    'st_cost_m2': 1500.0, # 元/m²
+    'st_annual_太阳小时': 1500, # Annual effective solar hours for thermal
+
+    'pv_kwh_m2_hr': 0.15, # kWh/m²/hr (average generation rate)
+    'pv_cost_m2': 1000.0, # 元/m² (simplified cost per area)
+    'pv_annual_太阳小时': 1200, # Annual effective solar hours for PV (considers capacity factor)
+
+    'hp_cop': 4.0, # Heat pump COP
+    'hp_eer': 5.0, # Heat pump EER
+    'hp_cost_kw': 2000.0, # 元/kW (cost per kW heating/cooling capacity)
+
+    'storage_eff_charge': 0.95, # 95%
+    'storage_eff_discharge': 0.95, # 95%
+    'storage_cost_kwh': 1500.0, # 元/kWh
+    'storage_c_rate': 0.5, # Max charge/discharge power per hour as a fraction of capacity
+
+    'project_lifespan_years': 20, # Years
+    'opex_percentage': 0.015, # 1.5% of CAPEX per year
+    'tax_rate': 0.25, # 25%
+    'discount_rate': 0.08, # 8% Hurdle Rate / Discount Rate
+    'depreciation_years': 10 # Fixed by tax law for assets > 10 years
+}
+
+
+DERIVED_KEYS = ('shoulder_perc',) # Set by complete_config, not edited directly
+NON_NUMERIC_KEYS = (TARIFF_KEY,) # Config values that are not numbers (never perturbed or stacked into arrays)
+# Numeric model inputs; configs may carry other entries (e.g. the app's meter_profile_hash) the model ignores
+NUMERIC_INPUT_KEYS = tuple(key for key in tuple(DEFAULT_CONFIG) + DERIVED_KEYS if key not in NON_NUMERIC_KEYS)
+
+# Fill missing keys from DEFAULT_CONFIG and derive shoulder_perc as the configuration page does
+def complete_config(config=None):
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    config['shoulder_perc'] = max(0.0, 1.0 - config['peak_perc'] - config['valley_perc'])
+    return config
+
+# Calculate Weighted Average TOU Grid Price based on annual percentages
+# Elementwise: prices and percentages may be arrays (one row per perturbation); scalars give a float
+def calculate_avg_tou_price(peak_price, valley_price, shoulder_price, peak_perc, valley_perc, shoulder_perc):
+    # Ensure percentages sum to 1, handle potential floating point inaccuracies
+    total_perc = peak_perc + valley_perc + shoulder_perc
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weighted = (peak_price * (peak_perc / total_perc)) + (valley_price * (valley_perc / total_perc)) + (shoulder_price * (shoulder_perc / total_perc))
+    # Default to static price if percentages are zero
+    price = np.where(total_perc > 0, weighted, (peak_price + valley_price + shoulder_price) / 3)
+    return float(price) if np.ndim(price) == 0 else price
+
+# Average grid price of the annual model: the weighted TOU price, or the mean hourly price of a tariff definition
+def average_grid_price(config):
+    if config.get(TARIFF_KEY) is not None:
+        return compiled_tariff(config).average_price
+    return calculate_avg_tou_price(
+        config['grid_price_peak'], config['grid_price_valley'], config['grid_price_shoulder'],
+        config['peak_perc'], config['valley_perc'], config['shoulder_perc']
+    )
+
+# Grid energy input of the baseline (pure grid) system for the annual demands
+# Electricity needs grid kWh directly, heat needs Heat Demand / COP_base and cool Cool Demand / EER_base kWh grid input
+def baseline_grid_input(config):
+    return config['annual_elec_kwh'] + config['annual_heat_kwh'] / config['grid_avg_cop'] + config['annual_cool_kwh'] / config['grid_avg_eer']
+
+# Calculate Baseline Annual Cost (Pure Grid, using Avg TOU)
+def calculate_baseline_annual_cost(config):
+    return baseline_grid_input(config) * average_grid_price(config)
+
+# --- Stages of the annual simplified model ---
+# Only elementwise operations: config values may be scalars or arrays broadcastable against the sizing
+# arrays (e.g. one row per park in efinops.portfolio, one row per draw in efinops.montecarlo).
+
+HP_ANNUAL_RUN_HOURS = 4000 # Simplified assumption for total heat pump run hours over the year (split heating / cooling)
+
+# Annual generation potential of the installed equipment, before capping by demand
+# Solar thermal / PV: area x generation rate x annual effective solar hours.
+# Heat pump: capacity x COP (EER) x half of the annual run hours for heating (cooling).
+def generation_potentials(config, st_area, pv_area, hp_capacity_kw):
+    return {
+        'st_heat': st_area * config['st_kwh_m2_hr'] * config['st_annual_太阳小时'],
+        'pv_elec': pv_area * config['pv_kwh_m2_hr'] * config['pv_annual_太阳小时'],
+        'hp_heat': hp_capacity_kw * config['hp_cop'] * (HP_ANNUAL_RUN_HOURS / 2),
+        'hp_cool': hp_capacity_kw * config['hp_eer'] * (HP_ANNUAL_RUN_HOURS / 2),
+    }
+
+# Grid energy input of the mixed system before storage arbitrage
+# Supply is capped by demand (HP supplements ST for heat); PV and ST have zero marginal running cost, the HP
+# draws supplied / COP (EER) from the grid and the remaining demand is met by the baseline grid equipment.
+def grid_input_pre_storage(config, potentials):
+    annual_elec_need = config['annual_elec_kwh']
+    annual_heat_need = config['annual_heat_kwh']
+    annual_cool_need = config['annual_cool_kwh']
+
+    annual_pv_supplied = np.minimum(potentials['pv_elec'], annual_elec_need)
+    annual_st_supplied_heat = np.minimum(potentials['st_heat'], annual_heat_need)
+    annual_hp_supplied_heat = np.minimum(potentials['hp_heat'], annual_heat_need - annual_st_supplied_heat)
+    annual_hp_supplied_cool = np.minimum(potentials['hp_cool'], annual_cool_need)
+
+    annual_hp_grid_input = (annual_hp_supplied_heat / config['hp_cop']) + (annual_hp_supplied_cool / config['hp_eer'])
+    annual_elec_from_grid = np.maximum(0, annual_elec_need - annual_pv_supplied)
+    annual_heat_from_grid_input = np.maximum(0, annual_heat_need - annual_st_supplied_heat - annual_hp_supplied_heat) / config['grid_avg_cop']
+    annual_cool_from_grid_input = np.maximum(0, annual_cool_need - annual_hp_supplied_cool) / config['grid_avg_eer']
+    return annual_elec_from_grid + annual_heat_from_grid_input + annual_cool_from_grid_input + annual_hp_grid_input
+
+# Annual storage arbitrage saving of the cost-minimizing hourly schedule under the TOU tariff, within the
+# capacity, power and round-trip efficiency limits (efinops.storage)
+def storage_arbitrage_saving(config, storage_capacity_kwh):
+    return annual_storage_saving(config, storage_capacity_kwh)
+
+# Grid cost of the mixed system; cannot be negative
+def grid_cost_from_stages(grid_input, avg_tou_price, storage_saving):
+    return np.maximum(0, grid_input * avg_tou_price - storage_saving)
+
+# Annual grid cost of the mixed system (simplified annual model) for arrays of sizings
+def annual_grid_cost_batch(config, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh, avg_tou_price):
+    grid_input = grid_input_pre_storage(config, generation_potentials(config, st_area, pv_area, hp_capacity_kw))
+    return grid_cost_from_stages(grid_input, avg_tou_price, storage_arbitrage_saving(config, storage_capacity_kwh))
+
+# Stage graph of the annual model (see efinops.pipeline):
+# capex, generation -> energy_balance, storage_arbitrage, tou_price -> grid_cost, baseline -> cash_flows
+ANNUAL_STAGES = (
+    Stage('capex', keys=CAPEX_COST_KEYS, sizing=SIZING_COLUMNS,
+          compute=lambda config, inputs, options: capex_batch(config, np.column_stack([inputs[column] for column in SIZING_COLUMNS]))),
+    Stage('generation', keys=('st_kwh_m2_hr', 'st_annual_太阳小时', 'pv_kwh_m2_hr', 'pv_annual_太阳小时', 'hp_cop', 'hp_eer'),
+          sizing=('st_area', 'pv_area', 'hp_capacity_kw'),
+          compute=lambda config, inputs, options: generation_potentials(config, inputs['st_area'], inputs['pv_area'], inputs['hp_capacity_kw'])),
+    Stage('energy_balance', keys=('annual_elec_kwh', 'annual_heat_kwh', 'annual_cool_kwh', 'hp_cop', 'hp_eer', 'grid_avg_cop', 'grid_avg_eer'),
+          upstream=('generation',),
+          compute=lambda config, inputs, options: grid_input_pre_storage(config, inputs['generation'])),
+    Stage('storage_arbitrage', keys=STORAGE_PLAN_KEYS + (TARIFF_KEY,),
+          sizing=('storage_capacity_kwh',),
+          compute=lambda config, inputs, options: storage_arbitrage_saving(config, inputs['storage_capacity_kwh'])),
+    Stage('tou_price', keys=('grid_price_peak', 'grid_price_valley', 'grid_price_shoulder', 'peak_perc', 'valley_perc', 'shoulder_perc', TARIFF_KEY),
+          compute=lambda config, inputs, options: average_grid_price(config)),
+    Stage('grid_cost', upstream=('energy_balance', 'tou_price', 'storage_arbitrage'),
+          compute=lambda config, inputs, options: grid_cost_from_stages(inputs['energy_balance'], inputs['tou_price'], inputs['storage_arbitrage'])),
+    Stage('baseline', keys=('annual_elec_kwh', 'annual_heat_kwh', 'annual_cool_kwh', 'grid_avg_cop', 'grid_avg_eer'), upstream=('tou_price',),
+          compute=lambda config, inputs, options: baseline_grid_input(config) * inputs['tou_price']),
+    Stage('cash_flows', keys=('project_lifespan_years', 'opex_percentage', 'tax_rate', 'discount_rate', 'depreciation_years'),
+          upstream=('capex', 'grid_cost', 'baseline'), options=('compute_irr',),
+          compute=lambda config, inputs, options: cash_flow_metrics(config, inputs['capex'], inputs['grid_cost'], inputs['baseline'], options.get('compute_irr', True))),
+)
+
+# Calculate Mixed System Metrics (Simplified Model for What-If)
+# Metrics of one sizing with display strings for the payback period and IRR, evaluated through ANNUAL_STAGES
+# baseline_annual_cost may be passed in when the caller already has it for this config; pipeline: a
+# StagePipeline over ANNUAL_STAGES whose per-stage caches are reused across calls
+def calculate_mixed_system_metrics(config, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh, baseline_annual_cost=None, pipeline=None):
+    # Total delivered energy is the sum of needs, which is constant across scenarios
+    if config['annual_elec_kwh'] + config['annual_heat_kwh'] + config['annual_cool_kwh'] == 0:
+        return {
+            "total_capex": 0, "annual_opex_mixed": 0, "annual_gross_saving": 0,
+            "payback_period": "N/A (无能源需求)", "irr": "N/A", "irr_value": -np.inf,
+            "npv_value": 0, "cash_flows": [0] * (config['project_lifespan_years'] + 1)
+        }
+
+    sizing = [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh]
+    count('scenario_evaluations', model='annual')
+    if pipeline is not None:
+        metrics = pipeline.evaluate(config, [sizing], {'compute_irr': True})['cash_flows']
+    else:
+        precomputed = None if baseline_annual_cost is None else {'baseline': baseline_annual_cost}
+        metrics = run_stages(ANNUAL_STAGES, config, [sizing], {'compute_irr': True}, precomputed)['cash_flows']
+    cash_flows = metrics['cash_flows'][0]
+    return {
+        "total_capex": metrics['total_capex'][0],
+        "annual_opex_mixed": metrics['annual_opex_mixed'][0],
+        "annual_gross_saving": metrics['annual_gross_saving'][0], # Saving vs baseline operating cost (pre-tax/deprec)
+        "payback_period": format_payback(metrics['payback_year_num'][0], cash_flows),
+        "payback_year_num": metrics['payback_year_num'][0], # Numerical for optimization
+        "irr": format_irr(metrics['irr_value'][0], metrics['irr_status'][0]),
+        "irr_value": metrics['irr_value'][0], # Numerical for optimization
+        "npv_value": metrics['npv_value'][0], # Numerical for optimization
+        "cash_flows": list(cash_flows) # Full cash flow series
+    }
+
+# Batch version of calculate_mixed_system_metrics for optimization sweeps
+# sizings: array of shape (N, 4) with columns [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh]
+# Returns a dict of NumPy arrays (one entry per candidate) with the same numerical results as the scalar version.
+# Display strings are not produced here; payback_year_num is inf where the project never recovers, irr_value is -inf where IRR is not computable.
+# compute_irr=False skips the IRR solve (irr_value/irr_status are then None) for sweeps that rank by NPV or payback.
+# pipeline: optional StagePipeline over ANNUAL_STAGES, e.g. for sweeps that vary only financial inputs
+def calculate_mixed_system_metrics_batch(config, sizings, compute_irr=True, pipeline=None):
+    sizings = as_sizings(sizings)
+    n = sizings.shape[0]
+    count('scenario_evaluations', n, model='annual')
+    project_lifespan = config['project_lifespan_years']
+
+    if config['annual_elec_kwh'] + config['annual_heat_kwh'] + config['annual_cool_kwh'] == 0:
+        zeros = np.zeros(n)
+        return {
+            "total_capex": zeros, "annual_opex_mixed": zeros.copy(), "annual_gross_saving": zeros.copy(),
+            "payback_year_num": np.full(n, np.inf), "irr_value": np.full(n, -np.inf),
+            "irr_status": np.full(n, IRR_STATUS_INITIAL_NOT_NEGATIVE, dtype=np.int8),
+            "npv_value": zeros.copy(), "cash_flows": np.zeros((n, project_lifespan + 1))
+        }
+
+    # CAPEX -> energy balance and grid cost -> after-tax cash flow matrix, N x (lifespan + 1)
+    if pipeline is not None:
+        return pipeline.evaluate(config, sizings, {'compute_irr': compute_irr})['cash_flows']
+    return run_stages(ANNUAL_STAGES, config, sizings, {'compute_irr': compute_irr})['cash_flows']
+
+# Bounds of the mixed-system model over boxes of sizings (used for branch-and-bound pruning)
+# lower/upper: arrays of shape (K, 4), same column order as calculate_mixed_system_metrics_batch
+# Returns per-box CAPEX range, a lower bound on the annual grid cost and the baseline cost.
+def calculate_mixed_system_bounds_batch(config, lower, upper):
+    lower = np.atleast_2d(np.asarray(lower, dtype=float))
+    upper = np.atleast_2d(np.asarray(upper, dtype=float))
+    capex_lo = capex_batch(config, lower)
+    capex_hi = capex_batch(config, upper)
+
+    annual_elec_need = config['annual_elec_kwh']
+    annual_heat_need = config['annual_heat_kwh']
+    annual_cool_need = config['annual_cool_kwh']
+    if annual_elec_need + annual_heat_need + annual_cool_need == 0:
+        zeros = np.zeros(len(lower))
+        return {"capex_lo": zeros, "capex_hi": zeros.copy(), "grid_cost_lb": zeros.copy(), "baseline_cost": 0.0}
+
+    # Electricity: grid import only falls as PV grows
+    pv_supplied_max = np.minimum(upper[:, 1] * config['pv_kwh_m2_hr'] * config['pv_annual_太阳小时'], annual_elec_need)
+    elec_lb = np.maximum(0, annual_elec_need - pv_supplied_max)
+
+    # Cooling: grid input is linear in the HP-supplied share, so the minimum is at one end of its range
+    def cool_input(hp_cool):
+        return np.maximum(0, annual_cool_need - hp_cool) / config['grid_avg_eer'] + hp_cool / config['hp_eer']
+    hp_cool_range = [np.minimum(b[:, 2] * config['hp_eer'] * (HP_ANNUAL_RUN_HOURS / 2), annual_cool_need) for b in (lower, upper)]
+    cool_lb = np.minimum(cool_input(hp_cool_range[0]), cool_input(hp_cool_range[1]))
+
+    # Heating: grid input is linear in (ST supplied, HP supplied) over a polygon, so evaluate its vertices
+    def heat_input(st_heat, hp_heat):
+        return np.maximum(0, annual_heat_need - st_heat - hp_heat) / config['grid_avg_cop'] + hp_heat / config['hp_cop']
+    st_range = [np.minimum(b[:, 0] * config['st_kwh_m2_hr'] * config['st_annual_太阳小时'], annual_heat_need) for b in (lower, upper)]
+    hp_heat_range = [b[:, 2] * config['hp_cop'] * (HP_ANNUAL_RUN_HOURS / 2) for b in (lower, upper)]
+    st_vertices = st_range + [np.clip(annual_heat_need - p, st_range[0], st_range[1]) for p in hp_heat_range]
+    heat_lb = np.min([heat_input(s, np.minimum(p, annual_heat_need - s)) for s in st_vertices for p in hp_heat_range], axis=0)
+
+    # Storage: the optimal schedule's value is nondecreasing in capacity on the slider lattice (efinops.storage)
+    storage_saving_max = np.maximum(storage_arbitrage_saving(config, lower[:, 3]), storage_arbitrage_saving(config, upper[:, 3]))
+
+    avg_tou_price = average_grid_price(config)
+    grid_cost_lb = np.maximum(0, (elec_lb + heat_lb + cool_lb) * avg_tou_price - storage_saving_max)
+
+    return {
+        "capex_lo": capex_lo,
+        "capex_hi": capex_hi,
+        "grid_cost_lb": grid_cost_lb,
+        "baseline_cost": calculate_baseline_annual_cost(config),
+    }
+
+# Batch evaluator of either model (same result keys, see calculate_mixed_system_metrics_batch)
+# hourly: output of efinops.hourly.hourly_inputs(config); built from synthetic profiles when not supplied
+def evaluate_model_batch(config, sizings, model=MODEL_ANNUAL, compute_irr=True, hourly=None):
+    if model == MODEL_HOURLY:
+        hourly = hourly_inputs(config) if hourly is None else hourly
+        return calculate_mixed_system_metrics_hourly(config, hourly['profiles'], sizings, compute_irr,
+                                                     prices=hourly['prices'], periods=hourly['periods'])
+    if model == MODEL_ANNUAL:
+        return calculate_mixed_system_metrics_batch(config, sizings, compute_irr)
+    raise ValueError(f"Unknown model: {model}")
+
+
+# Hourly-model metrics of one sizing with the display strings of calculate_mixed_system_metrics
+def calculate_mixed_system_metrics_hourly_display(config, sizing, hourly=None):
+    metrics = evaluate_model_batch(config, [sizing], MODEL_HOURLY, hourly=hourly)
+    cash_flows = metrics['cash_flows'][0]
+    return {
+        "total_capex": metrics['total_capex'][0],
+        "annual_opex_mixed": metrics['annual_opex_mixed'][0],
+        "annual_gross_saving": metrics['annual_gross_saving'][0],
+        "payback_period": format_payback(metrics['payback_year_num'][0], cash_flows),
+        "payback_year_num": metrics['payback_year_num'][0],
+        "irr": format_irr(metrics['irr_value'][0], metrics['irr_status'][0]),
+        "irr_value": metrics['irr_value'][0],
+        "npv_value": metrics['npv_value'][0],
+        "cash_flows": list(cash_flows),
+        "dispatch": {key: float(value[0]) for key, value in metrics['dispatch'].items()},
+    }
@@ -0,0 +1,382 @@
+# Streaming baseline-deviation and anomaly detection for the Operate phase (实时监控与预警).
+# A MeterMonitor consumes meter readings as they arrive, in batches of the ingest long format (timestamp,
+# meter_id, kwh per reading interval), and keeps everything it needs per meter in compact arrays:
+#   - an expected-consumption baseline per (day type, hour of day) slot: exponentially weighted mean and
+#     variance of the readings over about MONITOR_BASELINE_DAYS days, updated in O(1) per reading (spikes
+#     excluded). Slots can be seeded from metered hourly profiles around the monitored date (efinops.ingest /
+#     efinops.profile_store), otherwise they learn online and flag nothing before MONITOR_WARMUP_READINGS readings;
+#   - a drift score: exponentially weighted mean of the readings' z-scores against their slot, which picks
+#     up sustained deviations too small to flag as single spikes;
+#   - actual vs. expected energy per TOU class (valley / shoulder / peak of the config's tariff) and the cost
+#     of the deviation at each reading's hourly tariff price.
+# A reading with |z| above the spike threshold or a drift score above the drift threshold makes its meter
+# anomalous; an alert is raised when a meter becomes anomalous, not for every anomalous reading, and the meter
+# clears once its drift score has fallen below half the threshold.
+#
+# Readings are grouped into ticks of interval_s (one reading per meter and tick; duplicates are summed, late
+# readings of an already processed tick are dropped) and each tick is one vectorized update over its meters,
+# so thousands of meters at 1-minute resolution run on a single core far faster than real time.
+# Feeds are any iterable (or async iterable) of reading batches; replay_meter_file replays a local export as
+# a stand-in for a live feed and synthetic_feed generates minute readings from hourly profiles.
+import time
+
+import numpy as np
+import pandas as pd
+
+from efinops.ingest import DEFAULT_COLUMNS, INGEST_CHUNK_ROWS, iter_meter_chunks
+from efinops.instrument import count, timer
+from efinops.model import complete_config
+from efinops.tariff import (
+    HOURS_PER_DAY,
+    HOURS_PER_YEAR,
+    PERIOD_PEAK,
+    PERIOD_SHOULDER,
+    PERIOD_VALLEY,
+    TOU_CLASSES,
+    compiled_tariff,
+)
+
+MONITOR_INTERVAL_S = 60 # Reading interval of the feed (one tick)
+MONITOR_BASELINE_DAYS = 14 # Memory of the baselines: days of a slot's day type its mean / variance average over
+MONITOR_DRIFT_WEIGHT = 0.1 # Weight of a reading's z-score in its meter's drift score (memory ~10 readings)
+MONITOR_Z_THRESHOLD = 5.0 # |z| of a single reading flagged as a spike
+MONITOR_DRIFT_THRESHOLD = 2.0 # |drift score| flagged as a sustained deviation
+MONITOR_WARMUP_READINGS = 30 # Readings a slot needs before its deviations are scored
+MONITOR_RELATIVE_NOISE = 0.05 # Standard deviation floor as a share of the expected reading
+MONITOR_ABSOLUTE_NOISE = 1e-3 # Standard deviation floor in kWh per reading
+MONITOR_SEED_WINDOW_DAYS = 28 # Days of the profile year around the monitored date that seed the baselines
+MONITOR_STALE_AFTER_S = 15 * 60 # Meters without a reading for this long are reported as stale
+MONITOR_REPLAY_CHUNK_ROWS = INGEST_CHUNK_ROWS
+
+ALERT_SPIKE = 'spike' # Single reading far from the baseline
+ALERT_DRIFT = 'drift' # Sustained deviation
+TOU_CLASS_NAMES = (PERIOD_VALLEY, PERIOD_SHOULDER, PERIOD_PEAK) # Labels of TOU_CLASSES
+DAY_TYPES = 2 # Workday, weekend
+SLOTS = DAY_TYPES * HOURS_PER_DAY
+ALERT_COLUMNS = ('timestamp', 'meter_id', 'kind', 'kwh', 'expected_kwh', 'z', 'drift', 'period', 'excess_kwh', 'excess_cost')
+
+_METER_ARRAYS = ('mean', 'var', 'count', 'drift', 'active', 'last_tick', 'last_kwh', 'meter_readings', 'incidents',
+                 'actual_kwh', 'expected_kwh', 'excess_cost')
+_SECONDS_PER_DAY = 86_400
+_EPOCH_WEEKDAY = 3 # 1970-01-01 was a Thursday (Monday = 0)
+
+
+# Baseline slot (day type x hour of day) of epoch seconds in local time
+def baseline_slots(seconds):
+    days = seconds // _SECONDS_PER_DAY
+    weekend = (days + _EPOCH_WEEKDAY) % 7 >= 5
+    return weekend * HOURS_PER_DAY + (seconds % _SECONDS_PER_DAY) // 3600
+
+
+# Hour of the (non-leap) tariff year of epoch seconds; 29 February is priced as 28 February
+def tariff_hours(seconds):
+    moments = seconds.astype('datetime64[s]')
+    years = moments.astype('datetime64[Y]')
+    hours = (moments - years.astype('datetime64[s]')).astype(np.int64) // 3600
+    year = years.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    hours = hours - np.where(leap & (hours >= 59 * HOURS_PER_DAY), HOURS_PER_DAY, 0)
+    return np.clip(hours, 0, HOURS_PER_YEAR - 1)
+
+
+def _epoch_seconds(timestamps):
+    timestamps = pd.Series(timestamps)
+    if not pd.api.types.is_datetime64_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
+    return timestamps.to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+
+class MeterMonitor:
+    # config: prices and TOU classes come from its tariff (efinops.tariff); columns: as in efinops.ingest
+    def __init__(self, config=None, meter_ids=(), interval_s=MONITOR_INTERVAL_S, baseline_days=MONITOR_BASELINE_DAYS,
+                 drift_weight=MONITOR_DRIFT_WEIGHT, z_threshold=MONITOR_Z_THRESHOLD, drift_threshold=MONITOR_DRIFT_THRESHOLD,
+                 warmup=MONITOR_WARMUP_READINGS, columns=None):
+        tariff = compiled_tariff(complete_config(config))
+        self.prices = tariff.prices
+        self.periods = tariff.periods
+        self.interval_s = int(interval_s)
+        self.alpha = min(self.interval_s / (baseline_days * 3600), 1.0) # Weight of a reading in its slot
+        self.drift_weight = drift_weight
+        self.z_threshold = z_threshold
+        self.drift_threshold = drift_threshold
+        self.warmup = warmup
+        self.columns = {**DEFAULT_COLUMNS, **(columns or {})}
+        self.readings = 0
+        self.readings_dropped = 0
+        self.alerts = 0
+        self._meter_rows = {}
+        self._meter_ids = []
+        # State arrays, meters along the last axis (grown as meters appear); slot arrays are SLOTS x meters so
+        # that one tick reads and writes one contiguous row
+        self.mean = np.zeros((SLOTS, 0), dtype=np.float32) # Expected kWh per reading
+        self.var = np.zeros((SLOTS, 0), dtype=np.float32)
+        self.count = np.zeros((SLOTS, 0), dtype=np.int32) # Readings seen (seeded slots start at warmup)
+        self.drift = np.zeros(0, dtype=np.float32)
+        self.active = np.zeros(0, dtype=bool) # Meter currently anomalous
+        self.last_tick = np.zeros(0, dtype=np.int64) # Last processed tick, -1 before the first reading
+        self.last_kwh = np.zeros(0, dtype=np.float32)
+        self.meter_readings = np.zeros(0, dtype=np.int64)
+        self.incidents = np.zeros(0, dtype=np.int32)
+        self.actual_kwh = np.zeros((len(TOU_CLASSES), 0)) # Of scored readings, per TOU class
+        self.expected_kwh = np.zeros((len(TOU_CLASSES), 0))
+        self.excess_cost = np.zeros(0)
+        self._index = pd.Index([], dtype=object) # Meter ids by row, for vectorized lookups
+        self.register(meter_ids)
+
+    # --- State ---
+
+    def _grow(self, n_meters):
+        capacity = self.drift.shape[0]
+        if n_meters <= capacity:
+            return
+        capacity = max(n_meters, 2 * capacity, 16)
+        for name in _METER_ARRAYS:
+            array = getattr(self, name)
+            extra = np.full(array.shape[:-1] + (capacity - array.shape[-1],), -1 if name == 'last_tick' else 0, dtype=array.dtype)
+            setattr(self, name, np.concatenate([array, extra], axis=-1))
+
+    # Add meters (known meter ids are ignored); returns their rows
+    def register(self, meter_ids):
+        rows = []
+        for meter_id in meter_ids:
+            meter_id = str(meter_id)
+            if meter_id not in self._meter_rows:
+                self._meter_rows[meter_id] = len(self._meter_ids)
+                self._meter_ids.append(meter_id)
+            rows.append(self._meter_rows[meter_id])
+        if len(self._index) != len(self._meter_ids):
+            self._index = pd.Index(self._meter_ids, dtype=object)
+            self._grow(len(self._meter_ids))
+        return np.array(rows, dtype=np.int64)
+
+    @property
+    def meter_ids(self):
+        return list(self._meter_ids)
+
+    # Seed the baselines from metered hourly kWh (efinops.ingest.MeterAccumulator.result() or a profile store
+    # entry): slot means and variances of the hourly values, scaled to one reading interval. With `day` (day of
+    # the profile year the monitoring starts at) only the window_days around it are used, so the baselines follow
+    # the season; otherwise the whole year. Seeded slots are scored from the first reading on.
+    def seed(self, meter_data, day=None, window_days=MONITOR_SEED_WINDOW_DAYS):
+        rows = self.register(meter_data['meters']['meter_id'].astype(str))
+        start = np.datetime64(f"{meter_data['year']}-01-01", 's').astype(np.int64)
+        hours = np.arange(HOURS_PER_YEAR)
+        if day is not None:
+            days = HOURS_PER_YEAR // HOURS_PER_DAY
+            distance = np.abs((hours // HOURS_PER_DAY - day + days // 2) % days - days // 2) # Wraps around the year
+            hours = hours[distance <= window_days // 2]
+        hourly = np.asarray(meter_data['hourly_kwh'])[:, hours].astype(np.float64) * (self.interval_s / 3600)
+        onehot = np.zeros((len(hours), SLOTS))
+        onehot[np.arange(len(hours)), baseline_slots(start + hours * 3600)] = 1.0
+        n = onehot.sum(axis=0)
+        mean = (hourly @ onehot) / np.maximum(n, 1)
+        var = np.maximum((hourly ** 2 @ onehot) / np.maximum(n, 1) - mean ** 2, 0.0)
+        self.mean[:, rows] = mean.T
+        self.var[:, rows] = var.T
+        self.count[:, rows] = np.where(n > 0, max(self.warmup, int(np.ceil(1 / self.alpha))), 0)[:, None]
+
+    # --- Processing ---
+
+    # Rows of a batch's meter ids (new meters are registered), -1 for missing ids
+    def _rows(self, meter_ids):
+        meter_ids = pd.Series(meter_ids).astype('category')
+        categories = meter_ids.cat.categories.astype(str)
+        lookup = self._index.get_indexer(categories)
+        if (lookup < 0).any():
+            lookup[lookup < 0] = self.register(categories[lookup < 0])
+        codes = meter_ids.cat.codes.to_numpy()
+        return np.where(codes >= 0, lookup[codes] if len(lookup) else -1, -1)
+
+    # Process one batch of readings (DataFrame in the ingest long format, any order) and return the alerts it
+    # raised as a DataFrame with ALERT_COLUMNS: kind (ALERT_SPIKE / ALERT_DRIFT), the reading and its expected
+    # value (kWh), z-score, drift score, TOU period and the deviation in kWh and ¥ at the hour's price.
+    def process(self, chunk):
+        cols = self.columns
+        with timer('monitor_batch'):
+            seconds = _epoch_seconds(chunk[cols['timestamp']])
+            values = pd.to_numeric(chunk[cols['value']], errors='coerce').to_numpy(dtype=np.float64)
+            rows = self._rows(chunk[cols['meter_id']])
+            keep = np.isfinite(values) & (rows >= 0)
+            alerts = self._process(seconds[keep] // self.interval_s, rows[keep], values[keep])
+            self.readings_dropped += int((~keep).sum())
+        count('monitor_readings', len(chunk))
+        return alerts
+
+    def _process(self, ticks, rows, values):
+        n_meters = len(self._meter_ids)
+        if not len(ticks):
+            return _alert_frame([], self._meter_ids)
+        # One reading per meter and tick, ordered by tick
+        first_tick = ticks.min()
+        cells, inverse = np.unique((ticks - first_tick) * n_meters + rows, return_inverse=True)
+        cell_values = np.bincount(inverse, weights=values)
+        cell_ticks = cells // n_meters + first_tick
+        cell_rows = cells % n_meters
+        late = cell_ticks <= self.last_tick[cell_rows]
+        self.readings_dropped += int(late.sum())
+        cell_ticks, cell_rows, cell_values = cell_ticks[~late], cell_rows[~late], cell_values[~late]
+        self.readings += len(cell_ticks)
+        if not len(cell_ticks):
+            return _alert_frame([], self._meter_ids)
+
+        # Every reading of a tick shares its baseline slot, TOU class and price
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(cell_ticks)) + 1, [len(cell_ticks)]])
+        starts = cell_ticks[bounds[:-1]] * self.interval_s
+        slots = baseline_slots(starts)
+        hours = tariff_hours(starts)
+        alerts = []
+        for i, (begin, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            raised = self._update(starts[i] // self.interval_s, cell_rows[begin:end], cell_values[begin:end], slots[i],
+                                  self.periods[hours[i]], self.prices[hours[i]])
+            if raised is not None:
+                alerts.append({'timestamp': np.full(len(raised['row']), starts[i]), **raised})
+        self.alerts += sum(len(a['row']) for a in alerts)
+        return _alert_frame(alerts, self._meter_ids)
+
+    # One tick: distinct meter rows m with readings x, in baseline slot s and TOU class `period`
+    def _update(self, tick, m, x, s, period, price):
+        mean, var, n = self.mean[s, m].astype(np.float64), self.var[s, m].astype(np.float64), self.count[s, m]
+        scored = n >= self.warmup
+        std = np.sqrt(var + (MONITOR_RELATIVE_NOISE * mean) ** 2 + MONITOR_ABSOLUTE_NOISE ** 2)
+        z = np.where(scored, (x - mean) / std, 0.0)
+        spike = np.abs(z) > self.z_threshold
+        drift = (1 - self.drift_weight) * self.drift[m] + self.drift_weight * np.clip(z, -self.z_threshold, self.z_threshold)
+        anomalous = spike | (np.abs(drift) > self.drift_threshold)
+        active = self.active[m]
+        raised = anomalous & ~active
+        self.active[m] = anomalous | (active & (np.abs(drift) > self.drift_threshold / 2))
+        self.drift[m] = drift
+
+        # Baseline update (running mean until the slot has 1 / alpha readings); spikes do not enter it
+        weight = np.where(spike, 0.0, np.maximum(self.alpha, 1.0 / (n + 1)))
+        delta = x - mean
+        self.mean[s, m] = mean + weight * delta
+        self.var[s, m] = (1 - weight) * (var + weight * delta ** 2)
+        self.count[s, m] = n + ~spike
+
+        excess = np.where(scored, delta, 0.0)
+        self.actual_kwh[period, m] += np.where(scored, x, 0.0)
+        self.expected_kwh[period, m] += np.where(scored, mean, 0.0)
+        self.excess_cost[m] += excess * price
+        self.last_kwh[m] = x
+        self.meter_readings[m] += 1
+        self.incidents[m] += raised
+        self.last_tick[m] = tick
+        if not raised.any():
+            return None
+        return {
+            'row': m[raised], 'kind': np.where(spike[raised], ALERT_SPIKE, ALERT_DRIFT), 'kwh': x[raised],
+            'expected_kwh': mean[raised], 'z': z[raised], 'drift': drift[raised], 'period': np.full(raised.sum(), period),
+            'excess_kwh': excess[raised], 'excess_cost': excess[raised] * price,
+        }
+
+    # --- Reporting ---
+
+    # Meter state as a DataFrame, one row per meter: active (anomalous now), drift score, last reading time
+    # and kWh, readings, incidents (alerts raised), and actual / expected kWh of the scored readings in total and
+    # per TOU period with the deviation cost (¥) at the tariff's hourly prices
+    def status(self):
+        n = len(self._meter_ids)
+        last_seen = pd.to_datetime(np.where(self.last_tick[:n] >= 0, self.last_tick[:n] * self.interval_s, np.nan), unit='s')
+        actual, expected = self.actual_kwh[:, :n], self.expected_kwh[:, :n]
+        frame = pd.DataFrame({
+            'meter_id': self._meter_ids,
+            'active': self.active[:n],
+            'drift': self.drift[:n],
+            'last_seen': last_seen,
+            'last_kwh': self.last_kwh[:n],
+            'readings': self.meter_readings[:n],
+            'incidents': self.incidents[:n],
+            'actual_kwh': actual.sum(axis=0),
+            'expected_kwh': expected.sum(axis=0),
+        })
+        frame['deviation_kwh'] = frame['actual_kwh'] - frame['expected_kwh']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frame['deviation_pct'] = frame['deviation_kwh'] / frame['expected_kwh'] * 100
+        for c, name in zip(TOU_CLASSES, TOU_CLASS_NAMES):
+            frame[f'deviation_kwh_{name}'] = actual[c] - expected[c]
+        frame['deviation_cost'] = self.excess_cost[:n]
+        return frame
+
+    # Meters without a reading for more than after_s seconds before `now` (a timestamp; default: the latest
+    # reading of any meter), including registered meters that never reported
+    def stale_meters(self, now=None, after_s=MONITOR_STALE_AFTER_S):
+        n = len(self._meter_ids)
+        if now is None:
+            now_s = (self.last_tick[:n].max(initial=-1) + 1) * self.interval_s
+        else:
+            now_s = int(_epoch_seconds([now])[0])
+        stale = (self.last_tick[:n] < 0) | ((self.last_tick[:n] + 1) * self.interval_s < now_s - after_s)
+        return [self._meter_ids[i] for i in np.flatnonzero(stale)]
+
+    # Alerts of every batch of a feed (an iterable of reading batches)
+    def stream(self, feed):
+        for chunk in feed:
+            yield self.process(chunk)
+
+    # Async variant for async feeds (e.g. a message queue consumer); plain iterables are accepted as well
+    async def astream(self, feed):
+        if hasattr(feed, '__aiter__'):
+            async for chunk in feed:
+                yield self.process(chunk)
+        else:
+            for chunk in feed:
+                yield self.process(chunk)
+
+
+def _alert_frame(alerts, meter_ids):
+    if not alerts:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in zip(
+            ALERT_COLUMNS, ('datetime64[s]', object, object, float, float, float, float, object, float, float))})
+    merged = {key: np.concatenate([alert[key] for alert in alerts]) for key in alerts[0]}
+    frame = pd.DataFrame({
+        'timestamp': merged['timestamp'].astype('datetime64[s]'),
+        'meter_id': np.asarray(meter_ids, dtype=object)[merged['row']],
+        'kind': merged['kind'],
+        'kwh': merged['kwh'],
+        'expected_kwh': merged['expected_kwh'],
+        'z': merged['z'],
+        'drift': merged['drift'].astype(float),
+        'period': np.asarray(TOU_CLASS_NAMES, dtype=object)[merged['period']],
+        'excess_kwh': merged['excess_kwh'],
+        'excess_cost': merged['excess_cost'],
+    })
+    return frame
+
+
+# --- Feeds ---
+
+# Local stand-in for a live feed: replays a meter export (CSV / Parquet in the ingest format, ordered by time)
+# chunk by chunk. speed: multiple of real time to pace the replay at (None: as fast as possible).
+def replay_meter_file(source, chunk_rows=MONITOR_REPLAY_CHUNK_ROWS, file_format=None, columns=None, speed=None):
+    timestamp_column = {**DEFAULT_COLUMNS, **(columns or {})}['timestamp']
+    started, first = time.perf_counter(), None
+    for chunk in iter_meter_chunks(source, chunk_rows, file_format, columns):
+        if speed and len(chunk):
+            seconds = _epoch_seconds(chunk[timestamp_column])
+            first = seconds.min() if first is None else first
+            time.sleep(max((seconds.max() - first) / speed - (time.perf_counter() - started), 0.0))
+        yield chunk
+
+
+# Synthetic readings from hourly profiles (meter_data as in efinops.ingest), one batch per ticks_per_batch ticks
+# of all meters: each reading is its hour's kWh spread evenly over the hour, with relative Gaussian noise.
+# days: number of days from start_day (day of the profiles' year).
+def synthetic_feed(meter_data, start_day=0, days=1, interval_s=MONITOR_INTERVAL_S, noise=0.05, ticks_per_batch=60, seed=0):
+    rng = np.random.default_rng(seed)
+    meter_ids = meter_data['meters']['meter_id'].astype(str)
+    categories = pd.CategoricalDtype(meter_ids.unique())
+    codes = categories.categories.get_indexer(meter_ids)
+    hourly = np.asarray(meter_data['hourly_kwh'], dtype=np.float64) * (interval_s / 3600)
+    n_meters = len(meter_ids)
+    year_start = np.datetime64(f"{meter_data['year']}-01-01", 's').astype(np.int64)
+    ticks = days * _SECONDS_PER_DAY // interval_s
+    for first in range(0, ticks, ticks_per_batch):
+        seconds = year_start + start_day * _SECONDS_PER_DAY + np.arange(first, min(first + ticks_per_batch, ticks)) * interval_s
+        expected = hourly[:, (seconds - year_start) // 3600 % HOURS_PER_YEAR].T # ticks x meters
+        values = expected * (1 + noise * rng.standard_normal(expected.shape))
+        yield pd.DataFrame({
+            DEFAULT_COLUMNS['timestamp']: np.repeat(seconds, n_meters).astype('datetime64[s]'),
+            DEFAULT_COLUMNS['meter_id']: pd.Categorical.from_codes(np.tile(codes, len(seconds)), dtype=categories),
+            DEFAULT_COLUMNS['value']: np.maximum(values, 0.0).ravel(),
+        })
@@ -0,0 +1,119 @@
+# Monte Carlo uncertainty analysis of one sizing (annual simplified model).
+# Grid prices, COP/EER and solar hours are sampled from per-parameter distributions; every draw becomes one
+# row of the vectorized cash-flow math, so NPV, IRR and payback of tens of thousands of draws are computed
+# in a few array passes.
+#
+# Draws are generated in fixed-size chunks, and chunk k always uses the k-th child of SeedSequence(seed).
+# The samples therefore depend only on (seed, chunk_size, n_draws), not on how chunks are spread over
+# processes, and any chunk can be regenerated on its own.
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from efinops.finance import as_sizings, capex_batch, cash_flow_metrics
+from efinops.model import annual_grid_cost_batch, calculate_avg_tou_price, calculate_baseline_annual_cost
+from efinops.tariff import tou_equivalent
+
+# Config keys that may be sampled
+UNCERTAIN_PARAMS = (
+    'grid_price_peak', 'grid_price_valley', 'grid_price_shoulder',
+    'grid_avg_cop', 'grid_avg_eer', 'hp_cop', 'hp_eer',
+    'st_annual_太阳小时', 'pv_annual_太阳小时',
+)
+# Distribution specs, one tuple per sampled key:
+#   ('triangular', low, mode, high), ('uniform', low, high), ('normal', mean, std) (clipped at 0),
+#   ('lognormal', median, sigma)
+DISTRIBUTIONS = ('triangular', 'uniform', 'normal', 'lognormal')
+MC_DRAWS = 20000 # Default number of draws
+MC_CHUNK_SIZE = 5000 # Draws per RNG stream / task
+MC_PERCENTILES = (10, 50, 90) # P10 / P50 / P90 (plain percentiles: P10 is the low case)
+MC_METRICS = ('npv_value', 'irr_value', 'payback_year_num')
+
+
+# Triangular distributions of +/- spread (relative) around the config's point values
+def triangular_spread(config, spread=0.2, params=UNCERTAIN_PARAMS):
+    return {key: ('triangular', config[key] * (1 - spread), config[key], config[key] * (1 + spread)) for key in params}
+
+
+def _validate(distributions):
+    for key, spec in distributions.items():
+        if key not in UNCERTAIN_PARAMS:
+            raise ValueError(f"Parameter cannot be sampled: {key}")
+        if spec[0] not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution for {key}: {spec[0]}")
+
+
+def _draw(rng, spec, n):
+    kind, *args = spec
+    if kind == 'triangular':
+        low, mode, high = args
+        return rng.triangular(low, mode, high, n) if high > low else np.full(n, float(mode))
+    if kind == 'uniform':
+        return rng.uniform(args[0], args[1], n)
+    if kind == 'normal':
+        return np.maximum(rng.normal(args[0], args[1], n), 0.0)
+    return args[0] * np.exp(rng.normal(0.0, args[1], n))
+
+
+# Sampled config values for draws [chunk_index * chunk_size, ...) of a run; keys in UNCERTAIN_PARAMS order
+def sample_chunk(distributions, seed, chunk_index, n):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+    return {key: _draw(rng, distributions[key], n) for key in UNCERTAIN_PARAMS if key in distributions}
+
+
+# Metrics of one sizing for n sampled configs; config values not in the samples stay fixed
+def evaluate_draws(config, sizing, samples, compute_irr=True):
+    config = tou_equivalent(config)
+    params = {**config, **samples}
+    n = len(next(iter(samples.values()))) if samples else 1
+    st_area, pv_area, hp_capacity_kw, storage_capacity_kwh = as_sizings(sizing)[0]
+    total_capex = np.full(n, capex_batch(config, [sizing])[0])
+
+    annual_elec_need = config['annual_elec_kwh']
+    if annual_elec_need + config['annual_heat_kwh'] + config['annual_cool_kwh'] == 0:
+        return {"npv_value": np.zeros(n), "irr_value": np.full(n, -np.inf), "payback_year_num": np.full(n, np.inf)}
+
+    avg_tou_price = calculate_avg_tou_price(
+        params['grid_price_peak'], params['grid_price_valley'], params['grid_price_shoulder'],
+        config['peak_perc'], config['valley_perc'], config['shoulder_perc']
+    )
+    annual_grid_cost = annual_grid_cost_batch(params, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh, avg_tou_price)
+    metrics = cash_flow_metrics(config, total_capex, annual_grid_cost, calculate_baseline_annual_cost(params), compute_irr)
+    return {key: metrics[key] for key in MC_METRICS if metrics[key] is not None}
+
+
+def _run_chunk(task):
+    config, sizing, distributions, seed, chunk_index, n, compute_irr = task
+    return evaluate_draws(config, sizing, sample_chunk(distributions, seed, chunk_index, n), compute_irr)
+
+
+# Percentiles without interpolation, so infinite values (payback never reached, IRR undefined) are kept
+def percentile_summary(values, percentiles=MC_PERCENTILES):
+    summary = {f"p{p}": float(np.percentile(values, p, method='inverted_cdf')) for p in percentiles}
+    finite = values[np.isfinite(values)]
+    summary['mean'] = float(finite.mean()) if len(finite) else float('nan')
+    summary['finite_share'] = len(finite) / len(values)
+    return summary
+
+
+# Monte Carlo run for one sizing [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh]
+# Returns the per-draw metric arrays (MC_METRICS), a percentile summary per metric, the probability of a
+# positive NPV, n_draws, seed and elapsed seconds. workers > 1 spreads chunks over processes.
+def run_monte_carlo(config, sizing, distributions, n_draws=MC_DRAWS, seed=0, chunk_size=MC_CHUNK_SIZE, workers=1, compute_irr=True):
+    _validate(distributions)
+    t_start = time.perf_counter()
+    tasks = [(config, sizing, distributions, seed, k, min(chunk_size, n_draws - start), compute_irr)
+             for k, start in enumerate(range(0, n_draws, chunk_size))]
+    if workers <= 1 or len(tasks) <= 1:
+        chunks = [_run_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            chunks = list(pool.map(_run_chunk, tasks))
+
+    result = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+    result['summary'] = {key: percentile_summary(result[key]) for key in MC_METRICS if key in result}
+    result['prob_npv_positive'] = float(np.mean(result['npv_value'] > 0))
+    result.update({'n_draws': n_draws, 'seed': seed, 'elapsed': time.perf_counter() - t_start})
+    return result
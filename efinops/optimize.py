@@ -0,0 +1,394 @@
+# Optimization engine for the What-If sizing search.
+# Works on the integer lattice of the What-If sliders (every candidate is a multiple of the slider step),
+# so results are directly comparable to what a user can dial in by hand.
+#
+# Strategies are registered in OPTIMIZERS and share one signature: strategy(search) -> None, where `search`
+# is a SearchState carrying the evaluator, objective, incumbent and time budget. They can be chained
+# (the default "hybrid" runs adaptive grid -> coordinate descent -> branch and bound).
+import itertools
+import time
+
+import numpy as np
+
+from efinops.instrument import count, timer
+
+# Slider bounds and steps of the What-If page: (min, max, step) per sizing dimension
+SIZING_SPACE = (
+    (0.0, 5000.0, 50.0),    # st_area (m²)
+    (0.0, 10000.0, 100.0),  # pv_area (m²)
+    (0.0, 2000.0, 10.0),    # hp_capacity_kw
+    (0.0, 5000.0, 50.0),    # storage_capacity_kwh
+)
+
+OBJECTIVE_IRR = 'irr'
+OBJECTIVE_PAYBACK = 'payback'
+OBJECTIVE_NPV = 'npv'
+OBJECTIVES = (OBJECTIVE_IRR, OBJECTIVE_PAYBACK, OBJECTIVE_NPV)
+
+# Score used for candidates whose IRR cannot be computed (same penalty the original grid search used)
+IRR_PENALTY = -1e9
+# Score bounds of boxes (box_score_bounds): IRR bracket, bisection steps, and the margin added for rounding
+IRR_BOUND_MIN = -0.99
+IRR_BOUND_MAX = 100.0
+BISECTION_STEPS = 60
+SCORE_BOUND_SLACK = 1e-9
+
+# Convert batch metrics into scores where higher is always better
+# - irr: IRR value, IRR_PENALTY where not computable, -inf where the solver found no root
+# - payback: negative payback years, non-recovering projects penalized as 2 x lifespan
+# - npv: NPV at the configured discount rate
+def objective_scores(objective, metrics, config):
+    if objective == OBJECTIVE_IRR:
+        irr_value = metrics['irr_value']
+        return np.where(irr_value == -np.inf, IRR_PENALTY, np.nan_to_num(irr_value, nan=-np.inf))
+    if objective == OBJECTIVE_PAYBACK:
+        payback = metrics['payback_year_num']
+        return -np.where(np.isinf(payback), config['project_lifespan_years'] * 2, payback)
+    if objective == OBJECTIVE_NPV:
+        return np.asarray(metrics['npv_value'], dtype=float)
+    raise ValueError(f"Unknown objective: {objective}")
+
+# Metric keys objective_scores reads, e.g. to limit what worker processes send back
+OBJECTIVE_METRIC_KEYS = {
+    OBJECTIVE_IRR: ('irr_value',),
+    OBJECTIVE_PAYBACK: ('payback_year_num',),
+    OBJECTIVE_NPV: ('npv_value',),
+}
+
+# --- Bounds for branch and bound ---
+
+# Present value of 1/yr over years 1..L and over the depreciation window 1..min(D, L)
+def _annuity_factors(config, rate):
+    lifespan = config['project_lifespan_years']
+    depreciation_years = config['depreciation_years']
+    rate = np.asarray(rate, dtype=float)
+    years = np.arange(1, lifespan + 1)
+    discount = (1 + rate[..., None]) ** -years
+    return discount.sum(axis=-1), discount[..., :min(depreciation_years, lifespan)].sum(axis=-1)
+
+# Upper bound on NPV at `rate` for every box, given model bounds
+# NPV = A*(baseline - grid_cost) + k*capex with A = (1-T)*S_L and k = T*S_D/D - 1 - A*opex%
+def _npv_upper_bound(config, bounds, rate):
+    tax_rate = config['tax_rate']
+    annuity, annuity_dep = _annuity_factors(config, rate)
+    a = (1 - tax_rate) * annuity
+    k = tax_rate * annuity_dep / config['depreciation_years'] - 1 - a * config['opex_percentage']
+    return a * (bounds['baseline_cost'] - bounds['grid_cost_lb']) + np.maximum(k * bounds['capex_lo'], k * bounds['capex_hi'])
+
+# Upper bound on cumulative cash flow at (fractional) year p for every box
+# cum(p) = (1-T)*p*(baseline - grid_cost) + capex*(T*min(p, D)/D - 1 - (1-T)*p*opex%), linear within each year
+def _cumulative_cf_upper_bound(config, bounds, p):
+    tax_rate = config['tax_rate']
+    a = (1 - tax_rate) * p
+    k = tax_rate * np.minimum(p, config['depreciation_years']) / config['depreciation_years'] - 1 - a * config['opex_percentage']
+    return a * (bounds['baseline_cost'] - bounds['grid_cost_lb']) + np.maximum(k * bounds['capex_lo'], k * bounds['capex_hi'])
+
+# Margin by which a box could still beat the incumbent score (<= 0 means the box can be pruned).
+# The IRR and payback bounds assume non-negative annual cash flows after year 0, which holds for every
+# candidate able to beat a finite incumbent under the default economics.
+def box_improvement_margin(objective, config, bounds, incumbent_score):
+    if objective == OBJECTIVE_NPV:
+        if not np.isfinite(incumbent_score):
+            return np.full(len(bounds['capex_lo']), np.inf)
+        return _npv_upper_bound(config, bounds, config['discount_rate']) - incumbent_score
+    if objective == OBJECTIVE_IRR:
+        if not np.isfinite(incumbent_score) or incumbent_score <= -1:
+            return np.full(len(bounds['capex_lo']), np.inf)
+        return _npv_upper_bound(config, bounds, incumbent_score)
+    if objective == OBJECTIVE_PAYBACK:
+        incumbent_payback = -incumbent_score
+        if incumbent_payback >= config['project_lifespan_years']:
+            return np.full(len(bounds['capex_lo']), np.inf)
+        return _cumulative_cf_upper_bound(config, bounds, incumbent_payback)
+    raise ValueError(f"Unknown objective: {objective}")
+
+# Upper bound on the objective score of every point in each box (used to prune boxes dominated by a Pareto front,
+# efinops.pareto). IRR and payback are bracketed by bisection on the bounds above, under the same cash-flow
+# assumption as box_improvement_margin; every bound is rounded up past the evaluator's numerical error.
+def box_score_bounds(objective, config, bounds):
+    n = len(bounds['capex_lo'])
+    if objective == OBJECTIVE_NPV:
+        npv = _npv_upper_bound(config, bounds, np.full(n, config['discount_rate']))
+        return npv + SCORE_BOUND_SLACK * (1 + np.abs(npv))
+    if objective == OBJECTIVE_IRR:
+        # Largest rate at which the NPV bound is still positive; inf when it is positive even at IRR_BOUND_MAX
+        lo, hi = np.full(n, IRR_BOUND_MIN), np.full(n, IRR_BOUND_MAX)
+        for _ in range(BISECTION_STEPS):
+            mid = (lo + hi) / 2
+            positive = _npv_upper_bound(config, bounds, mid) > 0
+            lo, hi = np.where(positive, mid, lo), np.where(positive, hi, mid)
+        bound = np.where(_npv_upper_bound(config, bounds, np.full(n, IRR_BOUND_MAX)) > 0, np.inf, hi)
+        return bound + SCORE_BOUND_SLACK
+    if objective == OBJECTIVE_PAYBACK:
+        # Earliest (fractional) year at which the cumulative cash-flow bound reaches zero: the first whole year
+        # where it does, then bisection within the year before (the bound is convex there)
+        lifespan = config['project_lifespan_years']
+        cumulative = np.column_stack([_cumulative_cf_upper_bound(config, bounds, float(year)) for year in range(lifespan + 1)])
+        reached = cumulative >= 0
+        year = np.argmax(reached, axis=1)
+        lo, hi = np.maximum(year - 1.0, 0.0), year.astype(float)
+        for _ in range(BISECTION_STEPS):
+            mid = (lo + hi) / 2
+            below = _cumulative_cf_upper_bound(config, bounds, mid) < 0
+            lo, hi = np.where(below, mid, lo), np.where(below, hi, mid)
+        # Boxes that never reach zero hold only plans that never pay back (scored as 2 x lifespan)
+        return np.where(reached.any(axis=1), -lo, -2.0 * lifespan) + SCORE_BOUND_SLACK
+    raise ValueError(f"Unknown objective: {objective}")
+
+# --- Search state shared by all strategies ---
+
+class SearchState:
+    def __init__(self, config, objective, evaluate_batch, bound_batch=None, space=SIZING_SPACE, time_budget=1.0,
+                 progress=None, record_candidates=True):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective: {objective}")
+        self.config = config
+        self.objective = objective
+        self.evaluate_batch = evaluate_batch
+        self.bound_batch = bound_batch
+        self.lower = np.array([s[0] for s in space])
+        self.step = np.array([s[2] for s in space])
+        self.n_steps = np.array([int(round((s[1] - s[0]) / s[2])) + 1 for s in space])
+        self.time_budget = time_budget
+        self.started = time.perf_counter()
+        self.deadline = self.started + time_budget
+        self.progress = progress  # ThrottledProgress (or anything with report/finish), optional
+        self.best_index = None
+        self.best_score = -np.inf
+        self.evaluations = 0
+        self.phase = None # Strategy currently running (instrumentation label)
+        self.exhaustive = False
+        self._scores = {}
+        self._records = [] if record_candidates else None
+
+    def time_left(self):
+        return time.perf_counter() < self.deadline
+
+    def to_sizings(self, index):
+        return self.lower + np.asarray(index) * self.step
+
+    def clip(self, index):
+        return np.clip(np.asarray(index), 0, self.n_steps - 1).astype(np.int64)
+
+    # Lattice indices of sizings (K x 4) and a mask of the rows that lie exactly on the lattice
+    def to_index(self, sizings):
+        position = (np.asarray(sizings, dtype=float).reshape(-1, len(self.n_steps)) - self.lower) / self.step
+        index = np.round(position).astype(np.int64)
+        on_lattice = np.all(np.isclose(position, index) & (index >= 0) & (index < self.n_steps), axis=1)
+        return index, on_lattice
+
+    def _update_incumbent(self, index, scores):
+        if len(scores) == 0:
+            return
+        i = int(np.argmax(scores))
+        if scores[i] > self.best_score:
+            self.best_score = float(scores[i])
+            self.best_index = np.array(index[i])
+
+    # Evaluate lattice points (K x 4 int array), skipping points scored earlier in this search
+    def evaluate(self, index):
+        index = np.unique(self.clip(index), axis=0)
+        keys = [tuple(row) for row in index.tolist()]
+        new = [i for i, key in enumerate(keys) if key not in self._scores]
+        if new:
+            new_scores = self._score(index[new])
+            for i, score in zip(new, new_scores):
+                self._scores[keys[i]] = score
+        scores = np.array([self._scores[key] for key in keys])
+        return index, scores
+
+    # Evaluate without memoization (used by branch and bound, whose leaves never overlap)
+    def evaluate_uncached(self, index):
+        index = np.asarray(index, dtype=np.int64)
+        return index, self._score(index)
+
+    def _score(self, index):
+        metrics = self.evaluate_batch(self.to_sizings(index))
+        scores = objective_scores(self.objective, metrics, self.config)
+        self.evaluations += len(index)
+        count('optimizer_evaluations', len(index), phase=self.phase)
+        self._update_incumbent(index, scores)
+        if self._records is not None:
+            self._records.append((index.astype(np.int32), scores))
+        if self.progress is not None:
+            fraction = min((time.perf_counter() - self.started) / self.time_budget, 0.99) if self.time_budget > 0 else 0.0
+            self.progress.report(fraction, evaluations=self.evaluations, best_score=self.best_score, best_params=self.best_params())
+        return scores
+
+    # Incumbent sizing as a list of floats (None before the first evaluation)
+    def best_params(self):
+        return None if self.best_index is None else [float(v) for v in self.to_sizings(self.best_index)]
+
+    def result(self, method):
+        best_params = self.best_params()
+        if self.progress is not None:
+            self.progress.finish(evaluations=self.evaluations, best_score=self.best_score, best_params=best_params)
+        candidates = None
+        if self._records:
+            # Branch and bound may revisit points scored by earlier phases; keep each lattice point once
+            index = np.concatenate([r[0] for r in self._records])
+            _, first = np.unique(np.ravel_multi_index(index.T, self.n_steps), return_index=True)
+            candidates = {
+                "sizings": self.to_sizings(index[first]),
+                "scores": np.concatenate([r[1] for r in self._records])[first],
+            }
+        return {
+            "method": method,
+            "objective": self.objective,
+            "best_params": best_params,
+            "best_score": self.best_score,
+            "evaluations": self.evaluations,
+            "elapsed": time.perf_counter() - self.started,
+            "exhaustive": self.exhaustive,  # True when branch and bound proved the optimum on the lattice
+            "candidates": candidates,  # every evaluated candidate (sizings N x 4, scores N) when recorded
+        }
+
+# --- Strategies ---
+
+# Plain lattice grid with `points_per_dim` evenly spaced values per dimension
+def grid_search(search, points_per_dim=6):
+    axes = [np.unique(np.round(np.linspace(0, n - 1, min(points_per_dim, n))).astype(np.int64)) for n in search.n_steps]
+    search.evaluate(np.array(list(itertools.product(*axes))))
+
+# Coarse-to-fine grid: evaluate a coarse lattice, then repeatedly zoom into the best `top_k` cells
+# with a 5-point grid per dimension and half the radius, down to single slider steps.
+def adaptive_grid_search(search, coarse_points=9, top_k=4, refine_points=5):
+    grid_search(search, coarse_points)
+    radius = np.maximum((search.n_steps - 1) / (coarse_points - 1), 1.0)
+    offsets = np.linspace(-1.0, 1.0, refine_points)
+    while search.time_left():
+        top = _top_points(search, top_k)
+        local_axes = [np.round(offsets * r).astype(np.int64) for r in radius]
+        deltas = np.array(list(itertools.product(*local_axes)))
+        search.evaluate((top[:, None, :] + deltas[None, :, :]).reshape(-1, len(search.n_steps)))
+        if np.all(radius <= 1.0):
+            break
+        radius = np.maximum(radius / 2.0, 1.0)
+
+def _top_points(search, k):
+    keys = list(search._scores.keys())
+    scores = np.fromiter(search._scores.values(), dtype=float, count=len(keys))
+    order = np.argsort(scores)[::-1][:k]
+    return np.array([keys[i] for i in order], dtype=np.int64)
+
+# Coordinate/pattern search from the incumbent: try +-s steps along every axis for s in
+# {2^j, ..., 2, 1} at once, move to the best improving neighbour, shrink s when nothing improves.
+def coordinate_descent(search, max_stride=None):
+    if search.best_index is None:
+        grid_search(search, 3)
+    dims = len(search.n_steps)
+    stride = int(max_stride or 2 ** int(np.log2(max(search.n_steps.max() // 4, 1))))
+    while search.time_left() and stride >= 1:
+        current, current_score = search.best_index.copy(), search.best_score
+        strides = [stride >> j for j in range(0, 3) if stride >> j >= 1]
+        moves = np.concatenate([np.eye(dims, dtype=np.int64) * s for s in strides] + [-np.eye(dims, dtype=np.int64) * s for s in strides])
+        search.evaluate(current[None, :] + moves)
+        if search.best_score <= current_score:
+            stride //= 2
+
+# Branch and bound over lattice boxes: split the widest axis, prune boxes whose model bound cannot beat
+# the incumbent, and enumerate boxes small enough to evaluate outright. Boxes are processed best-bound
+# first in vectorized batches. Sets search.exhaustive when the whole lattice has been covered.
+def branch_and_bound(search, leaf_size=64, boxes_per_round=2048):
+    if search.bound_batch is None:
+        return
+    dims = len(search.n_steps)
+    lo = np.zeros((1, dims), dtype=np.int64)
+    hi = (search.n_steps - 1)[None, :].astype(np.int64)
+    while len(lo) and search.time_left():
+        count('optimizer_bounded_boxes', len(lo))
+        bounds = search.bound_batch(search.to_sizings(lo), search.to_sizings(hi))
+        margin = box_improvement_margin(search.objective, search.config, bounds, search.best_score)
+        alive = margin > 0
+        lo, hi, margin = lo[alive], hi[alive], margin[alive]
+        if not len(lo):
+            break
+
+        order = np.argsort(margin)[::-1]
+        current, deferred = order[:boxes_per_round], order[boxes_per_round:]
+        lo_now, hi_now = lo[current], hi[current]
+        extent = hi_now - lo_now + 1
+        is_leaf = extent.prod(axis=1) <= leaf_size
+
+        if is_leaf.any():
+            search.evaluate_uncached(enumerate_boxes(lo_now[is_leaf], extent[is_leaf]))
+
+        split_lo, split_hi = split_boxes(lo_now[~is_leaf], hi_now[~is_leaf])
+        lo = np.concatenate([lo[deferred], split_lo])
+        hi = np.concatenate([hi[deferred], split_hi])
+    search.exhaustive = len(lo) == 0
+
+# Halves of every box (lattice index corners lo / hi, inclusive) split along its widest axis: the lower halves
+# first, then the upper halves
+def split_boxes(lo, hi):
+    axis = np.argmax(hi - lo, axis=1)
+    rows = np.arange(len(lo))
+    mid = (lo[rows, axis] + hi[rows, axis]) // 2
+    left_hi = hi.copy()
+    left_hi[rows, axis] = mid
+    right_lo = lo.copy()
+    right_lo[rows, axis] = mid + 1
+    return np.concatenate([lo, right_lo]), np.concatenate([left_hi, hi])
+
+# All lattice points of the given boxes, vectorized per distinct box shape
+def enumerate_boxes(lo, extent):
+    points = []
+    shapes, shape_of_box = np.unique(extent, axis=0, return_inverse=True)
+    for i, shape in enumerate(shapes):
+        offsets = np.indices(shape).reshape(len(shape), -1).T
+        points.append((lo[shape_of_box.ravel() == i][:, None, :] + offsets[None, :, :]).reshape(-1, len(shape)))
+    return np.concatenate(points)
+
+# Run a strategy as a named phase: timed as optimizer_phase{phase=name}, evaluations counted under it
+def run_phase(search, name, strategy):
+    outer, search.phase = search.phase, name
+    try:
+        with timer('optimizer_phase', phase=name):
+            strategy(search)
+    finally:
+        search.phase = outer
+
+# Default: coarse-to-fine grid to find the basin, local search to reach the slider-step optimum,
+# then branch and bound (when a bound function is available) to verify it within the time budget.
+def hybrid_search(search):
+    run_phase(search, 'adaptive_grid', adaptive_grid_search)
+    run_phase(search, 'coordinate_descent', coordinate_descent)
+    run_phase(search, 'branch_and_bound', branch_and_bound)
+
+OPTIMIZERS = {
+    'grid': grid_search,
+    'adaptive_grid': adaptive_grid_search,
+    'coordinate_descent': coordinate_descent,
+    'branch_and_bound': branch_and_bound,
+    'hybrid': hybrid_search,
+}
+
+# Run one registered strategy headlessly and return a result dict:
+# best_params (sizing list or None), best_score, evaluations, elapsed seconds, exhaustive flag, candidates
+# progress: optional ThrottledProgress receiving (fraction, {evaluations, best_score}) while the search runs
+def optimize(config, objective, evaluate_batch, bound_batch=None, method='hybrid', time_budget=1.0, space=SIZING_SPACE,
+             progress=None, record_candidates=True):
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimization method: {method}")
+    search = SearchState(config, objective, evaluate_batch, bound_batch, space, time_budget, progress, record_candidates)
+    with timer('optimizer_run', method=method, objective=objective):
+        run_phase(search, method, OPTIMIZERS[method])
+    return search.result(method)
+
+# Convert scores back to the objective's natural unit (IRR fraction, payback years, NPV ¥); nan where not computable
+def objective_values(objective, scores):
+    scores = np.asarray(scores, dtype=float)
+    if objective == OBJECTIVE_IRR:
+        return np.where(scores <= IRR_PENALTY, np.nan, scores)
+    if objective == OBJECTIVE_PAYBACK:
+        return -scores
+    return scores
+
+# Best `limit` recorded candidates of a result, best first: (sizings K x 4, objective values K)
+def top_candidates(result, limit=None):
+    candidates = result['candidates']
+    if candidates is None:
+        return np.empty((0, 4)), np.empty(0)
+    order = np.argsort(candidates['scores'], kind='stable')[::-1][:limit]
+    return candidates['sizings'][order], objective_values(result['objective'], candidates['scores'][order])
+
@@ -0,0 +1,237 @@
+# Multi-objective sizing search: the Pareto frontier over IRR, NPV, payback and total CAPEX in one run.
+# The single-objective strategies of efinops.optimize are run for IRR, payback and NPV in turn (on part of the
+# time budget), but through one shared evaluator: every lattice point is evaluated once with all metrics,
+# later searches reuse what earlier ones scored, and each evaluated batch is merged into a non-dominated set
+# that is maintained incrementally with vectorized dominance checks.
+#
+# That set is only the non-dominated part of what the searches visited. With a bound function, a front search
+# follows on the rest of the budget: branch and bound over lattice boxes that prunes every box whose score
+# bounds are dominated by the front found so far. When it finishes, the front is the exact Pareto front of the
+# lattice ('exhaustive'); otherwise (time budget, no bound function as with the hourly model) it is an
+# approximation whose plans may still be dominated by plans that were never evaluated.
+import time
+
+import numpy as np
+
+from efinops.instrument import count, timer
+from efinops.optimize import (
+    OBJECTIVE_IRR,
+    OBJECTIVE_NPV,
+    OBJECTIVE_PAYBACK,
+    OPTIMIZERS,
+    SIZING_SPACE,
+    SearchState,
+    box_score_bounds,
+    enumerate_boxes,
+    objective_scores,
+    objective_values,
+    run_phase,
+    split_boxes,
+)
+
+OBJECTIVE_PARETO = 'pareto' # Optimizer mode label (jobs, UI) for the multi-objective search
+OBJECTIVE_CAPEX = 'capex'
+PARETO_OBJECTIVES = (OBJECTIVE_IRR, OBJECTIVE_NPV, OBJECTIVE_PAYBACK, OBJECTIVE_CAPEX)
+# Objectives searched for directly; minimum CAPEX needs no search (the empty sizing) and the other three
+# searches spread candidates along the CAPEX axis on their own
+PARETO_SEARCH_OBJECTIVES = (OBJECTIVE_IRR, OBJECTIVE_PAYBACK, OBJECTIVE_NPV)
+PARETO_METRIC_KEYS = ('irr_value', 'npv_value', 'payback_year_num', 'total_capex')
+DOMINANCE_CHUNK_ELEMENTS = 4_000_000 # Pairwise comparisons per vectorized dominance step (bounds temporary memory)
+PARETO_SEARCH_BUDGET_SHARE = 0.5 # Part of the time budget for the single-objective searches; the front search gets the rest
+
+# Scores of every candidate as an (n x 4) array in PARETO_OBJECTIVES order, higher is always better
+# (objective_scores for IRR / NPV / payback, negative CAPEX)
+def pareto_scores(metrics, config):
+    return np.column_stack([
+        objective_scores(OBJECTIVE_IRR, metrics, config),
+        objective_scores(OBJECTIVE_NPV, metrics, config),
+        objective_scores(OBJECTIVE_PAYBACK, metrics, config),
+        -np.asarray(metrics['total_capex'], dtype=float),
+    ])
+
+# Mask of the rows of `points` dominated by at least one row of `by` (at least as good in every objective and
+# strictly better in one). Scores of -inf (IRR without a root) compare like any other value.
+def dominated_by(points, by):
+    dominated = np.zeros(len(points), dtype=bool)
+    if not len(points) or not len(by):
+        return dominated
+    chunk = max(1, DOMINANCE_CHUNK_ELEMENTS // (len(by) * points.shape[1]))
+    for start in range(0, len(points), chunk):
+        p = points[start:start + chunk, None, :]
+        dominated[start:start + chunk] = ((by[None] >= p).all(axis=2) & (by[None] > p).any(axis=2)).any(axis=1)
+    return dominated
+
+# Non-dominated rows of `points` (indices into points). Rows are visited in lexicographically descending
+# order, where a row can only be dominated by rows before it, so each block is checked against the
+# non-dominated rows found so far plus itself.
+def non_dominated(points, block=1024):
+    order = np.lexsort(points.T[::-1])[::-1]
+    keep = np.empty(0, dtype=np.int64)
+    for start in range(0, len(order), block):
+        rows = order[start:start + block]
+        rows = rows[~dominated_by(points[rows], points[keep])]
+        rows = rows[~dominated_by(points[rows], points[rows])]
+        keep = np.concatenate([keep, rows])
+    return keep
+
+
+# Incrementally maintained non-dominated set of sizings
+class ParetoFront:
+    def __init__(self, n_objectives=len(PARETO_OBJECTIVES)):
+        self.sizings = np.empty((0, 4))
+        self.scores = np.empty((0, n_objectives))
+
+    def __len__(self):
+        return len(self.scores)
+
+    # Merge a batch (sizings K x 4, scores K x n_objectives); returns the number of batch rows that joined
+    def add(self, sizings, scores):
+        scores = np.asarray(scores, dtype=float)
+        # Against the (small) front first: most candidates of a batch are dropped there cheaply
+        new = np.flatnonzero(~dominated_by(scores, self.scores))
+        new = new[non_dominated(scores[new])]
+        if not len(new):
+            return 0
+        survivors = ~dominated_by(self.scores, scores[new])
+        self.sizings = np.concatenate([self.sizings[survivors], np.asarray(sizings, dtype=float)[new]])
+        self.scores = np.concatenate([self.scores[survivors], scores[new]])
+        return len(new)
+
+    # Front rows in natural units (IRR fraction, NPV ¥, payback years, CAPEX ¥), sorted by CAPEX
+    def result(self):
+        order = np.argsort(-self.scores[:, 3], kind='stable')
+        scores = self.scores[order]
+        return {
+            'sizings': self.sizings[order],
+            'irr_value': objective_values(OBJECTIVE_IRR, scores[:, 0]),
+            'npv_value': scores[:, 1],
+            'payback_year_num': objective_values(OBJECTIVE_PAYBACK, scores[:, 2]),
+            'total_capex': -scores[:, 3],
+        }
+
+
+# evaluate_batch wrapper shared by the per-objective searches: evaluates each lattice sizing once (all
+# PARETO_METRIC_KEYS), merges new results into the front and returns the cached metrics for the request
+class _SharedEvaluator:
+    def __init__(self, config, evaluate_batch, front, progress, started, time_budget):
+        self.config = config
+        self.evaluate_batch = evaluate_batch
+        self.front = front
+        self.progress = progress
+        self.started = started
+        self.time_budget = time_budget
+        self.evaluations = 0
+        self._rows = {}
+        self._metrics = {key: np.empty(0) for key in PARETO_METRIC_KEYS}
+
+    def __call__(self, sizings):
+        keys = [tuple(row) for row in np.asarray(sizings).tolist()]
+        new = list(dict.fromkeys(key for key in keys if key not in self._rows))
+        if new:
+            metrics = self.evaluate_batch(np.array(new, dtype=float))
+            for key in PARETO_METRIC_KEYS:
+                self._metrics[key] = np.concatenate([self._metrics[key], np.asarray(metrics[key], dtype=float)])
+            for key in new:
+                self._rows[key] = len(self._rows)
+            self.evaluations += len(new)
+            count('pareto_front_updates', self.front.add(np.array(new, dtype=float), pareto_scores(metrics, self.config)))
+            if self.progress is not None:
+                fraction = min((time.perf_counter() - self.started) / self.time_budget, 0.99) if self.time_budget > 0 else 0.0
+                self.progress.report(fraction, evaluations=self.evaluations, front_size=len(self.front))
+        rows = [self._rows[key] for key in keys]
+        return {key: self._metrics[key][rows] for key in PARETO_METRIC_KEYS}
+
+
+# Upper bounds of the PARETO_OBJECTIVES scores of every point in each box, as an (n x 4) array like pareto_scores
+def box_pareto_bounds(config, bounds):
+    return np.column_stack([
+        box_score_bounds(OBJECTIVE_IRR, config, bounds),
+        box_score_bounds(OBJECTIVE_NPV, config, bounds),
+        box_score_bounds(OBJECTIVE_PAYBACK, config, bounds),
+        -np.asarray(bounds['capex_lo'], dtype=float),
+    ])
+
+# Front search: branch and bound over lattice boxes of `search` (its lattice and deadline), evaluating through
+# the shared evaluator, which merges every evaluated plan into the front. A box is pruned once the upper bounds
+# of its scores are dominated by a front point, as that point then dominates every plan in the box. A box that
+# survived a check only needs checking against the points that joined the front since (a point that left the
+# front was dominated by one that joined). Boxes with the highest NPV bound go first; boxes small enough are
+# evaluated outright. Returns True when every box was settled, i.e. the front is the exact front of the lattice.
+def front_branch_and_bound(search, front, leaf_size=64, boxes_per_round=512):
+    dims = len(search.n_steps)
+    lo = np.zeros((0, dims), dtype=np.int64)
+    hi = np.zeros((0, dims), dtype=np.int64)
+    ideal = np.empty((0, len(PARETO_OBJECTIVES)))
+    new_lo = np.zeros((1, dims), dtype=np.int64)
+    new_hi = (search.n_steps - 1)[None, :].astype(np.int64)
+    checked = set()
+    while (len(lo) or len(new_lo)) and search.time_left():
+        count('optimizer_bounded_boxes', len(new_lo))
+        joined = [i for i, row in enumerate(map(tuple, front.scores.tolist())) if row not in checked]
+        alive = ~dominated_by(ideal, front.scores[joined])
+        new_ideal = box_pareto_bounds(search.config, search.bound_batch(search.to_sizings(new_lo), search.to_sizings(new_hi)))
+        new_alive = ~dominated_by(new_ideal, front.scores)
+        checked = set(map(tuple, front.scores.tolist()))
+        lo = np.concatenate([lo[alive], new_lo[new_alive]])
+        hi = np.concatenate([hi[alive], new_hi[new_alive]])
+        ideal = np.concatenate([ideal[alive], new_ideal[new_alive]])
+        if not len(lo):
+            break
+
+        order = np.argsort(ideal[:, 1], kind='stable')[::-1]
+        current, deferred = order[:boxes_per_round], order[boxes_per_round:]
+        lo_now, hi_now = lo[current], hi[current]
+        extent = hi_now - lo_now + 1
+        is_leaf = extent.prod(axis=1) <= leaf_size
+        if is_leaf.any():
+            search.evaluate_batch(search.to_sizings(enumerate_boxes(lo_now[is_leaf], extent[is_leaf])))
+
+        new_lo, new_hi = split_boxes(lo_now[~is_leaf], hi_now[~is_leaf])
+        lo, hi, ideal = lo[deferred], hi[deferred], ideal[deferred]
+    return not len(lo) and not len(new_lo)
+
+# Run `method` for every objective of PARETO_SEARCH_OBJECTIVES with one shared evaluator, then (with a bound_batch)
+# the front search, and return a result dict: front (natural-unit arrays, see ParetoFront.result; payback inf
+# where never), best (best sizing per searched objective), evaluations (distinct sizings), elapsed seconds,
+# exhaustive (the front search finished: the front is the exact lattice front; otherwise it is approximate) and
+# optima_exhaustive (branch and bound proved every single-objective optimum).
+# evaluate_batch must return all PARETO_METRIC_KEYS; bound_batch and progress as in efinops.optimize.optimize.
+def pareto_optimize(config, evaluate_batch, bound_batch=None, method='hybrid', time_budget=1.0, space=SIZING_SPACE,
+                    progress=None):
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimization method: {method}")
+    started = time.perf_counter()
+    front = ParetoFront()
+    shared = _SharedEvaluator(config, evaluate_batch, front, progress, started, time_budget)
+    best, optima_exhaustive = {}, True
+    # Without a bound function there is no front search, and the single-objective searches get the whole budget
+    search_budget = time_budget * (PARETO_SEARCH_BUDGET_SHARE if bound_batch is not None else 1.0)
+    with timer('optimizer_run', method=method, objective='pareto'):
+        for i, objective in enumerate(PARETO_SEARCH_OBJECTIVES):
+            # Each search may use what the earlier ones left of the budget up to its own share
+            deadline = started + search_budget * (i + 1) / len(PARETO_SEARCH_OBJECTIVES)
+            search = SearchState(config, objective, shared, bound_batch, space, max(deadline - time.perf_counter(), 0.0),
+                                 record_candidates=False)
+            run_phase(search, method, OPTIMIZERS[method])
+            best[objective] = search.best_params()
+            optima_exhaustive = optima_exhaustive and search.exhaustive
+        exhaustive = False
+        if bound_batch is not None:
+            search = SearchState(config, OBJECTIVE_NPV, shared, bound_batch, space,
+                                 max(started + time_budget - time.perf_counter(), 0.0), record_candidates=False)
+            with timer('optimizer_phase', phase='front_branch_and_bound'):
+                exhaustive = front_branch_and_bound(search, front)
+    if progress is not None:
+        progress.finish(evaluations=shared.evaluations, front_size=len(front))
+    result = front.result()
+    # Plans that never pay back carry the payback penalty score; report them as never (inf)
+    result['payback_year_num'][result['payback_year_num'] > config['project_lifespan_years']] = np.inf
+    return {
+        'method': method,
+        'front': result,
+        'best': best,
+        'evaluations': shared.evaluations,
+        'elapsed': time.perf_counter() - started,
+        'exhaustive': exhaustive,
+        'optima_exhaustive': optima_exhaustive,
+    }
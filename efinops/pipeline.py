@@ -0,0 +1,124 @@
+# Staged computation graph for the energy models.
+# A model is a tuple of Stage records in dependency order. Each stage declares the config keys it reads,
+# the sizing columns it reads, the upstream stages whose results it consumes and the evaluation options
+# (e.g. compute_irr) that change its result. run_stages evaluates a graph once; StagePipeline caches every
+# stage result under a fingerprint of exactly those inputs, so a change to a financial key such as
+# discount_rate reuses the generation and energy-balance results of the previous evaluation.
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from efinops.cache import ScenarioCache, arrays_hash, config_hash
+from efinops.finance import SIZING_COLUMNS, as_sizings
+from efinops.instrument import timer
+
+STAGE_CACHE_SIZE = 256 # Cached results per stage
+
+# compute(config, inputs, options) -> stage result; inputs maps sizing column names to (N,) arrays and
+# upstream stage names to their results
+Stage = namedtuple('Stage', ('name', 'keys', 'upstream', 'sizing', 'options', 'compute'), defaults=((), (), (), (), None))
+
+
+def _stage_map(stages):
+    return {stage.name: stage for stage in stages}
+
+
+# Config keys a stage depends on, including those of all its upstream stages (in first-use order)
+def stage_inputs(stages, name):
+    by_name = _stage_map(stages)
+    keys = []
+    def visit(stage_name):
+        stage = by_name[stage_name]
+        for upstream in stage.upstream:
+            visit(upstream)
+        keys.extend(key for key in stage.keys if key not in keys)
+    visit(name)
+    return tuple(keys)
+
+
+# Names of the stages whose result changes when any of `keys` (config keys or sizing columns) changes
+def affected_stages(stages, keys):
+    keys = set(keys)
+    affected = []
+    for stage in stages:
+        if keys & set(stage.keys) or keys & set(stage.sizing) or set(stage.upstream) & set(affected):
+            affected.append(stage.name)
+    return affected
+
+
+def _stage_inputs(stage, columns, results):
+    inputs = {column: columns[column] for column in stage.sizing}
+    inputs.update({name: results[name] for name in stage.upstream})
+    return inputs
+
+
+# Evaluate every stage once, without caching. precomputed: {stage name: result} used instead of computing
+# those stages (e.g. a baseline cost the caller already has). Returns {stage name: result}.
+def run_stages(stages, config, sizings, options=None, precomputed=None):
+    options = options or {}
+    sizings = as_sizings(sizings)
+    columns = dict(zip(SIZING_COLUMNS, sizings.T))
+    results = dict(precomputed or {})
+    for stage in stages:
+        if stage.name not in results:
+            with timer('stage', stage=stage.name):
+                results[stage.name] = stage.compute(config, _stage_inputs(stage, columns, results), options)
+    return results
+
+
+class StagePipeline:
+    def __init__(self, stages, cache_size=STAGE_CACHE_SIZE):
+        self.stages = tuple(stages)
+        self.caches = {stage.name: ScenarioCache(cache_size, name=f'stage:{stage.name}') for stage in self.stages}
+        self.last_computed = [] # Stages recomputed (cache misses) by the last evaluate call
+
+    # Same as run_stages, with per-stage memoization. Cached results are shared between calls and must not be
+    # modified by the caller.
+    def evaluate(self, config, sizings, options=None):
+        options = options or {}
+        sizings = as_sizings(sizings)
+        columns = dict(zip(SIZING_COLUMNS, sizings.T))
+        column_hashes = {}
+        fingerprints = {}
+        results = {}
+        self.last_computed = []
+        for stage in self.stages:
+            if stage.sizing not in column_hashes:
+                column_hashes[stage.sizing] = arrays_hash({column: columns[column] for column in stage.sizing}) if stage.sizing else ''
+            payload = repr((
+                stage.name,
+                tuple(_fingerprint_value(config[key]) for key in stage.keys),
+                column_hashes[stage.sizing],
+                tuple(fingerprints[name] for name in stage.upstream),
+                tuple(options.get(option) for option in stage.options),
+            ))
+            fingerprints[stage.name] = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+            def compute(stage=stage):
+                self.last_computed.append(stage.name)
+                with timer('stage', stage=stage.name):
+                    return stage.compute(config, _stage_inputs(stage, columns, results), options)
+            results[stage.name] = self.caches[stage.name].get(fingerprints[stage.name], compute)
+        return results
+
+    def invalidate(self):
+        for cache in self.caches.values():
+            cache.invalidate()
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+
+# Keys of `new` whose value differs from `old` (or that only one of them has), compared by fingerprint
+def changed_keys(old, new):
+    return sorted(key for key in set(old) | set(new)
+                  if key not in old or key not in new or _fingerprint_value(old[key]) != _fingerprint_value(new[key]))
+
+
+def _fingerprint_value(value):
+    if isinstance(value, np.ndarray):
+        return arrays_hash({'': value})
+    if isinstance(value, dict):
+        return config_hash(value)
+    return float(value) if isinstance(value, (int, float, np.number)) and not isinstance(value, bool) else value
@@ -0,0 +1,191 @@
+# Multi-park portfolio evaluation (annual simplified model).
+# N park configs are held as a struct of arrays (one NumPy array of length P per config key), and the
+# per-park invariants that do not depend on the sizing (baseline cost, average TOU price, depreciation
+# schedule, lifespan mask, discount factors) are computed once. A (P x K) block of candidate sizings is
+# then evaluated for all parks in one vectorized pass, and investments are ranked across the portfolio
+# under a shared capital budget.
+import numpy as np
+
+from efinops.finance import payback_years
+from efinops.irr import solve_irr_batch
+from efinops.model import NUMERIC_INPUT_KEYS, annual_grid_cost_batch, calculate_avg_tou_price, complete_config
+from efinops.optimize import SIZING_SPACE
+from efinops.tariff import tou_equivalent
+
+RANK_BY_NPV = 'npv'
+RANK_BY_IRR = 'irr'
+BUDGET_UNITS = 2000 # Resolution of the capital budget in the knapsack allocation
+
+
+class Portfolio:
+    # configs: list of park config dicts (missing keys are filled from DEFAULT_CONFIG, tariff definitions are
+    # evaluated through their three-price equivalent); names: park labels
+    def __init__(self, configs, names=None):
+        configs = [tou_equivalent(complete_config(config)) for config in configs]
+        if not configs:
+            raise ValueError("portfolio needs at least one park")
+        self.names = list(names) if names is not None else [f"park_{i + 1}" for i in range(len(configs))]
+        self.n_parks = len(configs)
+        # Struct of arrays, shaped (P, 1) so that they broadcast against (P, K) candidate blocks
+        self.params = {key: np.array([config[key] for config in configs], dtype=float)[:, None] for key in NUMERIC_INPUT_KEYS}
+        p = self.params
+
+        # --- Per-park invariants ---
+        self.avg_tou_price = np.array([[calculate_avg_tou_price(
+            config['grid_price_peak'], config['grid_price_valley'], config['grid_price_shoulder'],
+            config['peak_perc'], config['valley_perc'], config['shoulder_perc']
+        )] for config in configs])
+        self.baseline_cost = (p['annual_elec_kwh'] + p['annual_heat_kwh'] / p['grid_avg_cop'] + p['annual_cool_kwh'] / p['grid_avg_eer']) * self.avg_tou_price
+        self.has_demand = (p['annual_elec_kwh'] + p['annual_heat_kwh'] + p['annual_cool_kwh'])[:, 0] != 0
+        self.unit_costs = np.hstack([p['st_cost_m2'], p['pv_cost_m2'], p['hp_cost_kw'], p['storage_cost_kwh']]) # (P, 4)
+
+        # Cash-flow schedules padded to the longest lifespan; years past a park's lifespan carry zero
+        lifespans = np.array([int(config['project_lifespan_years']) for config in configs])
+        depreciation_years = np.array([int(config['depreciation_years']) for config in configs])
+        self.max_lifespan = int(lifespans.max())
+        years = np.arange(1, self.max_lifespan + 1)
+        self.life_mask = (years[None, :] <= lifespans[:, None]).astype(float) # (P, L)
+        with np.errstate(divide='ignore'):
+            self.depreciation_schedule = np.where( # Fraction of CAPEX depreciated per year
+                (years[None, :] <= depreciation_years[:, None]) & (depreciation_years[:, None] > 0),
+                1.0 / np.maximum(depreciation_years, 1)[:, None], 0.0
+            ) * self.life_mask
+        self.discount_factors = (1 + p['discount_rate']) ** -np.arange(self.max_lifespan + 1)[None, :] # (P, L+1)
+
+    # Metrics for a (P, K, 4) block of sizings, K candidates per park (a (K, 4) array is shared by all parks)
+    # Returns (P, K) arrays with the keys of calculate_mixed_system_metrics_batch; cash_flows is (P, K, L+1).
+    def evaluate(self, sizings, compute_irr=True):
+        sizings = np.asarray(sizings, dtype=float)
+        if sizings.ndim == 2:
+            sizings = np.broadcast_to(sizings, (self.n_parks,) + sizings.shape)
+        st_area, pv_area, hp_capacity_kw, storage_capacity_kwh = np.moveaxis(sizings, -1, 0)
+
+        total_capex = np.einsum('pkc,pc->pk', sizings, self.unit_costs)
+        annual_grid_cost = annual_grid_cost_batch(self.params, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh, self.avg_tou_price)
+        annual_opex_mixed = total_capex * self.params['opex_percentage']
+        annual_gross_saving = self.baseline_cost - (annual_grid_cost + annual_opex_mixed)
+
+        tax_rate = self.params['tax_rate'][:, :, None]
+        cash_flows = np.empty(total_capex.shape + (self.max_lifespan + 1,))
+        cash_flows[..., 0] = -total_capex
+        cash_flows[..., 1:] = (annual_gross_saving[..., None] * (1 - tax_rate) * self.life_mask[:, None, :]
+                               + total_capex[..., None] * tax_rate * self.depreciation_schedule[:, None, :])
+        # Parks without demand: nothing to evaluate (same convention as the single-park model)
+        cash_flows[~self.has_demand] = 0.0
+        total_capex[~self.has_demand] = 0.0
+        annual_opex_mixed[~self.has_demand] = 0.0
+        annual_gross_saving[~self.has_demand] = 0.0
+
+        flat = cash_flows.reshape(-1, self.max_lifespan + 1)
+        metrics = {
+            "total_capex": total_capex,
+            "annual_opex_mixed": annual_opex_mixed,
+            "annual_gross_saving": annual_gross_saving,
+            "annual_grid_cost": annual_grid_cost,
+            "payback_year_num": payback_years(flat).reshape(total_capex.shape),
+            "npv_value": np.einsum('pkt,pt->pk', cash_flows, self.discount_factors),
+            "cash_flows": cash_flows,
+            "irr_value": None,
+            "irr_status": None,
+        }
+        if compute_irr:
+            irr_value, irr_status = solve_irr_batch(flat)
+            metrics["irr_value"] = irr_value.reshape(total_capex.shape)
+            metrics["irr_status"] = irr_status.reshape(total_capex.shape)
+        return metrics
+
+    # Rank investments across the portfolio under a shared capital budget.
+    # Every park gets the same lattice of candidate sizings (grid over SIZING_SPACE with points_per_dim
+    # values per axis, evaluated for all parks at once); at most one sizing is funded per park.
+    # - rank_by='npv': maximize total NPV subject to total CAPEX <= budget (multiple-choice knapsack by
+    #   dynamic programming over BUDGET_UNITS budget steps, costs rounded up so the budget always holds)
+    # - rank_by='irr': capital rationing by IRR; parks are visited in descending order of their best IRR and
+    #   each gets its highest-IRR sizing with positive NPV that still fits the remaining budget
+    # Returns a dict of per-park arrays ordered by rank (funded parks first), plus totals.
+    def allocate(self, budget, rank_by=RANK_BY_NPV, points_per_dim=7, space=SIZING_SPACE):
+        if rank_by not in (RANK_BY_NPV, RANK_BY_IRR):
+            raise ValueError(f"Unknown rank_by: {rank_by}")
+        axes = [np.linspace(low, high, points_per_dim) for low, high, _ in space]
+        axes = [np.round(axis / step) * step for axis, (_, _, step) in zip(axes, space)]
+        candidates = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(space))
+        metrics = self.evaluate(candidates, compute_irr=(rank_by == RANK_BY_IRR))
+        npv = metrics['npv_value']
+        capex = metrics['total_capex']
+
+        if rank_by == RANK_BY_NPV:
+            choice = _knapsack_choices(capex, npv, budget)
+        else:
+            irr = np.where(npv > 0, np.nan_to_num(metrics['irr_value'], nan=-np.inf), -np.inf)
+            best_irr = irr.max(axis=1)
+            choice = np.full(self.n_parks, -1)
+            remaining = budget
+            for park in np.argsort(-best_irr, kind='stable'):
+                affordable = np.where(capex[park] <= remaining, irr[park], -np.inf)
+                k = int(np.argmax(affordable))
+                if np.isfinite(affordable[k]):
+                    choice[park] = k
+                    remaining -= capex[park, k]
+
+        funded = choice >= 0
+        rows = np.arange(self.n_parks)
+        picked = np.where(funded, choice, 0)
+        sizing = np.where(funded[:, None], candidates[picked], 0.0)
+        chosen = {key: np.where(funded, metrics[key][rows, picked], 0.0) for key in ('total_capex', 'npv_value', 'annual_opex_mixed', 'annual_gross_saving')}
+        payback = np.where(funded, metrics['payback_year_num'][rows, picked], np.inf)
+        # IRR of the funded sizings (solved only for those when ranking by NPV)
+        irr_value = np.full(self.n_parks, -np.inf)
+        if funded.any():
+            irr_value[funded] = solve_irr_batch(metrics['cash_flows'][rows[funded], picked[funded]])[0]
+
+        key = -chosen['npv_value'] if rank_by == RANK_BY_NPV else -np.nan_to_num(irr_value, nan=-np.inf)
+        order = np.lexsort((key, ~funded))
+        return {
+            'park': [self.names[i] for i in order],
+            'funded': funded[order],
+            'sizing': sizing[order],
+            'total_capex': chosen['total_capex'][order],
+            'cumulative_capex': np.cumsum(chosen['total_capex'][order]),
+            'npv_value': chosen['npv_value'][order],
+            'irr_value': irr_value[order],
+            'payback_year_num': payback[order],
+            'annual_opex_mixed': chosen['annual_opex_mixed'][order],
+            'annual_gross_saving': chosen['annual_gross_saving'][order],
+            'budget': float(budget),
+            'total_npv': float(chosen['npv_value'].sum()),
+            'candidates_per_park': len(candidates),
+        }
+
+
+# Multiple-choice knapsack: pick at most one candidate per park (rows of capex/value) maximizing total value
+# with total capex <= budget. Only candidates with positive value are considered. Returns the chosen column
+# per park, -1 where nothing is funded.
+def _knapsack_choices(capex, value, budget, units=BUDGET_UNITS):
+    n_parks = capex.shape[0]
+    if budget <= 0:
+        return np.full(n_parks, -1)
+    unit = budget / units
+    cost = np.ceil(capex / unit - 1e-9).astype(np.int64)
+    usable = (value > 0) & (cost <= units)
+
+    best = np.zeros(units + 1) # best[b]: max value with budget b units using the parks so far
+    decisions = np.full((n_parks, units + 1), -1, dtype=np.int64)
+    for park in range(n_parks):
+        new_best = best.copy()
+        for k in np.flatnonzero(usable[park]):
+            c = cost[park, k]
+            gain = np.full(units + 1, -np.inf)
+            gain[c:] = best[:units + 1 - c] + value[park, k]
+            better = gain > new_best
+            new_best[better] = gain[better]
+            decisions[park, better] = k
+        best = new_best
+
+    # Walk back from the full budget
+    choice = np.full(n_parks, -1)
+    b = units
+    for park in range(n_parks - 1, -1, -1):
+        k = decisions[park, b]
+        if k >= 0:
+            choice[park] = k
+            b -= cost[park, k]
+    return choice
@@ -0,0 +1,173 @@
+# Local columnar store for resampled hourly profiles, indexed by park, year and meter.
+# Each (park, year) is one directory holding the (meters x 8760) float32 matrix as a .npy file, opened
+# memory-mapped and zero-copy, and the per-meter table (meter_id, carrier, metadata, coverage) as Parquet.
+# index.json at the root lists parks, years and meter ids, so lookups never touch the data files.
+#
+#   <root>/index.json
+#   <root>/<park>-<hash>/<year>/hourly_kwh.npy
+#   <root>/<park>-<hash>/<year>/meters.parquet
+#   <root>/<park>-<hash>/<year>/manifest.json      (year, rows_read, rows_dropped)
+#
+# Any hourly series in the ingest layout can be stored, e.g. irradiance sensors as meters with their own
+# carrier value.
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from efinops.tariff import HOURS_PER_YEAR
+
+PROFILE_STORE_ENV = 'EFINOPS_PROFILE_STORE'
+DEFAULT_PROFILE_STORE = os.path.join(os.path.expanduser('~'), '.efinops', 'profiles')
+
+_INDEX_FILE = 'index.json'
+_MATRIX_FILE = 'hourly_kwh.npy'
+_METERS_FILE = 'meters.parquet'
+_MANIFEST_FILE = 'manifest.json'
+_PARK_PREFIX_CHARS = 64 # Readable part of a park directory name; keeps CJK names within the 255-byte limit
+
+
+def default_store_root():
+    return os.environ.get(PROFILE_STORE_ENV, DEFAULT_PROFILE_STORE)
+
+
+# Park names become directory names: a filesystem-safe, readable prefix (CJK characters allowed) plus a
+# short hash of the exact name, so names that sanitize alike ('North Park', 'North_Park') never share files
+def _park_dirname(park):
+    park = str(park)
+    if not park.strip():
+        raise ValueError(f"Invalid park name: {park!r}")
+    prefix = re.sub(r'[\\/:*?"<>|\s]+', '_', park).strip('._')[:_PARK_PREFIX_CHARS]
+    digest = hashlib.sha256(park.encode('utf-8')).hexdigest()[:10]
+    return f"{prefix}-{digest}" if prefix else digest
+
+
+# Write via a temporary file and rename, so readers never see a partially written file
+def _atomic_write(path, write):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class ProfileStore:
+    def __init__(self, root=None):
+        self.root = root or default_store_root()
+        os.makedirs(self.root, exist_ok=True)
+        self._opened = {} # (park, year) -> (manifest mtime, meter data); serves reruns without re-reading files
+
+    # --- Index ---
+
+    def _index_path(self):
+        return os.path.join(self.root, _INDEX_FILE)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_index(self, index):
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, indent=1)
+        _atomic_write(self._index_path(), write)
+
+    def parks(self):
+        return sorted(self._read_index())
+
+    def years(self, park):
+        return sorted(int(year) for year in self._read_index().get(str(park), {}))
+
+    def meter_ids(self, park, year):
+        return list(self._read_index().get(str(park), {}).get(str(year), {}).get('meter_ids', []))
+
+    # (park, year) pairs containing meter_id
+    def find_meter(self, meter_id):
+        return [(park, int(year)) for park, years in sorted(self._read_index().items())
+                for year, entry in sorted(years.items()) if meter_id in entry['meter_ids']]
+
+    def _year_dir(self, park, year):
+        return os.path.join(self.root, _park_dirname(park), str(int(year)))
+
+    # --- Writing ---
+
+    # Persist the output of efinops.ingest.ingest_meter_file (or MeterAccumulator.result()) for a park
+    # Replaces the park's data for that year.
+    def put(self, park, meter_data):
+        year = int(meter_data['year'])
+        hourly = np.ascontiguousarray(meter_data['hourly_kwh'], dtype=np.float32)
+        meters = meter_data['meters']
+        if hourly.shape != (len(meters), HOURS_PER_YEAR):
+            raise ValueError("hourly_kwh must have shape (meters, 8760) matching the meters table")
+        year_dir = self._year_dir(park, year)
+        os.makedirs(year_dir, exist_ok=True)
+
+        _atomic_write(os.path.join(year_dir, _MATRIX_FILE), lambda path: _save_npy(path, hourly))
+        _atomic_write(os.path.join(year_dir, _METERS_FILE), lambda path: meters.to_parquet(path, index=False))
+        manifest = {'year': year, 'rows_read': int(meter_data.get('rows_read', 0)), 'rows_dropped': int(meter_data.get('rows_dropped', 0))}
+        def write_manifest(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+        _atomic_write(os.path.join(year_dir, _MANIFEST_FILE), write_manifest)
+
+        index = self._read_index()
+        index.setdefault(str(park), {})[str(year)] = {'meter_ids': [str(m) for m in meters['meter_id']]}
+        self._write_index(index)
+        self._opened.pop((str(park), year), None)
+
+    def delete(self, park, year):
+        year_dir = self._year_dir(park, year)
+        for name in (_MANIFEST_FILE, _MATRIX_FILE, _METERS_FILE):
+            try:
+                os.remove(os.path.join(year_dir, name))
+            except FileNotFoundError:
+                pass
+        index = self._read_index()
+        index.get(str(park), {}).pop(str(int(year)), None)
+        if not index.get(str(park), True):
+            index.pop(str(park))
+        self._write_index(index)
+        self._opened.pop((str(park), int(year)), None)
+
+    # --- Reading ---
+
+    # Stored meter data in the ingest layout (meters, hourly_kwh, year, rows_read, rows_dropped).
+    # hourly_kwh is a read-only memory map unless mmap=False. Results are kept per store instance and
+    # reopened only when the park-year was rewritten.
+    def get(self, park, year, mmap=True):
+        year = int(year)
+        year_dir = self._year_dir(park, year)
+        manifest_path = os.path.join(year_dir, _MANIFEST_FILE)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            raise KeyError(f"No profiles stored for park {park!r}, year {year}") from None
+        key = (str(park), year)
+        cached = self._opened.get(key)
+        if cached is not None and cached[0] == mtime and (mmap or not isinstance(cached[1]['hourly_kwh'], np.memmap)):
+            return cached[1]
+
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        meters = pd.read_parquet(os.path.join(year_dir, _METERS_FILE))
+        hourly = np.load(os.path.join(year_dir, _MATRIX_FILE), mmap_mode='r' if mmap else None)
+        data = {'meters': meters, 'hourly_kwh': hourly, **manifest}
+        self._opened[key] = (mtime, data)
+        return data
+
+    # Hourly series of one meter (a row view of the memory map)
+    def meter_profile(self, park, year, meter_id):
+        data = self.get(park, year)
+        rows = np.flatnonzero(data['meters']['meter_id'].astype(str).to_numpy() == str(meter_id))
+        if not len(rows):
+            raise KeyError(f"Meter {meter_id!r} not stored for park {park!r}, year {year}")
+        return data['hourly_kwh'][rows[0]]
+
+
+def _save_npy(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
@@ -0,0 +1,30 @@
+# Throttled progress channel for long-running headless computations (optimizer, sweeps).
+# Producers may call report() on every batch; the sink (e.g. a Streamlit progress bar) is invoked at most
+# max_updates_per_second times, plus once for the final update, so UI traffic stays bounded regardless
+# of how many candidates are evaluated.
+import time
+
+
+class ThrottledProgress:
+    def __init__(self, sink, max_updates_per_second=4.0, clock=time.monotonic):
+        self.sink = sink
+        self.min_interval = 1.0 / max_updates_per_second if max_updates_per_second > 0 else 0.0
+        self.clock = clock
+        self.reports_received = 0
+        self.updates_sent = 0
+        self._last_sent = None
+
+    # fraction in [0, 1]; info is passed through to the sink as a dict (e.g. evaluations, best_score)
+    # Returns True if the sink was called.
+    def report(self, fraction, force=False, **info):
+        self.reports_received += 1
+        now = self.clock()
+        if not force and self._last_sent is not None and now - self._last_sent < self.min_interval:
+            return False
+        self._last_sent = now
+        self.updates_sent += 1
+        self.sink(min(max(float(fraction), 0.0), 1.0), info)
+        return True
+
+    def finish(self, **info):
+        return self.report(1.0, force=True, **info)
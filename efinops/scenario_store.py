@@ -0,0 +1,193 @@
+# Persistent scenario store shared by every session, colleague and restart of the server.
+# Evaluated scenarios are kept in a local SQLite file, one row per (config hash, model, park, sizing) with CAPEX and
+# the investment metrics, so questions such as "top 20 NPV under ¥5M CAPEX" are answered by an indexed
+# query instead of a new search. Optimizer jobs bulk-insert every scenario they evaluated in one transaction;
+# rows evaluated again are merged (a later IRR search fills the IRR of rows an NPV search stored without it).
+#
+# The database runs in WAL mode: queries use read-only connections and never wait for a job that is
+# writing, and several server processes can share one file.
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from efinops.cache import config_hash
+from efinops.finance import SIZING_COLUMNS, as_sizings, capex_batch
+
+SCENARIO_STORE_ENV = 'EFINOPS_SCENARIO_DB'
+DEFAULT_SCENARIO_STORE = os.path.join(os.path.expanduser('~'), '.efinops', 'scenarios.sqlite')
+# Metrics stored per scenario besides total_capex (NULL where the evaluation did not compute them)
+STORE_METRIC_KEYS = ('npv_value', 'irr_value', 'payback_year_num', 'annual_gross_saving', 'annual_opex_mixed')
+STORE_COLUMNS = SIZING_COLUMNS + ('total_capex',) + STORE_METRIC_KEYS
+STORE_WRITE_CACHE_KB = 65536 # SQLite page cache of a writing connection
+# Ranking metrics of top(): True where higher is better
+RANK_METRICS = {'npv_value': True, 'irr_value': True, 'payback_year_num': False, 'total_capex': False}
+
+# A scenario row belongs to one (config hash, model, park) entry of the configs table, referenced by its integer id
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS configs (
+    config_id INTEGER PRIMARY KEY,
+    config_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    park TEXT NOT NULL,
+    config TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (config_hash, model, park)
+);
+CREATE INDEX IF NOT EXISTS configs_park ON configs (park, model);
+CREATE TABLE IF NOT EXISTS scenarios (
+    config_id INTEGER NOT NULL REFERENCES configs (config_id),
+    {', '.join(f'{column} REAL' for column in STORE_COLUMNS)},
+    PRIMARY KEY (config_id, {', '.join(SIZING_COLUMNS)})
+) WITHOUT ROWID;
+{''.join(f'CREATE INDEX IF NOT EXISTS scenarios_{key} ON scenarios (config_id, {key});' for key in RANK_METRICS)}
+"""
+_UPSERT = f"""
+INSERT INTO scenarios (config_id, {', '.join(STORE_COLUMNS)}) VALUES ({', '.join('?' * (len(STORE_COLUMNS) + 1))})
+ON CONFLICT (config_id, {', '.join(SIZING_COLUMNS)}) DO UPDATE SET total_capex = excluded.total_capex,
+    {', '.join(f'{key} = COALESCE(excluded.{key}, {key})' for key in STORE_METRIC_KEYS)}
+"""
+
+
+def default_store_path():
+    return os.environ.get(SCENARIO_STORE_ENV, DEFAULT_SCENARIO_STORE)
+
+
+class ScenarioStore:
+    # path: SQLite file (default ~/.efinops/scenarios.sqlite or $EFINOPS_SCENARIO_DB)
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock() # One writer per process; other processes wait on the SQLite lock
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    # One connection per call (committed and closed on exit), read-only unless writing
+    @contextmanager
+    def _connect(self, write=False):
+        if write:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute(f"PRAGMA cache_size = -{STORE_WRITE_CACHE_KB}") # Index pages of a bulk insert stay in memory
+        else:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # Store evaluated scenarios of a config: sizings (N x 4) and batch metrics holding any of STORE_METRIC_KEYS
+    # (missing, None or nan values are stored as NULL). CAPEX is computed from the config. Returns the config hash.
+    def insert(self, config, model, sizings, metrics, park=''):
+        sizings = as_sizings(sizings)
+        key = config_hash(config)
+        columns = [sizings, capex_batch(config, sizings)[:, None]]
+        for metric in STORE_METRIC_KEYS:
+            values = metrics.get(metric)
+            columns.append(np.full((len(sizings), 1), np.nan) if values is None else np.asarray(values, dtype=float)[:, None])
+        table = np.hstack(columns)
+        table = table[np.lexsort(sizings.T[::-1])] # Primary key order: appends to the B-tree instead of random inserts
+        now = time.time()
+        with self._lock, self._connect(write=True) as db:
+            db.execute("INSERT INTO configs (config_hash, model, park, config, created, updated) VALUES (?, ?, ?, ?, ?, ?)"
+                       " ON CONFLICT (config_hash, model, park) DO UPDATE SET updated = excluded.updated",
+                       (key, model, park, json.dumps(config, sort_keys=True, ensure_ascii=False, default=float), now, now))
+            config_id = db.execute("SELECT config_id FROM configs WHERE config_hash = ? AND model = ? AND park = ?",
+                                   (key, model, park)).fetchone()[0]
+            # SQLite binds nan as NULL
+            db.executemany(_UPSERT, ((config_id, *row) for row in table.tolist()))
+        return key
+
+    # Best `limit` stored scenarios by `metric` (see RANK_METRICS), optionally of one config (dict or hash),
+    # park and model and with CAPEX at most max_capex. Scenarios without a value for the metric are skipped.
+    # Returns sizings (K x 4), config_hash, model and park (lists) and one array per other STORE_COLUMNS column.
+    def top(self, metric, limit=20, config=None, park=None, model=None, max_capex=None):
+        if metric not in RANK_METRICS:
+            raise ValueError(f"Unknown ranking metric: {metric}")
+        where, where_args = _filter(config_hash=_hash(config), park=park, model=model)
+        with self._connect() as db:
+            entries = {row['config_id']: row for row in db.execute(
+                f"SELECT config_id, config_hash, model, park FROM configs WHERE {where}", where_args)}
+            # One config is read in index order (config_id, metric); several are merged by a sort
+            ids = list(entries)
+            conditions, args = [f"config_id IN ({', '.join('?' * len(ids))})", f"{metric} IS NOT NULL"], ids
+            if max_capex is not None:
+                conditions.append("total_capex <= ?")
+                args = args + [float(max_capex)]
+            rows = db.execute(f"SELECT config_id, {', '.join(STORE_COLUMNS)} FROM scenarios WHERE {' AND '.join(conditions)}"
+                              f" ORDER BY {metric} {'DESC' if RANK_METRICS[metric] else 'ASC'} LIMIT ?", (*args, limit)).fetchall()
+        values = np.array([tuple(row)[1:] for row in rows], dtype=float).reshape(-1, len(STORE_COLUMNS))
+        return {
+            'sizings': values[:, :len(SIZING_COLUMNS)],
+            **{column: [entries[row['config_id']][column] for row in rows] for column in ('config_hash', 'model', 'park')},
+            **{key: values[:, i] for i, key in enumerate(STORE_COLUMNS) if key not in SIZING_COLUMNS},
+        }
+
+    # Stored config of a hash, or None
+    def config(self, key):
+        with self._connect() as db:
+            row = db.execute("SELECT config FROM configs WHERE config_hash = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row['config'])
+
+    # Parks with stored scenarios
+    def parks(self):
+        with self._connect() as db:
+            return [row['park'] for row in db.execute("SELECT DISTINCT park FROM configs ORDER BY park")]
+
+    # Number of stored scenarios and configs, optionally of one park and model
+    def counts(self, park=None, model=None):
+        conditions, args = _filter(park=park, model=model)
+        with self._connect() as db:
+            row = db.execute("SELECT COUNT(*), COUNT(DISTINCT c.config_hash) FROM configs c JOIN scenarios s"
+                             f" ON s.config_id = c.config_id WHERE {conditions}", args).fetchone()
+        return {'scenarios': row[0], 'configs': row[1]}
+
+
+# Config hash of a config dict (a hash string or None is passed through)
+def _hash(config):
+    return config if config is None or isinstance(config, str) else config_hash(config)
+
+
+# WHERE clause on configs columns and its arguments; None values do not filter
+def _filter(**values):
+    values = {column: value for column, value in values.items() if value is not None}
+    return ' AND '.join([f"{column} = ?" for column in values] or ['1']), list(values.values())
+
+
+# evaluate_batch wrapper that keeps the STORE_METRIC_KEYS of every evaluated batch, for one bulk insert
+# after the search (rows evaluated twice are merged by the store)
+class ScenarioRecorder:
+    def __init__(self, evaluate_batch):
+        self.evaluate_batch = evaluate_batch
+        self._sizings = []
+        self._metrics = []
+
+    def __call__(self, sizings):
+        metrics = self.evaluate_batch(sizings)
+        sizings = as_sizings(sizings)
+        self._sizings.append(sizings)
+        self._metrics.append({key: np.full(len(sizings), np.nan) if metrics.get(key) is None else np.asarray(metrics[key], dtype=float)
+                              for key in STORE_METRIC_KEYS})
+        return metrics
+
+    def __len__(self):
+        return sum(len(sizings) for sizings in self._sizings)
+
+    def save(self, store, config, model, park=''):
+        if not self._sizings:
+            return 0
+        store.insert(config, model, np.concatenate(self._sizings),
+                     {key: np.concatenate([metrics[key] for metrics in self._metrics]) for key in STORE_METRIC_KEYS}, park)
+        return len(self)
@@ -0,0 +1,171 @@
+# Sensitivity analysis of one sizing (annual simplified model): one-at-a-time tornado and 2-D grids.
+# The stages of efinops.model.ANNUAL_STAGES are grouped into CAPEX, baseline cost, mixed-system grid cost and
+# cash flows. A perturbation recomputes only the groups whose inputs it touches and reuses the unperturbed
+# result of the others, e.g. a tax-rate change only redoes the cash flows. Perturbations are evaluated as rows
+# of per-row config arrays, so each group of keys with the same affected stages costs one vectorized pass.
+import numpy as np
+
+from efinops.finance import SIZING_COLUMNS, capex_batch, cash_flow_metrics
+from efinops.model import (
+    ANNUAL_STAGES,
+    DERIVED_KEYS,
+    NON_NUMERIC_KEYS,
+    annual_grid_cost_batch,
+    average_grid_price,
+    baseline_grid_input,
+    calculate_mixed_system_metrics_batch,
+)
+from efinops.pipeline import run_stages, stage_inputs
+from efinops.tariff import tou_equivalent
+
+
+# Config keys read by each stage, including upstream stages (shoulder_perc is derived from peak/valley_perc, a
+# tariff definition is analysed through its three-price equivalent)
+def _inputs(stage_name):
+    return tuple(key for key in stage_inputs(ANNUAL_STAGES, stage_name) if key not in DERIVED_KEYS + NON_NUMERIC_KEYS)
+
+CAPEX_KEYS = _inputs('capex')
+BASELINE_KEYS = _inputs('baseline')
+GRID_COST_KEYS = _inputs('grid_cost')
+CASH_FLOW_KEYS = next(stage.keys for stage in ANNUAL_STAGES if stage.name == 'cash_flows')
+SENSITIVITY_KEYS = CAPEX_KEYS + GRID_COST_KEYS + CASH_FLOW_KEYS # Every config key the model reads
+INTEGER_KEYS = ('project_lifespan_years', 'depreciation_years', 'st_annual_太阳小时', 'pv_annual_太阳小时')
+# Cash-flow inputs that set the shape of the cash-flow matrix or the discount vector (rows are grouped by them)
+_SCALAR_CASH_FLOW_KEYS = ('project_lifespan_years', 'depreciation_years', 'discount_rate')
+SENSITIVITY_METRICS = ('npv_value', 'irr_value', 'payback_year_num')
+
+
+# Unperturbed stage results of a sizing, shared by every perturbation
+def base_stages(config, sizing):
+    results = run_stages(ANNUAL_STAGES, config, [sizing], {'compute_irr': False})
+    return {
+        'total_capex': results['capex'][0],
+        'baseline_cost': results['baseline'],
+        'annual_grid_cost': results['grid_cost'][0],
+    }
+
+
+# Metrics of one sizing under per-row overrides {key: array of n values}; keys are config keys or sizing
+# columns. Only the stages reading an overridden key are recomputed, the others come from `stages`
+# (base_stages of the same config and sizing). Returns n-element arrays of SENSITIVITY_METRICS plus
+# total_capex, annual_grid_cost and annual_gross_saving, and the recomputed stage names.
+def evaluate_overrides(config, sizing, overrides, stages=None, compute_irr=True):
+    config = tou_equivalent(config)
+    overrides = {key: np.atleast_1d(np.asarray(value, dtype=float)) for key, value in overrides.items()}
+    n = len(next(iter(overrides.values())))
+    stages = stages or base_stages(config, sizing)
+    params = {**config, **overrides}
+    if 'peak_perc' in overrides or 'valley_perc' in overrides:
+        params['shoulder_perc'] = np.maximum(0.0, 1.0 - params['peak_perc'] - params['valley_perc'])
+    sizing_arrays = [np.broadcast_to(params.get(column, value), (n,)) for column, value in zip(SIZING_COLUMNS, sizing)]
+    touched = set(overrides)
+    sizing_touched = bool(touched & set(SIZING_COLUMNS))
+    recomputed = []
+
+    # Changed stages run the model's stage functions on the per-row params
+    if sizing_touched or touched & set(CAPEX_KEYS):
+        total_capex = capex_batch(params, np.column_stack(sizing_arrays))
+        recomputed.append('capex')
+    else:
+        total_capex = np.full(n, stages['total_capex'])
+
+    if touched & set(BASELINE_KEYS):
+        avg_tou_price = average_grid_price(params)
+        baseline_cost = np.broadcast_to(baseline_grid_input(params) * avg_tou_price, (n,))
+        recomputed.append('baseline')
+    else:
+        avg_tou_price = None
+        baseline_cost = np.full(n, stages['baseline_cost'])
+
+    if sizing_touched or touched & set(GRID_COST_KEYS):
+        if avg_tou_price is None:
+            avg_tou_price = average_grid_price(params)
+        annual_grid_cost = annual_grid_cost_batch(params, *sizing_arrays, avg_tou_price)
+        recomputed.append('grid_cost')
+    else:
+        annual_grid_cost = np.full(n, stages['annual_grid_cost'])
+
+    # Cash flows: always recomputed (cheap), one call per distinct lifespan / depreciation / discount rate
+    # tax_rate and opex_percentage enter elementwise and may stay per-row arrays
+    recomputed.append('cash_flow')
+    result = {key: np.empty(n) for key in SENSITIVITY_METRICS + ('annual_gross_saving',)}
+    group_values = np.column_stack([np.broadcast_to(params[key], (n,)) for key in _SCALAR_CASH_FLOW_KEYS])
+    unique_values, group_of_row = np.unique(group_values, axis=0, return_inverse=True)
+    for g, values in enumerate(unique_values):
+        rows = np.flatnonzero(group_of_row.ravel() == g)
+        group_config = {
+            **config,
+            'project_lifespan_years': int(values[0]), 'depreciation_years': int(values[1]), 'discount_rate': values[2],
+            'tax_rate': np.broadcast_to(params['tax_rate'], (n,))[rows],
+            'opex_percentage': np.broadcast_to(params['opex_percentage'], (n,))[rows],
+        }
+        metrics = cash_flow_metrics(group_config, total_capex[rows], annual_grid_cost[rows], baseline_cost[rows], compute_irr)
+        for key in result:
+            if metrics.get(key) is not None:
+                result[key][rows] = metrics[key]
+    if not compute_irr:
+        result['irr_value'] = None
+    result.update({'total_capex': total_capex, 'annual_grid_cost': annual_grid_cost, 'recomputed': recomputed})
+    return result
+
+
+# Low / high values of a one-at-a-time perturbation by +/- delta (relative); integer keys move at least 1
+def perturbation_values(config, key, delta):
+    value = config[key]
+    low, high = value * (1 - delta), value * (1 + delta)
+    if key in INTEGER_KEYS:
+        low, high = min(round(low), value - 1), max(round(high), value + 1)
+        low = max(low, 1)
+    return low, high
+
+
+# One-at-a-time tornado: every key is moved to its low and high value with all other inputs at base.
+# Keys that touch the same stages are evaluated together in one pass.
+# Returns base metrics, the keys, their low/high input values and the metrics at low/high (arrays per key).
+def tornado(config, sizing, keys=SENSITIVITY_KEYS, delta=0.1, compute_irr=True):
+    config = tou_equivalent(config)
+    keys = [key for key in keys if key in config]
+    stages = base_stages(config, sizing)
+    base = calculate_mixed_system_metrics_batch(config, [sizing], compute_irr)
+    low_values, high_values = np.array([perturbation_values(config, key, delta) for key in keys], dtype=float).reshape(-1, 2).T
+    low = {key: np.empty(len(keys)) for key in SENSITIVITY_METRICS}
+    high = {key: np.empty(len(keys)) for key in SENSITIVITY_METRICS}
+
+    groups = {}
+    for i, key in enumerate(keys):
+        signature = (key in CAPEX_KEYS, key in BASELINE_KEYS, key in GRID_COST_KEYS)
+        groups.setdefault(signature, []).append(i)
+    for indices in groups.values():
+        # Rows 2j / 2j+1 move keys[indices[j]] to its low / high value
+        overrides = {}
+        for j, i in enumerate(indices):
+            values = np.full(2 * len(indices), float(config[keys[i]]))
+            values[2 * j:2 * j + 2] = low_values[i], high_values[i]
+            overrides[keys[i]] = values
+        metrics = evaluate_overrides(config, sizing, overrides, stages, compute_irr)
+        for key in SENSITIVITY_METRICS:
+            if metrics[key] is None:
+                continue
+            low[key][indices] = metrics[key][0::2]
+            high[key][indices] = metrics[key][1::2]
+
+    return {
+        'base': {key: float(base[key][0]) for key in SENSITIVITY_METRICS if base[key] is not None},
+        'keys': keys,
+        'low_values': low_values,
+        'high_values': high_values,
+        'low': low if compute_irr else {key: value for key, value in low.items() if key != 'irr_value'},
+        'high': high if compute_irr else {key: value for key, value in high.items() if key != 'irr_value'},
+    }
+
+
+# 2-D sensitivity grid (heatmap) over two inputs, each a config key or a sizing column.
+# Returns metric arrays of shape (len(y_values), len(x_values)).
+def sensitivity_grid(config, sizing, x_key, x_values, y_key, y_values, compute_irr=True):
+    if x_key == y_key:
+        raise ValueError("x_key and y_key must differ")
+    x_values = np.asarray(x_values, dtype=float)
+    y_values = np.asarray(y_values, dtype=float)
+    x_grid, y_grid = np.meshgrid(x_values, y_values)
+    metrics = evaluate_overrides(config, sizing, {x_key: x_grid.ravel(), y_key: y_grid.ravel()}, compute_irr=compute_irr)
+    return {key: metrics[key].reshape(x_grid.shape) for key in SENSITIVITY_METRICS if metrics[key] is not None}
@@ -0,0 +1,259 @@
+# Cost-minimizing storage dispatch by dynamic programming over a discretized state of charge.
+# Replaces the fixed-cycle arbitrage estimate (capacity x cycles x peak/valley spread) with the schedule that
+# minimizes the grid bill for the actual hourly prices, net load and PV surplus under the capacity, power
+# (storage_c_rate) and round-trip efficiency limits.
+#
+# The year is cut into 24-hour windows starting at the evening valley, when an arbitrage battery is empty
+# anyway, and every window starts and ends empty. The windows are then independent: the backward recursion
+# runs once over 24 hours with every step vectorized across windows and scenarios (storage sizes), and
+# identical windows (e.g. the weekday / weekend days of a synthetic profile) are solved only once. With
+# STORAGE_SOC_LEVELS states this costs a few milliseconds per storage size on a metered profile and well
+# under one on a synthetic profile, which keeps the solver inside optimizer sweeps.
+import numpy as np
+
+from efinops.cache import ScenarioCache, config_hash
+from efinops.hourly import HOURLY_DEFAULTS, synthetic_elec_load, tou_price_vector
+from efinops.instrument import count, timer
+from efinops.tariff import HOURS_PER_DAY, TARIFF_KEY, TOU_CLASSES, TOU_VALLEY, compiled_tariff
+
+STORAGE_SOC_LEVELS = 12 # State-of-charge steps between empty and full
+STORAGE_PLAN_CACHE_SIZE = 16384 # Cached annual schedules, one per (tariff / storage parameters, lattice capacity)
+STORAGE_ENVELOPE_STEP_KWH = 50.0 # Spacing of the solved capacities (the slider / optimizer step)
+STORAGE_PLAN_GROUPS = 64 # Distinct per-row tariffs solved exactly; beyond that plans are solved at the group mean prices
+
+# Numeric config keys the annual storage value depends on (besides the tariff definition, TARIFF_KEY), and the
+# TOU prices in period order (TOU_VALLEY, TOU_SHOULDER, TOU_PEAK)
+STORAGE_PLAN_KEYS = (
+    'grid_price_peak', 'grid_price_valley', 'grid_price_shoulder', 'peak_perc', 'valley_perc', 'shoulder_perc',
+    'storage_eff_charge', 'storage_eff_discharge', 'storage_c_rate', 'annual_elec_kwh',
+)
+PERIOD_PRICE_KEYS = ('grid_price_valley', 'grid_price_shoulder', 'grid_price_peak')
+
+_plan_cache = ScenarioCache(STORAGE_PLAN_CACHE_SIZE, name='storage_plans')
+
+
+def _c_rate(config):
+    return config.get('storage_c_rate', HOURLY_DEFAULTS['storage_c_rate'])
+
+
+# Value of a STORAGE_PLAN_KEYS entry; only storage_c_rate has a default, a missing other key raises KeyError
+def _plan_value(config, key):
+    return _c_rate(config) if key == 'storage_c_rate' else config[key]
+
+
+# Prices the period flows are valued at: the configured TOU prices, or the class mean prices of a tariff definition
+def period_prices(config):
+    if config.get(TARIFF_KEY) is not None:
+        return compiled_tariff(config).period_prices
+    return np.array([config[key] for key in PERIOD_PRICE_KEYS])
+
+
+# First hour of the dispatch windows: the start of the valley block that follows a non-valley hour (the
+# evening valley of the default tariff), or midnight for a flat tariff
+def window_start(periods):
+    day = np.asarray(periods[:HOURS_PER_DAY])
+    starts = np.flatnonzero((day == TOU_VALLEY) & (np.roll(day, 1) != TOU_VALLEY))
+    return int(starts[0]) if len(starts) else 0
+
+
+# (8760, n) hourly series -> (24, windows, n) with hour 0 at `start` (the last window wraps into 1 January)
+def _windows(series, start):
+    series = np.roll(series, -start, axis=0)
+    return series.reshape(-1, HOURS_PER_DAY, series.shape[1]).transpose(1, 0, 2)
+
+
+def _unwindow(windows, start):
+    return np.roll(windows.transpose(1, 0, 2).reshape(-1, windows.shape[2]), start, axis=0)
+
+
+# Cost-minimizing storage schedule for hour-major (8760 x n) net load and PV surplus and n capacities, with
+# the same contract as efinops.hourly.storage_soc_kernel: returns hourly PV charge and grid charge (kWh drawn
+# into the battery) and discharge (kWh delivered), each (8760 x n). prices: hourly ¥/kWh; periods: TOU period
+# of every hour (sets the window start). A net load / surplus of shape (8760, 1) is shared by all capacities.
+@timer('stage', stage='storage_dispatch')
+def optimal_storage_dispatch(config, net_load, pv_surplus, prices, periods, capacity, levels=STORAGE_SOC_LEVELS):
+    net_load = np.asarray(net_load, dtype=float)
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=float), net_load.shape[1:])
+    if not np.any(capacity > 0):
+        return tuple(np.zeros((len(net_load), len(capacity))) for _ in range(3))
+    start, inverse, flows = dispatch_windows(config, net_load, pv_surplus, prices, periods, capacity, levels)
+    return tuple(_unwindow(flow[:, inverse], start) for flow in flows)
+
+
+# Optimal schedule of every distinct window. Returns the window start hour, the distinct window of each
+# window and the (PV charge, grid charge, discharge) flows as (24, distinct windows, n) arrays.
+def dispatch_windows(config, net_load, pv_surplus, prices, periods, capacity, levels=STORAGE_SOC_LEVELS):
+    count('storage_dispatch_scenarios', len(capacity))
+    start = window_start(periods)
+    load = _windows(net_load, start)
+    surplus = _windows(np.broadcast_to(pv_surplus, net_load.shape), start)
+    price = _windows(np.asarray(prices, dtype=float)[:, None], start)
+
+    # Windows with identical prices, loads and surplus in every scenario share one solution
+    first, inverse = _distinct_windows(price, load, surplus)
+    load, surplus, price = load[:, first], surplus[:, first], price[:, first]
+    steps = solve_soc_windows(config, load, surplus, price, capacity / levels, levels, storage_shifts(config, levels))
+
+    # Energy flows of the chosen level changes (kWh). Delivery is capped at the net load (no export); what a
+    # capped step takes from the battery beyond that is the rounding loss of the SOC grid and counts as a loss
+    energy = steps * (capacity / levels)
+    drawn = np.maximum(energy, 0) / config['storage_eff_charge']
+    from_pv = np.minimum(drawn, surplus)
+    delivered = np.minimum(np.maximum(-energy, 0) * config['storage_eff_discharge'], load)
+    return start, inverse, (from_pv, drawn - from_pv, delivered)
+
+
+# Index of the first occurrence of every distinct window and the distinct window of each window
+def _distinct_windows(*arrays):
+    rows = np.concatenate([np.ascontiguousarray(array.transpose(1, 0, *range(2, array.ndim))).reshape(array.shape[1], -1) for array in arrays], axis=1)
+    seen = {}
+    inverse = np.array([seen.setdefault(row.tobytes(), len(seen)) for row in rows])
+    first = np.zeros(len(seen), dtype=np.int64)
+    first[inverse[::-1]] = np.arange(len(rows))[::-1]
+    return first, inverse
+
+
+# Level changes per hour that the power limit allows: charging draws at most capacity x storage_c_rate from
+# PV or grid, discharging delivers at most as much. Ordered by size, so ties keep the smaller move.
+def storage_shifts(config, levels=STORAGE_SOC_LEVELS):
+    max_up = int(np.floor(_c_rate(config) * config['storage_eff_charge'] * levels + 1e-9))
+    max_down = int(np.floor(_c_rate(config) / config['storage_eff_discharge'] * levels + 1e-9)) if config['storage_eff_discharge'] > 0 else 0
+    shifts = [k for k in range(-min(max_down, levels), min(max_up, levels) + 1) if k != 0]
+    return sorted(shifts, key=abs)
+
+
+# Backward recursion over the 24 hours of (24, windows, n) arrays (or (24, windows, 1) when shared by all
+# scenarios), then the forward pass from an empty battery. step_kwh: stored energy per level for each of the
+# n scenarios. Returns the chosen level change of every hour as (24, windows, n) integers.
+def solve_soc_windows(config, load, surplus, price, step_kwh, levels, shifts):
+    hours, n_windows = load.shape[:2]
+    n = len(step_kwh)
+    eff_charge = config['storage_eff_charge']
+    eff_discharge = config['storage_eff_discharge']
+    pad = levels
+    value = np.zeros((n_windows, n, levels + 1)) # Cost-to-go; energy left at the end of a window is worthless
+    padded = np.full((n_windows, n, levels + 1 + 2 * pad), np.inf)
+    candidate = np.empty_like(value)
+    better = np.empty(value.shape, dtype=bool)
+    policy = np.zeros((hours, n_windows, n, levels + 1), dtype=np.int8)
+    for t in range(hours - 1, -1, -1):
+        padded[..., pad:pad + levels + 1] = value
+        best = value.copy() # Idle
+        choice = policy[t]
+        for k in shifts:
+            if k > 0:
+                cost = price[t] * np.maximum(k * step_kwh / eff_charge - surplus[t], 0)
+            else:
+                cost = -price[t] * np.minimum(-k * step_kwh * eff_discharge, load[t])
+            np.add(padded[..., pad + k:pad + k + levels + 1], cost[..., None], out=candidate)
+            np.less(candidate, best, out=better)
+            np.copyto(best, candidate, where=better)
+            np.copyto(choice, k, where=better)
+        value = best
+
+    steps = np.zeros((hours, n_windows, n), dtype=np.int64)
+    level = np.zeros((n_windows, n), dtype=np.int64)
+    for t in range(hours):
+        steps[t] = np.take_along_axis(policy[t], level[..., None], axis=-1)[..., 0]
+        level += steps[t]
+    return steps
+
+
+# --- Annual model ---
+
+# Net storage discharge minus grid charge per TOU period (kWh / year, columns TOU_VALLEY, TOU_SHOULDER,
+# TOU_PEAK) of the optimal schedule for each capacity, at a scalar config. The annual model has no hourly PV,
+# so the battery works against the synthetic electric load profile and charges from the grid only; the
+# annual saving is these flows priced at the period prices.
+# Schedules are solved at the multiples of STORAGE_ENVELOPE_STEP_KWH (the slider lattice) and interpolated
+# linearly in between, so a sweep costs one solve per lattice point however many sizings it has. A battery
+# can run the schedule of any smaller one, so each lattice point takes the best schedule among itself and
+# the smaller points; this removes the dips the relative SOC grid causes at large capacities and makes the
+# value nondecreasing in capacity, which the optimizer's bounds rely on.
+def storage_period_flows(config, capacities):
+    capacities = np.maximum(np.asarray(capacities, dtype=float), 0.0)
+    references, envelope = _envelope_flows(config, float(capacities.max(initial=0.0)))
+    return np.stack([np.interp(capacities, references, envelope[:, j]) for j in range(3)], axis=-1)
+
+
+# Lattice capacities up to `top` and the flows of the best schedule at or below each of them
+def _envelope_flows(config, top):
+    references = np.arange(int(np.ceil(top / STORAGE_ENVELOPE_STEP_KWH)) + 1) * STORAGE_ENVELOPE_STEP_KWH
+    solved = np.zeros((len(references), 3))
+    solved[1:] = _solved_flows(config, references[1:])
+    values = solved @ period_prices(config)
+    best = np.maximum.accumulate(np.where(values >= np.maximum.accumulate(values), np.arange(len(values)), 0))
+    return references, solved[best]
+
+
+# Flows of the optimal schedule for positive capacities, solved in one batch for those not cached yet. Flows
+# are net discharge per TOU class in price-equivalent kWh (their value at the hourly prices divided by the
+# class price of period_prices), which are plain kWh under a three-price tariff and keep seasonal or
+# critical-peak prices exact under a tariff definition.
+def _solved_flows(config, capacities):
+    plan_key = tuple(float(_plan_value(config, key)) for key in STORAGE_PLAN_KEYS)
+    if config.get(TARIFF_KEY) is not None:
+        plan_key += (config_hash(config[TARIFF_KEY]),)
+    solved = np.zeros((len(capacities), 3))
+    missing = []
+    for i, capacity in enumerate(capacities):
+        cached = _plan_cache.peek((plan_key, capacity))
+        if cached is None:
+            missing.append(i)
+        else:
+            solved[i] = cached
+    if missing:
+        prices, periods = tou_price_vector(config)
+        load = synthetic_elec_load(config['annual_elec_kwh'])[:, None]
+        start, inverse, (_, grid_charge, discharge) = dispatch_windows(config, load, 0.0, prices, periods, capacities[missing])
+        # Value of one year: the distinct windows expanded to every window, at the hourly prices
+        value = (discharge - grid_charge)[:, inverse] * _windows(prices[:, None], start)
+        window_periods = _windows(periods[:, None], start)[:, :, 0]
+        class_prices = period_prices(config)
+        for j, period in enumerate(TOU_CLASSES):
+            if class_prices[j] != 0:
+                solved[missing, j] = value[window_periods == period].sum(axis=0) / class_prices[j]
+        for i in missing:
+            _plan_cache.put((plan_key, capacities[i]), solved[i].copy())
+    return solved
+
+
+# Annual saving of optimally dispatched storage (¥) for capacity (scalar or array). Config values may be
+# arrays that broadcast against it (per-row configs of efinops.portfolio, efinops.montecarlo and
+# efinops.sensitivity): schedules are then solved per distinct row of the varying STORAGE_PLAN_KEYS. With
+# more than STORAGE_PLAN_GROUPS distinct rows (e.g. Monte Carlo price draws), rows that differ only in
+# prices share the schedule solved at their mean prices, and every row prices that schedule at its own tariff.
+def annual_storage_saving(config, capacity):
+    capacity = np.asarray(capacity, dtype=float)
+    varying = [key for key in STORAGE_PLAN_KEYS if np.ndim(config.get(key, 0.0)) > 0]
+    if not varying:
+        references, envelope = _envelope_flows(config, float(capacity.max(initial=0.0)))
+        return np.interp(np.maximum(capacity, 0.0), references, envelope @ period_prices(config))
+
+    # Group the config rows first (few, e.g. one per park), then map every broadcast row to its group
+    config_shape = np.broadcast_shapes(*(np.shape(config[key]) for key in varying))
+    shape = np.broadcast_shapes(capacity.shape, config_shape)
+    rows = {key: np.broadcast_to(_plan_value(config, key), config_shape).ravel() for key in STORAGE_PLAN_KEYS}
+    grouping = varying
+    if len(np.unique(np.column_stack([rows[key] for key in grouping]), axis=0)) > STORAGE_PLAN_GROUPS:
+        grouping = [key for key in varying if key not in PERIOD_PRICE_KEYS]
+    if grouping:
+        _, group_of_config = np.unique(np.column_stack([rows[key] for key in grouping]), axis=0, return_inverse=True)
+    else:
+        group_of_config = np.zeros(len(rows[varying[0]]), dtype=np.int64)
+    config_row = np.broadcast_to(np.arange(len(group_of_config)).reshape(config_shape), shape).ravel()
+    group_of_row = group_of_config.ravel()[config_row]
+    capacity = np.broadcast_to(capacity, shape).ravel()
+
+    flows = np.zeros((len(capacity), 3))
+    for g in range(group_of_row.max() + 1):
+        members = np.flatnonzero(group_of_row == g)
+        in_group = group_of_config.ravel() == g
+        plan_config = {key: float(np.mean(rows[key][in_group])) for key in STORAGE_PLAN_KEYS}
+        plan_config[TARIFF_KEY] = config.get(TARIFF_KEY)
+        flows[members] = storage_period_flows(plan_config, capacity[members])
+    if config.get(TARIFF_KEY) is not None: # Prices come from the tariff definition, not from per-row values
+        prices = np.broadcast_to(period_prices(config), (len(config_row), 3))
+    else:
+        prices = np.column_stack([rows[key][config_row] for key in PERIOD_PRICE_KEYS])
+    return np.einsum('ij,ij->i', flows, prices).reshape(shape)
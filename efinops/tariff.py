@@ -0,0 +1,212 @@
+# Tariff compiler: declarative grid tariffs -> hourly price vectors, compiled once and cached.
+# A tariff definition is a plain JSON-style dict (so it can live in a config, a park file or the job table):
+#
+#   {
+#       'prices': {'valley': 0.31, 'shoulder': 0.68, 'peak': 1.12, 'critical_peak': 1.34},   # ¥/kWh
+#       'seasons': [                                   # first season listing a month wins; other months: shoulder
+#           {'months': [7, 8], 'hours': {'valley': [0, 1, 2, 3, 4, 5, 6, 23], 'peak': [10, 11, 16, 17, 18],
+#                                        'critical_peak': [19, 20]}, 'prices': {'critical_peak': 1.5}},
+#           {'months': [1, 2, 3, 4, 5, 6, 9, 10, 11, 12], 'hours': {'valley': [0, 1, 2, 3, 4, 5, 6, 23], 'peak': [10, 11, 18, 19, 20]}},
+#       ],
+#       'tiers': [[500000, 0.03], [1000000, 0.05]],   # monthly blocks: kWh beyond each threshold pays its adder on top
+#       'demand_charge': 38.0,                         # ¥ per kW of each month's maximum grid import
+#       'market_prices': [...8760 values...],          # market-traded energy price per hour (¥/kWh), optional
+#       'market_share': 0.6,                           # share of energy bought at market prices, the rest at TOU prices
+#   }
+#
+# Hours not listed in a season are shoulder hours; a season's 'prices' override the tariff prices for its
+# months. Compiling yields the 8760-hour energy price vector, the TOU class of every hour (critical peak is
+# dispatched like peak) and per-period hour masks; energy costs are then one dot product with it. Tiered blocks
+# and demand charges depend on the monthly totals and peaks of an import series (CompiledTariff.charges).
+#
+# A config without a 'tariff' (or with None) gets the tariff of its three TOU prices and peak/valley shares,
+# so the hourly model prices exactly as before; the annual model uses the tariff's mean hourly price.
+import numpy as np
+
+from efinops.cache import ScenarioCache, config_hash
+
+HOURS_PER_DAY = 24
+DAYS_PER_YEAR = 365
+HOURS_PER_YEAR = HOURS_PER_DAY * DAYS_PER_YEAR
+DAYS_PER_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+MONTHS = len(DAYS_PER_MONTH)
+MONTH_OF_HOUR = np.repeat(np.arange(MONTHS), np.array(DAYS_PER_MONTH) * HOURS_PER_DAY)
+MONTH_START_HOURS = np.concatenate([[0], np.cumsum(DAYS_PER_MONTH)[:-1]]) * HOURS_PER_DAY
+
+# TOU classes the dispatch engines work with
+TOU_VALLEY = 0
+TOU_SHOULDER = 1
+TOU_PEAK = 2
+TOU_CLASSES = (TOU_VALLEY, TOU_SHOULDER, TOU_PEAK)
+
+# Tariff periods and the TOU class each is dispatched as
+PERIOD_VALLEY = 'valley'
+PERIOD_SHOULDER = 'shoulder'
+PERIOD_PEAK = 'peak'
+PERIOD_CRITICAL_PEAK = 'critical_peak'
+PERIOD_CLASSES = {PERIOD_VALLEY: TOU_VALLEY, PERIOD_SHOULDER: TOU_SHOULDER, PERIOD_PEAK: TOU_PEAK, PERIOD_CRITICAL_PEAK: TOU_PEAK}
+
+TARIFF_KEY = 'tariff' # Config key of a tariff definition
+TARIFF_CACHE_SIZE = 64 # Compiled tariffs kept in memory
+
+_compiled = ScenarioCache(TARIFF_CACHE_SIZE, name='tariffs')
+
+# Hours of the day in the order they are assigned to valley / peak periods
+_VALLEY_HOUR_ORDER = (0, 1, 2, 3, 4, 5, 23, 6, 22, 7, 12, 13, 14, 21, 15, 8, 16, 9, 17, 10, 18, 11, 20, 19)
+_PEAK_HOUR_ORDER = (19, 18, 20, 10, 11, 9, 17, 21, 16, 15, 8, 14, 13, 12, 22, 7, 6, 23, 5, 4, 3, 2, 1, 0)
+
+
+# TOU period of every hour of the year from the configured peak/valley shares (whole hours per day)
+def tou_periods(config):
+    total_perc = config['peak_perc'] + config['valley_perc'] + config['shoulder_perc']
+    if total_perc <= 0:
+        return np.full(HOURS_PER_YEAR, TOU_SHOULDER, dtype=np.int8)
+    n_valley = int(round(HOURS_PER_DAY * config['valley_perc'] / total_perc))
+    n_peak = min(int(round(HOURS_PER_DAY * config['peak_perc'] / total_perc)), HOURS_PER_DAY - n_valley)
+    day = np.full(HOURS_PER_DAY, TOU_SHOULDER, dtype=np.int8)
+    day[list(_VALLEY_HOUR_ORDER[:n_valley])] = TOU_VALLEY
+    peak_hours = [h for h in _PEAK_HOUR_ORDER if day[h] != TOU_VALLEY][:n_peak]
+    day[peak_hours] = TOU_PEAK
+    return np.tile(day, DAYS_PER_YEAR)
+
+
+# Tariff definition of a config: its 'tariff' entry, or the all-year TOU tariff of the three configured
+# prices with the valley / peak hours of tou_periods
+def config_tariff(config):
+    if config.get(TARIFF_KEY) is not None:
+        return config[TARIFF_KEY]
+    day = tou_periods(config)[:HOURS_PER_DAY]
+    return {
+        'prices': {PERIOD_VALLEY: float(config['grid_price_valley']), PERIOD_SHOULDER: float(config['grid_price_shoulder']),
+                   PERIOD_PEAK: float(config['grid_price_peak'])},
+        'seasons': [{'months': list(range(1, MONTHS + 1)),
+                     'hours': {PERIOD_VALLEY: np.flatnonzero(day == TOU_VALLEY).tolist(), PERIOD_PEAK: np.flatnonzero(day == TOU_PEAK).tolist()}}],
+    }
+
+
+# Compiled tariff of a definition, served from the cache when the same definition was compiled before
+def compile_tariff(definition):
+    if isinstance(definition.get('market_prices'), np.ndarray):
+        definition = {**definition, 'market_prices': definition['market_prices'].tolist()}
+    return _compiled.get(config_hash(definition), lambda: CompiledTariff(definition))
+
+
+def compiled_tariff(config):
+    return compile_tariff(config_tariff(config))
+
+
+class CompiledTariff:
+    # Raises ValueError for an invalid definition (unknown period, hour or month out of range, wrong lengths)
+    def __init__(self, definition):
+        unknown = set(definition) - {'prices', 'seasons', 'tiers', 'demand_charge', 'market_prices', 'market_share'}
+        if unknown:
+            raise ValueError(f"Unknown tariff fields: {', '.join(sorted(unknown))}")
+        base_prices = _period_prices(definition.get('prices', {}))
+        if PERIOD_SHOULDER not in base_prices:
+            raise ValueError("Tariff needs a shoulder price")
+
+        day_of_month = np.repeat(np.arange(MONTHS), DAYS_PER_MONTH)
+        period_of_day = {} # month -> (24,) period names
+        price_of_month = {}
+        for season in definition.get('seasons', []):
+            day = np.full(HOURS_PER_DAY, PERIOD_SHOULDER, dtype=object)
+            for period, hours in season.get('hours', {}).items():
+                _check_period(period)
+                hours = np.asarray(hours, dtype=int)
+                if np.any((hours < 0) | (hours >= HOURS_PER_DAY)):
+                    raise ValueError(f"Tariff hours must be within 0..{HOURS_PER_DAY - 1}")
+                day[hours] = period
+            prices = {**base_prices, **_period_prices(season.get('prices', {}))}
+            for month in season.get('months', []):
+                if not 1 <= month <= MONTHS:
+                    raise ValueError(f"Tariff months must be within 1..{MONTHS}")
+                period_of_day.setdefault(month - 1, day)
+                price_of_month.setdefault(month - 1, prices)
+
+        names = tuple(PERIOD_CLASSES)
+        period_index = np.empty((MONTHS, HOURS_PER_DAY), dtype=np.int8) # month x hour -> index into names
+        month_prices = np.empty((MONTHS, len(names)))
+        for month in range(MONTHS):
+            day = period_of_day.get(month, np.full(HOURS_PER_DAY, PERIOD_SHOULDER, dtype=object))
+            period_index[month] = [names.index(period) for period in day]
+            prices = price_of_month.get(month, base_prices)
+            missing = {names[i] for i in period_index[month]} - set(prices)
+            if missing:
+                raise ValueError(f"Tariff has no price for period {', '.join(sorted(missing))}")
+            month_prices[month] = [prices.get(name, np.nan) for name in names]
+
+        hourly_period = period_index[day_of_month].ravel()
+        month = MONTH_OF_HOUR
+        self.prices = month_prices[month, hourly_period]
+        market_share = float(definition.get('market_share', 0.0))
+        if definition.get('market_prices') is not None and market_share > 0:
+            market_prices = np.asarray(definition['market_prices'], dtype=float)
+            if market_prices.shape != (HOURS_PER_YEAR,):
+                raise ValueError(f"Tariff market_prices needs {HOURS_PER_YEAR} hourly values")
+            self.prices = (1 - market_share) * self.prices + market_share * market_prices
+        self.periods = np.array([PERIOD_CLASSES[name] for name in names], dtype=np.int8)[hourly_period]
+        self.masks = {name: hourly_period == i for i, name in enumerate(names) if np.any(hourly_period == i)}
+        tiers = np.asarray(definition.get('tiers', []), dtype=float).reshape(-1, 2)
+        self.tier_thresholds, self.tier_adders = tiers[:, 0], tiers[:, 1]
+        self.demand_charge = float(definition.get('demand_charge', 0.0))
+        for array in (self.prices, self.periods, *self.masks.values()):
+            array.flags.writeable = False # Shared by every user of the cached tariff
+
+    # Mean energy price of each TOU class (valley, shoulder, peak); the overall mean for a class without hours
+    @property
+    def period_prices(self):
+        return np.array([self.prices[self.periods == c].mean() if np.any(self.periods == c) else self.prices.mean() for c in TOU_CLASSES])
+
+    # Mean energy price over the hours of the year (the annual model's average grid price)
+    @property
+    def average_price(self):
+        return float(self.prices.mean())
+
+    # Share of the hours of the year in each TOU class (valley, shoulder, peak)
+    @property
+    def period_shares(self):
+        return np.bincount(self.periods, minlength=len(TOU_CLASSES)) / HOURS_PER_YEAR
+
+    # Tiered-block adders plus demand charges (¥) for an hourly grid import series (8760,) or (8760, n)
+    def charges(self, grid_import):
+        grid_import = np.asarray(grid_import, dtype=float)
+        total = np.zeros(grid_import.shape[1:])
+        if len(self.tier_adders):
+            monthly_kwh = np.add.reduceat(grid_import, MONTH_START_HOURS, axis=0)
+            excess = np.maximum(monthly_kwh[..., None] - self.tier_thresholds, 0.0)
+            total = total + (excess @ self.tier_adders).sum(axis=0)
+        if self.demand_charge:
+            total = total + self.demand_charge * np.maximum.reduceat(grid_import, MONTH_START_HOURS, axis=0).sum(axis=0)
+        return total
+
+    # Annual bill (¥) for an hourly grid import series (8760,) or (8760, n)
+    def cost(self, grid_import):
+        return self.prices @ grid_import + self.charges(grid_import)
+
+
+# Config with a tariff definition replaced by its three-price equivalent (class mean prices, shares of hours in
+# each class), which has the same mean price; configs without one are returned as they are. Lets analyses
+# that perturb prices as per-row arrays (Monte Carlo, sensitivity, portfolio) run on configs with a tariff
+# definition; seasonal hours, tiered blocks and demand charges are not represented.
+def tou_equivalent(config):
+    if config.get(TARIFF_KEY) is None:
+        return config
+    tariff = compiled_tariff(config)
+    valley, shoulder, peak = (float(v) for v in tariff.period_prices)
+    valley_perc, shoulder_perc, peak_perc = (float(v) for v in tariff.period_shares)
+    return {
+        **config, TARIFF_KEY: None,
+        'grid_price_valley': valley, 'grid_price_shoulder': shoulder, 'grid_price_peak': peak,
+        'valley_perc': valley_perc, 'shoulder_perc': shoulder_perc, 'peak_perc': peak_perc,
+    }
+
+
+def _check_period(period):
+    if period not in PERIOD_CLASSES:
+        raise ValueError(f"Unknown tariff period {period!r} (expected one of {', '.join(PERIOD_CLASSES)})")
+
+
+def _period_prices(prices):
+    for period in prices:
+        _check_period(period)
+    return {period: float(price) for period, price in prices.items()}
@@ -0,0 +1,229 @@
+# Warm-started re-optimization for iterative what-if sessions.
+# A CandidateMemory per park and model keeps every candidate the optimizer evaluated under the previous
+# config: its sizing, its energy saving (baseline minus grid cost, which only the energy model produces) and
+# its metrics, plus the optimum found per objective. When the next search runs on a config in which only
+# unit costs or financial inputs changed, the candidates stay valid: their cash flows are rebuilt from the
+# stored energy saving without running the model, and only the rows whose metrics depend on the changed
+# keys are re-scored (a new storage unit cost leaves every plan without storage as it was). Any other
+# change invalidates the stored metrics, but the previous optima and best candidates still seed the search.
+#
+# The warm search starts from the best known candidates, walks to the slider-step optimum with coordinate
+# descent and then lets branch and bound (when a bound function is available) prove it, with the incumbent
+# pruning most of the lattice and every remembered candidate served from memory.
+import threading
+import time
+
+import numpy as np
+
+from efinops.cache import ScenarioCache
+from efinops.finance import CAPEX_COST_KEYS, as_sizings, capex_batch, cash_flow_metrics
+from efinops.instrument import count, timer
+from efinops.optimize import (
+    OBJECTIVE_IRR,
+    OBJECTIVE_PAYBACK,
+    OBJECTIVES,
+    OPTIMIZERS,
+    SIZING_SPACE,
+    SearchState,
+    branch_and_bound,
+    coordinate_descent,
+    objective_scores,
+    run_phase,
+)
+from efinops.pipeline import changed_keys
+
+WARM_START_MEMORIES = 8 # Park x model candidate memories kept per server process
+WARM_MAX_CANDIDATES = 250_000 # Candidates remembered per memory; later ones are evaluated but not kept
+WARM_SEED_CANDIDATES = 64 # Best remembered candidates the warm search starts from
+# Metrics evaluate_batch must return for the memory (energy saving = annual_gross_saving + annual_opex_mixed)
+WARM_EVALUATE_KEYS = ('annual_gross_saving', 'annual_opex_mixed', 'npv_value', 'irr_value', 'payback_year_num')
+WARM_METRIC_KEYS = ('npv_value', 'irr_value', 'payback_year_num')
+# Inputs that only enter the CAPEX and cash-flow stages; candidates survive changes to these
+RESCORE_KEYS = CAPEX_COST_KEYS + ('project_lifespan_years', 'opex_percentage', 'tax_rate', 'discount_rate', 'depreciation_years')
+
+_memories = ScenarioCache(WARM_START_MEMORIES, name='warm_start')
+
+
+# Candidate memory of a park under a model, shared by the searches of every session in this process
+def candidate_memory(park, model):
+    return _memories.get((park, model), CandidateMemory)
+
+
+# Candidates are keyed by their linear index on the sizing lattice and looked up with a sorted key array,
+# so a branch-and-bound round of a hundred thousand leaves is matched in one vectorized search
+class CandidateMemory:
+    def __init__(self, space=SIZING_SPACE):
+        self.lock = threading.Lock() # Held by the search using the memory
+        self.reset(space)
+
+    def __len__(self):
+        return len(self.sizings)
+
+    # Forget everything, including the previous optima (new config history or sizing lattice)
+    def reset(self, space):
+        self.space = tuple(space)
+        self.config = None
+        self.best = {} # objective -> best sizing (list) under self.config
+        self.seeds = np.empty((0, 4)) # Best candidates of a config whose metrics were invalidated
+        self.model_evaluations = 0
+        self.clear()
+
+    # Forget the candidates (their metrics no longer hold)
+    def clear(self):
+        self.sizings = np.empty((0, 4))
+        self.energy_saving = np.empty(0)
+        self.metrics = {key: np.empty(0) for key in WARM_METRIC_KEYS} # irr_value nan where not computed yet
+        self._keys = np.empty(0, dtype=np.int64) # Sorted lattice keys and the row of each
+        self._key_rows = np.empty(0, dtype=np.int64)
+
+    def _lattice_keys(self, sizings):
+        lower = np.array([s[0] for s in self.space])
+        step = np.array([s[2] for s in self.space])
+        n_steps = [int(round((s[1] - s[0]) / s[2])) + 1 for s in self.space]
+        index = np.round((as_sizings(sizings) - lower) / step).astype(np.int64)
+        return np.ravel_multi_index(index.T, n_steps)
+
+    # Rows of lattice sizings in the memory, -1 where not remembered
+    def rows(self, sizings):
+        keys = self._lattice_keys(sizings)
+        position = np.minimum(np.searchsorted(self._keys, keys), max(len(self._keys) - 1, 0))
+        if not len(self._keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        return np.where(self._keys[position] == keys, self._key_rows[position], -1)
+
+    # Remember new (distinct, not yet remembered) lattice sizings with their evaluate_batch metrics
+    def add(self, sizings, metrics):
+        sizings = as_sizings(sizings)
+        keys = self._lattice_keys(sizings)
+        order = np.argsort(keys)
+        position = np.searchsorted(self._keys, keys[order])
+        self._keys = np.insert(self._keys, position, keys[order])
+        self._key_rows = np.insert(self._key_rows, position, len(self) + order)
+        self.sizings = np.concatenate([self.sizings, sizings])
+        self.energy_saving = np.concatenate([self.energy_saving, np.asarray(metrics['annual_gross_saving'], dtype=float)
+                                             + np.asarray(metrics['annual_opex_mixed'], dtype=float)])
+        for key in WARM_METRIC_KEYS:
+            self.metrics[key] = np.concatenate([self.metrics[key], _metric_values(metrics, key, len(sizings))])
+
+    # Recompute the metrics of `rows` under self.config from their stored energy saving (no model run)
+    def rescore(self, rows, compute_irr):
+        if not len(rows):
+            return
+        metrics = cash_flow_metrics(self.config, capex_batch(self.config, self.sizings[rows]), 0.0, self.energy_saving[rows], compute_irr)
+        for key in WARM_METRIC_KEYS:
+            self.metrics[key][rows] = _metric_values(metrics, key, len(rows))
+        count('warm_start_rescored', len(rows))
+
+    # Move the memory to `config` (and `space`). Returns the changed keys and the number of re-scored candidates;
+    # their IRR is solved when a search asks for it.
+    def rebase(self, config, space):
+        if tuple(space) != self.space:
+            self.reset(space)
+        if self.config is None:
+            self.config = dict(config)
+            return [], 0
+        changed = changed_keys(self.config, config)
+        has_demand = config['annual_elec_kwh'] + config['annual_heat_kwh'] + config['annual_cool_kwh'] != 0
+        if changed and (not set(changed) <= set(RESCORE_KEYS) or not has_demand):
+            # Energy inputs changed: the stored savings no longer hold, keep the best plans as starting points
+            self.seeds = np.unique(np.concatenate([self.seed_sizings(objective, WARM_SEED_CANDIDATES) for objective in OBJECTIVES]
+                                                  + [self.seeds]), axis=0)
+            self.clear()
+            self.config = dict(config)
+            return changed, 0
+        self.config = dict(config)
+        if set(changed) & set(RESCORE_KEYS[len(CAPEX_COST_KEYS):]):
+            rows = np.arange(len(self))
+        else:
+            # Only unit costs changed: candidates with none of the affected equipment keep their metrics
+            columns = [CAPEX_COST_KEYS.index(key) for key in changed]
+            rows = np.flatnonzero((self.sizings[:, columns] != 0).any(axis=1))
+        self.rescore(rows, compute_irr=False)
+        return changed, len(rows)
+
+    # Best `limit` remembered sizings for an objective plus its previous optimum. Candidates remembered from
+    # NPV / payback searches have no IRR yet; the best by payback stand in for them (IRR is solved on use).
+    def seed_sizings(self, objective, limit):
+        seeds = [np.asarray(self.best[objective], dtype=float).reshape(-1, 4)] if self.best.get(objective) else []
+        if len(self):
+            objectives = [objective]
+            if objective == OBJECTIVE_IRR and np.isnan(self.metrics['irr_value']).any():
+                objectives.append(OBJECTIVE_PAYBACK)
+            for ranked_by in objectives:
+                scores = objective_scores(ranked_by, self.metrics, self.config)
+                seeds.append(self.sizings[np.argsort(-scores, kind='stable')[:limit]])
+        return np.concatenate(seeds) if seeds else np.empty((0, 4))
+
+    # evaluate_batch serving remembered candidates from memory; others are evaluated with evaluate_batch
+    # (which must return WARM_EVALUATE_KEYS) and remembered while there is room. Returns WARM_METRIC_KEYS arrays.
+    # Sizings must be distinct lattice points, as SearchState passes them.
+    def evaluator(self, evaluate_batch, compute_irr):
+        def evaluate(sizings):
+            sizings = as_sizings(sizings)
+            rows = self.rows(sizings)
+            known = rows >= 0
+            if compute_irr:
+                self.rescore(np.unique(rows[known][np.isnan(self.metrics['irr_value'][rows[known]])]), True)
+            output = {key: np.empty(len(sizings)) for key in WARM_METRIC_KEYS}
+            for key in WARM_METRIC_KEYS:
+                output[key][known] = self.metrics[key][rows[known]]
+            if not known.all():
+                new = sizings[~known]
+                metrics = evaluate_batch(new)
+                self.model_evaluations += len(new)
+                for key in WARM_METRIC_KEYS:
+                    output[key][~known] = _metric_values(metrics, key, len(new))
+                if len(self) + len(new) <= WARM_MAX_CANDIDATES:
+                    self.add(new, metrics)
+            count('warm_start_reused', int(known.sum()))
+            return output
+        return evaluate
+
+
+# Metric as a float array; nan where not computed (irr_value without compute_irr, None or left out by workers)
+def _metric_values(metrics, key, n):
+    return np.full(n, np.nan) if metrics.get(key) is None else np.asarray(metrics[key], dtype=float)
+
+
+# Warm strategy: seed lattice points, then local descent to the slider-step optimum and branch and bound
+def warm_search(search, seeds):
+    search.evaluate(seeds)
+    run_phase(search, 'coordinate_descent', coordinate_descent)
+    run_phase(search, 'branch_and_bound', branch_and_bound)
+
+
+# optimize() on a park's candidate memory. The first search of a memory runs `method` from scratch; later
+# ones re-score the remembered candidates under the new config and run warm_search from the best of them.
+# evaluate_batch must return WARM_EVALUATE_KEYS. The result is optimize()'s plus 'warm': whether the search
+# was warm-started, the changed config keys, re-scored / reused candidates and model evaluations.
+def warm_optimize(config, objective, evaluate_batch, memory, bound_batch=None, method='hybrid', time_budget=1.0,
+                  space=SIZING_SPACE, progress=None, record_candidates=True):
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimization method: {method}")
+    compute_irr = objective == OBJECTIVE_IRR
+    with memory.lock:
+        started = time.perf_counter()
+        changed, rescored = memory.rebase(config, space)
+        reused, model_evaluations = len(memory), memory.model_evaluations
+        seeds = np.concatenate([memory.seeds, memory.seed_sizings(objective, WARM_SEED_CANDIDATES)])
+        search = SearchState(config, objective, memory.evaluator(evaluate_batch, compute_irr), bound_batch, space, time_budget,
+                             progress, record_candidates)
+        index, on_lattice = search.to_index(seeds)
+        warm = bool(on_lattice.any())
+        with timer('optimizer_run', method='warm' if warm else method, objective=objective):
+            if warm:
+                run_phase(search, 'warm', lambda search: warm_search(search, index[on_lattice]))
+            else:
+                run_phase(search, method, OPTIMIZERS[method])
+        memory.best[objective] = search.best_params()
+        memory.seeds = np.empty((0, 4))
+        result = search.result('warm' if warm else method)
+        result['warm'] = {
+            'warm_started': warm,
+            'changed_keys': changed,
+            'rescored': rescored,
+            'reused': reused,
+            'model_evaluations': memory.model_evaluations - model_evaluations,
+        }
+    result['elapsed'] = time.perf_counter() - started
+    return result
@@ -1,242 +1,149 @@
-import streamlit as st
-import numpy_financial as npf
+import json
+import time
+import uuid
+
+import altair as alt
 import numpy as np
+import streamlit as st
 import pandas as pd # Optional: for displaying cash flow table
 
-# Set page configuration
-st.set_page_config(layout="wide", page_title="工业园区 E-FinOps 投资分析")
-
-# --- Helper Functions for Calculations ---
-
-# Calculate Weighted Average TOU Grid Price based on annual percentages
-def calculate_avg_tou_price(peak_price, valley_price, shoulder_price, peak_perc, valley_perc, shoulder_perc):
-     # Ensure percentages sum to 1, handle potential floating point inaccuracies
-     total_perc = peak_perc + valley_perc + shoulder_perc
-     if total_perc > 0:
-         peak_perc /= total_perc
-         valley_perc /= total_perc
-         shoulder_perc /= total_perc
-     else:
-         # Default to static price if percentages are zero
-         return (peak_price + valley_price + shoulder_price) / 3 # Or handle as error
-
-     return (peak_price * peak_perc) + (valley_price * valley_perc) + (shoulder_price * shoulder_perc)
-
-# Calculate Baseline Annual Cost (Pure Grid, using Avg TOU)
-def calculate_baseline_annual_cost(config):
-    annual_elec = config['annual_elec_kwh']
-    annual_heat = config['annual_heat_kwh']
-    annual_cool = config['annual_cool_kwh']
-    grid_avg_cop = config['grid_avg_cop']
-    grid_avg_eer = config['grid_avg_eer']
-
-    # Total grid energy input needed for baseline to meet all demands
-    # Electricity needs grid kWh directly
-    # Heat needs Heat Demand / COP_base kWh grid input
-    # Cool needs Cool Demand / EER_base kWh grid input
-    total_grid_energy_baseline_input = annual_elec + annual_heat / grid_avg_cop + annual_cool / grid_avg_eer
-
-    # Use weighted average TOU price for baseline cost estimation
-    avg_tou_price = calculate_avg_tou_price(
-        config['grid_price_peak'], config['grid_price_valley'], config['grid_price_shoulder'],
-        config['peak_perc'], config['valley_perc'], config['shoulder_perc']
-    )
+from efinops.cache import ScenarioCache, arrays_hash, config_hash, sizing_key
+from efinops.chargeback import ALLOCATION_RULES, POOL_PV_STORAGE, POOL_THERMAL, RULE_FIXED, chargeback, monthly_close, rollup
+from efinops.cli import parse_park_records
+from efinops.finance import SIZING_COLUMNS
+from efinops.hourly import hourly_baseline_cost, hourly_inputs
+from efinops.instrument import REGISTRY, timer, to_json, to_prometheus
+from efinops.ingest import annual_totals, ingest_meter_file, load_profiles
+from efinops.jobs import JOB_ACTIVE, JOB_DONE, JOB_FAILED, JOB_QUEUED, JobRunner, optimization_job, pareto_job
+from efinops.model import (
+    ANNUAL_STAGES,
+    DEFAULT_CONFIG,
+    MODEL_ANNUAL,
+    MODEL_HOURLY,
+    calculate_baseline_annual_cost,
+    calculate_mixed_system_metrics,
+    calculate_mixed_system_metrics_hourly_display,
+)
+from efinops.monitor import (
+    ALERT_DRIFT,
+    ALERT_SPIKE,
+    MONITOR_STALE_AFTER_S,
+    MONITOR_WARMUP_READINGS,
+    MeterMonitor,
+    replay_meter_file,
+    synthetic_feed,
+)
+from efinops.montecarlo import MC_DRAWS, MC_PERCENTILES, run_monte_carlo, triangular_spread
+from efinops.optimize import (
+    OBJECTIVE_IRR,
+    OBJECTIVE_NPV,
+    OBJECTIVE_PAYBACK,
+    SIZING_SPACE,
+)
+from efinops.pareto import OBJECTIVE_PARETO
+from efinops.pipeline import StagePipeline
+from efinops.portfolio import RANK_BY_IRR, RANK_BY_NPV, Portfolio
+from efinops.profile_store import ProfileStore
+from efinops.scenario_store import RANK_METRICS, ScenarioStore
+from efinops.sensitivity import INTEGER_KEYS, SENSITIVITY_KEYS, perturbation_values, sensitivity_grid, tornado
+from efinops.tariff import PERIOD_PEAK, PERIOD_SHOULDER, PERIOD_VALLEY, TARIFF_KEY, compile_tariff, tou_equivalent
 
-    return total_grid_energy_baseline_input * avg_tou_price
-
-# Calculate Mixed System Metrics (Simplified Model for What-If)
-# This function estimates annual generation/consumption and calculates financial metrics
-def calculate_mixed_system_metrics(config, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh):
-    annual_elec_need = config['annual_elec_kwh']
-    annual_heat_need = config['annual_heat_kwh']
-    annual_cool_need = config['annual_cool_kwh']
-    # Total delivered energy is the sum of needs, which is constant across scenarios
-    total_annual_delivered_energy = annual_elec_need + annual_heat_need + annual_cool_need
-
-    if total_annual_delivered_energy == 0:
-        return {
-            "total_capex": 0, "annual_opex_mixed": 0, "annual_gross_saving": 0,
-            "payback_period": "N/A (无能源需求)", "irr": "N/A", "irr_value": -np.inf,
-            "npv_value": 0, "cash_flows": [0] * (config['project_lifespan_years'] + 1)
-        }
+RERUN_STARTED = time.perf_counter() # Script start of this rerun (timed as app_rerun)
 
+# Set page configuration
+st.set_page_config(layout="wide", page_title="工业园区 E-FinOps 投资分析")
 
-    # --- 1. CAPEX Calculation ---
-    capex_st = st_area * config['st_cost_m2']
-    # Simplified PV cost based on area, assuming average panel efficiency translates area to kWp
-    # A more accurate model would use area to calculate kWp, then cost per kWp
-    # Let's add a simple conversion assumption for PV area to effective capacity
-    pv_capacity_kwp = pv_area * config['pv_kwh_m2_hr'] / config['pv_annual_太阳小时'] * 1000 # Very rough est: avg_gen_per_hr * peak_hours -> avg_power -> kWp
-    # Let's use a simpler CAPEX based directly on Area for this demo as configured
-    capex_pv = pv_area * config['pv_cost_m2']
-
-    capex_hp = hp_capacity_kw * config['hp_cost_kw']
-    capex_storage = storage_capacity_kwh * config['storage_cost_kwh']
-    total_capex = capex_st + capex_pv + capex_hp + capex_storage
-
-    # --- 2. Annual Energy Generation/Provision (Simplified Potential based on installed size) ---
-    # Estimate total annual generation based on area and assumed annual effective hours
-    annual_st_potential_heat = st_area * config['st_kwh_m2_hr'] * config['st_annual_太阳小时']
-    annual_pv_potential_elec = pv_area * config['pv_kwh_m2_hr'] * config['pv_annual_太阳小时']
-
-    # Estimate total annual energy HP can provide if running, capped by potential demand
-    # Assume HP can run enough hours to meet demand fraction up to its capacity limits over the year
-    # Simplified: Estimate potential annual heat/cool HP can provide based on capacity and assumed operational hours
-    # Let's assume HP operates enough to meet *a fraction* of the *potential* demand it's sized for in the year
-    # A simple approach: HP capacity * COP/EER * estimated annual operating hours. But this doesn't link to demand.
-    # Let's assume HP annual output is related to its capacity, but capped by total demand.
-    # Assume HP provides up to its capacity * operational_hours_per_year / COP/EER total delivered energy.
-    # Let's use a simplified fraction approach linked to demand.
-    # What fraction of *annual* heat/cool demand could the HP capacity *potentially* meet?
-    # Estimate max potential delivered energy by HP = HP_capacity_kW * 8760_hours * Average_Utilization_Factor
-    # This is hard without profiles. Let's simplify dramatically:
-    # Assume HP is sized to meet a fraction of PEAK demand. Annual energy is even harder.
-    # Let's link HP potential annual delivery directly to CAPACITY using an assumed total annual run-time factor (e.g., 3000-5000 hrs/year total)
-    hp_annual_run_hours = 4000 # Simplified assumption for total run hours over year (heating + cooling)
-    hp_potential_delivered_heat = hp_capacity_kw * config['hp_cop'] * (hp_annual_run_hours / 2) # Assume split hours for heat/cool
-    hp_potential_delivered_cool = hp_capacity_kw * config['hp_eer'] * (hp_annual_run_hours / 2)
-
-    # Cap the provided energy by the actual annual demand
-    annual_pv_supplied = min(annual_pv_potential_elec, annual_elec_need)
-    annual_st_supplied_heat = min(annual_st_potential_heat, annual_heat_need)
-    annual_hp_supplied_heat = min(hp_potential_delivered_heat, annual_heat_need - annual_st_supplied_heat) # HP supplements ST for heat
-    annual_hp_supplied_cool = min(hp_potential_delivered_cool, annual_cool_need)
-
-    # --- 3. Energy Balance & Grid Import (Simplified) ---
-    # Calculate energy from each source on the INPUT side for cost calculation
-    annual_pv_input_cost = 0 # Assume PV has zero marginal running cost
-    annual_st_input_cost = 0 # Assume ST has zero marginal running cost
-
-    # Grid energy input required for HP
-    annual_hp_grid_input = (annual_hp_supplied_heat / config['hp_cop']) + (annual_hp_supplied_cool / config['hp_eer'])
-
-    # Remaining demand met by grid (input energy perspective)
-    # Remaining electrical demand input = (Total Elec Need - PV Supplied)
-    # Remaining heat demand input from grid = (Total Heat Need - ST Supplied - HP Supplied Heat) / Baseline COP
-    # Remaining cool demand input from grid = (Total Cool Need - HP Supplied Cool) / Baseline EER
-    annual_elec_from_grid = max(0, annual_elec_need - annual_pv_supplied)
-    annual_heat_from_grid_input = max(0, annual_heat_need - annual_st_supplied_heat - annual_hp_supplied_heat) / config['grid_avg_cop']
-    annual_cool_from_grid_input = max(0, annual_cool_need - annual_hp_supplied_cool) / config['grid_avg_eer']
-
-    # Total grid energy *input* required for mixed system (before storage arbitrage)
-    total_grid_input_mixed_pre_storage = annual_elec_from_grid + annual_heat_from_grid_input + annual_cool_from_grid_input + annual_hp_grid_input
-
-    # Annual storage arbitrage potential
-    # Simplified: assume storage cycles a certain number of times per year, shifting energy from valley to peak
-    # This is a major simplification; real storage value depends heavily on load/generation profiles and TOU structure.
-    storage_arbitrage_kwh_year = storage_capacity_kwh * config['storage_cycles_year']
-    storage_saving_per_kwh_shifted = (config['grid_price_peak'] - config['grid_price_valley']) # Gross saving per kWh shifted peak vs valley
-    # Account for round trip efficiency
-    annual_storage_saving = storage_arbitrage_kwh_year * storage_saving_per_kwh_shifted * config['storage_eff_charge'] * config['storage_eff_discharge']
-
-
-    # Calculate grid cost for mixed system
-    avg_tou_price = calculate_avg_tou_price(
-        config['grid_price_peak'], config['grid_price_valley'], config['grid_price_shoulder'],
-        config['peak_perc'], config['valley_perc'], config['shoulder_perc']
+# --- Scenario Cache (per browser session) ---
+SCENARIO_CACHE_SIZE = 2048 # Max memoized scenarios per session
+
+def get_scenario_cache():
+    if 'scenario_cache' not in st.session_state:
+        st.session_state.scenario_cache = ScenarioCache(SCENARIO_CACHE_SIZE, name='scenario')
+    return st.session_state.scenario_cache
+
+# Hash of the current config; refreshed by the config page only when a value actually changes
+def current_config_hash(config):
+    if 'config_hash' not in st.session_state:
+        st.session_state.config_hash = config_hash(config)
+    return st.session_state.config_hash
+
+# --- Energy models (efinops.model) ---
+# Hourly load/yield profiles and TOU price vector of the current config, built once per config hash
+def cached_hourly_inputs(config):
+    return get_scenario_cache().get(
+        (current_config_hash(config), 'hourly_inputs'),
+        lambda: hourly_inputs(config, st.session_state.get('meter_profiles'))
     )
-    annual_grid_cost_mixed = total_grid_input_mixed_pre_storage * avg_tou_price - annual_storage_saving
-    annual_grid_cost_mixed = max(0, annual_grid_cost_mixed) # Grid cost cannot be negative
-
-
-    # Annual Operating Expenses (OPEX) for mixed system components
-    annual_opex_mixed = total_capex * config['opex_percentage'] # Simplified OPEX as % of total CAPEX
-
-    # Total Annual Operating Cost (before tax/depreciation saving)
-    annual_operating_cost_mixed = annual_grid_cost_mixed + annual_opex_mixed
-
-    # --- 4. Financial Metrics Calculation (using After-Tax Cash Flows) ---
-
-    # Annual Gross Saving (Operating Cost Saving compared to baseline)
-    baseline_annual_cost_tou = calculate_baseline_annual_cost(config)
-    annual_gross_saving = baseline_annual_cost_tou - annual_operating_cost_mixed
-
-    # Calculate cash flows over the project lifespan
-    project_lifespan = config['project_lifespan_years']
-    depreciation_years = config['depreciation_years']
-    tax_rate = config['tax_rate']
-
-    cash_flows = [-total_capex] # CF_0 is initial investment
-
-    for t in range(1, project_lifespan + 1):
-        # Depreciation for tax shield
-        current_depreciation = total_capex / depreciation_years if depreciation_years > 0 and t <= depreciation_years else 0
-
-        # Annual Cash Flow (After-Tax)
-        # Formula: CF_t = (Gross Saving - Depreciation) * (1 - Tax Rate) + Depreciation
-        # This correctly accounts for the tax shield from depreciation.
-        # Handle case where Gross Saving < Depreciation (taxable income is negative). Assuming tax shield only applies up to the point of reducing taxable income to zero.
-        taxable_income_increase = annual_gross_saving - current_depreciation
-        tax_amount = max(0, taxable_income_increase) * tax_rate # Tax paid on the positive part of saving after depreciation
-
-        # Net cash flow = Gross Saving - Tax paid
-        cf_t = annual_gross_saving - tax_amount
-        # The standard formula is often better: CF = (Gross Saving - Deprec) * (1-T) + Deprec = Gross Saving * (1-T) + Deprec * T
-        cf_t = annual_gross_saving * (1 - tax_rate) + current_depreciation * tax_rate
 
-
-        cash_flows.append(cf_t)
-
-    # Payback Period Calculation
-    cumulative_cf = np.cumsum(cash_flows)
-    payback_period_display = "N/A (未能回本)" # Default if not recovered
-    payback_year_num = float('inf')
-
-    if cumulative_cf[-1] >= 0: # Only calculate if project eventually breaks even
-        for i in range(1, len(cumulative_cf)):
-            if cumulative_cf[i] >= 0 and cumulative_cf[i-1] < 0:
-                payback_year_num = i - 1 + abs(cumulative_cf[i-1]) / cash_flows[i]
-                payback_period_display = f"{payback_year_num:.2f} 年"
-                break
-        if payback_year_num == float('inf') and cumulative_cf[0] < 0 and cumulative_cf[1] >= 0: # Case where break even in year 1
-             payback_year_num = abs(cash_flows[0]) / cash_flows[1] if cash_flows[1] > 0 else float('inf')
-             payback_period_display = f"{payback_year_num:.2f} 年" if payback_year_num != float('inf') else "N/A (第一年现金流不足)"
-        elif payback_year_num == float('inf') and cumulative_cf[0] >=0: # Case where already cash flow positive from start (unlikely with CAPEX)
-             payback_period_display = "即时" # Or 0 years
-
-
-    # IRR Calculation
-    irr_value = -np.inf # Default to very low value
-    irr_display = "N/A (无法计算IRR)"
-    
-    # Add debugging output
-    # st.write("Debug: Cash flows:", cash_flows)
-    
-    # np.irr requires cash flows to contain both positive and negative values
-    if cash_flows[0] < 0:  # Ensure initial investment is negative
-        try:
-            # Check if we have any positive cash flows
-            if any(cf > 0 for cf in cash_flows[1:]):
-                # Use numpy financial's IRR calculation
-                irr_value = npf.irr(cash_flows)
-                if not np.isnan(irr_value) and not np.isinf(irr_value):
-                    irr_display = f"{irr_value*100:.2f} %"
-                else:
-                    irr_display = "N/A (IRR计算结果无效)"
-            else:
-                irr_display = "N/A (无正现金流)"
-        except Exception as e:
-            irr_display = f"N/A (IRR计算错误: {str(e)})"
-            
+def cached_baseline_annual_cost(config, model=MODEL_ANNUAL):
+    if model == MODEL_HOURLY:
+        inputs = cached_hourly_inputs(config)
+        compute = lambda: hourly_baseline_cost(config, inputs['profiles'], inputs['prices'])
     else:
-        irr_display = "N/A (初始投资应为负值)"
-
-    # NPV Calculation (using the defined discount rate)    
-    npv_value = npf.npv(config['discount_rate'], cash_flows)
-
-
-
-    return {
-        "total_capex": total_capex,
-        "annual_opex_mixed": annual_opex_mixed,
-        "annual_gross_saving": annual_gross_saving, # Saving vs baseline operating cost (pre-tax/deprec)
-        "payback_period": payback_period_display,
-        "payback_year_num": payback_year_num, # Numerical for optimization
-        "irr": irr_display,
-        "irr_value": irr_value, # Numerical for optimization
-        "npv_value": npv_value, # Numerical for optimization
-        "cash_flows": cash_flows # Full cash flow series
-    }
+        compute = lambda: calculate_baseline_annual_cost(config)
+    return get_scenario_cache().get((current_config_hash(config), model, 'baseline'), compute)
+
+# Per-stage caches of the annual model: after a config edit only the stages reading the edited keys rerun
+# (e.g. a tax rate change reuses the energy balance of every slider position seen before)
+def get_stage_pipeline():
+    if 'stage_pipeline' not in st.session_state:
+        st.session_state.stage_pipeline = StagePipeline(ANNUAL_STAGES)
+    return st.session_state.stage_pipeline
+
+# Metrics for one sizing [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh], memoized per (config hash, model, sizing)
+def cached_mixed_system_metrics(config, sizing, model=MODEL_ANNUAL):
+    if model == MODEL_HOURLY:
+        compute = lambda: calculate_mixed_system_metrics_hourly_display(config, sizing, cached_hourly_inputs(config))
+    else:
+        compute = lambda: calculate_mixed_system_metrics(config, *sizing, pipeline=get_stage_pipeline())
+    return get_scenario_cache().get((current_config_hash(config), model, sizing_key(sizing)), compute)
+
+# --- Background jobs (efinops.jobs) ---
+# Optimizer searches run on the server's job runner instead of the script thread, so widget interactions
+# and reruns no longer abort them. Hourly-model searches shard their batches over a process pool owned by
+# the job; annual-model scenarios cost microseconds and are evaluated in the job thread.
+SWEEP_MAX_WORKERS = None # None = one worker per CPU core
+JOB_POLL_INTERVAL_S = 0.5 # Refresh interval of the job status while a job is active
+
+# One runner (thread pool + SQLite job table) per server process, shared by all sessions
+@st.cache_resource
+def get_job_runner():
+    return JobRunner()
+
+# Owner id of this browser session's jobs in the shared job table
+def session_owner():
+    if 'session_owner' not in st.session_state:
+        st.session_state.session_owner = uuid.uuid4().hex[:12]
+    return st.session_state.session_owner
+
+# --- Scenario store (efinops.scenario_store) ---
+# Every scenario an optimizer job evaluates is kept in one SQLite file shared by all sessions and restarts;
+# the store section of the What-If page queries it instead of recomputing
+DEFAULT_PARK = "默认园区"
+SCENARIO_QUERY_ROWS = 20 # Default rows of a store query
+
+@st.cache_resource
+def get_scenario_store():
+    return ScenarioStore()
+
+# Park of this session's scenarios and warm starts: the park of the metered data in use, if any
+def current_park():
+    return st.session_state.get('meter_park', DEFAULT_PARK)
+
+# --- Metered profiles ---
+# One store per server process; it keeps opened park-years mapped, so reruns and new sessions load in milliseconds
+@st.cache_resource
+def get_profile_store():
+    return ProfileStore()
+
+# Use metered data for this session: annual totals go into the config, load profiles into the hourly model.
+# 'meter_profile_hash' is kept in the config so cached results and worker pools follow the selected data.
+def use_meter_data(park, meter_data):
+    st.session_state.meter_park = park
+    st.session_state.meter_data = meter_data
+    st.session_state.meter_profiles = load_profiles(meter_data)
+    st.session_state.config.update({key: int(round(total)) for key, total in annual_totals(meter_data).items()})
+    st.session_state.config['meter_profile_hash'] = arrays_hash(st.session_state.meter_profiles)
 
 # --- Configuration Tab ---
 def config_page():
@@ -247,47 +154,43 @@ def config_page():
     # Use session state for persistent configuration
     if 'config' not in st.session_state:
         # Set reasonable default values
-        st.session_state.config = {
-            'annual_elec_kwh': 10_000_000,
-            'annual_heat_kwh': 5_000_000,
-            'annual_cool_kwh': 3_000_000,
-
-            'grid_price_static': 0.8, # 元/kWh
-            'grid_price_peak': 1.2,   # 元/kWh
-            'grid_price_valley': 0.5, # 元/kWh
-            'grid_price_shoulder': 0.8, # 元/kWh
-            'peak_perc': 0.20, # 20%
-            'valley_perc': 0.35, # 35%
-            # shoulder_perc derived as 1 - peak - valley
-
-            'grid_avg_cop': 2.5, # Baseline electric heating/cooling efficiency
-            'grid_avg_eer': 3.5,
-
-            'st_kwh_m2_hr': 0.5, # kWh/m²/hr
-            'st_cost_m2': 1500.0, # 元/m²
-            'st_annual_太阳小时': 1500, # Annual effective solar hours for thermal
-
-            'pv_kwh_m2_hr': 0.15, # kWh/m²/hr (average generation rate)
-            'pv_cost_m2': 1000.0, # 元/m² (simplified cost per area)
-            'pv_annual_太阳小时': 1200, # Annual effective solar hours for PV (considers capacity factor)
-
-            'hp_cop': 4.0, # Heat pump COP
-            'hp_eer': 5.0, # Heat pump EER
-            'hp_cost_kw': 2000.0, # 元/kW (cost per kW heating/cooling capacity)
-
-            'storage_eff_charge': 0.95, # 95%
-            'storage_eff_discharge': 0.95, # 95%
-            'storage_cost_kwh': 1500.0, # 元/kWh
-            'storage_cycles_year': 300, # Equivalent full cycles per year for arbitrage
-
-            'project_lifespan_years': 20, # Years
-            'opex_percentage': 0.015, # 1.5% of CAPEX per year
-            'tax_rate': 0.25, # 25%
-            'discount_rate': 0.08, # 8% Hurdle Rate / Discount Rate
-            'depreciation_years': 10 # Fixed by tax law for assets > 10 years
-        }
+        st.session_state.config = dict(DEFAULT_CONFIG)
+
+    config_before = dict(st.session_state.config)
 
     st.header("1. 园区年能源需求 (总计)")
+
+    # Metered demand (Phase 1 Inform): sets the annual totals below and the load profiles of the hourly model.
+    # Imports are persisted in the profile store, so later sessions open them memory-mapped instead of re-parsing.
+    with st.expander("📥 计量数据 (CSV / Parquet 导入与已保存数据)"):
+        st.write("<sub>长表格式，每行一条读数: timestamp, meter_id, kwh, carrier (elec / heat / cool)，可选 zone / device / source 列。"
+                 "任意采样间隔，按表计逐小时汇总；缺测小时按同一时刻的平均值补齐。</sub>", unsafe_allow_html=True)
+        store = get_profile_store()
+        park = st.text_input("园区名称", value=current_park())
+        meter_file = st.file_uploader("计量数据文件", type=['csv', 'parquet'])
+        if meter_file is not None and st.button("导入并保存计量数据"):
+            with st.spinner("正在分块读取并按小时汇总..."):
+                meter_data = ingest_meter_file(meter_file)
+            store.put(park, meter_data)
+            use_meter_data(park, store.get(park, meter_data['year']))
+
+        stored = [(stored_park, year) for stored_park in store.parks() for year in store.years(stored_park)]
+        if stored:
+            col_stored1, col_stored2 = st.columns([3, 1])
+            selected = col_stored1.selectbox("已保存的计量数据", stored, format_func=lambda item: f"{item[0]} · {item[1]} 年")
+            if col_stored2.button("加载", use_container_width=True):
+                use_meter_data(selected[0], store.get(*selected))
+
+        if 'meter_data' in st.session_state:
+            meter_data = st.session_state.meter_data
+            st.write(f"当前使用: {st.session_state.meter_park} · {meter_data['year']} 年，{len(meter_data['meters'])} 个表计，"
+                     f"{meter_data['rows_read']:,} 条读数 (跳过 {meter_data['rows_dropped']:,} 条)。")
+            st.dataframe(meter_data['meters'], use_container_width=True, height=200)
+            if st.button("停止使用计量数据"):
+                for key in ('meter_data', 'meter_profiles', 'meter_park'):
+                    st.session_state.pop(key)
+                st.session_state.config.pop('meter_profile_hash', None)
+
     st.session_state.config['annual_elec_kwh'] = st.number_input("年总用电需求 (kWh/年)", value=st.session_state.config['annual_elec_kwh'], min_value=0, step=10000)
     st.session_state.config['annual_heat_kwh'] = st.number_input("年总用热需求 (kWh 热量/年)", value=st.session_state.config['annual_heat_kwh'], min_value=0, step=10000)
     st.session_state.config['annual_cool_kwh'] = st.number_input("年总用冷需求 (kWh 冷量/年)", value=st.session_state.config['annual_cool_kwh'], min_value=0, step=10000)
@@ -312,6 +215,31 @@ def config_page():
     st.session_state.config['grid_avg_cop'] = st.number_input("市电制热平均COP (用于基线)", value=st.session_state.config['grid_avg_cop'], min_value=1.0, format="%.2f")
     st.session_state.config['grid_avg_eer'] = st.number_input("市电制冷平均EER (用于基线)", value=st.session_state.config['grid_avg_eer'], min_value=1.0, format="%.2f")
 
+    # Tariff definition (seasons, critical peak, tiered blocks, demand charge, market prices); replaces the
+    # three TOU prices above. Compiled once into an hourly price vector and cached.
+    with st.expander("📑 电价方案 (季节分时 / 尖峰 / 阶梯 / 需量电费 / 市场化电价)"):
+        st.write("<sub>JSON 格式，字段: prices (valley / shoulder / peak / critical_peak 单价)、seasons (months、hours、可选 prices)、"
+                 "tiers ([[月用电量阈值 kWh, 加价 元/kWh], ...])、demand_charge (元/kW·月)、market_prices (8760 个小时电价) 与 market_share。"
+                 "年度模型按电价方案的小时平均电价计算；阶梯与需量电费在逐时模型中计入。</sub>", unsafe_allow_html=True)
+        tariff = st.session_state.config.get(TARIFF_KEY)
+        tariff_text = st.text_area("电价方案", value=json.dumps(tariff, ensure_ascii=False, indent=1) if tariff is not None else "", height=200)
+        col_tariff1, col_tariff2 = st.columns(2)
+        if col_tariff1.button("应用电价方案", use_container_width=True):
+            try:
+                definition = json.loads(tariff_text)
+                compile_tariff(definition)
+            except (ValueError, TypeError, AttributeError) as exc:
+                st.error(f"电价方案无效: {exc}")
+            else:
+                st.session_state.config[TARIFF_KEY] = definition
+        if col_tariff2.button("使用峰平谷电价", use_container_width=True):
+            st.session_state.config[TARIFF_KEY] = None
+        if st.session_state.config.get(TARIFF_KEY) is not None:
+            compiled = compile_tariff(st.session_state.config[TARIFF_KEY])
+            valley, shoulder, peak = compiled.period_prices
+            st.write(f"当前电价方案: 小时平均电价 **{compiled.average_price:.4f} 元/kWh**，谷 / 平 / 峰 (含尖峰) 平均 "
+                     f"{valley:.3f} / {shoulder:.3f} / {peak:.3f} 元/kWh，需量电费 {compiled.demand_charge:,.1f} 元/kW·月。")
+
 
     st.header("3. 太阳雨牌设备参数")
     col_sr1, col_sr2 = st.columns(2)
@@ -337,7 +265,7 @@ def config_page():
         st.session_state.config['storage_eff_charge'] = st.number_input("充电效率 (%)", value=st.session_state.config['storage_eff_charge']*100, min_value=0.0, max_value=100.0, format="%.1f") / 100
         st.session_state.config['storage_eff_discharge'] = st.number_input("放电效率 (%)", value=st.session_state.config['storage_eff_discharge']*100, min_value=0.0, max_value=100.0, format="%.1f") / 100
         st.session_state.config['storage_cost_kwh'] = st.number_input("每kWh容量成本 (元/kWh)", value=st.session_state.config['storage_cost_kwh'], min_value=100.0, step=100.0)
-        st.session_state.config['storage_cycles_year'] = st.number_input("年等效循环次数 (用于储能套利估算)", value=st.session_state.config['storage_cycles_year'], min_value=0, step=10)
+        st.session_state.config['storage_c_rate'] = st.number_input("充放电倍率 (C)", value=st.session_state.config['storage_c_rate'], min_value=0.05, max_value=4.0, step=0.05, help="每小时最大充放电功率占容量的比例；储能按分时电价求解最优充放电计划")
 
 
     st.header("4. 经济参数")
@@ -353,11 +281,165 @@ def config_page():
              st.session_state.config['depreciation_years'] = 1 # Avoid division by zero
 
 
+    # Invalidate memoized scenarios only when an input actually changed
+    if st.session_state.config != config_before:
+        st.session_state.config_hash = config_hash(st.session_state.config)
+        get_scenario_cache().invalidate()
+        st.session_state.pop('optimization_results', None) # Ranked for the old config
+        st.session_state.pop('pareto_results', None)
+
     st.write("---")
     st.info("参数已保存。请切换到 'What if 投资分析' 页面进行模拟和优化。")
 
 
 # --- What If Analysis Tab ---
+# Optimization strategies offered in the UI and the optimizer objective each maps to
+OPTIMIZATION_OBJECTIVES = {
+    '最大化内部收益率 (IRR)': OBJECTIVE_IRR,
+    '最小化投资回收期 (Payback Period)': OBJECTIVE_PAYBACK,
+    '最大化净现值 (NPV)': OBJECTIVE_NPV,
+    '多目标帕累托前沿 (IRR / NPV / 回收期 / 投资)': OBJECTIVE_PARETO,
+}
+OPTIMIZATION_TIME_BUDGET_S = 1.0 # Default seconds; the search stops with the best lattice point found so far
+OPTIMIZATION_MAX_TIME_BUDGET_S = 600.0 # Longer searches are fine now that they run as background jobs
+OPTIMIZATION_RESULTS_TABLE_ROWS = 10_000 # Candidates kept for the results table / CSV download
+OPTIMIZATION_VALUE_COLUMNS = {
+    OBJECTIVE_IRR: '内部收益率 IRR (%)',
+    OBJECTIVE_PAYBACK: '投资回收期 (年)',
+    OBJECTIVE_NPV: '净现值 NPV (¥)',
+}
+# Columns of the Pareto frontier table (sizing columns as in the candidates table)
+PARETO_COLUMNS = {
+    'total_capex': '总投资 CAPEX (¥)',
+    'npv_value': OPTIMIZATION_VALUE_COLUMNS[OBJECTIVE_NPV],
+    'irr_value': OPTIMIZATION_VALUE_COLUMNS[OBJECTIVE_IRR],
+    'payback_year_num': OPTIMIZATION_VALUE_COLUMNS[OBJECTIVE_PAYBACK],
+}
+# Energy models offered on the What-If page
+SIMULATION_MODELS = {
+    '年度简化模型': MODEL_ANNUAL,
+    '8760 小时仿真': MODEL_HOURLY,
+}
+# Widget keys of the sizing sliders, in optimizer parameter order
+SLIDER_WIDGET_KEYS = {
+    'st_area': 'st_area_slider',
+    'pv_area': 'pv_area_slider',
+    'hp_capacity_kw': 'hp_kw_slider',
+    'storage_capacity_kwh': 'storage_kwh_slider',
+}
+# Sensitivity analysis: metrics offered and the heatmap resolution per axis
+SENSITIVITY_METRIC_LABELS = {
+    'npv_value': '净现值 NPV (¥)',
+    'irr_value': '内部收益率 IRR (%)',
+    'payback_year_num': '投资回收期 (年)',
+}
+SENSITIVITY_GRID_POINTS = 15
+
+# Session state of a finished optimization (job result, or the partial best of a stopped job) for the results section
+def optimization_results_state(job):
+    params, result, info = job['params'], job['result'], job['info'] or {}
+    if result is None: # Cancelled or interrupted: only the best sizing reported so far, no candidate table
+        result = {'objective': OPTIMIZATION_OBJECTIVES[params['strategy']], 'best_params': info.get('best_params'),
+                  'evaluations': info.get('evaluations', 0), 'elapsed': (job['finished'] or time.time()) - (job['started'] or job['created']),
+                  'exhaustive': False, 'candidates': {'sizings': [], 'values': []}}
+    objective = result['objective']
+    sizings = np.asarray(result['candidates']['sizings'], dtype=float).reshape(-1, 4)
+    values = np.asarray(result['candidates']['values'], dtype=float)
+    return {
+        'strategy': params['strategy'],
+        'model': params['model'],
+        'evaluations': result['evaluations'],
+        'elapsed': result['elapsed'],
+        'exhaustive': result['exhaustive'],
+        'best_params': result['best_params'],
+        'warm': result.get('warm'),
+        'table': pd.DataFrame({
+            '光热集热器面积 (m²)': sizings[:, 0],
+            '光伏阵列面积 (m²)': sizings[:, 1],
+            '热泵/冷机容量 (kW)': sizings[:, 2],
+            '储能系统容量 (kWh)': sizings[:, 3],
+            OPTIMIZATION_VALUE_COLUMNS[objective]: values * 100 if objective == OBJECTIVE_IRR else values,
+        }),
+    }
+
+# Session state of a finished Pareto search: frontier table (cheapest plan first) and run summary
+def pareto_results_state(job):
+    result = job['result']
+    front = result['front']
+    sizings = np.asarray(front['sizings'], dtype=float).reshape(-1, 4)
+    table = pd.DataFrame({
+        '光热集热器面积 (m²)': sizings[:, 0],
+        '光伏阵列面积 (m²)': sizings[:, 1],
+        '热泵/冷机容量 (kW)': sizings[:, 2],
+        '储能系统容量 (kWh)': sizings[:, 3],
+        **{column: np.asarray(front[key], dtype=float) for key, column in PARETO_COLUMNS.items()},
+    })
+    table[PARETO_COLUMNS['irr_value']] *= 100
+    return {
+        'strategy': job['params']['strategy'],
+        'model': result['model'],
+        'evaluations': result['evaluations'],
+        'elapsed': result['elapsed'],
+        'exhaustive': result['exhaustive'],
+        'optima_exhaustive': result.get('optima_exhaustive', False),
+        'sizings': sizings,
+        'table': table,
+    }
+
+# Move the sliders to a sizing on the next run (see pending_sliders in whatif_page)
+def apply_sliders(sizing):
+    st.session_state.pending_sliders = dict(zip(SLIDER_WIDGET_KEYS, sizing))
+
+# Status of this session's optimization job. Runs as a fragment that refreshes itself every JOB_POLL_INTERVAL_S
+# while the job is active, so the page stays interactive; once the job has finished, the whole app reruns
+# with the result applied to the sliders.
+@st.fragment(run_every=JOB_POLL_INTERVAL_S)
+def optimization_job_status(config):
+    job_id = st.session_state.get('optimization_job')
+    runner = get_job_runner()
+    job = runner.get(job_id) if job_id is not None else None
+    if job is None:
+        return
+    info = job['info'] or {}
+    if job['status'] in JOB_ACTIVE:
+        if job['status'] == JOB_QUEUED:
+            text = "排队等待中..."
+        else:
+            text = f"正在执行优化计算，策略: {job['params']['strategy']}... 已评估 {info.get('evaluations', 0):,} 个方案"
+            if 'front_size' in info:
+                text += f"，帕累托前沿 {info['front_size']:,} 个方案"
+        st.progress(min(job['progress'], 1.0), text=text)
+        if info.get('best_params'):
+            best = info['best_params']
+            st.write(f"<sub>目前最优: 光热 {best[0]:,.0f} m² / 光伏 {best[1]:,.0f} m² / 热泵 {best[2]:,.0f} kW / 储能 {best[3]:,.0f} kWh</sub>",
+                     unsafe_allow_html=True)
+        st.button("⏹ 取消优化", key='cancel_optimization_job', on_click=runner.cancel, args=(job_id,))
+        return
+
+    del st.session_state['optimization_job']
+    if job['status'] == JOB_FAILED:
+        st.session_state.optimization_notice = ('error', f"优化失败: {job['error']}")
+    elif job['params']['config_hash'] != current_config_hash(config):
+        st.session_state.optimization_notice = ('warning', "优化期间配置参数已修改，结果已丢弃，请重新优化。")
+    elif OPTIMIZATION_OBJECTIVES[job['params']['strategy']] == OBJECTIVE_PARETO:
+        # The frontier is browsed below; the sliders move only when a plan is applied from it
+        if job['status'] == JOB_DONE:
+            st.session_state.pareto_results = pareto_results_state(job)
+        else:
+            st.session_state.optimization_notice = ('warning', "优化已取消。")
+    else:
+        results = optimization_results_state(job)
+        if job['status'] != JOB_DONE:
+            st.session_state.optimization_notice = ('warning', "优化已取消。" + ("下面显示取消前找到的最优方案。" if results['best_params'] else ""))
+        if results['best_params']:
+            st.session_state.optimization_results = results
+            # Update sliders to optimal values on the next run (see pending_sliders above)
+            apply_sliders([float(v) for v in results['best_params']])
+        elif job['status'] == JOB_DONE:
+            st.session_state.optimization_notice = ('warning', "未能找到有效的近似最优方案。请检查配置参数、滑块范围或尝试不同的优化策略。")
+    # Rerun the whole app to update the sliders and the main metrics display above
+    st.rerun(scope='app')
+
 def whatif_page():
     st.title("📊 E-FinOps What if 投资分析")
     st.write("通过调整滑块，实时查看不同设备组合对成本节约和投资回报的影响。")
@@ -378,8 +460,14 @@ def whatif_page():
     col_demand3.metric("用冷需求", f"{config['annual_cool_kwh']:,.0f} kWh")
     st.write("---")
 
+    # --- Energy model ---
+    model = SIMULATION_MODELS[st.radio(
+        "计算模型:", tuple(SIMULATION_MODELS), index=0, horizontal=True, key='simulation_model',
+        help="8760 小时仿真按典型年逐时负荷、光照曲线和峰谷时段调度光热、热泵、光伏与储能。"
+    )]
+
     # --- Display Baseline ---
-    baseline_annual_cost = calculate_baseline_annual_cost(config)
+    baseline_annual_cost = cached_baseline_annual_cost(config, model)
     st.subheader("基线方案 (纯市电供能，考虑峰谷电价和基础电制热/冷效率)")
     st.metric("预计年总成本 (运营成本)", f"¥{baseline_annual_cost:,.2f}")
     st.write("---")
@@ -396,6 +484,12 @@ def whatif_page():
             'storage_capacity_kwh': 0.0,
         }
 
+    # Apply optimizer results to the slider widgets before they are created (widget state can't be set afterwards)
+    if 'pending_sliders' in st.session_state:
+        for name, value in st.session_state.pop('pending_sliders').items():
+            st.session_state.sliders[name] = value
+            st.session_state[SLIDER_WIDGET_KEYS[name]] = value
+
     col_sliders1, col_sliders2 = st.columns(2)
 
     with col_sliders1:
@@ -432,8 +526,8 @@ def whatif_page():
     hp_capacity_kw = st.session_state.sliders['hp_capacity_kw']
     storage_capacity_kwh = st.session_state.sliders['storage_capacity_kwh']
 
-    mixed_metrics = calculate_mixed_system_metrics(
-        config, st_area, pv_area, hp_capacity_kw, storage_capacity_kwh
+    mixed_metrics = cached_mixed_system_metrics(
+        config, (st_area, pv_area, hp_capacity_kw, storage_capacity_kwh), model
     )
 
     st.subheader("组合供能方案效果")
@@ -452,151 +546,513 @@ def whatif_page():
 
     # Optional: Display cash flow table in an expander
     with st.expander("查看详细年度现金流量预测 (税后)"):
-        cf_df = pd.DataFrame({'年份': range(len(mixed_metrics['cash_flows'])), '现金流量 (¥)': mixed_metrics['cash_flows']})
-        st.dataframe(cf_df.style.format({'现金流量 (¥)': '{:,.2f}'}))
+        with timer('app_section', section='cash_flow_table'):
+            cf_df = pd.DataFrame({'年份': range(len(mixed_metrics['cash_flows'])), '现金流量 (¥)': mixed_metrics['cash_flows']})
+            st.dataframe(cf_df.style.format({'现金流量 (¥)': '{:,.2f}'}))
         st.write("<sub>注: 0年份为初始投资CAPEX，后续年份为年度净现金流入。折旧税盾在折旧年限内生效。</sub>", unsafe_allow_html=True)
 
+    if model == MODEL_HOURLY:
+        with st.expander("查看逐时调度年度汇总"):
+            dispatch = mixed_metrics['dispatch']
+            col_dispatch1, col_dispatch2, col_dispatch3 = st.columns(3)
+            col_dispatch1.metric("市电购电量", f"{dispatch['grid_import_kwh']:,.0f} kWh")
+            col_dispatch1.metric("光伏发电量 (自用 / 弃光)", f"{dispatch['pv_used_kwh']:,.0f} / {dispatch['pv_curtailed_kwh']:,.0f} kWh")
+            col_dispatch2.metric("光热供热量", f"{dispatch['st_heat_kwh']:,.0f} kWh")
+            col_dispatch2.metric("热泵供热 / 供冷量", f"{dispatch['hp_heat_kwh']:,.0f} / {dispatch['hp_cool_kwh']:,.0f} kWh")
+            col_dispatch3.metric("储能充电量", f"{dispatch['storage_charged_kwh']:,.0f} kWh")
+            col_dispatch3.metric("储能放电量", f"{dispatch['storage_discharged_kwh']:,.0f} kWh")
+
+    # Chargeback (Inform / 人人有责): metered cost per tenant, department and device for the current sizing
+    if 'meter_data' in st.session_state:
+        with st.expander("🏢 租户 / 部门成本分摊 (Chargeback)"):
+            chargeback_panel(config, (st_area, pv_area, hp_capacity_kw, storage_capacity_kwh))
+
+    # Monte Carlo: uncertain prices, efficiencies and solar hours sampled around the configured point values
+    with st.expander("🎲 不确定性分析 (蒙特卡洛)"):
+        st.write("<sub>电价、能效 (COP/EER) 和日照小时按三角分布在配置值上下浮动抽样，对当前方案逐次计算税后现金流、NPV、IRR 与回收期"
+                 f"{' (年度简化模型)' if model == MODEL_HOURLY else ''}。相同随机种子得到相同结果。</sub>", unsafe_allow_html=True)
+        col_mc1, col_mc2, col_mc3 = st.columns(3)
+        price_spread = col_mc1.slider("电价浮动 (±%)", 0, 50, 20, 5, key='mc_price_spread')
+        efficiency_spread = col_mc2.slider("能效浮动 (±%)", 0, 50, 10, 5, key='mc_efficiency_spread')
+        solar_spread = col_mc3.slider("日照小时浮动 (±%)", 0, 50, 15, 5, key='mc_solar_spread')
+        col_mc4, col_mc5 = st.columns(2)
+        n_draws = col_mc4.number_input("抽样次数", min_value=1000, max_value=200_000, value=MC_DRAWS, step=5000, key='mc_draws')
+        seed = col_mc5.number_input("随机种子", min_value=0, value=0, step=1, key='mc_seed')
+
+        if st.button("运行蒙特卡洛分析"):
+            distributions = {
+                **triangular_spread(tou_equivalent(config), price_spread / 100, ('grid_price_peak', 'grid_price_valley', 'grid_price_shoulder')),
+                **triangular_spread(config, efficiency_spread / 100, ('grid_avg_cop', 'grid_avg_eer', 'hp_cop', 'hp_eer')),
+                **triangular_spread(config, solar_spread / 100, ('st_annual_太阳小时', 'pv_annual_太阳小时')),
+            }
+            with st.spinner("正在抽样计算..."):
+                st.session_state.monte_carlo = run_monte_carlo(
+                    config, (st_area, pv_area, hp_capacity_kw, storage_capacity_kwh), distributions, int(n_draws), int(seed)
+                )
+
+        if 'monte_carlo' in st.session_state:
+            mc = st.session_state.monte_carlo
+            summary = mc['summary']
+            st.write(f"<sub>{mc['n_draws']:,} 次抽样，耗时 {mc['elapsed']:.2f} 秒。NPV 为正的概率: <b>{mc['prob_npv_positive']*100:.1f}%</b></sub>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame({
+                '指标': ["净现值 NPV (¥)", "内部收益率 IRR (%)", "投资回收期 (年)"],
+                **{f"P{p}": [summary['npv_value'][f'p{p}'], summary['irr_value'][f'p{p}'] * 100, summary['payback_year_num'][f'p{p}']] for p in MC_PERCENTILES},
+            }).style.format({f"P{p}": '{:,.2f}' for p in MC_PERCENTILES}), use_container_width=True)
+            counts, edges = np.histogram(mc['npv_value'], bins=40)
+            st.bar_chart(pd.DataFrame({'抽样次数': counts}, index=pd.Index(np.round((edges[:-1] + edges[1:]) / 2, -3), name="NPV (¥)")))
+
+    # Sensitivity: one-at-a-time tornado over the config keys and a 2-D grid over any two inputs.
+    # Each perturbation recomputes only the model stages it affects, so both run on every rerun.
+    with st.expander("📐 敏感性分析 (龙卷风图 / 热力图)"):
+        sizing = (st_area, pv_area, hp_capacity_kw, storage_capacity_kwh)
+        if model == MODEL_HOURLY:
+            st.write("<sub>敏感性分析基于年度简化模型。</sub>", unsafe_allow_html=True)
+        col_sens1, col_sens2 = st.columns(2)
+        metric_key = col_sens1.selectbox("指标", list(SENSITIVITY_METRIC_LABELS), format_func=SENSITIVITY_METRIC_LABELS.get, key='sensitivity_metric')
+        delta = col_sens2.slider("参数浮动 (±%)", 5, 50, 10, 5, key='sensitivity_delta') / 100
+        scale = 100 if metric_key == 'irr_value' else 1
+
+        result = tornado(config, sizing, delta=delta)
+        base_value = result['base'][metric_key] * scale
+        low = result['low'][metric_key] * scale - base_value
+        high = result['high'][metric_key] * scale - base_value
+        swing = np.nan_to_num(np.abs(high - low), nan=0.0, posinf=0.0)
+        order = np.argsort(-swing)
+        tornado_df = pd.DataFrame({
+            '参数': np.repeat(np.array(result['keys'])[order], 2),
+            '情形': np.tile([f"-{delta:.0%}", f"+{delta:.0%}"], len(order)),
+            '变化量': np.column_stack([low[order], high[order]]).ravel(),
+        })
+        tornado_df = tornado_df[np.isfinite(tornado_df['变化量'])]
+        st.write(f"<sub>基准值: {base_value:,.2f}。条形为参数单独上下浮动时{SENSITIVITY_METRIC_LABELS[metric_key]}相对基准的变化，按影响幅度排序。</sub>", unsafe_allow_html=True)
+        st.altair_chart(alt.Chart(tornado_df).mark_bar().encode(
+            x=alt.X('变化量:Q', title=SENSITIVITY_METRIC_LABELS[metric_key]),
+            y=alt.Y('参数:N', sort=list(np.array(result['keys'])[order]), title=None),
+            color=alt.Color('情形:N'),
+        ), use_container_width=True)
+
+        st.markdown("##### 双参数热力图")
+        axis_keys = list(SLIDER_WIDGET_KEYS) + [key for key in SENSITIVITY_KEYS if key in config]
+        col_grid1, col_grid2 = st.columns(2)
+        x_key = col_grid1.selectbox("横轴参数", axis_keys, index=axis_keys.index('pv_area'), key='sensitivity_x')
+        y_key = col_grid2.selectbox("纵轴参数", axis_keys, index=axis_keys.index('grid_price_peak'), key='sensitivity_y')
+        if x_key == y_key:
+            st.warning("请选择两个不同的参数。")
+        else:
+            def axis_values(key):
+                if key in SLIDER_WIDGET_KEYS:
+                    low_value, high_value, _ = SIZING_SPACE[list(SLIDER_WIDGET_KEYS).index(key)]
+                else:
+                    low_value, high_value = perturbation_values(tou_equivalent(config), key, 0.5)
+                values = np.linspace(low_value, high_value, SENSITIVITY_GRID_POINTS)
+                return np.unique(np.round(values)) if key in INTEGER_KEYS else values
+            x_values, y_values = axis_values(x_key), axis_values(y_key)
+            grid = sensitivity_grid(config, sizing, x_key, x_values, y_key, y_values)[metric_key] * scale
+            x_grid, y_grid = np.meshgrid(x_values, y_values)
+            st.altair_chart(alt.Chart(pd.DataFrame({
+                x_key: np.round(x_grid.ravel(), 4), y_key: np.round(y_grid.ravel(), 4), 'value': grid.ravel(),
+            })).mark_rect().encode(
+                x=alt.X(f'{x_key}:O'), y=alt.Y(f'{y_key}:O', sort='descending'),
+                color=alt.Color('value:Q', title=SENSITIVITY_METRIC_LABELS[metric_key], scale=alt.Scale(scheme='redyellowgreen', reverse=metric_key == 'payback_year_num')),
+                tooltip=[x_key, y_key, alt.Tooltip('value:Q', format=',.2f')],
+            ), use_container_width=True)
+
     st.write("---")
 
     # --- Optimization Section ---
     st.subheader("方案优化")
     optimization_strategy = st.radio(
         "选择优化策略:",
-        ('最大化内部收益率 (IRR)', '最小化投资回收期 (Payback Period)', '最大化净现值 (NPV)'),
+        tuple(OPTIMIZATION_OBJECTIVES),
         index=0, # Default to Maximize IRR
         horizontal=True
     )
-    st.write("<sub>注: 优化计算采用简化模型和网格搜索，结果为近似最优。计算量可能与滑块范围和步长有关。</sub>", unsafe_allow_html=True)
-
-
-    if st.button("🔎 查找最优方案", use_container_width=True):
-        st.info(f"正在执行优化计算，策略: {optimization_strategy}...")
-
-        # --- Optimization Logic (Simple Grid Search) ---
-        # Define the objective function based on the strategy
-        def objective_function(params):
-            # params = [st_area, pv_area, hp_capacity_kw, storage_capacity_kwh]
-            # Ensure non-negative values, round to slider steps for grid search consistency
-            rounded_params = [
-                round(params[0] / 50.0) * 50.0,    # st_area step 50
-                round(params[1] / 100.0) * 100.0,  # pv_area step 100
-                round(params[2] / 10.0) * 10.0,    # hp_capacity_kw step 10
-                round(params[3] / 50.0) * 50.0,    # storage_capacity_kwh step 50
-            ]
-            # Ensure within slider bounds
-            rounded_params[0] = np.clip(rounded_params[0], 0.0, 5000.0)
-            rounded_params[1] = np.clip(rounded_params[1], 0.0, 10000.0)
-            rounded_params[2] = np.clip(rounded_params[2], 0.0, 2000.0)
-            rounded_params[3] = np.clip(rounded_params[3], 0.0, 5000.0)
-
-            metrics = calculate_mixed_system_metrics(config, *rounded_params)
-
-            if optimization_strategy == '最大化内部收益率 (IRR)':
-                # Return -IRR value (minimize negative IRR = maximize IRR). Penalize non-calculable IRRs. 
-                # return -metrics['irr_value'] if metrics['irr_value'] != -np.inf else np.inf
-                # Change the penalty to a large negative number (e.g., -1e9) instead of np.inf. 
-                # This way, the optimizer will still prefer solutions with calculable IRR, but it won't completely disregard solutions where IRR cannot be calculated, 
-                # allowing it to explore a wider range of possibilities
-                # return -metrics['irr_value'] if metrics['irr_value'] != -np.inf else -1e9
-                return metrics['irr_value'] if metrics['irr_value'] != -np.inf else -1e9
-            
-            
-            elif optimization_strategy == '最小化投资回收期 (Payback Period)':
-                 # Return numerical payback period. Penalize non-recovered projects.
-                 return metrics['payback_year_num'] if metrics['payback_year_num'] != float('inf') else config['project_lifespan_years'] * 2 # Penalize non-recovery
-
-            elif optimization_strategy == '最大化净现值 (NPV)':
-                # Return -NPV (minimize negative NPV = maximize NPV)
-                return -metrics['npv_value']
-
-
-        # Define steps for grid search (using fewer steps for faster demo)
-        # Adjust these ranges and steps for more precision vs speed
-        st_steps_opt = np.linspace(0, 5000, 6) # 0, 1000, 2000, 3000, 4000, 5000
-        pv_steps_opt = np.linspace(0, 10000, 6) # 0, 2000, 4000, ... 10000
-        hp_steps_opt = np.linspace(0, 2000, 6)  # 0, 400, 800, ... 2000
-        storage_steps_opt = np.linspace(0, 5000, 6) # 0, 1000, 2000, ... 5000
-
-        best_objective_value = float('inf') if '最小化' in optimization_strategy else float('-inf')
-        best_params = None
-
-        # Simple Grid Search Loop
-        progress_text = "优化中，请稍候..."
-        my_bar = st.progress(0, text=progress_text)
-        total_iterations = len(st_steps_opt) * len(pv_steps_opt) * len(hp_steps_opt) * len(storage_steps_opt)
-        i = 0
-
-        for s_area in st_steps_opt:
-            for p_area in pv_steps_opt:
-                for h_cap in hp_steps_opt:
-                    for stor_cap in storage_steps_opt:
-                        current_params = [s_area, p_area, h_cap, stor_cap]
-
-                        # Calculate objective value (handle potential errors)
-                        try:
-                            current_objective_value = objective_function(current_params)
-                            
-                            st.write(f"Params: {current_params}, Objective: {current_objective_value}")
-
-                            if '最小化' in optimization_strategy:
-                                if current_objective_value < best_objective_value:
-                                    best_objective_value = current_objective_value
-                                    best_params = current_params
-                            elif '最大化' in optimization_strategy:
-                                 if current_objective_value > best_objective_value:
-                                    best_objective_value = current_objective_value
-                                    best_params = current_params
-
-                        except Exception as e:
-                            # print(f"Error calculating metrics for {current_params}: {e}") # Debugging
-                            pass # Skip combinations that cause calculation errors (e.g. division by zero if demand is 0 but capacity isn't)
-
-
-                        i += 1
-                        my_bar.progress(i / total_iterations, text=progress_text)
-
-        my_bar.empty() # Hide progress bar when done
-
-
-        if best_params:
-            st.success("✅ 找到近似最优方案！")
-            # Update sliders to optimal values using session state
-            st.session_state.sliders['st_area'] = float(best_params[0])
-            st.session_state.sliders['pv_area'] = float(best_params[1])
-            st.session_state.sliders['hp_capacity_kw'] = float(best_params[2])
-            st.session_state.sliders['storage_capacity_kwh'] = float(best_params[3])
-
-            # Recalculate metrics for the best params to display them clearly below
-            optimal_metrics = calculate_mixed_system_metrics(config, *best_params)
-
-            st.write("**🏆 近似最优方案配置:**")
-            
-            optimal_metrics_irr = calculate_mixed_system_metrics(config, *best_params)
-            st.write("IRR Cash Flows:", optimal_metrics_irr['cash_flows'])
-            
-            st.write(f"- 光热集热器面积: **{best_params[0]:,.0f}** m²")
-            st.write(f"- 光伏阵列面积: **{best_params[1]:,.0f}** m²")
-            st.write(f"- 热泵/冷机容量: **{best_params[2]:,.0f}** kW")
-            st.write(f"- 储能系统容量: **{best_params[3]:,.0f}** kWh")
-
-            st.write("**📈 该最优方案的投资回报指标:**")
-            col_opt_metrics1, col_opt_metrics2, col_opt_metrics3 = st.columns(3)
-            col_opt_metrics1.metric("总投资 (CAPEX)", f"¥{optimal_metrics['total_capex']:,.0f}")
-            col_opt_metrics2.metric("预计年总运维费用 (OPEX)", f"¥{optimal_metrics['annual_opex_mixed']:,.0f}")
-            col_opt_metrics3.metric("预计年总成本节约 (税前)", f"¥{optimal_metrics['annual_gross_saving']:,.0f}")
-
-            col_opt_metrics4, col_opt_metrics5 = st.columns(2)
-            with col_opt_metrics4:
-                 st.metric("投资回收期:", optimal_metrics['payback_period'])
-            with col_opt_metrics5:
-                 st.metric("内部收益率 (IRR):", optimal_metrics['irr'])
-
-
-            # Trigger a rerun to update the sliders and the main metrics display above
-            st.rerun()
+    st.write("<sub>注: 优化计算采用所选计算模型，在滑块步长精度上先做由粗到细的网格搜索与坐标下降；年度简化模型再用分支定界在时间预算内验证最优性。</sub>", unsafe_allow_html=True)
+
+
+    time_budget = st.number_input(
+        "优化时间预算 (秒)", min_value=0.5, max_value=OPTIMIZATION_MAX_TIME_BUDGET_S, value=OPTIMIZATION_TIME_BUDGET_S, step=0.5,
+        key='optimization_time_budget',
+        help="搜索在后台任务中运行，页面可继续操作；预算用完时返回目前找到的最优方案。",
+    )
+    warm_start = st.checkbox(
+        "增量优化 (基于上次优化结果)", value=True, key='optimization_warm_start',
+        help="只修改了设备单价或财务参数时直接重算上次评估过的方案，并从上次的最优方案出发继续搜索；其他参数修改后仍以上次的最优方案为起点。",
+    )
 
+    notice = st.session_state.pop('optimization_notice', None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+
+    job_id = st.session_state.get('optimization_job')
+    if st.button("🔎 查找最优方案", use_container_width=True, disabled=job_id is not None):
+        # --- Optimization Logic (adaptive grid -> coordinate descent -> branch and bound on the slider lattice) ---
+        # Submitted as a background job; the status fragment below polls the job table until it has finished
+        objective = OPTIMIZATION_OBJECTIVES[optimization_strategy]
+        if objective == OBJECTIVE_PARETO: # One search over all objectives instead of one run per objective
+            kind, job = 'pareto', pareto_job(config, model, time_budget=time_budget, load_profiles=st.session_state.get('meter_profiles'),
+                                             max_workers=SWEEP_MAX_WORKERS, park=current_park(), store=get_scenario_store())
         else:
-            st.warning("未能找到有效的近似最优方案。请检查配置参数、滑块范围或尝试不同的优化策略。")
+            kind, job = 'optimize', optimization_job(config, objective, model, time_budget=time_budget,
+                                                     load_profiles=st.session_state.get('meter_profiles'),
+                                                     table_rows=OPTIMIZATION_RESULTS_TABLE_ROWS, max_workers=SWEEP_MAX_WORKERS,
+                                                     park=current_park(), warm_start=warm_start, store=get_scenario_store())
+        st.session_state.optimization_job = job_id = get_job_runner().submit(
+            kind, job,
+            params={'strategy': optimization_strategy, 'model': model, 'time_budget': time_budget,
+                    'config_hash': current_config_hash(config)},
+            owner=session_owner(),
+        )
+    if job_id is not None:
+        optimization_job_status(config)
+
+    # Results of the last optimization run, rendered after the rerun so the best plan is evaluated only once
+    # (the slider position equals best_params, so its metrics come from the scenario cache)
+    if 'optimization_results' in st.session_state and st.session_state.optimization_results['best_params']:
+        results = st.session_state.optimization_results
+        best_params = results['best_params']
+        optimal_metrics = cached_mixed_system_metrics(config, best_params, results['model'])
+
+        st.success("✅ 找到近似最优方案！")
+        st.write("**🏆 近似最优方案配置:**")
+        st.write(f"- 光热集热器面积: **{best_params[0]:,.0f}** m²")
+        st.write(f"- 光伏阵列面积: **{best_params[1]:,.0f}** m²")
+        st.write(f"- 热泵/冷机容量: **{best_params[2]:,.0f}** kW")
+        st.write(f"- 储能系统容量: **{best_params[3]:,.0f}** kWh")
+
+        st.write("**📈 该最优方案的投资回报指标:**")
+        col_opt_metrics1, col_opt_metrics2, col_opt_metrics3 = st.columns(3)
+        col_opt_metrics1.metric("总投资 (CAPEX)", f"¥{optimal_metrics['total_capex']:,.0f}")
+        col_opt_metrics2.metric("预计年总运维费用 (OPEX)", f"¥{optimal_metrics['annual_opex_mixed']:,.0f}")
+        col_opt_metrics3.metric("预计年总成本节约 (税前)", f"¥{optimal_metrics['annual_gross_saving']:,.0f}")
+
+        col_opt_metrics4, col_opt_metrics5 = st.columns(2)
+        with col_opt_metrics4:
+             st.metric("投资回收期:", optimal_metrics['payback_period'])
+        with col_opt_metrics5:
+             st.metric("内部收益率 (IRR):", optimal_metrics['irr'])
+
+        # All candidates of that run, rendered as one table instead of one line per candidate
+        with st.expander(f"查看上次优化的候选方案 ({results['strategy']})"):
+            st.write(f"<sub>共评估 {results['evaluations']:,} 个方案，耗时 {results['elapsed']:.2f} 秒"
+                     f"{'，已验证为滑块步长下的全局最优' if results['exhaustive'] else ''}。"
+                     f"下表按目标值排序，最多显示前 {OPTIMIZATION_RESULTS_TABLE_ROWS:,} 个。</sub>", unsafe_allow_html=True)
+            warm = results.get('warm')
+            if warm and warm['warm_started']:
+                st.write(f"<sub>增量优化: 修改的参数 {', '.join(warm['changed_keys']) or '无'}；复用上次的 {warm['reused']:,} 个方案"
+                         f" (其中重算 {warm['rescored']:,} 个)，新评估 {warm['model_evaluations']:,} 个方案。</sub>", unsafe_allow_html=True)
+            st.dataframe(results['table'], use_container_width=True, height=400)
+            st.download_button(
+                "下载候选方案 (CSV)", results['table'].to_csv(index=False).encode('utf-8-sig'),
+                file_name="efinops_optimization_candidates.csv", mime="text/csv"
+            )
+
+    # Pareto frontier of the last multi-objective run: no evaluated plan beats a plan on it in IRR, NPV, payback
+    # and investment at once. Only an exhaustive run proves that for every plan of the slider lattice; otherwise
+    # the front is labelled approximate. A selected plan can be applied to the sliders
+    if 'pareto_results' in st.session_state:
+        pareto = st.session_state.pareto_results
+        table = pareto['table']
+        if pareto['exhaustive']:
+            label = '帕累托前沿 (已验证为滑块步长下的精确前沿)'
+        else:
+            label = f"近似帕累托前沿 (未验证，可能存在更优方案{'；各单目标最优均已验证' if pareto['optima_exhaustive'] else ''})"
+        st.success(f"✅ {label}包含 {len(table):,} 个方案 (共评估 {pareto['evaluations']:,} 个方案，耗时 {pareto['elapsed']:.2f} 秒)。")
+        capex_column, npv_column, irr_column, payback_column = PARETO_COLUMNS.values()
+        st.altair_chart(alt.Chart(table.reset_index(names='方案')).mark_circle(size=60).encode(
+            x=alt.X(f'{capex_column}:Q'), y=alt.Y(f'{npv_column}:Q'),
+            color=alt.Color(f'{irr_column}:Q', scale=alt.Scale(scheme='viridis')),
+            tooltip=['方案'] + [alt.Tooltip(f'{column}:Q', format=',.2f') for column in table.columns],
+        ), use_container_width=True)
+        st.dataframe(table, use_container_width=True, height=300)
+        col_pick, col_apply = st.columns([3, 1])
+        row = col_pick.selectbox(
+            "选择前沿方案", range(len(table)), key='pareto_row',
+            format_func=lambda i: f"#{i}: 投资 ¥{table[capex_column].iloc[i]:,.0f} / NPV ¥{table[npv_column].iloc[i]:,.0f} / "
+                                  f"IRR {table[irr_column].iloc[i]:.2f}% / 回收期 {table[payback_column].iloc[i]:.2f} 年",
+        )
+        col_apply.button("应用到滑块", key='pareto_apply', use_container_width=True, on_click=apply_sliders,
+                         args=([float(v) for v in pareto['sizings'][row]],))
+        st.download_button(
+            "下载帕累托前沿 (CSV)", table.to_csv(index=False).encode('utf-8-sig'),
+            file_name="efinops_pareto_front.csv", mime="text/csv"
+        )
+
+    scenario_store_panel(config, model)
+
+    # Jobs of this browser session, including ones still running after the page was left
+    jobs = get_job_runner().jobs(owner=session_owner(), limit=10)
+    if jobs:
+        with st.expander("后台任务"):
+            st.dataframe(pd.DataFrame([{
+                '任务': job['job_id'],
+                '策略': job['params'].get('strategy'),
+                '状态': job['status'],
+                '进度': f"{job['progress']:.0%}",
+                '已评估方案数': (job['result'] or job['info'] or {}).get('evaluations', 0),
+                '提交时间': time.strftime('%H:%M:%S', time.localtime(job['created'])),
+            } for job in jobs]), use_container_width=True, hide_index=True)
+
+# Scope and ranking options of the scenario store query
+SCENARIO_SCOPES = {'当前配置参数': 'config', '当前园区 (全部配置参数)': 'park', '全部园区': 'all'}
+SCENARIO_RANK_LABELS = {
+    'npv_value': '净现值 NPV 最高',
+    'irr_value': '内部收益率 IRR 最高',
+    'payback_year_num': '投资回收期最短',
+    'total_capex': '总投资最少',
+}
+
+# Scenarios evaluated by earlier optimizer jobs of any session, queried from the shared store (no recomputation)
+def scenario_store_panel(config, model):
+    with st.expander("🗄️ 方案库 (所有会话优化评估过的方案)"):
+        store, park = get_scenario_store(), current_park()
+        counts = store.counts(park=park, model=model)
+        st.write(f"<sub>{park}: 当前计算模型下已保存 {counts['scenarios']:,} 个方案，来自 {counts['configs']:,} 组配置参数。"
+                 "每次优化评估过的方案都会保存到方案库。</sub>", unsafe_allow_html=True)
+        col_scope, col_rank, col_capex, col_rows = st.columns(4)
+        scope = SCENARIO_SCOPES[col_scope.selectbox("范围", tuple(SCENARIO_SCOPES), key='scenario_scope')]
+        metric = col_rank.selectbox("排序", tuple(RANK_METRICS), format_func=SCENARIO_RANK_LABELS.get, key='scenario_metric')
+        max_capex = col_capex.number_input("总投资上限 (¥，0 为不限)", min_value=0.0, value=0.0, step=500_000.0, key='scenario_max_capex')
+        limit = col_rows.number_input("显示条数", min_value=1, max_value=1000, value=SCENARIO_QUERY_ROWS, key='scenario_rows')
+        found = store.top(metric, int(limit), config=current_config_hash(config) if scope == 'config' else None,
+                          park=None if scope == 'all' else park, model=model, max_capex=max_capex or None)
+        if not len(found['sizings']):
+            st.info("方案库中没有符合条件的方案。")
+            return
+        sizings = found['sizings']
+        table = pd.DataFrame({
+            '光热集热器面积 (m²)': sizings[:, 0],
+            '光伏阵列面积 (m²)': sizings[:, 1],
+            '热泵/冷机容量 (kW)': sizings[:, 2],
+            '储能系统容量 (kWh)': sizings[:, 3],
+            **{column: found[key] for key, column in PARETO_COLUMNS.items()},
+            '园区': found['park'],
+            '配置参数': found['config_hash'],
+        })
+        table[PARETO_COLUMNS['irr_value']] *= 100
+        if scope != 'config':
+            st.write("<sub>其他配置参数下的方案指标按其保存时的配置参数计算；应用到滑块后按当前配置参数重新计算。</sub>", unsafe_allow_html=True)
+        st.dataframe(table, use_container_width=True, height=300)
+        col_pick, col_apply = st.columns([3, 1])
+        row = col_pick.selectbox("选择方案", range(len(table)), key='scenario_row',
+                                 format_func=lambda i: f"#{i}: 投资 ¥{found['total_capex'][i]:,.0f} / NPV ¥{found['npv_value'][i]:,.0f}")
+        col_apply.button("应用到滑块", key='scenario_apply', use_container_width=True, on_click=apply_sliders,
+                         args=([float(v) for v in sizings[row]],))
+
+# --- Portfolio Page (multi-park capital allocation, annual simplified model) ---
+PORTFOLIO_RANK_OPTIONS = {"净现值 (NPV) 总和最大": RANK_BY_NPV, "内部收益率 (IRR) 优先": RANK_BY_IRR}
+
+def portfolio_page():
+    st.title("🏭 多园区投资组合")
+    st.write("在共享资本预算下对多个园区的投资方案进行统一评估和排序 (年度简化模型)。")
+    st.write("---")
+
+    st.write("<sub>每行一个园区: park 列为园区名称，其余列覆盖配置页面中的同名参数 (如 annual_elec_kwh、grid_price_peak、discount_rate)。"
+             "支持 CSV、JSON 和 JSON Lines，格式与命令行 `python -m efinops portfolio` 相同。</sub>", unsafe_allow_html=True)
+    parks_file = st.file_uploader("园区列表文件", type=['csv', 'json', 'jsonl'])
+    # The annual model does not use metered profiles, so their hash is left out of the park configs
+    base_config = {key: value for key, value in st.session_state.get('config', DEFAULT_CONFIG).items() if key != 'meter_profile_hash'}
+
+    col_budget, col_rank, col_points = st.columns(3)
+    budget = col_budget.number_input("总投资预算 (¥)", min_value=0.0, value=10_000_000.0, step=500_000.0, format="%.0f")
+    rank_by = PORTFOLIO_RANK_OPTIONS[col_rank.radio("排序依据", list(PORTFOLIO_RANK_OPTIONS))]
+    points_per_dim = col_points.slider("每个设备维度的候选取值数", min_value=3, max_value=11, value=7)
+
+    if parks_file is None:
+        st.info("请上传园区列表文件。")
+        return
+    file_format = parks_file.name.rsplit('.', 1)[-1].lower()
+    records = parse_park_records(parks_file.getvalue().decode('utf-8-sig'), file_format)
+    unknown = sorted({key for record in records for key in record} - set(DEFAULT_CONFIG) - {'park', 'profile_year'} - set(SIZING_COLUMNS))
+    if unknown:
+        st.error(f"未知的配置参数: {', '.join(unknown)}")
+        return
+    configs = [{**base_config, **{key: value for key, value in record.items() if key in DEFAULT_CONFIG}} for record in records]
+
+    with st.spinner(f"正在评估 {len(configs)} 个园区的候选方案..."):
+        result = Portfolio(configs, [record['park'] for record in records]).allocate(budget, rank_by=rank_by, points_per_dim=points_per_dim)
+
+    funded = result['funded']
+    col_total1, col_total2, col_total3 = st.columns(3)
+    col_total1.metric("获得投资的园区", f"{int(funded.sum())} / {len(funded)}")
+    col_total2.metric("已分配投资 (CAPEX)", f"¥{result['total_capex'].sum():,.0f}")
+    col_total3.metric("组合净现值 (NPV)", f"¥{result['total_npv']:,.0f}")
+
+    table = pd.DataFrame({
+        '排名': [i + 1 if is_funded else None for i, is_funded in enumerate(funded)],
+        '园区': result['park'],
+        '光热集热器面积 (m²)': result['sizing'][:, 0],
+        '光伏阵列面积 (m²)': result['sizing'][:, 1],
+        '热泵/冷机容量 (kW)': result['sizing'][:, 2],
+        '储能系统容量 (kWh)': result['sizing'][:, 3],
+        '总投资 (¥)': result['total_capex'],
+        '累计投资 (¥)': result['cumulative_capex'],
+        '净现值 (¥)': result['npv_value'],
+        'IRR (%)': np.where(np.isfinite(result['irr_value']), result['irr_value'] * 100, np.nan),
+        '回收期 (年)': np.where(np.isfinite(result['payback_year_num']), result['payback_year_num'], np.nan),
+    })
+    st.write(f"<sub>每个园区评估 {result['candidates_per_park']:,} 个候选方案，每个园区至多投资一个方案；未获得投资的园区排在最后。</sub>", unsafe_allow_html=True)
+    st.dataframe(table, use_container_width=True)
+    st.download_button(
+        "下载投资组合 (CSV)", table.to_csv(index=False).encode('utf-8-sig'),
+        file_name="efinops_portfolio.csv", mime="text/csv"
+    )
+
+CHARGEBACK_RULE_LABELS = {
+    'hourly_energy': "按逐时用能 (同一小时内按用量分)",
+    'annual_energy': "按全年用能",
+    'baseline_cost': "按基线电费",
+    'fixed': "按约定比例 (一级分组)",
+}
+CHARGEBACK_COLUMN_LABELS = {
+    'meters': "表计数", 'energy_kwh': "计量能耗 (kWh)", 'grid_kwh': "折算市电 (kWh)", 'baseline_cost': "基线电费 (¥)",
+    'pv_storage_saving': "光伏/储能节约 (¥)", 'thermal_saving': "光热/热泵节约 (¥)", 'asset_cost': "设备年化成本 (¥)",
+    'net_cost': "应分摊费用 (¥)", 'net_cost_share': "占比",
+}
+
+# Metered costs per hierarchy level: TOU-priced baseline cost minus shared-asset savings plus annualized asset cost
+def chargeback_panel(config, sizing):
+    meter_data = st.session_state.meter_data
+    st.write("<sub>各表计按逐时电价计算基线电费 (热/冷按基线 COP/EER 折算市电)，再按规则分摊光伏/储能与光热/热泵的节约和设备年化成本"
+             " (资本回收系数 + 运维)。层级表: CSV，列 meter_id 与 tenant / department 等。</sub>", unsafe_allow_html=True)
+    hierarchy_file = st.file_uploader("层级映射表 (可选)", type=['csv'], key='chargeback_hierarchy')
+    hierarchy = pd.read_csv(hierarchy_file, dtype=str) if hierarchy_file is not None else None
+    col_rule1, col_rule2 = st.columns(2)
+    rules = {
+        POOL_PV_STORAGE: col_rule1.selectbox("光伏/储能分摊规则", ALLOCATION_RULES, format_func=CHARGEBACK_RULE_LABELS.get, key='chargeback_rule_pv'),
+        POOL_THERMAL: col_rule2.selectbox("光热/热泵分摊规则", ALLOCATION_RULES, format_func=CHARGEBACK_RULE_LABELS.get, key='chargeback_rule_thermal'),
+    }
+    available = [c for c in (hierarchy.columns if hierarchy is not None else []) if c != 'meter_id']
+    available += [c for c in ('zone', 'device', 'source') if c in meter_data['meters'].columns and c not in available]
+    levels = st.multiselect("汇总层级 (按顺序)", available, default=available[:1], key='chargeback_levels')
+    fixed_shares = {}
+    if RULE_FIXED in rules.values():
+        if not levels:
+            st.warning("约定比例规则需要至少一个汇总层级。")
+            return
+        groups = sorted(set((hierarchy if hierarchy is not None and levels[0] in hierarchy.columns else meter_data['meters'])[levels[0]].dropna().astype(str)))
+        shares = st.data_editor(pd.DataFrame({levels[0]: groups, '约定比例': 1.0}), hide_index=True, key='chargeback_fixed_shares')
+        fixed_shares = {pool: dict(zip(shares[levels[0]], shares['约定比例'])) for pool, rule in rules.items() if rule == RULE_FIXED}
+    month = st.selectbox("期间", [0] + list(range(1, 13)), format_func=lambda m: "全年" if m == 0 else f"{m} 月", key='chargeback_month')
+
+    if st.button("计算成本分摊", key='chargeback_run'):
+        with st.spinner("正在按表计逐时分摊..."):
+            try:
+                st.session_state.chargeback = chargeback(config, meter_data, sizing, hierarchy, levels, rules, fixed_shares)
+            except ValueError as exc:
+                st.error(str(exc))
+                return
+    if 'chargeback' not in st.session_state:
+        return
+    result = st.session_state.chargeback
+    park = result['park']
+    col_park1, col_park2, col_park3 = st.columns(3)
+    col_park1.metric("园区基线电费", f"¥{park['baseline_cost']:,.0f}")
+    col_park2.metric("组合方案购电费", f"¥{park['mixed_grid_cost']:,.0f}")
+    col_park3.metric("设备年化成本", f"¥{park['asset_cost']:,.0f}")
+    result_levels = [level for level in levels if level in result['levels']] or result['levels'][:1]
+    table = (rollup(result['meters'], result_levels) if month == 0 else monthly_close(result, month, result_levels)) if result_levels else result['meters']
+    st.dataframe(table.rename(columns=CHARGEBACK_COLUMN_LABELS).style.format(
+        {label: '{:,.0f}' for key, label in CHARGEBACK_COLUMN_LABELS.items() if key not in ('meters', 'net_cost_share')} | {"占比": '{:.1%}'}),
+        hide_index=True, use_container_width=True)
+    st.download_button("下载表计明细 (CSV, 按月)", result['monthly'].to_csv(index=False).encode('utf-8-sig'),
+                       file_name="chargeback_monthly.csv", mime="text/csv")
+
+# --- Operate Monitoring Page (streaming baseline deviation and anomaly alerts) ---
+MONITOR_FEED_SYNTHETIC = "模拟读数 (由计量数据生成)"
+MONITOR_FEED_FILE = "回放计量文件"
+MONITOR_ALERT_ROWS = 500 # Most recent alerts shown
+MONITOR_ALERT_LABELS = {
+    'timestamp': "时间", 'meter_id': "表计", 'kind': "类型", 'kwh': "读数 (kWh)", 'expected_kwh': "基线 (kWh)",
+    'z': "偏离 (σ)", 'drift': "持续偏离分数", 'period': "时段", 'excess_kwh': "超出 (kWh)", 'excess_cost': "超出费用 (¥)",
+}
+MONITOR_KIND_LABELS = {ALERT_SPIKE: "突变", ALERT_DRIFT: "持续偏离"}
+MONITOR_PERIOD_LABELS = {PERIOD_VALLEY: "谷", PERIOD_SHOULDER: "平", PERIOD_PEAK: "峰"}
+
+def monitor_page():
+    st.title("📡 运行监控")
+    st.write("按分钟读数流式更新各表计的分时段基线 (工作日/周末 × 小时)，实时标记突变和持续偏离，并按分时电价核算偏离费用。")
+    st.write("---")
+    config = st.session_state.get('config', DEFAULT_CONFIG)
+    meter_data = st.session_state.get('meter_data')
+
+    col_feed1, col_feed2 = st.columns(2)
+    feeds = ([MONITOR_FEED_SYNTHETIC] if meter_data is not None else []) + [MONITOR_FEED_FILE]
+    feed_kind = col_feed1.radio("读数来源", feeds, key='monitor_feed')
+    year = meter_data['year'] if meter_data is not None else pd.Timestamp.now().year
+    start = col_feed2.date_input("监控起始日期", value=pd.Timestamp(year, 1, 8).date(), key='monitor_start',
+                                 help="基线按该日期前后的计量数据初始化；修改后请重置监控")
+    start_day = (pd.Timestamp(start) - pd.Timestamp(start.year, 1, 1)).days
+    if meter_data is None:
+        st.info("未加载计量数据: 基线从读数在线学习 (每个时段需 "
+                f"{MONITOR_WARMUP_READINGS} 条读数后开始预警)。在配置页面导入计量数据后可用历史数据初始化基线。")
+
+    if 'monitor' not in st.session_state:
+        monitor = MeterMonitor(config)
+        if meter_data is not None:
+            monitor.seed(meter_data, day=start_day)
+        st.session_state.monitor = monitor
+        st.session_state.monitor_alerts = []
+    monitor = st.session_state.monitor
+
+    if feed_kind == MONITOR_FEED_SYNTHETIC:
+        days = st.slider("模拟天数", min_value=1, max_value=7, value=1, key='monitor_days')
+        feed_source = lambda: synthetic_feed(meter_data, start_day=start_day, days=days)
+    else:
+        st.write("<sub>长表格式 (timestamp, meter_id, kwh)，按时间排序；每条 kwh 为一个读数间隔 (1 分钟) 的用量。</sub>", unsafe_allow_html=True)
+        replay_file = st.file_uploader("计量数据文件", type=['csv', 'parquet'], key='monitor_file')
+        feed_source = (lambda: replay_meter_file(replay_file)) if replay_file is not None else None
+
+    col_run1, col_run2 = st.columns(2)
+    if col_run1.button("▶️ 处理读数", disabled=feed_source is None, use_container_width=True):
+        progress = st.empty()
+        started = time.perf_counter()
+        readings = monitor.readings
+        for alerts in monitor.stream(feed_source()):
+            if len(alerts):
+                st.session_state.monitor_alerts.append(alerts)
+            progress.write(f"已处理 {monitor.readings - readings:,} 条读数，预警 {monitor.alerts} 次。")
+        elapsed = time.perf_counter() - started
+        progress.write(f"已处理 {monitor.readings - readings:,} 条读数，用时 {elapsed:.2f} 秒 "
+                       f"({(monitor.readings - readings) / max(elapsed, 1e-9):,.0f} 条/秒)。")
+    if col_run2.button("重置监控", use_container_width=True):
+        for key in ('monitor', 'monitor_alerts'):
+            st.session_state.pop(key)
+        st.rerun()
+
+    if not monitor.readings:
+        return
+    status = monitor.status()
+    stale = monitor.stale_meters()
+    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+    col_m1.metric("表计 / 读数", f"{len(status)} / {monitor.readings:,}")
+    col_m2.metric("当前异常表计", int(status['active'].sum()), f"累计预警 {monitor.alerts}", delta_color="off")
+    col_m3.metric("偏离电量", f"{status['deviation_kwh'].sum():,.1f} kWh")
+    col_m4.metric("偏离费用", f"¥{status['deviation_cost'].sum():,.2f}")
+    if stale:
+        st.warning(f"{len(stale)} 个表计超过 {MONITOR_STALE_AFTER_S // 60} 分钟无读数: {', '.join(stale[:20])}{' ...' if len(stale) > 20 else ''}")
+
+    st.subheader("预警")
+    if st.session_state.monitor_alerts:
+        alerts = pd.concat(st.session_state.monitor_alerts, ignore_index=True).tail(MONITOR_ALERT_ROWS).iloc[::-1]
+        alerts = alerts.assign(kind=alerts['kind'].map(MONITOR_KIND_LABELS), period=alerts['period'].map(MONITOR_PERIOD_LABELS))
+        st.dataframe(alerts.rename(columns=MONITOR_ALERT_LABELS).style.format(
+            {MONITOR_ALERT_LABELS[key]: '{:,.3f}' for key in ('kwh', 'expected_kwh', 'excess_kwh')}
+            | {MONITOR_ALERT_LABELS[key]: '{:,.2f}' for key in ('z', 'drift', 'excess_cost')}),
+            hide_index=True, use_container_width=True)
+    else:
+        st.success("暂无预警。")
+
+    st.subheader("表计偏离 (按偏离费用排序)")
+    table = status.sort_values('deviation_cost', ascending=False, key=np.abs)
+    labels = {'meter_id': "表计", 'active': "异常中", 'incidents': "预警次数", 'actual_kwh': "实际 (kWh)", 'expected_kwh': "基线 (kWh)",
+              'deviation_pct': "偏离 (%)", 'deviation_cost': "偏离费用 (¥)",
+              **{f'deviation_kwh_{name}': f"{label}时段偏离 (kWh)" for name, label in MONITOR_PERIOD_LABELS.items()}}
+    st.dataframe(table[list(labels)].rename(columns=labels).style.format(
+        {label: '{:,.2f}' for key, label in labels.items() if key not in ('meter_id', 'active', 'incidents')}),
+        hide_index=True, use_container_width=True)
+    st.download_button("下载表计偏离 (CSV)", status.to_csv(index=False).encode('utf-8-sig'),
+                       file_name="monitor_status.csv", mime="text/csv")
 
 # --- Add image ---
 # The image path 'D:\ChrisH\Pictures\total_energy_solution.png' is local.
@@ -606,7 +1062,7 @@ def whatif_page():
 st.sidebar.image("total_energy_solution.png")
 # --- Main App Navigation ---
 st.sidebar.title("导航")
-page = st.sidebar.radio("", ["配置页面", "What if 投资分析页面", "论文"])
+page = st.sidebar.radio("", ["配置页面", "What if 投资分析页面", "多园区投资组合", "运行监控", "论文"])
 
 st.sidebar.markdown("---")
 st.sidebar.header("关于")
@@ -641,7 +1097,45 @@ if page == "配置页面":
     config_page()
 elif page == "What if 投资分析页面":
     whatif_page()
+elif page == "多园区投资组合":
+    portfolio_page()
+elif page == "运行监控":
+    monitor_page()
 else:  # page == "论文"
     paper_page()
+
+# --- Debug panel: timings and counters of this server process (efinops.instrument) ---
+def _labels_text(labels):
+    return ', '.join(f"{key}={value}" for key, value in labels.items())
+
+def debug_panel(rerun_seconds):
+    st.sidebar.markdown("---")
+    if not st.sidebar.checkbox("🛠 调试: 性能计数", key='debug_panel', help="各计算阶段、优化阶段的耗时与评估/缓存计数 (本服务进程累计)"):
+        return
+    st.sidebar.metric("本次页面运行耗时", f"{rerun_seconds * 1000:,.1f} ms")
+    snapshot = REGISTRY.snapshot()
+    timers = pd.DataFrame([{
+        '计时项': t['name'], '标签': _labels_text(t['labels']), '次数': t['calls'],
+        '总耗时 (ms)': t['total_s'] * 1000, '平均 (ms)': t['total_s'] * 1000 / t['calls'], '最大 (ms)': t['max_s'] * 1000,
+    } for t in snapshot['timers']])
+    if not timers.empty:
+        st.sidebar.dataframe(timers.sort_values('总耗时 (ms)', ascending=False).style.format(
+            {'总耗时 (ms)': '{:,.2f}', '平均 (ms)': '{:,.3f}', '最大 (ms)': '{:,.2f}'}), hide_index=True)
+    counters = pd.DataFrame([{'计数项': c['name'], '标签': _labels_text(c['labels']), '数值': c['value']} for c in snapshot['counters']])
+    if not counters.empty:
+        st.sidebar.dataframe(counters, hide_index=True)
+    if 'scenario_cache' in st.session_state:
+        stats = st.session_state.scenario_cache.stats()
+        st.sidebar.caption(f"会话场景缓存: {stats['size']}/{stats['maxsize']} 条, 命中率 {stats['hit_rate']:.1%}")
+    col_json, col_prom = st.sidebar.columns(2)
+    col_json.download_button("JSON", to_json(snapshot), file_name="efinops_metrics.json", mime="application/json")
+    col_prom.download_button("Prometheus", to_prometheus(snapshot), file_name="efinops_metrics.prom", mime="text/plain")
+    if st.sidebar.button("清零计数", key='debug_reset'):
+        REGISTRY.reset()
+        st.rerun()
+
+rerun_seconds = time.perf_counter() - RERUN_STARTED
+REGISTRY.observe('app_rerun', rerun_seconds, page=page)
+debug_panel(rerun_seconds)
     
 
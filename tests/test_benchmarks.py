@@ -0,0 +1,14 @@
+from benchmarks.run import BENCHMARKS, compare, run_benchmark
+
+
+def test_benchmark_reports_time_throughput_and_memory():
+    result = run_benchmark('tornado', quick=True)
+    assert result['repeats'] == BENCHMARKS['tornado'][3]
+    assert 0 < result['min_s'] <= result['median_s']
+    assert result['items_per_s'] > 0 and result['peak_mem_mb'] >= 0
+
+
+def test_compare_flags_slowdowns():
+    baseline = {'a': {'median_s': 1.0}, 'b': {'median_s': 1.0}}
+    lines, slower = compare({'a': {'median_s': 1.1}, 'b': {'median_s': 2.0}, 'c': {'median_s': 1.0}}, baseline, 1.25)
+    assert slower == ['b'] and len(lines) == 2
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from efinops.cache import ScenarioCache, arrays_hash, config_hash, sizing_key
+
+CONFIG = {'discount_rate': 0.06, 'tax_rate': 0.25, 'project_lifespan_years': 20, 'depreciation_years': 10, 'grid_price_peak': 1.1, 'peak_perc': 0.35}
+TARIFF = {'prices': {'valley': 0.3, 'shoulder': 0.7, 'peak': 1.1},
+          'seasons': [{'months': list(range(1, 13)), 'hours': {'valley': [0, 1, 2, 3, 4, 5], 'peak': [10, 11, 18]}}]}
+
+
+def test_lru_eviction_and_counters():
+    cache = ScenarioCache(maxsize=2)
+    computed = []
+
+    def compute(value):
+        return lambda: computed.append(value) or value
+
+    assert cache.get('a', compute(1)) == 1 and cache.get('b', compute(2)) == 2
+    assert cache.get('a', compute(-1)) == 1 # Hit: 'a' becomes most recently used
+    cache.get('c', compute(3)) # Evicts 'b', the least recently used
+    assert 'b' not in cache and 'a' in cache and 'c' in cache and len(cache) == 2
+    assert cache.get('b', compute(4)) == 4 # Recomputed after eviction, now 'a' is evicted
+    assert 'a' not in cache and computed == [1, 2, 3, 4]
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 4, 'hit_rate': 0.2}
+
+
+def test_invalidate_keeps_counters():
+    cache = ScenarioCache(maxsize=8)
+    for key in ('a', 'b', 'a', 'a'):
+        cache.get(key, lambda: key.upper())
+    cache.invalidate()
+    stats = cache.stats()
+    assert len(cache) == 0 and stats['hits'] == 2 and stats['misses'] == 2 and stats['hit_rate'] == 0.5
+    assert cache.get('a', lambda: 'recomputed') == 'recomputed'
+    assert cache.stats()['misses'] == 3
+
+
+def test_hashes_are_stable_and_value_based():
+    reordered = dict(reversed(list(CONFIG.items())))
+    assert config_hash(reordered) == config_hash(CONFIG)
+    # NumPy scalars and int / float forms of the same value hash alike
+    numpy_config = {key: np.float64(value) if isinstance(value, float) else value for key, value in CONFIG.items()}
+    assert config_hash(numpy_config) == config_hash(CONFIG)
+    assert config_hash({**CONFIG, 'project_lifespan_years': np.int64(CONFIG['project_lifespan_years'])}) == config_hash(CONFIG)
+    assert config_hash({**CONFIG, 'project_lifespan_years': float(CONFIG['project_lifespan_years'])}) == config_hash(CONFIG)
+    assert config_hash({**CONFIG, 'discount_rate': CONFIG['discount_rate'] + 0.01}) != config_hash(CONFIG)
+
+    # Tariff dicts: nested values count, array and list forms are equivalent
+    tariff_config = {**CONFIG, 'tariff': TARIFF}
+    assert config_hash(tariff_config) != config_hash(CONFIG)
+    assert config_hash({**CONFIG, 'tariff': {**TARIFF, 'prices': {**TARIFF['prices'], 'peak': 1.2}}}) != config_hash(tariff_config)
+    market = np.linspace(0.2, 1.0, 24)
+    assert config_hash({**TARIFF, 'market_prices': market}) == config_hash({**TARIFF, 'market_prices': market.tolist()})
+    assert config_hash({**TARIFF, 'market_prices': market}) != config_hash({**TARIFF, 'market_prices': market[::-1]})
+
+    profiles = {'elec_load': np.arange(4.0), 'heat_load': np.ones(4)}
+    assert arrays_hash(profiles) == arrays_hash(dict(reversed(list(profiles.items()))))
+    assert arrays_hash(profiles) != arrays_hash({**profiles, 'heat_load': np.zeros(4)})
+    assert sizing_key([100, np.float32(50.0), 0, 1.5]) == (100.0, 50.0, 0.0, 1.5)
+
+
+def test_concurrent_lookups_compute_each_key_once():
+    cache = ScenarioCache(maxsize=4)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    with ThreadPoolExecutor(8) as pool:
+        values = list(pool.map(lambda _: cache.get('shared', compute), range(8)))
+    assert len(calls) == 1 and all(value is values[0] for value in values)
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 7
+
+    # Eviction racing with lookups of other keys
+    def churn(worker):
+        for i in range(2000):
+            key = (worker + i) % 9
+            assert cache.get(key, lambda: key * 10) == key * 10
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(churn, range(4)))
+    assert len(cache) == 4
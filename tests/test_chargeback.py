@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from efinops.chargeback import MONTH_OF_HOUR, POOL_PV_STORAGE, POOL_THERMAL, chargeback, monthly_close, pool_savings, rollup
+from efinops.hourly import synthetic_profiles
+from efinops.model import complete_config
+from efinops.tariff import HOURS_PER_YEAR
+
+CONFIG = complete_config()
+SIZING = (1000.0, 3000.0, 300.0, 500.0)
+
+
+def _meter_data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    carriers = np.array(['elec', 'heat', 'cool', 'pv'])[np.arange(n) % 4]
+    profiles = synthetic_profiles(CONFIG)
+    shapes = {'elec': profiles['elec_load'], 'heat': profiles['heat_load'], 'cool': profiles['cool_load'], 'pv': profiles['pv_yield']}
+    hourly = np.stack([shapes[c] / shapes[c].sum() * rng.uniform(1e4, 1e6) * rng.uniform(0.5, 1.5, HOURS_PER_YEAR) for c in carriers])
+    meters = pd.DataFrame({'meter_id': [f"m{i}" for i in range(n)], 'carrier': carriers, 'zone': np.array(['A', 'B', 'C'])[np.arange(n) % 3]})
+    hierarchy = pd.DataFrame({'meter_id': meters['meter_id'], 'tenant': [f"t{i % 5}" for i in range(n)]})
+    return {'meters': meters.astype('category'), 'hourly_kwh': hourly.astype(np.float32), 'year': 2024, 'rows_read': 0, 'rows_dropped': 0}, hierarchy
+
+
+def test_allocations_add_up_to_park_totals():
+    meter_data, hierarchy = _meter_data(40)
+    result = chargeback(CONFIG, meter_data, SIZING, hierarchy)
+    meters = result['meters']
+    assert len(meters) == 30 and result['levels'] == ['tenant', 'zone'] # pv meters are not charged
+    assert meters['baseline_cost'].sum() == pytest.approx(result['park']['baseline_cost'], rel=1e-9)
+    assert meters['net_cost'].sum() == pytest.approx(result['park']['net_cost'], rel=1e-9)
+    for pool, column in ((POOL_PV_STORAGE, 'pv_storage_saving'), (POOL_THERMAL, 'thermal_saving')):
+        assert meters[column].sum() == pytest.approx(result['pools'][pool]['saving'], rel=1e-9)
+    assert (meters.loc[meters['carrier'] == 'elec', 'thermal_saving'] == 0).all()
+    monthly = rollup(result['monthly'], ['tenant'], by_month=True)
+    np.testing.assert_allclose(monthly.groupby('tenant')['net_cost'].sum().to_numpy(), rollup(meters, ['tenant'])['net_cost'].to_numpy(), rtol=1e-9)
+
+
+def test_hourly_rule_matches_per_meter_loop():
+    meter_data, _ = _meter_data(8)
+    result = chargeback(CONFIG, meter_data, SIZING, include_asset_cost=False)
+    savings = pool_savings(CONFIG, meter_data, SIZING)['savings'][POOL_PV_STORAGE]
+    carriers = meter_data['meters']['carrier'].astype(str).to_numpy()
+    to_grid = {'elec': 1.0, 'heat': 1 / CONFIG['grid_avg_cop'], 'cool': 1 / CONFIG['grid_avg_eer']}
+    grid = {i: meter_data['hourly_kwh'][i].astype(float) * to_grid[c] for i, c in enumerate(carriers) if c in to_grid}
+    total = sum(grid.values())
+    march = MONTH_OF_HOUR == 2
+    for row, (i, series) in enumerate(grid.items()):
+        expected = np.sum(series[march] / total[march] * savings[march])
+        got = result['monthly'].query("meter_id == @meter_data['meters']['meter_id'][@i] and month == 3")['pv_storage_saving'].iloc[0]
+        assert got == pytest.approx(expected, rel=1e-9)
+
+
+def test_fixed_shares_and_monthly_close():
+    meter_data, hierarchy = _meter_data(40)
+    result = chargeback(CONFIG, meter_data, SIZING, hierarchy, levels=['tenant'], rules={POOL_PV_STORAGE: 'fixed'},
+                        fixed_shares={POOL_PV_STORAGE: {'t0': 3, 't1': 1}})
+    by_tenant = rollup(result['meters'], ['tenant']).set_index('tenant')['pv_storage_saving']
+    saving = result['pools'][POOL_PV_STORAGE]['saving']
+    assert by_tenant['t0'] == pytest.approx(0.75 * saving) and by_tenant['t1'] == pytest.approx(0.25 * saving)
+    assert by_tenant.drop(['t0', 't1']).abs().max() == 0
+    close = monthly_close(result, 1)
+    assert close['net_cost_share'].sum() == pytest.approx(1.0)
+    assert close['net_cost'].sum() == pytest.approx(result['monthly'].query('month == 1')['net_cost'].sum())
+    with pytest.raises(ValueError):
+        chargeback(CONFIG, meter_data, SIZING, hierarchy, rules={POOL_THERMAL: 'fixed'})
@@ -0,0 +1,51 @@
+import csv
+import json
+import subprocess
+import sys
+
+import pytest
+
+from efinops.cli import main
+from efinops.model import calculate_mixed_system_metrics, complete_config
+
+
+def test_evaluate_csv_matches_model(tmp_path):
+    parks = tmp_path / 'parks.csv'
+    parks.write_text("park,annual_elec_kwh,depreciation_years,pv_area,hp_capacity_kw\nA,20000000,8,2000,400\nB,,,,\n", encoding='utf-8')
+    out = tmp_path / 'metrics.csv'
+    assert main(['evaluate', str(parks), '-o', str(out)]) == 0
+
+    rows = list(csv.DictReader(out.open(encoding='utf-8')))
+    assert [row['park'] for row in rows] == ['A', 'B']
+    expected = calculate_mixed_system_metrics(complete_config({'annual_elec_kwh': 20_000_000, 'depreciation_years': 8}), 0, 2000, 400, 0)
+    assert float(rows[0]['npv_value']) == pytest.approx(expected['npv_value'], rel=1e-12)
+    assert float(rows[0]['irr_value']) == pytest.approx(expected['irr_value'], rel=1e-9)
+
+
+def test_optimize_reports_per_park_errors(tmp_path):
+    parks = tmp_path / 'parks.json'
+    parks.write_text(json.dumps({'ok': {'tax_rate': 0.15}, 'typo': {'tax_rat': 0.15}}), encoding='utf-8')
+    out = tmp_path / 'best.json'
+    assert main(['optimize', str(parks), '-o', str(out), '--objective', 'payback', '--time-budget', '0.2']) == 1
+
+    ok, typo = json.loads(out.read_text(encoding='utf-8'))
+    assert ok['status'] == 'ok' and ok['evaluations'] > 0 and ok['payback_year_num'] > 0
+    assert typo['status'] == 'error' and 'tax_rat' in typo['error']
+
+
+def test_package_and_cli_import_without_numpy():
+    code = "import sys, efinops, efinops.cli; print('numpy' in sys.modules, 'streamlit' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'False']
+
+
+def test_portfolio_command_ranks_within_budget(tmp_path):
+    parks = tmp_path / 'parks.jsonl'
+    parks.write_text('{"park": "A", "annual_elec_kwh": 20000000}\n{"park": "B", "annual_heat_kwh": 300000}\n', encoding='utf-8')
+    out = tmp_path / 'portfolio.json'
+    assert main(['portfolio', str(parks), '-o', str(out), '--budget', '2000000', '--points-per-dim', '4']) == 0
+
+    rows = json.loads(out.read_text(encoding='utf-8'))
+    assert {row['park'] for row in rows} == {'A', 'B'}
+    assert rows[0]['rank'] == 1 and rows[0]['funded']
+    assert rows[-1]['cumulative_capex'] <= 2_000_000
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from efinops.executor import SweepCancelled, SweepExecutor
+from efinops.model import MODEL_ANNUAL, MODEL_HOURLY, complete_config, evaluate_model_batch
+
+CONFIG = complete_config()
+
+
+# Random points of the What-If slider lattice
+def random_sizings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(0, 101, n) * 50.0,
+        rng.integers(0, 101, n) * 100.0,
+        rng.integers(0, 201, n) * 10.0,
+        rng.integers(0, 101, n) * 50.0,
+    ])
+
+
+@pytest.mark.parametrize("model", [MODEL_ANNUAL, MODEL_HOURLY])
+def test_parallel_sweep_matches_serial_evaluation(model):
+    sizings = random_sizings(60, seed=3)
+    with SweepExecutor(CONFIG, model, max_workers=2, chunk_size=16) as executor:
+        progress = []
+        merged = executor.evaluate_batch(sizings, on_chunk=lambda completed, total: progress.append((completed, total)))
+    reference = evaluate_model_batch(CONFIG, sizings, model)
+    for key in ("total_capex", "npv_value", "irr_value", "payback_year_num", "cash_flows"):
+        np.testing.assert_array_equal(merged[key], reference[key])
+    assert progress[-1] == (60, 60)
+
+
+def test_cancelled_executor_rejects_sweeps_until_cleared():
+    sizings = random_sizings(8, seed=4)
+    with SweepExecutor(CONFIG, MODEL_ANNUAL, max_workers=1) as executor:
+        executor.cancel()
+        with pytest.raises(SweepCancelled):
+            executor.evaluate_batch(sizings)
+        executor.clear_cancel()
+        assert len(executor.evaluate_batch(sizings, keys=("npv_value",))["npv_value"]) == 8
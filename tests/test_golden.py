@@ -0,0 +1,73 @@
+# Golden regression dataset (tests/golden, generated by `python -m benchmarks.golden --write`).
+# Every evaluation path of the annual model must reproduce the stored metrics; the tolerance only absorbs
+# last-digit differences between summation orders.
+import json
+import os
+
+import numpy as np
+import pytest
+
+from efinops.model import (
+    ANNUAL_STAGES,
+    MODEL_HOURLY,
+    calculate_mixed_system_metrics,
+    calculate_mixed_system_metrics_batch,
+    complete_config,
+    evaluate_model_batch,
+)
+from efinops.pipeline import StagePipeline
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+RTOL = 1e-9
+
+
+def _load(name):
+    with open(os.path.join(GOLDEN_DIR, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _by_config(cases):
+    groups = {}
+    for case in cases:
+        groups.setdefault(case['config'], []).append(case)
+    return groups
+
+
+ANNUAL_CASES = _by_config(_load('annual_metrics.json'))
+
+
+@pytest.mark.parametrize('name', sorted(ANNUAL_CASES))
+def test_annual_scalar_matches_golden(name):
+    for case in ANNUAL_CASES[name]:
+        metrics = calculate_mixed_system_metrics(complete_config(case['overrides']), *case['sizing'])
+        for key, expected in case['expected'].items():
+            if isinstance(expected, str):
+                assert metrics[key] == expected, (case['sizing'], key)
+            else:
+                np.testing.assert_allclose(metrics[key], expected, rtol=RTOL, atol=0, err_msg=f"{case['sizing']} {key}")
+
+
+@pytest.mark.parametrize('name', sorted(ANNUAL_CASES))
+def test_annual_batch_and_pipeline_match_golden(name):
+    cases = ANNUAL_CASES[name]
+    config = complete_config(cases[0]['overrides'])
+    sizings = [case['sizing'] for case in cases]
+    pipeline = StagePipeline(ANNUAL_STAGES)
+    for metrics in (calculate_mixed_system_metrics_batch(config, sizings), calculate_mixed_system_metrics_batch(config, sizings, pipeline=pipeline)):
+        for i, case in enumerate(cases):
+            for key in ('total_capex', 'annual_opex_mixed', 'annual_gross_saving', 'payback_year_num', 'irr_value', 'npv_value', 'cash_flows'):
+                if key not in case['expected']: # the no-demand result carries no payback value
+                    continue
+                np.testing.assert_allclose(metrics[key][i], case['expected'][key], rtol=RTOL, atol=0, err_msg=f"{case['sizing']} {key}")
+
+
+def test_hourly_matches_golden():
+    cases = _load('hourly_metrics.json')
+    metrics = evaluate_model_batch(complete_config(), [case['sizing'] for case in cases], MODEL_HOURLY)
+    for i, case in enumerate(cases):
+        for key, expected in case['expected'].items():
+            if key == 'dispatch':
+                for name, value in expected.items():
+                    np.testing.assert_allclose(metrics['dispatch'][name][i], value, rtol=RTOL, atol=1e-6, err_msg=f"{case['sizing']} {name}")
+            else:
+                np.testing.assert_allclose(metrics[key][i], expected, rtol=RTOL, atol=0, err_msg=f"{case['sizing']} {key}")
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from efinops.hourly import (
+    calculate_mixed_system_metrics_hourly,
+    simulate_dispatch,
+    simulate_dispatch_batch,
+    synthetic_profiles,
+    tou_price_vector,
+)
+from efinops.tariff import HOURS_PER_YEAR, TOU_PEAK
+
+# Default configuration of the E-FinOps configuration page
+CONFIG = {
+    'annual_elec_kwh': 10_000_000, 'annual_heat_kwh': 5_000_000, 'annual_cool_kwh': 3_000_000,
+    'grid_price_static': 0.8, 'grid_price_peak': 1.2, 'grid_price_valley': 0.5, 'grid_price_shoulder': 0.8,
+    'peak_perc': 0.20, 'valley_perc': 0.35, 'shoulder_perc': 0.45,
+    'grid_avg_cop': 2.5, 'grid_avg_eer': 3.5,
+    'st_kwh_m2_hr': 0.5, 'st_cost_m2': 1500.0, 'st_annual_太阳小时': 1500,
+    'pv_kwh_m2_hr': 0.15, 'pv_cost_m2': 1000.0, 'pv_annual_太阳小时': 1200,
+    'hp_cop': 4.0, 'hp_eer': 5.0, 'hp_cost_kw': 2000.0,
+    'storage_eff_charge': 0.95, 'storage_eff_discharge': 0.95, 'storage_cost_kwh': 1500.0, 'storage_c_rate': 0.5,
+    'project_lifespan_years': 20, 'opex_percentage': 0.015, 'tax_rate': 0.25, 'discount_rate': 0.08,
+    'depreciation_years': 10,
+}
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    prices, periods = tou_price_vector(CONFIG)
+    return synthetic_profiles(CONFIG), prices, periods
+
+
+def random_sizings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(0, 101, n) * 50.0,
+        rng.integers(0, 101, n) * 100.0,
+        rng.integers(0, 201, n) * 10.0,
+        rng.integers(0, 101, n) * 50.0,
+    ])
+
+
+def test_batch_size_does_not_change_results(inputs):
+    profiles, prices, periods = inputs
+    sizings = random_sizings(40)
+    reference = simulate_dispatch_batch(CONFIG, profiles, prices, periods, sizings, batch_size=len(sizings))
+    for batch_size in (1, 7, 16):
+        chunked = simulate_dispatch_batch(CONFIG, profiles, prices, periods, sizings, batch_size=batch_size)
+        for key, value in reference.items():
+            assert chunked[key] == pytest.approx(value, rel=1e-12, abs=1e-6)
+
+
+def test_single_scenario_matches_batch(inputs):
+    profiles, prices, periods = inputs
+    sizings = random_sizings(5, seed=1)
+    batch = simulate_dispatch_batch(CONFIG, profiles, prices, periods, sizings)
+    for i, row in enumerate(sizings):
+        single = simulate_dispatch(CONFIG, profiles, prices, periods, *row)
+        assert single['grid_cost'] == pytest.approx(batch['grid_cost'][i], rel=1e-12)
+
+
+def test_storage_respects_capacity_power_and_tou(inputs):
+    profiles, prices, periods = inputs
+    capacity = 2000.0
+    result = simulate_dispatch(CONFIG, profiles, prices, periods, 0.0, 10_000.0, 500.0, capacity, keep_hourly=True)
+    charge, discharge = result['storage_charge'], result['storage_discharge']
+    assert charge.shape == discharge.shape == (HOURS_PER_YEAR,)
+
+    power = capacity * 0.5
+    assert charge.max() <= power + 1e-9 and discharge.max() <= power + 1e-9
+    assert np.all(discharge[periods != TOU_PEAK] == 0)
+
+    soc = np.cumsum(charge * CONFIG['storage_eff_charge'] - discharge / CONFIG['storage_eff_discharge'])
+    assert soc.min() >= -1e-6 and soc.max() <= capacity + 1e-6
+    assert result['storage_discharged_kwh'] > 0
+
+
+def test_storage_lowers_grid_cost_and_metrics_have_batch_keys(inputs):
+    profiles, prices, periods = inputs
+    metrics = calculate_mixed_system_metrics_hourly(CONFIG, profiles, [[0, 0, 0, 0], [0, 0, 0, 1000]], prices=prices, periods=periods)
+    assert metrics['annual_grid_cost'][1] < metrics['annual_grid_cost'][0]
+    for key in ("total_capex", "annual_opex_mixed", "annual_gross_saving", "payback_year_num", "irr_value", "npv_value", "cash_flows"):
+        assert len(metrics[key]) == 2
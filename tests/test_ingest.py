@@ -0,0 +1,74 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from efinops.hourly import hourly_inputs
+from efinops.ingest import VALUE_POWER, annual_totals, hourly_frame, ingest_meter_file, load_profiles
+from efinops.model import complete_config
+from efinops.tariff import HOURS_PER_YEAR
+
+CONFIG = complete_config()
+
+
+def meter_export(year=2023, freq='15min'):
+    timestamps = pd.date_range(f'{year}-01-01', f'{year}-12-31 23:45', freq=freq)
+    frames = []
+    for meter_id, carrier, kwh in (('E1', 'elec', 1.0), ('E2', 'elec', 0.5), ('H1', 'heat', 2.0), ('PV1', 'pv', 3.0)):
+        frames.append(pd.DataFrame({'timestamp': timestamps, 'meter_id': meter_id, 'kwh': kwh, 'carrier': carrier, 'zone': 'A'}))
+    return pd.concat(frames, ignore_index=True).sample(frac=1.0, random_state=0)
+
+
+def test_csv_is_resampled_to_hourly_in_chunks(tmp_path):
+    path = tmp_path / 'meters.csv'
+    meter_export().to_csv(path, index=False)
+    data = ingest_meter_file(path, chunk_rows=10_000)
+
+    assert data['hourly_kwh'].dtype == np.float32 and data['hourly_kwh'].shape == (4, HOURS_PER_YEAR)
+    assert data['meters']['meter_id'].dtype == 'category'
+    assert data['rows_read'] == 4 * HOURS_PER_YEAR * 4 and data['rows_dropped'] == 0
+    # Four 15-minute readings per hour
+    assert annual_totals(data) == pytest.approx({'annual_elec_kwh': 6.0 * HOURS_PER_YEAR, 'annual_heat_kwh': 8.0 * HOURS_PER_YEAR})
+    assert set(load_profiles(data)) == {'elec_load', 'heat_load'}
+    assert len(hourly_frame(data)) == 4 * HOURS_PER_YEAR
+
+    # Rows without a meter id are dropped, not booked to another meter
+    unnamed = pd.DataFrame({'timestamp': [pd.Timestamp('2023-01-01 00:00')] * 3, 'meter_id': ['A', 'B', None],
+                            'kwh': [1.0, 2.0, 50.0], 'carrier': 'elec'})
+    data = ingest_meter_file(io.StringIO(unnamed.to_csv(index=False)))
+    assert list(data['meters']['meter_id']) == ['A', 'B'] and data['rows_dropped'] == 1
+    np.testing.assert_allclose(data['hourly_kwh'][:, 0], [1.0, 2.0])
+
+    # Timestamps with a UTC offset are read as local time, also when the offset changes (daylight saving time)
+    local = pd.DataFrame({'timestamp': ['2023-01-01 00:15:00+08:00', '2023-03-26 01:00:00+01:00', '2023-03-26 03:00:00+02:00'],
+                          'meter_id': 'A', 'kwh': [1.0, 2.0, 3.0], 'carrier': 'elec'})
+    single_offset = ingest_meter_file(io.StringIO(local[:1].to_csv(index=False)))
+    assert single_offset['year'] == 2023 and single_offset['rows_dropped'] == 0 and single_offset['hourly_kwh'][0, 0] == 1.0
+    hourly = ingest_meter_file(io.StringIO(local.to_csv(index=False)))['hourly_kwh'][0]
+    assert hourly[0] == 1.0 and hourly[84 * 24 + 1] == 2.0 and hourly[84 * 24 + 3] == 3.0 # 26 March, 01:00 and 03:00
+
+
+def test_parquet_power_readings_with_gaps_and_leap_day(tmp_path):
+    export = meter_export(year=2024, freq='30min')
+    export['kwh'] = np.where(export['meter_id'] == 'E1', 100.0, export['kwh'])
+    export = export[~((export['meter_id'] == 'E1') & (export['timestamp'].dt.month == 6))] # June missing for E1
+    path = tmp_path / 'meters.parquet'
+    export.to_parquet(path)
+    data = ingest_meter_file(path, value_kind=VALUE_POWER, chunk_rows=5_000)
+
+    assert data['year'] == 2024
+    assert data['rows_dropped'] == 4 * 48 # 29 February
+    e1 = data['meters'].index[data['meters']['meter_id'] == 'E1'][0]
+    assert data['meters']['coverage'][e1] == pytest.approx(1 - 30 / 365)
+    # kW readings averaged per hour; missing hours filled from the hour-of-day mean
+    np.testing.assert_allclose(data['hourly_kwh'][e1], 100.0)
+
+
+def test_metered_profiles_replace_synthetic_load_shapes():
+    data_profiles = {'elec_load': np.r_[np.ones(HOURS_PER_YEAR - 1), 1000.0]}
+    inputs = hourly_inputs(CONFIG, data_profiles)
+    elec = inputs['profiles']['elec_load']
+    assert elec.sum() == pytest.approx(CONFIG['annual_elec_kwh'])
+    assert elec[-1] == pytest.approx(1000 * elec[0])
+    assert inputs['profiles']['heat_load'].sum() == pytest.approx(CONFIG['annual_heat_kwh'])
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+
+from efinops.cli import main
+from efinops.instrument import REGISTRY, Registry, to_prometheus
+from efinops.model import calculate_mixed_system_bounds_batch, calculate_mixed_system_metrics_batch, complete_config
+from efinops.optimize import optimize
+
+CONFIG = complete_config()
+
+
+def _by_name(entries, name):
+    return {tuple(sorted(entry['labels'].items())): entry for entry in entries if entry['name'] == name}
+
+
+def test_registry_snapshot_merge_and_prometheus():
+    registry = Registry()
+    with registry.timer('stage', stage='generation'):
+        pass
+    registry.count('evaluations', 5, source='optimizer')
+    other = Registry()
+    other.merge(registry.snapshot())
+    other.merge(registry.snapshot())
+    snapshot = other.snapshot()
+    assert snapshot['timers'][0]['calls'] == 2 and snapshot['counters'][0]['value'] == 10
+
+    text = to_prometheus(snapshot)
+    assert '# TYPE efinops_stage_seconds summary' in text
+    assert 'efinops_stage_seconds_count{stage="generation"} 2' in text
+    assert 'efinops_evaluations_total{source="optimizer"} 10' in text
+
+    registry.enabled = False
+    registry.count('evaluations')
+    assert registry.snapshot()['counters'][0]['value'] == 5
+
+
+def test_optimizer_phases_and_stage_timers():
+    REGISTRY.reset()
+    result = optimize(CONFIG, 'npv', lambda sizings: calculate_mixed_system_metrics_batch(CONFIG, sizings, False),
+                      lambda lower, upper: calculate_mixed_system_bounds_batch(CONFIG, lower, upper),
+                      time_budget=0.2, record_candidates=False)
+    snapshot = REGISTRY.snapshot()
+    phases = _by_name(snapshot['timers'], 'optimizer_phase')
+    assert {labels[0][1] for labels in phases} >= {'hybrid', 'adaptive_grid', 'coordinate_descent'}
+    evaluations = _by_name(snapshot['counters'], 'optimizer_evaluations')
+    assert sum(entry['value'] for entry in evaluations.values()) == result['evaluations']
+    scenarios = _by_name(snapshot['counters'], 'scenario_evaluations')[(('model', 'annual'),)]['value']
+    assert scenarios == result['evaluations']
+    assert (('stage', 'cash_flows'),) in _by_name(snapshot['timers'], 'stage')
+
+
+def test_cli_metrics_export(tmp_path):
+    parks = tmp_path / 'parks.json'
+    parks.write_text(json.dumps([{'park': 'a', 'pv_area': 1000}, {'park': 'b', 'hp_capacity_kw': 200}]))
+    REGISTRY.reset()
+    assert main(['evaluate', str(parks), '-o', str(tmp_path / 'out.csv'), '--metrics-out', str(tmp_path / 'metrics.json')]) == 0
+    snapshot = json.loads((tmp_path / 'metrics.json').read_text())
+    assert _by_name(snapshot['counters'], 'parks')[(('status', 'ok'),)]['value'] == 2
+    assert _by_name(snapshot['timers'], 'irr_solve')[()]['calls'] >= 2
+
+    assert main(['evaluate', str(parks), '-o', str(tmp_path / 'out.csv'), '--metrics-out', str(tmp_path / 'metrics.prom')]) == 0
+    assert 'efinops_parks_total{status="ok"}' in (tmp_path / 'metrics.prom').read_text()
+    assert np.isfinite(snapshot['timers'][0]['total_s'])
@@ -0,0 +1,84 @@
+import numpy as np
+import numpy_financial as npf
+import pytest
+
+from efinops.irr import (
+    IRR_STATUS_INITIAL_NOT_NEGATIVE,
+    IRR_STATUS_INVALID,
+    IRR_STATUS_NO_POSITIVE_CF,
+    IRR_STATUS_OK,
+    format_irr,
+    solve_irr_batch,
+)
+
+TOL = 1e-9
+
+
+def model_cash_flows(capex, saving, tax_rate=0.25, depreciation_years=10, lifespan=20):
+    # Same after-tax cash-flow shape as calculate_mixed_system_metrics
+    years = np.arange(1, lifespan + 1)
+    cf = saving * (1 - tax_rate) + np.where(years <= depreciation_years, capex / depreciation_years * tax_rate, 0.0)
+    return np.concatenate([[-capex], cf])
+
+
+@pytest.mark.parametrize("values", [
+    [-100, 39, 59, 55, 20],
+    [-100, 0, 0, 74],
+    [-100, 100, 0, -7],
+    [-100, 100, 0, 7],
+    [-5, 10.5, 1, -8, 1],
+    [-1000, 1, 1, 1, 1],
+    [-1, 1000, 0, 0],
+])
+def test_matches_npf_irr_on_textbook_series(values):
+    irr, status = solve_irr_batch([values])
+    assert status[0] == IRR_STATUS_OK
+    assert irr[0] == pytest.approx(npf.irr(values), rel=TOL, abs=TOL)
+
+
+def test_matches_npf_irr_on_model_cash_flows():
+    rng = np.random.default_rng(20250601)
+    capex = rng.uniform(1e4, 2e7, size=500)
+    saving = capex * rng.uniform(-0.05, 0.6, size=500)
+    rows = np.array([model_cash_flows(c, s) for c, s in zip(capex, saving)])
+
+    irr, status = solve_irr_batch(rows)
+
+    for row, value, code in zip(rows, irr, status):
+        expected = npf.irr(row) if (row[1:] > 0).any() else -np.inf
+        if code == IRR_STATUS_OK:
+            assert value == pytest.approx(expected, rel=TOL, abs=TOL)
+        elif code == IRR_STATUS_INVALID:
+            assert np.isnan(expected)
+        else:
+            assert code == IRR_STATUS_NO_POSITIVE_CF
+            assert value == -np.inf
+
+
+def test_matches_npf_irr_on_random_non_conventional_series():
+    rng = np.random.default_rng(7)
+    rows = np.column_stack([-rng.uniform(50, 150, 300), rng.normal(20, 40, (300, 12))])
+    irr, status = solve_irr_batch(rows)
+    expected = np.array([npf.irr(row) for row in rows])
+    has_root = np.isfinite(expected)
+    # Every root npf finds is solved, and to the same (closest to zero) root
+    assert not (has_root & (status == IRR_STATUS_INVALID)).any()
+    matched = has_root & (status == IRR_STATUS_OK)
+    assert matched.sum() == has_root.sum() > 250
+    np.testing.assert_allclose(irr[matched], expected[matched], rtol=0, atol=1e-7)
+
+
+def test_status_categories():
+    rows = [
+        [100, 10, 10],      # initial investment not negative
+        [-100, -10, 0],     # no positive cash flow
+        [-100, 1e-9, 0],    # positive flow but no root inside the search range
+        [-100, 60, 60],
+    ]
+    irr, status = solve_irr_batch(rows)
+    assert list(status) == [IRR_STATUS_INITIAL_NOT_NEGATIVE, IRR_STATUS_NO_POSITIVE_CF, IRR_STATUS_INVALID, IRR_STATUS_OK]
+    assert irr[0] == -np.inf and irr[1] == -np.inf and np.isnan(irr[2])
+    assert format_irr(irr[0], status[0]) == "N/A (初始投资应为负值)"
+    assert format_irr(irr[1], status[1]) == "N/A (无正现金流)"
+    assert format_irr(irr[2], status[2]) == "N/A (IRR计算结果无效)"
+    assert format_irr(irr[3], status[3]) == f"{npf.irr(rows[3]) * 100:.2f} %"
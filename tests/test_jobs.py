@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+
+import numpy as np
+
+from efinops.jobs import JOB_CANCELLED, JOB_DONE, JOB_FAILED, JOB_INTERRUPTED, JOB_QUEUED, JOB_RUNNING, JobRunner, optimization_job
+from efinops.model import MODEL_ANNUAL, complete_config
+from efinops.optimize import OBJECTIVE_NPV
+
+CONFIG = complete_config()
+
+
+def test_optimization_job_result_is_persisted(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    with JobRunner(path) as runner:
+        job_id = runner.submit('optimize', optimization_job(CONFIG, OBJECTIVE_NPV, MODEL_ANNUAL, time_budget=0.5, table_rows=5),
+                               params={'strategy': 'npv'}, owner='session')
+        job = runner.wait(job_id)
+    assert job['status'] == JOB_DONE and job['progress'] == 1.0
+    result = job['result']
+    assert len(result['best_params']) == 4 and result['evaluations'] > 0
+    assert np.shape(result['candidates']['sizings']) == (5, 4)
+    assert result['candidates']['values'][0] == result['best_score']
+
+    with JobRunner(path) as reopened:
+        assert [job['job_id'] for job in reopened.jobs(owner='session')] == [job_id]
+        assert reopened.get(job_id)['result'] == result
+
+
+def test_cancel_keeps_partial_best(tmp_path):
+    reported = threading.Event()
+
+    def search(context):
+        for step in range(10_000):
+            context.progress.report(step / 10_000, force=True, evaluations=step, best_params=[step, 0, 0, 0])
+            reported.set()
+            context.check()
+            threading.Event().wait(0.001)
+        return {}
+
+    with JobRunner(str(tmp_path / 'jobs.sqlite')) as runner:
+        job_id = runner.submit('search', search)
+        reported.wait(5)
+        runner.cancel(job_id)
+        job = runner.wait(job_id)
+    assert job['status'] == JOB_CANCELLED and job['result'] is None
+    assert job['info']['best_params'][0] == job['info']['evaluations'] > 0
+
+
+def test_failures_and_interrupted_jobs(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    with JobRunner(path) as runner:
+        failed = runner.submit('broken', lambda context: 1 / 0)
+        assert runner.wait(failed)['status'] == JOB_FAILED
+        assert runner.get(failed)['error'].startswith('ZeroDivisionError')
+
+        # A second runner on the same table leaves the jobs of a live runner alone
+        release = threading.Event()
+        running = runner.submit('running', lambda context: release.wait(5) and {})
+        with JobRunner(path) as second:
+            assert second.get(running)['status'] in (JOB_QUEUED, JOB_RUNNING)
+        release.set()
+        assert runner.wait(running)['status'] == JOB_DONE
+
+        # Once the runner's heartbeat has stopped (a crashed server), a new runner does not resume its jobs
+        release.clear()
+        stuck = runner.submit('stuck', lambda context: release.wait(5) and {})
+        with sqlite3.connect(path) as db:
+            db.execute("UPDATE runners SET heartbeat = 0 WHERE runner_id = ?", (runner.runner_id,))
+        with JobRunner(path) as restarted:
+            assert restarted.get(stuck)['status'] == JOB_INTERRUPTED
+        release.set()
+
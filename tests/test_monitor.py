@@ -0,0 +1,123 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from efinops.hourly import synthetic_profiles
+from efinops.model import complete_config
+from efinops.monitor import ALERT_SPIKE, MONITOR_WARMUP_READINGS, MeterMonitor, replay_meter_file, synthetic_feed
+
+CONFIG = complete_config()
+START_DAY = 38 # Thursday 8 February 2024 (the synthetic profiles start on a Monday, as 2024 does)
+
+
+def meter_data(n_meters=20):
+    load = synthetic_profiles(CONFIG)['elec_load']
+    scale = np.linspace(1.0, 40.0, n_meters)[:, None]
+    return {
+        'meters': pd.DataFrame({'meter_id': pd.Categorical([f"M{i}" for i in range(n_meters)])}),
+        'hourly_kwh': (scale * load / load.mean()).astype(np.float32),
+        'year': 2024,
+    }
+
+
+def seeded_monitor(data):
+    monitor = MeterMonitor(CONFIG)
+    monitor.seed(data, day=START_DAY)
+    return monitor
+
+
+def scale_readings(chunk, meter_id, factor, start, end):
+    selected = (chunk['meter_id'] == meter_id) & (chunk['timestamp'] >= pd.Timestamp(start)) & (chunk['timestamp'] < pd.Timestamp(end))
+    chunk.loc[selected, 'kwh'] *= factor
+    return chunk
+
+
+def test_spikes_and_sustained_drift_are_flagged_once():
+    data = meter_data()
+    feed = [scale_readings(scale_readings(chunk, 'M1', 3.0, '2024-02-08 10:00', '2024-02-08 10:01'),
+                           'M2', 1.4, '2024-02-08 14:00', '2024-02-08 16:00')
+            for chunk in synthetic_feed(data, start_day=START_DAY, days=1)]
+    monitor = seeded_monitor(data)
+    alerts = pd.concat(list(monitor.stream(feed)), ignore_index=True)
+
+    # One alert per incident and none on the clean meters
+    assert sorted(alerts['meter_id']) == ['M1', 'M2']
+    spike = alerts[alerts['meter_id'] == 'M1'].iloc[0]
+    assert spike['kind'] == ALERT_SPIKE and spike['timestamp'] == pd.Timestamp('2024-02-08 10:00') and spike['period'] == 'peak'
+    assert spike['excess_kwh'] == pytest.approx(spike['kwh'] - spike['expected_kwh'])
+    drift = alerts[alerts['meter_id'] == 'M2'].iloc[0]
+    assert pd.Timestamp('2024-02-08 14:00') <= drift['timestamp'] < pd.Timestamp('2024-02-08 14:30')
+    status = monitor.status().set_index('meter_id')
+    assert not status['active'].any() and status['incidents'].sum() == 2
+    assert monitor.readings == 20 * 1440 and monitor.alerts == 2
+
+    # Unseeded slots learn first and flag nothing during their warmup
+    learning = MeterMonitor(CONFIG)
+    first_hour = feed[0]
+    first_hour.loc[first_hour['meter_id'] == 'M5', 'kwh'] *= 10
+    assert learning.process(first_hour).empty
+    assert (learning.status()['readings'] == 60).all() and learning.count[:, :20].max() == 60 > MONITOR_WARMUP_READINGS
+
+
+def test_file_replay_matches_in_memory_processing(tmp_path):
+    data = meter_data(8)
+    feed = list(synthetic_feed(data, start_day=START_DAY, days=1, seed=1))
+    export = pd.concat(feed, ignore_index=True)
+    path = tmp_path / 'readings.csv'
+    export.to_csv(path, index=False)
+
+    replayed, in_memory = seeded_monitor(data), seeded_monitor(data)
+    replay_alerts = pd.concat(list(replayed.stream(replay_meter_file(path, chunk_rows=1000))), ignore_index=True)
+    memory_alerts = pd.concat([in_memory.process(export)], ignore_index=True)
+    pd.testing.assert_frame_equal(replayed.status(), in_memory.status(), rtol=1e-6)
+    assert len(replay_alerts) == len(memory_alerts)
+    assert replayed.readings == len(export) and replayed.readings_dropped == 0
+
+    # Late readings are dropped, duplicates of a tick summed, unknown meters registered
+    status = replayed.status()
+    late = export.head(3)
+    duplicate = pd.DataFrame({'timestamp': pd.Timestamp('2024-02-09'), 'meter_id': ['M0', 'M0', 'X1'], 'kwh': [0.2, 0.3, 1.0]})
+    replayed.process(late)
+    pd.testing.assert_frame_equal(replayed.status(), status)
+    replayed.process(duplicate)
+    assert replayed.readings_dropped == 3 and replayed.readings == len(export) + 2
+    latest = replayed.status().set_index('meter_id')
+    assert latest.loc['M0', 'last_kwh'] == pytest.approx(0.5) and latest.loc['X1', 'readings'] == 1
+
+    # Meters without readings in the last 15 minutes (or ever) are stale
+    silent = seeded_monitor(data)
+    silent.register(['NEVER'])
+    silent.process(export[(export['meter_id'] != 'M3') | (export['timestamp'] < pd.Timestamp('2024-02-08 23:30'))])
+    assert silent.stale_meters() == ['M3', 'NEVER']
+    assert silent.stale_meters(now='2024-02-08 23:50', after_s=3600) == ['NEVER']
+
+
+def test_deviation_is_split_by_tou_period_and_priced():
+    data = meter_data(5)
+    feed = [chunk.assign(kwh=chunk['kwh'] * 1.15) for chunk in synthetic_feed(data, start_day=START_DAY, days=1, noise=0.0)]
+    monitor = seeded_monitor(data)
+
+    async def readings():
+        for chunk in feed:
+            yield chunk
+
+    async def consume():
+        return [alerts async for alerts in monitor.astream(readings())]
+
+    alerts = pd.concat(asyncio.run(consume()), ignore_index=True)
+    assert set(alerts['meter_id']) == set(data['meters']['meter_id']) # A sustained +15 % on every meter
+    status = monitor.status()
+    by_period = status[['deviation_kwh_valley', 'deviation_kwh_shoulder', 'deviation_kwh_peak']]
+    np.testing.assert_allclose(by_period.sum(axis=1), status['deviation_kwh'])
+    assert ((status['deviation_pct'] > 13.5) & (status['deviation_pct'] < 15.0)).all() # The baselines adapt slowly
+
+    # Legacy tariff: one price per TOU period
+    prices = [CONFIG['grid_price_valley'], CONFIG['grid_price_shoulder'], CONFIG['grid_price_peak']]
+    np.testing.assert_allclose(status['deviation_cost'], by_period.to_numpy() @ prices, rtol=1e-9)
+
+    synchronous = seeded_monitor(data)
+    for chunk in feed:
+        synchronous.process(chunk)
+    pd.testing.assert_frame_equal(synchronous.status(), status)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from efinops.model import calculate_mixed_system_metrics_batch, complete_config
+from efinops.montecarlo import evaluate_draws, run_monte_carlo, sample_chunk, triangular_spread
+
+CONFIG = complete_config()
+SIZING = [1000.0, 3000.0, 300.0, 500.0]
+
+
+def test_zero_spread_reproduces_point_estimate():
+    result = run_monte_carlo(CONFIG, SIZING, triangular_spread(CONFIG, 0.0), n_draws=100)
+    expected = calculate_mixed_system_metrics_batch(CONFIG, [SIZING])
+    for key in ('npv_value', 'irr_value', 'payback_year_num'):
+        np.testing.assert_allclose(result[key], expected[key][0], rtol=1e-9)
+    assert result['summary']['npv_value']['p10'] == pytest.approx(expected['npv_value'][0])
+
+
+def test_draws_are_reproducible_per_chunk():
+    distributions = triangular_spread(CONFIG, 0.3)
+    full = run_monte_carlo(CONFIG, SIZING, distributions, n_draws=2500, seed=7, chunk_size=1000)
+    assert len(full['npv_value']) == 2500
+    # Chunk 2 regenerated on its own gives the same draws as inside the full run
+    samples = sample_chunk(distributions, 7, 2, 500)
+    np.testing.assert_array_equal(evaluate_draws(CONFIG, SIZING, samples)['npv_value'], full['npv_value'][2000:])
+    assert not np.array_equal(samples['grid_price_peak'], sample_chunk(distributions, 8, 2, 500)['grid_price_peak'])
+
+    summary = full['summary']['npv_value']
+    assert summary['p10'] < summary['p50'] < summary['p90']
+    assert 0.0 <= full['prob_npv_positive'] <= 1.0
+
+
+def test_rejects_unknown_parameters():
+    with pytest.raises(ValueError):
+        run_monte_carlo(CONFIG, SIZING, {'tax_rate': ('uniform', 0.1, 0.3)}, n_draws=10)
@@ -0,0 +1,122 @@
+import itertools
+import time
+
+import numpy as np
+import pytest
+
+from efinops.irr import solve_irr_batch
+from efinops.model import calculate_mixed_system_bounds_batch, calculate_mixed_system_metrics_batch, complete_config
+from efinops.optimize import OBJECTIVE_IRR, OBJECTIVE_NPV, OBJECTIVES, box_improvement_margin, objective_scores, optimize
+
+# Small stand-in for the mixed-system model with the same cash-flow shape: CAPEX is linear in the sizing,
+# the annual grid cost falls with diminishing returns along every axis
+CONFIG = {'project_lifespan_years': 20, 'depreciation_years': 10, 'tax_rate': 0.25, 'opex_percentage': 0.02, 'discount_rate': 0.06}
+BASELINE_COST = 2.0e6
+UNIT_COSTS = np.array([300.0, 150.0, 1500.0, 1200.0])
+MAX_SAVING = np.array([4.0e5, 3.0e5, 5.0e5, 2.0e5])
+SATURATION = np.array([1500.0, 4000.0, 600.0, 2500.0])
+SPACE = ((0.0, 5000.0, 1000.0), (0.0, 10000.0, 2000.0), (0.0, 2000.0, 400.0), (0.0, 5000.0, 1000.0))
+
+
+def annual_saving(sizings):
+    return (MAX_SAVING * (1 - np.exp(-sizings / SATURATION))).sum(axis=1)
+
+
+def evaluate(sizings):
+    sizings = np.atleast_2d(sizings)
+    capex = sizings @ UNIT_COSTS
+    years = np.arange(1, CONFIG['project_lifespan_years'] + 1)
+    cash_flows = np.empty((len(sizings), len(years) + 1))
+    cash_flows[:, 0] = -capex
+    cash_flows[:, 1:] = ((annual_saving(sizings) - CONFIG['opex_percentage'] * capex) * (1 - CONFIG['tax_rate']))[:, None] \
+        + (capex * CONFIG['tax_rate'] / CONFIG['depreciation_years'])[:, None] * (years <= CONFIG['depreciation_years'])
+    cumulative = np.cumsum(cash_flows, axis=1)
+    crossing = (cumulative[:, 1:] >= 0) & (cumulative[:, :-1] < 0)
+    first = np.argmax(crossing, axis=1) + 1
+    rows = np.arange(len(sizings))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payback = first - 1 + np.abs(cumulative[rows, first - 1]) / cash_flows[rows, first]
+    irr_value, _ = solve_irr_batch(cash_flows)
+    return {
+        'npv_value': cash_flows @ (1 + CONFIG['discount_rate']) ** -np.arange(len(years) + 1),
+        'payback_year_num': np.where(crossing.any(axis=1), payback, np.inf),
+        'irr_value': irr_value,
+    }
+
+
+def bound(lower, upper):
+    lower, upper = np.atleast_2d(lower), np.atleast_2d(upper)
+    return {'capex_lo': lower @ UNIT_COSTS, 'capex_hi': upper @ UNIT_COSTS,
+            'grid_cost_lb': BASELINE_COST - annual_saving(upper), 'baseline_cost': BASELINE_COST}
+
+
+# Every lattice point of SPACE and its score
+def exhaustive(objective):
+    sizings = np.array(list(itertools.product(*[np.arange(lo, hi + step / 2, step) for lo, hi, step in SPACE])))
+    return sizings, objective_scores(objective, evaluate(sizings), CONFIG)
+
+
+@pytest.mark.parametrize('objective', OBJECTIVES)
+def test_searches_find_the_exhaustive_optimum(objective):
+    sizings, scores = exhaustive(objective)
+    for method in ('hybrid', 'branch_and_bound'):
+        result = optimize(CONFIG, objective, evaluate, bound, method=method, time_budget=30, space=SPACE)
+        assert result['exhaustive']
+        assert result['best_score'] == pytest.approx(scores.max(), rel=1e-12, abs=1e-12)
+        best_row = np.flatnonzero(np.all(sizings == result['best_params'], axis=1))
+        assert scores[best_row[0]] == result['best_score']
+
+
+@pytest.mark.parametrize('objective', OBJECTIVES)
+def test_bound_never_prunes_the_optimum(objective):
+    sizings, scores = exhaustive(objective)
+    optimum = sizings[np.argmax(scores)]
+    incumbent = scores.max() - 1e-9 * max(abs(scores.max()), 1.0) # Anything just worse than the optimum
+    # Nested boxes around the optimum, from the whole space down to the single point
+    upper_limit = np.array([hi for _, hi, _ in SPACE])
+    step = np.array([s for _, _, s in SPACE])
+    for half_width in (upper_limit, 2 * step, step, 0 * step):
+        lower, upper = np.maximum(optimum - half_width, 0.0), np.minimum(optimum + half_width, upper_limit)
+        assert box_improvement_margin(objective, CONFIG, bound(lower, upper), incumbent)[0] > 0
+
+    # The NPV bound of every single-point box is at least the point's NPV
+    if objective == OBJECTIVE_NPV:
+        npv = evaluate(sizings)['npv_value']
+        assert np.all(box_improvement_margin(OBJECTIVE_NPV, CONFIG, bound(sizings, sizings), 0.0) >= npv - 1e-6 * np.abs(npv))
+
+
+def test_exhaustive_flag_and_time_budget():
+    # Only a completed branch and bound proves the optimum
+    for method in ('grid', 'adaptive_grid', 'coordinate_descent'):
+        assert not optimize(CONFIG, 'npv', evaluate, bound, method=method, time_budget=30, space=SPACE)['exhaustive']
+    assert not optimize(CONFIG, 'npv', evaluate, None, method='hybrid', time_budget=30, space=SPACE)['exhaustive']
+    assert not optimize(CONFIG, 'npv', evaluate, bound, method='branch_and_bound', time_budget=0.0)['exhaustive']
+
+    # A slow evaluator on the full slider lattice: the search stops after the batch running at the deadline
+    def slow(sizings):
+        time.sleep(0.05)
+        return evaluate(sizings)
+
+    started = time.perf_counter()
+    result = optimize(CONFIG, 'npv', slow, bound, method='hybrid', time_budget=0.3)
+    assert not result['exhaustive'] and result['best_params'] is not None
+    assert result['elapsed'] < 0.3 + 0.5 and time.perf_counter() - started < 0.3 + 0.5
+
+
+# The staged mixed-system model: its box bounds keep the exhaustive optimum of the coarse lattice
+@pytest.mark.parametrize('objective', OBJECTIVES)
+def test_model_bound_keeps_the_exhaustive_optimum(objective):
+    config = complete_config()
+    evaluate_model = lambda sizings: calculate_mixed_system_metrics_batch(config, sizings, objective == OBJECTIVE_IRR)
+    bound_model = lambda lower, upper: calculate_mixed_system_bounds_batch(config, lower, upper)
+    sizings = np.array(list(itertools.product(*[np.arange(lo, hi + step / 2, step) for lo, hi, step in SPACE])))
+    scores = objective_scores(objective, evaluate_model(sizings), config)
+
+    result = optimize(config, objective, evaluate_model, bound_model, method='branch_and_bound', time_budget=30, space=SPACE)
+    assert result['exhaustive'] and result['best_score'] == pytest.approx(scores.max(), rel=1e-12, abs=1e-12)
+    upper_limit = np.array([hi for _, hi, _ in SPACE])
+    optimum = sizings[np.argmax(scores)]
+    incumbent = scores.max() - 1e-9 * max(abs(scores.max()), 1.0)
+    for half_width in (upper_limit, np.array([s for _, _, s in SPACE]), 0 * upper_limit):
+        lower, upper = np.maximum(optimum - half_width, 0.0), np.minimum(optimum + half_width, upper_limit)
+        assert box_improvement_margin(objective, config, bound_model(lower[None, :], upper[None, :]), incumbent)[0] > 0
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from efinops.jobs import JOB_DONE, JobRunner, pareto_job
+from efinops.model import MODEL_ANNUAL, calculate_mixed_system_bounds_batch, calculate_mixed_system_metrics_batch, complete_config
+from efinops.optimize import OBJECTIVE_NPV, optimize
+from efinops.pareto import PARETO_METRIC_KEYS, ParetoFront, dominated_by, non_dominated, pareto_optimize, pareto_scores
+
+CONFIG = complete_config()
+SMALL_SPACE = ((0.0, 5000.0, 1000.0), (0.0, 10000.0, 2000.0), (0.0, 2000.0, 400.0), (0.0, 5000.0, 1000.0))
+FINE_SPACE = ((0.0, 5000.0, 500.0), (0.0, 10000.0, 1000.0), (0.0, 2000.0, 200.0), (0.0, 5000.0, 500.0))
+
+
+def brute_force_front(points):
+    return {i for i, p in enumerate(points) if not any((q >= p).all() and (q > p).any() for q in points)}
+
+
+def lattice_front(space):
+    lattice = np.array(np.meshgrid(*[np.arange(lo, hi + step, step) for lo, hi, step in space], indexing='ij')).reshape(4, -1).T
+    scores = pareto_scores(calculate_mixed_system_metrics_batch(CONFIG, lattice), CONFIG)
+    return lattice, scores, {tuple(lattice[i]) for i in brute_force_front(scores)}
+
+
+def test_incremental_front_matches_brute_force():
+    rng = np.random.default_rng(0)
+    points = np.round(rng.normal(size=(600, 4)), 1) # Rounded so that ties and duplicates occur
+    points[:, 3] = -np.abs(points[:, 0]) # Conflicting objectives keep the front large
+    expected = brute_force_front(points)
+    assert set(non_dominated(points, block=64).tolist()) == expected
+    assert set(np.flatnonzero(~dominated_by(points, points)).tolist()) == expected
+
+    front = ParetoFront()
+    for batch in np.array_split(rng.permutation(len(points)), 7):
+        front.add(np.repeat(batch[:, None], 4, axis=1), points[batch])
+    assert set(front.sizings[:, 0].astype(int).tolist()) == expected
+
+
+def test_pareto_search_evaluates_once_and_finds_the_lattice_front():
+    calls = []
+
+    def evaluate_batch(sizings):
+        calls.append(len(sizings))
+        return calculate_mixed_system_metrics_batch(CONFIG, sizings)
+
+    result = pareto_optimize(CONFIG, evaluate_batch, method='grid', time_budget=10.0, space=SMALL_SPACE)
+    # The grid covers the whole small lattice: the first search evaluates it, the other two reuse it
+    assert calls == [6 ** 4] and result['evaluations'] == 6 ** 4
+
+    _, scores, expected = lattice_front(SMALL_SPACE)
+    front = result['front']
+    assert {tuple(row) for row in front['sizings']} == expected
+    assert np.all(np.diff(front['total_capex']) >= 0) and front['total_capex'][0] == 0.0
+    assert front['npv_value'].max() == pytest.approx(scores[:, 1].max())
+
+
+@pytest.mark.parametrize('method', ['hybrid', 'branch_and_bound'])
+def test_front_search_finds_the_exact_lattice_front(method):
+    evaluate_batch = lambda sizings: calculate_mixed_system_metrics_batch(CONFIG, sizings)
+    bound_batch = lambda lower, upper: calculate_mixed_system_bounds_batch(CONFIG, lower, upper)
+    _, _, expected = lattice_front(FINE_SPACE)
+    result = pareto_optimize(CONFIG, evaluate_batch, bound_batch, method=method, time_budget=60.0, space=FINE_SPACE)
+    assert result['exhaustive'] and result['optima_exhaustive']
+    assert {tuple(row) for row in result['front']['sizings']} == expected
+
+    # Without a bound function the front is only the non-dominated part of what the search visited
+    result = pareto_optimize(CONFIG, evaluate_batch, method=method, time_budget=1.0, space=FINE_SPACE)
+    assert not result['exhaustive'] and not result['optima_exhaustive']
+
+
+def test_pareto_job_matches_single_objective_optimum(tmp_path):
+    with JobRunner(str(tmp_path / 'jobs.sqlite')) as runner:
+        job = runner.wait(runner.submit('pareto', pareto_job(CONFIG, MODEL_ANNUAL, time_budget=10.0)))
+    assert job['status'] == JOB_DONE and job['info']['front_size'] == len(job['result']['front']['sizings'])
+    result = job['result']
+    assert result['optima_exhaustive'] and set(result['front']) == {'sizings', *PARETO_METRIC_KEYS}
+
+    single = optimize(CONFIG, OBJECTIVE_NPV, lambda sizings: calculate_mixed_system_metrics_batch(CONFIG, sizings, False),
+                      lambda lower, upper: calculate_mixed_system_bounds_batch(CONFIG, lower, upper), method='branch_and_bound',
+                      time_budget=10.0, record_candidates=False)
+    assert max(result['front']['npv_value']) == pytest.approx(single['best_score'])
+    best = result['front']['sizings'][int(np.argmax(result['front']['npv_value']))]
+    assert best == result['best'][OBJECTIVE_NPV]
@@ -0,0 +1,47 @@
+import numpy as np
+
+from efinops.model import ANNUAL_STAGES, calculate_mixed_system_metrics, calculate_mixed_system_metrics_batch, complete_config
+from efinops.pipeline import StagePipeline, affected_stages, stage_inputs
+
+CONFIG = complete_config()
+SIZINGS = np.random.default_rng(5).uniform(0, 1, (64, 4)) * [5000, 10000, 2000, 5000]
+
+
+def test_financial_change_reuses_energy_stages():
+    pipeline = StagePipeline(ANNUAL_STAGES)
+    calculate_mixed_system_metrics_batch(CONFIG, SIZINGS, pipeline=pipeline)
+    assert pipeline.last_computed == [stage.name for stage in ANNUAL_STAGES]
+
+    for key, value in (('discount_rate', 0.05), ('tax_rate', 0.15)):
+        config = {**CONFIG, key: value}
+        metrics = calculate_mixed_system_metrics_batch(config, SIZINGS, pipeline=pipeline)
+        assert pipeline.last_computed == ['cash_flows']
+        expected = calculate_mixed_system_metrics_batch(config, SIZINGS)
+        for name in ('npv_value', 'irr_value', 'payback_year_num'):
+            np.testing.assert_array_equal(metrics[name], expected[name])
+
+    calculate_mixed_system_metrics_batch({**CONFIG, 'storage_c_rate': 0.25}, SIZINGS, pipeline=pipeline)
+    assert pipeline.last_computed == ['storage_arbitrage', 'grid_cost', 'cash_flows']
+    calculate_mixed_system_metrics_batch(CONFIG, SIZINGS, pipeline=pipeline)
+    assert pipeline.last_computed == []
+    assert pipeline.stats()['generation']['misses'] == 1
+
+
+def test_stage_declarations():
+    assert affected_stages(ANNUAL_STAGES, ['tax_rate']) == ['cash_flows']
+    assert affected_stages(ANNUAL_STAGES, ['pv_area']) == ['capex', 'generation', 'energy_balance', 'grid_cost', 'cash_flows']
+    assert affected_stages(ANNUAL_STAGES, ['grid_price_peak']) == ['storage_arbitrage', 'tou_price', 'grid_cost', 'baseline', 'cash_flows']
+    assert set(stage_inputs(ANNUAL_STAGES, 'baseline')) == {
+        'grid_price_peak', 'grid_price_valley', 'grid_price_shoulder', 'peak_perc', 'valley_perc', 'shoulder_perc', 'tariff',
+        'annual_elec_kwh', 'annual_heat_kwh', 'annual_cool_kwh', 'grid_avg_cop', 'grid_avg_eer',
+    }
+
+
+def test_display_metrics_through_pipeline():
+    pipeline = StagePipeline(ANNUAL_STAGES)
+    sizing = SIZINGS[3]
+    cached = calculate_mixed_system_metrics(CONFIG, *sizing, pipeline=pipeline)
+    direct = calculate_mixed_system_metrics(CONFIG, *sizing)
+    assert cached['payback_period'] == direct['payback_period'] and cached['irr'] == direct['irr']
+    assert cached['npv_value'] == direct['npv_value']
+    assert len(cached['cash_flows']) == CONFIG['project_lifespan_years'] + 1
@@ -0,0 +1,65 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from efinops.model import calculate_mixed_system_metrics_batch, complete_config
+from efinops.portfolio import Portfolio, _knapsack_choices
+
+PARKS = [
+    {'annual_elec_kwh': 20_000_000, 'discount_rate': 0.05, 'project_lifespan_years': 20, 'depreciation_years': 8},
+    {'annual_elec_kwh': 3_000_000, 'annual_heat_kwh': 800_000, 'tax_rate': 0.15, 'project_lifespan_years': 12},
+    {'annual_heat_kwh': 5_000_000, 'grid_price_peak': 1.5, 'discount_rate': 0.09, 'depreciation_years': 15},
+    {'annual_elec_kwh': 0, 'annual_heat_kwh': 0, 'annual_cool_kwh': 0},
+]
+
+
+def test_evaluate_matches_single_park_batch():
+    rng = np.random.default_rng(12)
+    sizings = rng.uniform(0, 1, (40, 4)) * [5000, 10000, 2000, 5000]
+    metrics = Portfolio(PARKS).evaluate(sizings)
+    for i, park in enumerate(PARKS[:-1]):
+        config = complete_config(park)
+        expected = calculate_mixed_system_metrics_batch(config, sizings)
+        for key in ('total_capex', 'annual_gross_saving', 'payback_year_num', 'npv_value', 'irr_value'):
+            np.testing.assert_allclose(metrics[key][i], expected[key], rtol=1e-9)
+        np.testing.assert_allclose(metrics['cash_flows'][i, :, :config['project_lifespan_years'] + 1], expected['cash_flows'], rtol=1e-12)
+    assert np.all(metrics['npv_value'][-1] == 0) and np.all(metrics['payback_year_num'][-1] == np.inf)
+
+
+@pytest.mark.parametrize('rank_by', ['npv', 'irr'])
+def test_allocate_respects_budget(rank_by):
+    budget = 1_500_000
+    result = Portfolio(PARKS, ['A', 'B', 'C', 'D']).allocate(budget, rank_by=rank_by, points_per_dim=4)
+    assert result['total_capex'].sum() <= budget
+    assert sorted(result['park']) == ['A', 'B', 'C', 'D']
+    funded = result['funded']
+    assert funded.any() and not funded[result['park'].index('D')]
+    assert np.all(result['npv_value'][funded] > 0) and np.all(result['total_capex'][~funded] == 0)
+    # Funded parks come first
+    assert list(funded) == sorted(funded, reverse=True)
+
+
+def test_knapsack_matches_brute_force():
+    rng = np.random.default_rng(3)
+    capex = rng.integers(1, 10, (4, 5)) * 100.0
+    value = rng.normal(50, 40, (4, 5))
+    budget = 1500.0
+    choice = _knapsack_choices(capex, value, budget)
+    picked = sum(value[park, k] for park, k in enumerate(choice) if k >= 0)
+    assert sum(capex[park, k] for park, k in enumerate(choice) if k >= 0) <= budget
+
+    best = 0.0
+    for combo in itertools.product(range(-1, 5), repeat=4):
+        cost = sum(capex[park, k] for park, k in enumerate(combo) if k >= 0)
+        if cost <= budget:
+            best = max(best, sum(value[park, k] for park, k in enumerate(combo) if k >= 0 and value[park, k] > 0))
+    assert picked == pytest.approx(best)
+
+
+def test_non_model_config_entries_are_ignored():
+    # A What-If session config after a meter import carries the profile hash string
+    sizings = np.array([[1000.0, 3000.0, 300.0, 500.0]])
+    configs = [{**complete_config(park), 'meter_profile_hash': '3fa9c0d1e2b34f56'} for park in PARKS[:2]]
+    metrics = Portfolio(configs).evaluate(sizings)
+    np.testing.assert_allclose(metrics['npv_value'], Portfolio(PARKS[:2]).evaluate(sizings)['npv_value'])
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from efinops.ingest import load_profiles
+from efinops.profile_store import ProfileStore
+from efinops.tariff import HOURS_PER_YEAR
+
+
+def meter_data(year, n=6, seed=0):
+    meters = pd.DataFrame({
+        'meter_id': pd.Categorical([f'M{i}' for i in range(n)]),
+        'carrier': pd.Categorical([('elec', 'heat', 'cool')[i % 3] for i in range(n)]),
+        'coverage': np.ones(n, dtype=np.float32),
+    })
+    hourly = np.random.default_rng(seed).random((n, HOURS_PER_YEAR)).astype(np.float32)
+    return {'meters': meters, 'hourly_kwh': hourly, 'year': year, 'rows_read': n * HOURS_PER_YEAR, 'rows_dropped': 0}
+
+
+def test_round_trip_is_memory_mapped_and_indexed(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    original = meter_data(2023)
+    store.put('园区 A', original)
+    store.put('园区 A', meter_data(2024, n=3, seed=1))
+
+    reopened = ProfileStore(str(tmp_path))
+    data = reopened.get('园区 A', 2023)
+    assert isinstance(data['hourly_kwh'], np.memmap)
+    np.testing.assert_array_equal(data['hourly_kwh'], original['hourly_kwh'])
+    assert data['meters']['meter_id'].dtype == 'category'
+    assert reopened.parks() == ['园区 A'] and reopened.years('园区 A') == [2023, 2024]
+    assert reopened.find_meter('M4') == [('园区 A', 2023)]
+    np.testing.assert_array_equal(reopened.meter_profile('园区 A', 2023, 'M4'), original['hourly_kwh'][4])
+    assert load_profiles(data)['elec_load'].sum() == pytest.approx(original['hourly_kwh'][[0, 3]].sum(dtype=np.float64))
+
+
+def test_rewrite_is_picked_up_and_delete_updates_index(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.put('P', meter_data(2023))
+    assert store.get('P', 2023) is store.get('P', 2023)
+    store.put('P', meter_data(2023, n=2, seed=5))
+    assert store.get('P', 2023)['hourly_kwh'].shape == (2, HOURS_PER_YEAR)
+
+    store.delete('P', 2023)
+    assert store.parks() == []
+    with pytest.raises(KeyError):
+        store.get('P', 2023)
+
+
+def test_park_names_that_sanitize_alike_stay_apart(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.put('North Park', meter_data(2023, seed=1))
+    store.put('North_Park', meter_data(2023, n=2, seed=2))
+    assert ProfileStore(str(tmp_path)).get('North Park', 2023)['hourly_kwh'].shape == (6, HOURS_PER_YEAR)
+    assert store.get('North_Park', 2023)['hourly_kwh'].shape == (2, HOURS_PER_YEAR)
+
+    store.delete('North_Park', 2023)
+    assert store.parks() == ['North Park'] and store.years('North Park') == [2023]
+    with pytest.raises(ValueError):
+        store.put(' ', meter_data(2023))
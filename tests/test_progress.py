@@ -0,0 +1,47 @@
+from efinops.progress import ThrottledProgress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_updates_inside_the_interval_are_dropped():
+    clock, updates = FakeClock(), []
+    progress = ThrottledProgress(lambda fraction, info: updates.append((fraction, info)), max_updates_per_second=4.0, clock=clock)
+
+    assert progress.report(0.1, evaluations=1) # The first update always goes out
+    clock.now += 0.125
+    assert not progress.report(0.2, evaluations=2)
+    clock.now += 0.0625
+    assert not progress.report(0.3, evaluations=3)
+    clock.now += 0.0625 # 0.25 s since the last update sent
+    assert progress.report(0.4, evaluations=4)
+    clock.now += 0.125
+    assert not progress.report(0.5)
+    assert progress.report(0.6, force=True)
+    assert updates == [(0.1, {'evaluations': 1}), (0.4, {'evaluations': 4}), (0.6, {})]
+    assert progress.reports_received == 6 and progress.updates_sent == 3
+
+
+def test_final_update_is_always_emitted():
+    clock, updates = FakeClock(), []
+    progress = ThrottledProgress(lambda fraction, info: updates.append((fraction, info)), max_updates_per_second=1.0, clock=clock)
+    progress.report(0.5)
+    assert progress.finish(evaluations=10, best_score=3.0) # Right after another update
+    assert updates[-1] == (1.0, {'evaluations': 10, 'best_score': 3.0})
+
+    # Without throttling every report is sent
+    unthrottled = ThrottledProgress(lambda fraction, info: updates.append(fraction), max_updates_per_second=0, clock=clock)
+    assert all(unthrottled.report(0.1 * i) for i in range(5))
+
+
+def test_fractions_are_clamped():
+    clock, fractions = FakeClock(), []
+    progress = ThrottledProgress(lambda fraction, info: fractions.append(fraction), clock=clock)
+    for value in (-0.5, 0.25, 1.7):
+        progress.report(value, force=True)
+    assert fractions == [0.0, 0.25, 1.0] and isinstance(fractions[1], float)
@@ -0,0 +1,89 @@
+import sqlite3
+
+import numpy as np
+
+from efinops.jobs import JOB_DONE, JobRunner, optimization_job, pareto_job
+from efinops.model import MODEL_ANNUAL, calculate_mixed_system_metrics_batch, complete_config
+from efinops.optimize import OBJECTIVE_IRR, OBJECTIVE_NPV
+from efinops.scenario_store import ScenarioRecorder, ScenarioStore
+
+CONFIG = complete_config()
+
+
+def random_sizings(n, seed=0):
+    return np.round(np.random.default_rng(seed).uniform(0.0, 1.0, (n, 4)) * [50, 100, 20, 50]) * 100.0
+
+
+def test_top_scenarios_under_capex_match_brute_force(tmp_path):
+    store = ScenarioStore(str(tmp_path / 'scenarios.sqlite'))
+    sizings = np.unique(random_sizings(2000), axis=0)
+    metrics = calculate_mixed_system_metrics_batch(CONFIG, sizings)
+    store.insert(CONFIG, MODEL_ANNUAL, sizings, {**metrics, 'irr_value': None}, park='north')
+
+    top = store.top('npv_value', 20, config=CONFIG, max_capex=5e6)
+    under = metrics['total_capex'] <= 5e6
+    expected = np.sort(metrics['npv_value'][under])[::-1][:20]
+    np.testing.assert_allclose(top['npv_value'], expected)
+    assert np.all(top['total_capex'] <= 5e6) and np.all(np.isnan(top['irr_value']))
+    assert store.top('irr_value', 20, config=CONFIG)['sizings'].shape == (0, 4) # Not computed: not ranked
+
+    # Re-inserting rows merges them: IRR is filled in, the NPV of rows inserted without it is kept
+    store.insert(CONFIG, MODEL_ANNUAL, sizings[:100], {'irr_value': metrics['irr_value'][:100]}, park='north')
+    top = store.top('irr_value', 5, config=CONFIG)
+    best = np.argsort(metrics['irr_value'][:100])[::-1][:5]
+    np.testing.assert_allclose(top['irr_value'], metrics['irr_value'][best])
+    np.testing.assert_allclose(top['npv_value'], metrics['npv_value'][best])
+    np.testing.assert_array_equal(top['sizings'], sizings[best])
+    assert store.counts() == {'scenarios': len(sizings), 'configs': 1}
+
+
+def test_queries_are_scoped_by_config_park_and_model_and_use_indexes(tmp_path):
+    path = str(tmp_path / 'scenarios.sqlite')
+    store = ScenarioStore(path)
+    sizings = random_sizings(500)
+    cheaper = {**CONFIG, 'pv_cost_m2': CONFIG['pv_cost_m2'] * 0.5}
+    for config, park in ((CONFIG, 'north'), (cheaper, 'north'), (CONFIG, 'south')):
+        recorder = ScenarioRecorder(lambda sizings, config=config: calculate_mixed_system_metrics_batch(config, sizings, False))
+        recorder(sizings[:250])
+        recorder(sizings[250:])
+        assert recorder.save(store, config, MODEL_ANNUAL, park) == len(sizings)
+
+    assert store.parks() == ['north', 'south']
+    assert store.counts(park='north') == {'scenarios': 2 * len(np.unique(sizings, axis=0)), 'configs': 2}
+    north = store.top('payback_year_num', 10, park='north')
+    assert set(north['park']) == {'north'} and np.all(np.diff(north['payback_year_num']) >= 0)
+    cheapest = store.top('total_capex', 10, park='north', model=MODEL_ANNUAL)
+    assert np.all(np.diff(cheapest['total_capex']) >= 0)
+    best = store.top('npv_value', 1, park='north')
+    assert best['config_hash'] == [store.top('npv_value', 1, config=cheaper)['config_hash'][0]]
+    assert store.config(best['config_hash'][0]) == cheaper
+    assert store.top('npv_value', 5, park='east')['sizings'].shape == (0, 4)
+
+    # Top-N of a config reads the metric index in order; a CAPEX limit is served by an index as well
+    with sqlite3.connect(path) as db:
+        plans = [' '.join(row[-1] for row in db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM scenarios WHERE config_id IN (?) AND npv_value IS NOT NULL" + capex
+            + " ORDER BY npv_value DESC LIMIT 20", args)) for capex, args in (('', (1,)), (' AND total_capex <= ?', (1, 5e6)))]
+    assert 'scenarios_npv_value' in plans[0] and 'TEMP B-TREE' not in plans[0]
+    assert 'USING INDEX scenarios_' in plans[1]
+
+
+def test_jobs_store_every_evaluated_scenario_for_other_sessions(tmp_path):
+    path = str(tmp_path / 'scenarios.sqlite')
+    with JobRunner(str(tmp_path / 'jobs.sqlite')) as runner:
+        store = ScenarioStore(path)
+        npv = runner.wait(runner.submit('optimize', optimization_job(CONFIG, OBJECTIVE_NPV, MODEL_ANNUAL, time_budget=5, table_rows=5,
+                                                                     park='north', warm_start=False, store=store)))
+        irr = runner.wait(runner.submit('optimize', optimization_job(CONFIG, OBJECTIVE_IRR, MODEL_ANNUAL, time_budget=5, table_rows=5,
+                                                                     park='north', warm_start=False, store=store)))
+        pareto = runner.wait(runner.submit('pareto', pareto_job(CONFIG, MODEL_ANNUAL, time_budget=5, park='south', store=store)))
+    assert npv['status'] == irr['status'] == pareto['status'] == JOB_DONE
+
+    reopened = ScenarioStore(path) # Another session or a restarted server
+    assert reopened.counts(park='north')['scenarios'] >= npv['result']['evaluations']
+    best = reopened.top('npv_value', 1, config=CONFIG, park='north')
+    assert best['sizings'].tolist() == [npv['result']['best_params']]
+    assert best['npv_value'][0] == npv['result']['best_score']
+    assert reopened.top('irr_value', 1, park='north')['irr_value'][0] == irr['result']['best_score']
+    front_best = pareto['result']['best'][OBJECTIVE_NPV]
+    assert reopened.top('npv_value', 1, park='south')['sizings'].tolist() == [front_best]
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from efinops.model import calculate_mixed_system_metrics_batch, complete_config
+from efinops.sensitivity import INTEGER_KEYS, SENSITIVITY_METRICS, evaluate_overrides, sensitivity_grid, tornado
+
+CONFIG = complete_config()
+SIZING = (1000.0, 3000.0, 300.0, 500.0)
+
+
+def _metrics(overrides, sizing=SIZING):
+    config = complete_config({**CONFIG, **overrides})
+    return calculate_mixed_system_metrics_batch(config, [sizing])
+
+
+def test_tornado_matches_full_recompute():
+    result = tornado(CONFIG, SIZING, delta=0.2)
+    assert 'grid_price_static' not in result['keys'] # not read by the model
+    for i, key in enumerate(result['keys']):
+        for side, values in (('low', result['low_values']), ('high', result['high_values'])):
+            value = int(values[i]) if key in INTEGER_KEYS else values[i]
+            expected = _metrics({key: value})
+            for metric in SENSITIVITY_METRICS:
+                assert result[side][metric][i] == pytest.approx(expected[metric][0], rel=1e-9), (key, side, metric)
+
+
+def test_only_affected_stages_are_recomputed():
+    assert evaluate_overrides(CONFIG, SIZING, {'tax_rate': [0.1, 0.3]})['recomputed'] == ['cash_flow']
+    assert evaluate_overrides(CONFIG, SIZING, {'pv_cost_m2': [800.0]})['recomputed'] == ['capex', 'cash_flow']
+    assert evaluate_overrides(CONFIG, SIZING, {'hp_cop': [3.5]})['recomputed'] == ['grid_cost', 'cash_flow']
+    assert evaluate_overrides(CONFIG, SIZING, {'grid_price_peak': [1.4]})['recomputed'] == ['baseline', 'grid_cost', 'cash_flow']
+
+    # Recomputed stages run the model's stage functions row by row
+    overrides = {'peak_perc': [0.1, 0.3], 'grid_price_valley': [0.4, 0.6], 'storage_cost_kwh': [900.0, 1800.0]}
+    result = evaluate_overrides(CONFIG, SIZING, overrides)
+    for row in range(2):
+        expected = _metrics({key: values[row] for key, values in overrides.items()})
+        for metric in ('total_capex', 'annual_gross_saving', 'npv_value'):
+            assert result[metric][row] == pytest.approx(expected[metric][0], rel=1e-12), metric
+
+
+def test_grid_over_sizing_and_lifespan():
+    pv_values = np.array([0.0, 2500.0, 6000.0])
+    lifespans = np.array([12, 20, 25])
+    grid = sensitivity_grid(CONFIG, SIZING, 'pv_area', pv_values, 'project_lifespan_years', lifespans)
+    assert grid['npv_value'].shape == (3, 3)
+    expected = _metrics({'project_lifespan_years': 12}, (1000.0, 6000.0, 300.0, 500.0))
+    assert grid['irr_value'][0, 2] == pytest.approx(expected['irr_value'][0], rel=1e-9)
+    assert grid['payback_year_num'][0, 2] == pytest.approx(expected['payback_year_num'][0], rel=1e-9)
@@ -0,0 +1,75 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from efinops.hourly import simulate_dispatch, synthetic_profiles, tou_price_vector
+from efinops.model import complete_config
+from efinops.storage import annual_storage_saving, solve_soc_windows, storage_shifts
+
+CONFIG = complete_config()
+
+
+def test_dp_matches_brute_force():
+    rng = np.random.default_rng(3)
+    hours, levels, step = 6, 3, 100.0
+    load = rng.uniform(0, 250, (hours, 1, 1))
+    surplus = rng.uniform(0, 80, (hours, 1, 1))
+    price = rng.choice([0.5, 0.8, 1.2], (hours, 1, 1))
+    config = {**CONFIG, 'storage_c_rate': 0.7}
+    shifts = storage_shifts(config, levels)
+
+    def cost(t, k):
+        if k > 0:
+            return price[t, 0, 0] * max(k * step / config['storage_eff_charge'] - surplus[t, 0, 0], 0)
+        return -price[t, 0, 0] * min(-k * step * config['storage_eff_discharge'], load[t, 0, 0])
+
+    best = 0.0
+    for moves in itertools.product([0] + shifts, repeat=hours):
+        levels_visited = np.cumsum(moves)
+        if levels_visited.min() >= 0 and levels_visited.max() <= levels:
+            best = min(best, sum(cost(t, k) for t, k in enumerate(moves) if k))
+    steps = solve_soc_windows(config, load, surplus, price, np.array([step]), levels, shifts)[:, 0, 0]
+    assert sum(cost(t, k) for t, k in enumerate(steps) if k) == pytest.approx(best)
+
+
+def test_hourly_optimal_dispatch_is_feasible_and_beats_rules():
+    profiles = synthetic_profiles(CONFIG)
+    prices, periods = tou_price_vector(CONFIG)
+    capacity = 2000.0
+    sizing = (0.0, 10_000.0, 500.0, capacity)
+    rule = simulate_dispatch(CONFIG, profiles, prices, periods, *sizing)
+    optimal = simulate_dispatch({**CONFIG, 'storage_dispatch': 'optimal'}, profiles, prices, periods, *sizing, keep_hourly=True)
+    assert optimal['grid_cost'] < rule['grid_cost']
+
+    charge, discharge = optimal['storage_charge'], optimal['storage_discharge']
+    power = capacity * CONFIG['storage_c_rate']
+    assert charge.max() <= power + 1e-9 and discharge.max() <= power + 1e-9
+    stored = np.cumsum(charge * CONFIG['storage_eff_charge'] - discharge / CONFIG['storage_eff_discharge'])
+    assert stored.min() >= -1e-6 # Never delivers more than was stored
+    assert optimal['grid_import'].min() >= -1e-9 # No export
+    assert optimal['storage_discharged_kwh'] > rule['storage_discharged_kwh']
+
+
+def test_annual_storage_value():
+    capacities = np.arange(0, 5001, 50.0)
+    saving = annual_storage_saving(CONFIG, capacities)
+    assert saving[0] == 0 and np.all(np.diff(saving) >= 0)
+    assert annual_storage_saving(CONFIG, 1025.0) == pytest.approx((saving[20] + saving[21]) / 2)
+
+    # Per-row configs (one row per park) give the scalar result of each row
+    peak_prices = np.array([[1.0], [1.2], [1.6]])
+    rows = annual_storage_saving({**CONFIG, 'grid_price_peak': peak_prices}, capacities[None, ::25])
+    for peak, row in zip(peak_prices[:, 0], rows):
+        np.testing.assert_allclose(row, annual_storage_saving({**CONFIG, 'grid_price_peak': peak}, capacities[::25]))
+    assert np.all(np.diff(rows[:, -1]) > 0)
+
+    # Many distinct tariffs (Monte Carlo draws): rows share the schedule of the mean tariff
+    draws = np.full(500, CONFIG['grid_price_peak'])
+    np.testing.assert_allclose(annual_storage_saving({**CONFIG, 'grid_price_peak': draws}, 1000.0), saving[20])
+
+    # Only the C-rate has a default, the other plan inputs are required
+    without_c_rate = {key: value for key, value in CONFIG.items() if key != 'storage_c_rate'}
+    assert annual_storage_saving(without_c_rate, 1000.0) > 0
+    with pytest.raises(KeyError):
+        annual_storage_saving({key: value for key, value in CONFIG.items() if key != 'storage_eff_charge'}, 1000.0)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from efinops.hourly import hourly_baseline_cost, simulate_dispatch_batch, synthetic_profiles, tou_price_vector
+from efinops.model import calculate_mixed_system_metrics, calculate_mixed_system_metrics_batch, complete_config
+from efinops.montecarlo import run_monte_carlo, triangular_spread
+from efinops.portfolio import Portfolio
+from efinops.sensitivity import tornado
+from efinops.tariff import (
+    HOURS_PER_DAY,
+    HOURS_PER_YEAR,
+    MONTH_OF_HOUR,
+    TOU_PEAK,
+    TOU_SHOULDER,
+    TOU_VALLEY,
+    compile_tariff,
+    compiled_tariff,
+    tou_equivalent,
+    tou_periods,
+)
+
+CONFIG = complete_config()
+SUMMER = [7, 8]
+TARIFF = {
+    'prices': {'valley': 0.3, 'shoulder': 0.7, 'peak': 1.1, 'critical_peak': 1.4},
+    'seasons': [
+        {'months': SUMMER, 'hours': {'valley': [0, 1, 2, 3, 4, 5, 6, 23], 'peak': [10, 11, 16, 17, 18], 'critical_peak': [19, 20]},
+         'prices': {'critical_peak': 1.6}},
+        {'months': [1, 2, 3, 4, 5, 6, 9, 10, 11, 12], 'hours': {'valley': [0, 1, 2, 3, 4, 5, 6, 23], 'peak': [10, 11, 18, 19, 20]}},
+    ],
+    'tiers': [[100_000, 0.05], [200_000, 0.05]],
+    'demand_charge': 40.0,
+}
+
+
+def test_legacy_config_compiles_to_its_tou_prices():
+    tariff = compiled_tariff(CONFIG)
+    assert compiled_tariff(dict(CONFIG)) is tariff # Served from the cache
+    periods = tou_periods(CONFIG)
+    np.testing.assert_array_equal(tariff.periods, periods)
+    expected = np.choose(periods, [CONFIG['grid_price_valley'], CONFIG['grid_price_shoulder'], CONFIG['grid_price_peak']])
+    np.testing.assert_allclose(tariff.prices, expected)
+    prices, _ = tou_price_vector(CONFIG)
+    np.testing.assert_allclose(prices, expected)
+    assert not tariff.prices.flags.writeable
+    np.testing.assert_array_equal(tariff.charges(np.ones(HOURS_PER_YEAR)), 0.0)
+    assert tou_equivalent(CONFIG) is CONFIG
+
+
+def test_seasonal_tariff_prices_tiers_and_demand_charge():
+    market = np.linspace(0.2, 1.0, HOURS_PER_YEAR)
+    tariff = compile_tariff({**TARIFF, 'market_prices': market, 'market_share': 0.5})
+    tou = compile_tariff(TARIFF)
+    hour = np.arange(HOURS_PER_YEAR) % HOURS_PER_DAY
+    summer = np.isin(MONTH_OF_HOUR, np.array(SUMMER) - 1)
+    np.testing.assert_allclose(tou.prices[summer & (hour == 19)], 1.6)
+    np.testing.assert_allclose(tou.prices[~summer & (hour == 19)], 1.1)
+    np.testing.assert_allclose(tou.prices[hour == 13], 0.7)
+    assert np.all(tou.periods[hour == 20] == TOU_PEAK) # Critical peak is dispatched as peak
+    assert np.all(tou.periods[hour == 3] == TOU_VALLEY) and np.all(tou.periods[hour == 13] == TOU_SHOULDER)
+    np.testing.assert_allclose(tariff.prices, 0.5 * tou.prices + 0.5 * market)
+
+    # 1000 kWh every hour: monthly totals of 672k-744k kWh pass both tier thresholds; peaks are 1000 kW
+    grid_import = np.column_stack([np.full(HOURS_PER_YEAR, 1000.0), np.zeros(HOURS_PER_YEAR)])
+    monthly_kwh = np.bincount(MONTH_OF_HOUR, weights=grid_import[:, 0])
+    expected = 0.05 * (monthly_kwh - 100_000).sum() + 0.05 * (monthly_kwh - 200_000).sum() + 40.0 * 1000.0 * 12
+    np.testing.assert_allclose(tou.charges(grid_import), [expected, 0.0])
+    np.testing.assert_allclose(tou.cost(grid_import[:, 0]), tou.prices.sum() * 1000.0 + expected)
+
+    for invalid in ({'prices': {'valley': 0.3}}, {**TARIFF, 'peak_hours': [1]},
+                    {**TARIFF, 'seasons': [{'months': [13], 'hours': {}}]},
+                    {**TARIFF, 'seasons': [{'months': [1], 'hours': {'super_peak': [1]}}]},
+                    {**TARIFF, 'market_prices': [0.5] * 24, 'market_share': 0.5}):
+        with pytest.raises(ValueError):
+            compile_tariff(invalid)
+
+
+def test_models_and_analyses_price_with_the_tariff():
+    config = {**CONFIG, 'tariff': TARIFF}
+    tariff = compiled_tariff(config)
+    profiles = synthetic_profiles(config)
+    prices, periods = tou_price_vector(config)
+    grid_input = profiles['elec_load'] + profiles['heat_load'] / config['grid_avg_cop'] + profiles['cool_load'] / config['grid_avg_eer']
+    assert hourly_baseline_cost(config, profiles, prices) == pytest.approx(float(tariff.cost(grid_input)))
+    dispatch = simulate_dispatch_batch(config, profiles, prices, periods, [[0.0, 0.0, 0.0, 0.0]], keep_hourly=True)
+    np.testing.assert_allclose(dispatch['grid_cost'], tariff.cost(dispatch['grid_import'][0]))
+
+    # Annual model: the tariff's mean hourly price, i.e. the same result as its three-price equivalent; storage
+    # arbitrage is solved against the tariff's own hourly prices
+    sizings = np.array([[1000.0, 4000.0, 500.0, 0.0], [1000.0, 4000.0, 500.0, 2000.0]])
+    metrics = calculate_mixed_system_metrics_batch(config, sizings)
+    equivalent = calculate_mixed_system_metrics_batch(tou_equivalent(config), sizings)
+    np.testing.assert_allclose(metrics['npv_value'][0], equivalent['npv_value'][0])
+    assert metrics['npv_value'][1] != pytest.approx(equivalent['npv_value'][1])
+    assert not np.allclose(metrics['npv_value'], calculate_mixed_system_metrics_batch(CONFIG, sizings)['npv_value'])
+    assert calculate_mixed_system_metrics(config, *sizings[1])['npv_value'] == pytest.approx(metrics['npv_value'][1])
+
+    # Per-row analyses run on the three-price equivalent
+    result = tornado(config, sizings[1])
+    assert 'tariff' not in result['keys']
+    assert result['base']['npv_value'] == pytest.approx(equivalent['npv_value'][1])
+    mc = run_monte_carlo(config, sizings[1], triangular_spread(tou_equivalent(config), 0.0, ('grid_price_peak',)), n_draws=100)
+    np.testing.assert_allclose(mc['npv_value'], equivalent['npv_value'][1])
+    portfolio = Portfolio([config, CONFIG]).evaluate(sizings[1:])
+    np.testing.assert_allclose(portfolio['npv_value'][0], equivalent['npv_value'][1:])
@@ -0,0 +1,91 @@
+import numpy as np
+
+from efinops.hourly import hourly_inputs
+from efinops.jobs import JOB_DONE, JobRunner, optimization_job
+from efinops.model import (
+    MODEL_ANNUAL,
+    MODEL_HOURLY,
+    calculate_mixed_system_bounds_batch,
+    calculate_mixed_system_metrics_batch,
+    complete_config,
+    evaluate_model_batch,
+)
+from efinops.optimize import OBJECTIVE_IRR, OBJECTIVE_NPV, optimize
+from efinops.warmstart import CandidateMemory, warm_optimize
+
+CONFIG = complete_config()
+SMALL_SPACE = ((0.0, 5000.0, 1000.0), (0.0, 10000.0, 2000.0), (0.0, 2000.0, 400.0), (0.0, 5000.0, 1000.0))
+
+
+def annual_search(config, objective, memory=None):
+    evaluate = lambda sizings: calculate_mixed_system_metrics_batch(config, sizings, objective == OBJECTIVE_IRR)
+    bound = lambda lower, upper: calculate_mixed_system_bounds_batch(config, lower, upper)
+    if memory is None:
+        return optimize(config, objective, evaluate, bound, time_budget=30)
+    return warm_optimize(config, objective, evaluate, memory, bound, time_budget=30)
+
+
+def test_warm_search_matches_cold_search_after_config_edits():
+    memory = CandidateMemory()
+    first = annual_search(CONFIG, OBJECTIVE_NPV, memory)
+    assert not first['warm']['warm_started'] and first['warm']['model_evaluations'] == len(memory)
+
+    # Financial and unit-cost edits keep the candidates; an energy input invalidates them (seeds remain)
+    edits = [{'storage_cost_kwh': 1200.0}, {'storage_cost_kwh': 1200.0, 'discount_rate': 0.06},
+             {'storage_cost_kwh': 1200.0, 'discount_rate': 0.06, 'grid_price_peak': 1.4}]
+    summaries = []
+    for objective in (OBJECTIVE_NPV, OBJECTIVE_IRR):
+        for edit in edits:
+            config = {**CONFIG, **edit}
+            warm, cold = annual_search(config, objective, memory), annual_search(config, objective)
+            assert warm['warm']['warm_started'] and warm['exhaustive']
+            assert np.isclose(warm['best_score'], cold['best_score'], rtol=1e-9)
+            assert objective == OBJECTIVE_IRR or warm['best_params'] == cold['best_params'] # IRR has tied optima
+            summaries.append(warm['warm'])
+    assert [summary['changed_keys'] for summary in summaries[:3]] == [['storage_cost_kwh'], ['discount_rate'], ['grid_price_peak']]
+    assert summaries[0]['rescored'] < summaries[0]['reused'] == len(first['candidates']['scores'])
+    assert summaries[1]['rescored'] == summaries[1]['reused']
+    assert summaries[2]['reused'] == summaries[2]['rescored'] == 0
+
+
+def test_unit_cost_edit_rescores_only_dependent_candidates():
+    hourly = hourly_inputs(CONFIG)
+    calls = []
+
+    def evaluate_batch(config):
+        def evaluate(sizings):
+            calls.append(len(sizings))
+            return evaluate_model_batch(config, sizings, MODEL_HOURLY, False, hourly)
+        return evaluate
+
+    memory = CandidateMemory(SMALL_SPACE)
+    warm_optimize(CONFIG, OBJECTIVE_NPV, evaluate_batch(CONFIG), memory, method='grid', space=SMALL_SPACE)
+    remembered = memory.sizings.copy()
+    config = {**CONFIG, 'storage_cost_kwh': 900.0}
+    calls.clear()
+    result = warm_optimize(config, OBJECTIVE_NPV, evaluate_batch(config), memory, space=SMALL_SPACE)
+    assert result['warm']['rescored'] == np.count_nonzero(remembered[:, 3]) < len(remembered)
+    assert result['warm']['model_evaluations'] == sum(calls)
+
+    # Remembered metrics (re-scored or kept) equal a fresh evaluation under the new config
+    rows = memory.rows(remembered)
+    expected = evaluate_model_batch(config, remembered, MODEL_HOURLY, False, hourly)
+    np.testing.assert_allclose(memory.metrics['npv_value'][rows], expected['npv_value'], rtol=1e-9)
+    np.testing.assert_allclose(memory.metrics['payback_year_num'][rows], expected['payback_year_num'], rtol=1e-9)
+    cold = optimize(config, OBJECTIVE_NPV, lambda sizings: evaluate_model_batch(config, sizings, MODEL_HOURLY, False, hourly),
+                    method='grid', space=SMALL_SPACE)
+    assert result['best_score'] >= cold['best_score']
+
+
+def test_optimization_job_warm_starts_per_park(tmp_path):
+    with JobRunner(str(tmp_path / 'jobs.sqlite')) as runner:
+        results = []
+        for park, config in (('north', CONFIG), ('north', {**CONFIG, 'tax_rate': 0.15}), ('south', CONFIG)):
+            job = runner.wait(runner.submit('optimize', optimization_job(config, OBJECTIVE_NPV, MODEL_ANNUAL, time_budget=5,
+                                                                           table_rows=5, park=park)))
+            assert job['status'] == JOB_DONE
+            results.append(job['result'])
+    assert [result['warm']['warm_started'] for result in results] == [False, True, False]
+    assert results[1]['warm']['changed_keys'] == ['tax_rate']
+    assert results[1]['warm']['rescored'] == results[1]['warm']['reused'] > 0
+    assert results[1]['best_params'] == annual_search({**CONFIG, 'tax_rate': 0.15}, OBJECTIVE_NPV)['best_params']